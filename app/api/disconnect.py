@@ -0,0 +1,57 @@
+"""
+Stopping work for clients that have gone away.
+
+Starlette does not cancel a handler when its client disconnects, so a
+compile would run to completion -- holding an admission slot and a worker --
+for a response nobody reads.  `cancel_on_disconnect` runs the awaitable
+while polling the connection, and cancels it once the client is gone.
+Compiles react to cancellation by killing their subprocesses.
+"""
+
+import asyncio
+from typing import Awaitable, TypeVar
+
+from starlette.requests import Request
+
+T = TypeVar("T")
+
+# How often a waiting request checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+class ClientDisconnectedError(Exception):
+    """The client closed the connection before its compile finished."""
+
+    def __init__(self, message: str = "Client closed the connection"):
+        self.message = message
+        super().__init__(message)
+
+
+async def cancel_on_disconnect(
+    request: Request,
+    awaitable: Awaitable[T],
+    poll_interval: float = DISCONNECT_POLL_SECONDS,
+) -> T:
+    """
+    Await *awaitable*, cancelling it if the client disconnects first.
+
+    Raises ClientDisconnectedError once the cancelled work has stopped.
+    Only call this after the request body has been read.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait([task], timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                break
+        task.cancel()
+        await asyncio.wait([task])
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+    if not task.cancelled() and task.exception() is None:
+        return task.result()  # finished before the cancellation landed
+    raise ClientDisconnectedError()
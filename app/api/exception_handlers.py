@@ -11,7 +11,9 @@ import traceback
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 
+from app.api.disconnect import ClientDisconnectedError
 from app.models.compile import ErrorResponse
+from app.services.admission import OverloadedError
 from app.services.validators import PayloadTooLargeError, ValidationError
 
 logger = logging.getLogger(__name__)
@@ -41,6 +43,39 @@ def register_exception_handlers(app: FastAPI) -> None:
             message=exc.message,
         )
 
+    @app.exception_handler(OverloadedError)
+    async def overloaded_handler(
+        request: Request, exc: OverloadedError
+    ) -> JSONResponse:
+        logger.warning(
+            "Rejected compile request %s: %s (retry after %ss)",
+            getattr(request.state, "request_id", "unknown"),
+            exc.message,
+            exc.retry_after,
+        )
+        response = _error_response(
+            status_code=503,
+            error_type="overloaded",
+            message=exc.message,
+        )
+        response.headers["Retry-After"] = str(exc.retry_after)
+        return response
+
+    @app.exception_handler(ClientDisconnectedError)
+    async def client_disconnected_handler(
+        request: Request, exc: ClientDisconnectedError
+    ) -> JSONResponse:
+        logger.info(
+            "Cancelled compile for request %s: client disconnected",
+            getattr(request.state, "request_id", "unknown"),
+        )
+        # Nobody reads this; 499 keeps access logs and metrics honest
+        return _error_response(
+            status_code=499,
+            error_type="client_disconnected",
+            message=exc.message,
+        )
+
 
 def _error_response(
     status_code: int,
@@ -0,0 +1,293 @@
+"""
+Response classes shared by the v1 and v2 routes.
+"""
+
+import base64
+import io
+import json
+import time
+import uuid
+import zipfile
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Mapping, Optional, Union
+
+import anyio
+from starlette.responses import FileResponse, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+# Bytes read from disk per chunk when streaming a PDF.  A multiple of 3, so
+# base64-encoded chunks concatenate without padding in between.
+PDF_CHUNK_SIZE = 48 * 1024
+
+
+class PdfFileResponse(FileResponse):
+    """
+    Stream a PDF from disk, then call *on_close*.
+
+    The body is sent in chunks (or via ``http.response.pathsend`` where the
+    server supports it), so memory use does not grow with the PDF size.
+    *on_close* runs once the body has been sent -- or sending failed, e.g.
+    because the client disconnected -- and is where the work dir holding the
+    PDF gets released.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        headers: Optional[Mapping[str, str]] = None,
+        on_close: Optional[Callable[[], None]] = None,
+    ):
+        super().__init__(
+            path,
+            headers=headers,
+            media_type="application/pdf",
+            filename="output.pdf",
+        )
+        self._on_close = on_close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """`StreamingResponse` that calls *on_close* like `PdfFileResponse`."""
+
+    def __init__(
+        self,
+        content: AsyncIterator[bytes],
+        media_type: str,
+        headers: Optional[Mapping[str, str]] = None,
+        on_close: Optional[Callable[[], None]] = None,
+    ):
+        super().__init__(content, headers=headers, media_type=media_type)
+        self._on_close = on_close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+
+
+class MultipartPdfResponse(ClosingStreamingResponse):
+    """
+    ``multipart/mixed`` response: a JSON metadata part, then the raw PDF.
+
+    The PDF part is streamed from *pdf* (a file, or bytes already in memory)
+    without any encoding, so the body is only a few hundred bytes larger than
+    the PDF itself.
+    """
+
+    def __init__(
+        self,
+        metadata: Mapping[str, Any],
+        pdf: Union[Path, bytes],
+        headers: Optional[Mapping[str, str]] = None,
+        on_close: Optional[Callable[[], None]] = None,
+    ):
+        boundary = uuid.uuid4().hex
+        super().__init__(
+            _multipart_body(boundary, metadata, pdf),
+            media_type=f"multipart/mixed; boundary={boundary}",
+            headers=headers,
+            on_close=on_close,
+        )
+
+
+class Base64JsonResponse(ClosingStreamingResponse):
+    """
+    JSON response of *metadata* plus ``"pdf_base64"``, encoded incrementally.
+
+    The envelope is sent first, then the PDF is base64-encoded one chunk at a
+    time as it is read, so memory use stays bounded by the chunk size and the
+    first bytes go out before the PDF has been read.
+    """
+
+    def __init__(
+        self,
+        metadata: Mapping[str, Any],
+        pdf: Union[Path, bytes],
+        headers: Optional[Mapping[str, str]] = None,
+        on_close: Optional[Callable[[], None]] = None,
+    ):
+        super().__init__(
+            _base64_json_body(metadata, pdf),
+            media_type="application/json",
+            headers=headers,
+            on_close=on_close,
+        )
+
+
+async def _base64_json_body(
+    metadata: Mapping[str, Any],
+    pdf: Union[Path, bytes],
+) -> AsyncIterator[bytes]:
+    envelope = json.dumps(metadata)
+    assert envelope.endswith("}")
+    separator = ", " if metadata else ""
+    yield f'{envelope[:-1]}{separator}"pdf_base64": "'.encode("utf-8")
+
+    carry = b""
+    async for chunk in iter_pdf_chunks(pdf):
+        chunk = carry + chunk
+        usable = len(chunk) - len(chunk) % 3
+        carry = chunk[usable:]
+        if usable:
+            yield base64.b64encode(chunk[:usable])
+    yield base64.b64encode(carry) + b'"}'
+
+
+async def _multipart_body(
+    boundary: str,
+    metadata: Mapping[str, Any],
+    pdf: Union[Path, bytes],
+) -> AsyncIterator[bytes]:
+    delimiter = f"--{boundary}\r\n".encode("ascii")
+    pdf_size = pdf.stat().st_size if isinstance(pdf, Path) else len(pdf)
+
+    yield (
+        delimiter
+        + b"Content-Type: application/json\r\n"
+        + b'Content-Disposition: inline; name="metadata"\r\n\r\n'
+        + json.dumps(metadata).encode("utf-8")
+        + b"\r\n"
+        + delimiter
+        + b"Content-Type: application/pdf\r\n"
+        + b'Content-Disposition: attachment; filename="output.pdf"\r\n'
+        + f"Content-Length: {pdf_size}\r\n\r\n".encode("ascii")
+    )
+    async for chunk in iter_pdf_chunks(pdf):
+        yield chunk
+    yield f"\r\n--{boundary}--\r\n".encode("ascii")
+
+
+class EventStreamResponse(ClosingStreamingResponse):
+    """
+    ``text/event-stream`` response (Server-Sent Events).
+
+    *content* yields complete events, as built by `sse_event()` and
+    `sse_pdf_event()`.  Proxies are asked not to buffer the stream.
+    """
+
+    def __init__(
+        self,
+        content: AsyncIterator[bytes],
+        headers: Optional[Mapping[str, str]] = None,
+        on_close: Optional[Callable[[], None]] = None,
+    ):
+        super().__init__(
+            content,
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no",
+                **(headers or {}),
+            },
+            on_close=on_close,
+        )
+
+
+def sse_event(event: str, data: Mapping[str, Any]) -> bytes:
+    """One Server-Sent Event with *data* as single-line JSON."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+async def sse_pdf_event(
+    event: str,
+    metadata: Mapping[str, Any],
+    pdf: Union[Path, bytes],
+) -> AsyncIterator[bytes]:
+    """`sse_event()` of *metadata* plus ``"pdf_base64"``, encoded incrementally."""
+    yield f"event: {event}\ndata: ".encode("utf-8")
+    async for chunk in _base64_json_body(metadata, pdf):
+        yield chunk
+    yield b"\n\n"
+
+
+def ndjson_line(data: Mapping[str, Any]) -> bytes:
+    """One line of newline-delimited JSON."""
+    return json.dumps(data).encode("utf-8") + b"\n"
+
+
+async def ndjson_pdf_line(
+    metadata: Mapping[str, Any], pdf: Union[Path, bytes]
+) -> AsyncIterator[bytes]:
+    """`ndjson_line()` of *metadata* plus ``"pdf_base64"``, encoded incrementally."""
+    async for chunk in _base64_json_body(metadata, pdf):
+        yield chunk
+    yield b"\n"
+
+
+class ZipStream:
+    """
+    A zip archive produced incrementally, for streaming as members arrive.
+
+    `add()` returns the bytes of a small in-memory member, `add_pdf()` yields
+    those of a PDF one chunk at a time, and `close()` returns the central
+    directory; concatenated, they form the archive.  Members are stored
+    uncompressed -- PDFs are compressed already.  `add()` and `close()` are
+    blocking: call them off the event loop.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = _ChunkBuffer()
+        # An unseekable target makes zipfile write data descriptors instead
+        # of seeking back to patch each local header
+        self._zip = zipfile.ZipFile(self._buffer, "w", zipfile.ZIP_STORED)
+
+    def add(self, name: str, data: bytes) -> bytes:
+        self._zip.writestr(name, data)
+        return self._buffer.drain()
+
+    async def add_pdf(self, name: str, pdf: Union[Path, bytes]) -> AsyncIterator[bytes]:
+        """Add *pdf* as member *name*, yielding the archive bytes per chunk."""
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        # Lets zipfile decide up front whether the member needs zip64
+        info.file_size = pdf.stat().st_size if isinstance(pdf, Path) else len(pdf)
+        with self._zip.open(info, "w") as member:
+            async for chunk in iter_pdf_chunks(pdf):
+                member.write(chunk)
+                yield self._buffer.drain()
+        yield self._buffer.drain()
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._buffer.drain()
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """Write-only, unseekable byte sink for `ZipStream`."""
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:  # type: ignore[override]
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def iter_pdf_chunks(
+    pdf: Union[Path, bytes], chunk_size: int = PDF_CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    """Yield *pdf* in chunks, reading files off the event loop."""
+    if isinstance(pdf, bytes):
+        for start in range(0, len(pdf), chunk_size):
+            yield pdf[start : start + chunk_size]
+        return
+
+    async with await anyio.open_file(pdf, "rb") as f:
+        while chunk := await f.read(chunk_size):
+            yield chunk
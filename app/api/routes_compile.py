@@ -1,25 +1,134 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
-from fastapi.responses import Response, JSONResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Request
+from fastapi.responses import JSONResponse
 from typing import Optional
 from pathlib import Path
+import asyncio
+import hashlib
+import json
+import shutil
 import tempfile
 import os
 
-from app.models.compile import CompileOptions, ValidateRequest, ValidateResponse
+from app.api.disconnect import cancel_on_disconnect
+from app.api.responses import PdfFileResponse
+from app.models.compile import (
+    CompileOptions,
+    CompileResult,
+    ValidateRequest,
+    ValidateResponse,
+)
+from app.services.admission import OverloadedError, compile_admission
+from app.services.executor import run_cancellable_in_compile_executor
 from app.services.latex_compiler import compile_latex_sync, cleanup_work_dir
+from app.services.pipeline import prelint_source
+from app.services.singleflight import Lease, SingleFlight
 from app.core.config import settings
+from app.core.timing import get_phase_timer
 
 router = APIRouter()
 
+# Identical in-flight compiles, keyed by _source_key()
+_compile_flights: SingleFlight[CompileResult] = SingleFlight()
+
+
+def _source_key(
+    source_digest: str,
+    suffix: str,
+    options: CompileOptions,
+    validate: bool = False,
+) -> str:
+    """Single-flight key for compiling an uploaded source with *options*."""
+    material = {
+        "source": source_digest,
+        "suffix": suffix,
+        "validate": validate,
+        "engine": options.engine,
+        "passes": options.passes,
+        "main_file": options.main_file,
+        "draft": options.draft,
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode()).hexdigest()
+
+
+async def _compile(
+    source_path: Path, options: CompileOptions, validate: bool = False
+) -> CompileResult:
+    """Run compile_latex_sync() on the compile executor behind admission control."""
+    try:
+        async with compile_admission.slot():
+            if validate:
+                return await run_cancellable_in_compile_executor(
+                    compile_latex_sync, source_path, options, validate=True
+                )
+            return await run_cancellable_in_compile_executor(
+                compile_latex_sync, source_path, options
+            )
+    except OverloadedError as exc:
+        raise HTTPException(
+            status_code=503,
+            detail=exc.message,
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
+
+def _start_compile(
+    source_path: Path, options: CompileOptions, validate: bool
+) -> "asyncio.Future[CompileResult]":
+    """
+    Start compiling a private link to *source_path*.
+
+    The uploading request deletes its temp file as soon as it stops waiting,
+    which may be before a shared compile has read it.
+    """
+    # compile_latex_sync dispatches on the suffix, so keep it last
+    staged = source_path.with_name(f"{source_path.stem}.flight{source_path.suffix}")
+    try:
+        os.link(source_path, staged)
+    except OSError:
+        shutil.copyfile(source_path, staged)
+    task = asyncio.ensure_future(_compile(staged, options, validate))
+    task.add_done_callback(lambda _task: staged.unlink(missing_ok=True))
+    return task
+
+
+async def _compile_shared(
+    request: Request,
+    key: str,
+    source_path: Path,
+    options: CompileOptions,
+    validate: bool = False,
+) -> Lease[CompileResult]:
+    """
+    `_compile`, joining an identical compile already in flight.
+
+    The work dir is removed once the last request sharing it releases its
+    lease.  If the client disconnects, this request stops waiting; the
+    compile is cancelled when no other request shares it.
+    """
+    return await cancel_on_disconnect(
+        request,
+        _compile_flights.join(
+            key,
+            lambda: _start_compile(source_path, options, validate),
+            finalize=cleanup_work_dir,
+        ),
+    )
+
 
 @router.post("/compile/sync")
 async def compile_sync(
+    request: Request,
     file: Optional[UploadFile] = File(None),
     code: Optional[str] = Form(None),
     engine: str = Form("pdflatex"),
     passes: int = Form(2),
     main_file: Optional[str] = Form(None),
 ):
+    # Phase timings for the Server-Timing header; receiving the form counts
+    # as the upload
+    timer = get_phase_timer(request)
+    timer.add("upload", timer.elapsed_ms())
+
     # Validate input: either file or code must be provided
     if not file and not code:
         raise HTTPException(
@@ -43,6 +152,7 @@ async def compile_sync(
     # Check file size
     MAX_SIZE = settings.MAX_UPLOAD_SIZE
     size = 0
+    hasher = hashlib.sha256()
 
     # Determine suffix
     suffix = ".tex"
@@ -55,7 +165,10 @@ async def compile_sync(
                 status_code=400, detail="Only .tex or .zip files are supported"
             )
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+    with (
+        timer.phase("spool"),
+        tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file,
+    ):
         if file:
             while True:
                 chunk = await file.read(1024 * 1024)
@@ -69,6 +182,7 @@ async def compile_sync(
                         status_code=413,
                         detail=f"File too large (max {MAX_SIZE // (1024 * 1024)}MB)",
                     )
+                hasher.update(chunk)
                 tmp_file.write(chunk)
         else:
             # Write raw code
@@ -81,31 +195,33 @@ async def compile_sync(
                     status_code=413,
                     detail=f"Code too large (max {MAX_SIZE // (1024 * 1024)}MB)",
                 )
+            hasher.update(code_bytes)
             tmp_file.write(code_bytes)
 
         tmp_path = Path(tmp_file.name)
 
     try:
-        result = compile_latex_sync(tmp_path, options)
+        lease = await _compile_shared(
+            request,
+            _source_key(hasher.hexdigest(), suffix, options),
+            tmp_path,
+            options,
+        )
+        result = lease.result
+        timer.update(result.phases)
+        timer.add_steps(result.steps)
 
         if result.success and result.pdf_path and result.pdf_path.exists():
-            # Read PDF content into memory, then clean up the work dir
-            with open(result.pdf_path, "rb") as f:
-                pdf_content = f.read()
-
-            # Guaranteed cleanup of the compilation work directory
-            cleanup_work_dir(result)
-
-            return Response(
-                content=pdf_content,
-                media_type="application/pdf",
-                headers={
-                    "Content-Disposition": 'attachment; filename="output.pdf"',
-                    "X-Compile-Time-Ms": str(result.compile_time_ms),
-                },
+            # Stream the PDF from the work dir; the lease (and with it the
+            # work dir) is released once the body has been sent
+            return PdfFileResponse(
+                result.pdf_path,
+                headers={"X-Compile-Time-Ms": str(result.compile_time_ms)},
+                on_close=lease.release,
             )
         else:
             # Work dir already cleaned up on failure by compile_latex_sync
+            lease.release()
             return JSONResponse(
                 status_code=400,
                 content={
@@ -126,10 +242,11 @@ async def compile_sync(
 
 
 @router.post("/compile/validate", response_model=ValidateResponse)
-async def validate_compile(payload: ValidateRequest):
+async def validate_compile(payload: ValidateRequest, request: Request):
     """
     Validate whether provided LaTeX code compiles without returning the PDF.
-    Accepts JSON body with a `code` string and optional `passes`/`engine`.
+    Accepts JSON body with a `code` string and optional `engine`/`prelint`.
+    Runs the pre-lint, then a single pdflatex draft pass if needed.
     """
     code = payload.code or ""
     if not code.strip():
@@ -144,20 +261,47 @@ async def validate_compile(payload: ValidateRequest):
             detail=f"Code too large (max {settings.MAX_UPLOAD_SIZE // (1024 * 1024)}MB)",
         )
 
+    timer = get_phase_timer(request)
+    timer.add("upload", timer.elapsed_ms())
+
+    with timer.phase("prelint"):
+        rejected = prelint_source(code) if payload.prelint else None
+    if rejected is not None:
+        return ValidateResponse(
+            compilable=False,
+            errors=rejected.errors,
+            warnings=rejected.warnings,
+            log=rejected.log,
+            log_truncated=rejected.log_truncated,
+            compile_time_ms=rejected.compile_time_ms,
+            stage="prelint",
+        )
+
     with tempfile.NamedTemporaryFile(delete=False, suffix=".tex") as tmp_file:
         tmp_file.write(code_bytes)
         tmp_path = Path(tmp_file.name)
 
     try:
         options = CompileOptions(
-            engine=payload.engine, passes=payload.passes, main_file=None
+            engine=payload.engine, passes=payload.passes, main_file=None, draft=True
+        )
+        lease = await _compile_shared(
+            request,
+            _source_key(
+                hashlib.sha256(code_bytes).hexdigest(), ".tex", options, validate=True
+            ),
+            tmp_path,
+            options,
+            validate=True,
         )
-        result = compile_latex_sync(tmp_path, options)
+        result = lease.result
+        timer.update(result.phases)
+        timer.add_steps(result.steps)
 
         # Work dir cleanup: on failure it's already cleaned up by
-        # compile_latex_sync. On success, clean it up here since
-        # validate doesn't need the PDF.
-        cleanup_work_dir(result)
+        # compile_latex_sync. On success, releasing the lease cleans it up
+        # since validate doesn't need the PDF.
+        lease.release()
 
         return ValidateResponse(
             compilable=result.success,
@@ -166,6 +310,7 @@ async def validate_compile(payload: ValidateRequest):
             log=result.log,
             log_truncated=result.log_truncated,
             compile_time_ms=result.compile_time_ms,
+            steps=result.steps,
         )
     finally:
         if tmp_path.exists():
@@ -4,169 +4,1992 @@ V2 API route handlers.
 Endpoints:
     POST /v2/compile/sync      Multi-file compile (multipart/form-data)
     POST /v2/compile/zip       Zip compile (multipart/form-data)
+    POST /v2/compile/stream    Compile with progress events (text/event-stream)
+    POST /v2/blobs/missing     Which blobs of a manifest are not stored (JSON)
+    POST /v2/blobs             Upload blobs (multipart/form-data)
+    POST /v2/compile/manifest  Compile a manifest of stored blobs (JSON body)
+    POST /v2/compile/batch     Compile many documents, streaming results (JSON body)
+    POST /v2/compile/merge     Compile a template once per set of variables
+    POST /v2/sessions                         Create a session (warm work dir)
+    GET /v2/sessions/{id}                     Session files
+    PATCH /v2/sessions/{id}/files             Add or replace files
+    DELETE /v2/sessions/{id}/files/{path}     Remove a file
+    POST /v2/sessions/{id}/compile            Compile in the session work dir
+    DELETE /v2/sessions/{id}                  Remove the session
+    POST /v2/jobs                             Queue a compile job
+    GET /v2/jobs/{id}                         Job status
+    GET /v2/jobs/{id}/pdf                     PDF of a succeeded job
+    GET /v2/jobs/{id}/log                     Compile log of a finished job
     POST /v2/compile/validate  Validation-only (JSON body)
 """
 
-import base64
+import asyncio
+import json
 import logging
 import os
+import re
 import tempfile
 import time
+from contextlib import aclosing
+from dataclasses import dataclass
 from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
 
 from fastapi import APIRouter, File, Form, Request, UploadFile
-from fastapi.responses import JSONResponse, Response
-
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+
+from app.api.disconnect import ClientDisconnectedError, cancel_on_disconnect
+from app.api.responses import (
+    Base64JsonResponse,
+    ClosingStreamingResponse,
+    EventStreamResponse,
+    MultipartPdfResponse,
+    PdfFileResponse,
+    ZipStream,
+    ndjson_line,
+    ndjson_pdf_line,
+    sse_event,
+    sse_pdf_event,
+)
 from app.core.config import settings
 from app.core.logging import log_compile_event
+from app.core.timing import PhaseTimer, get_phase_timer
 from app.models.compile import (
+    BatchCompileRequest,
+    BatchItem,
+    BlobQueryRequest,
+    BlobQueryResponse,
+    BlobUploadResponse,
     CompileOptions,
     CompileResult,
     ErrorResponse,
+    JobResponse,
+    ManifestCompileRequest,
+    SessionResponse,
+    StepUsage,
+    StoredBlob,
     TextCountResponse,
     ValidateRequest,
     ValidateResponse,
 )
-from app.services.adapters import build_workdir_from_multipart, build_workdir_from_zip
-from app.services.pipeline import compile_project
+from app.services.adapters import (
+    MergeTemplate,
+    MissingBlobsError,
+    Project,
+    ProjectSnapshot,
+    ProjectView,
+    build_workdir_from_multipart,
+    build_workdir_from_zip,
+    parse_merge_variables,
+    read_manifest,
+    read_merge_template,
+    read_multipart_snapshot,
+    read_source_snapshot,
+    read_zip_snapshot,
+    write_project,
+    write_snapshot,
+)
+from app.services.admission import AdmissionTicket, OverloadedError, compile_admission
+from app.services.blob_store import blob_store, is_blob_digest
+from app.services.executor import (
+    run_cancellable_in_compile_executor,
+    run_in_compile_executor,
+)
+from app.services.jobs import FINISHED_STATUSES, JobNotFoundError, job_store
+from app.services.pipeline import (
+    compile_outcome,
+    compile_project,
+    compile_project_async,
+    compile_project_events,
+    failure_type,
+    prelint_source,
+    prepare_format,
+    validate_project,
+    validate_project_async,
+)
+from app.services.result_cache import CachedCompile, compile_cache_key, result_cache
+from app.services.sessions import Session, SessionNotFoundError, session_store
+from app.services.singleflight import SingleFlight
 from app.services.textcount import collect_textcount
 from app.services.validators import (
     PayloadTooLargeError,
     ValidationError,
     scan_dangerous_macros,
+    validate_file_path,
     validate_limits,
 )
-from app.services.workdir import cleanup_workdir, create_workdir, safe_write_file
+from app.services.workdir import cleanup_workdir, create_workdir
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/v2")
+
+# Values of the ``return`` form field
+RETURN_FORMATS = ("pdf", "json", "multipart")
+
+# Identical in-flight compiles, keyed by compile_cache_key()
+_compile_flights: SingleFlight[tuple[CompileResult, AdmissionTicket]] = SingleFlight()
+
+
+# ---------------------------------------------------------------------------
+# helpers
+# ---------------------------------------------------------------------------
+
+
+def _get_request_id(request: Request) -> str:
+    return getattr(request.state, "request_id", "unknown")
+
+
+def _start_timer(request: Request) -> PhaseTimer:
+    """
+    The request's phase timer, with the time until the handler ran --
+    receiving and parsing the body -- recorded as ``upload``.
+    """
+    timer = get_phase_timer(request)
+    timer.add("upload", timer.elapsed_ms())
+    return timer
+
+
+async def _compile(
+    work_dir: Path,
+    main_file: str,
+    options: CompileOptions,
+    validate: bool = False,
+) -> tuple[CompileResult, AdmissionTicket]:
+    """
+    Run the compile pipeline on the configured ``COMPILE_BACKEND``.
+
+    With ``validate=True`` runs the single-draft-pass validation mode instead.
+    Waits for an admission slot first.  Raises OverloadedError (-> 503) when
+    the compile queue is full or the wait exceeds the queue-time deadline.
+    """
+    async with compile_admission.slot() as ticket:
+        if settings.COMPILE_BACKEND == "asyncio":
+            run_async = validate_project_async if validate else compile_project_async
+            result = await run_async(work_dir, main_file, options)
+        else:
+            run_sync = validate_project if validate else compile_project
+            result = await run_cancellable_in_compile_executor(
+                run_sync, work_dir, main_file, options
+            )
+    return result, ticket
+
+
+def _compile_error_response(
+    status_code: int,
+    error_type: str,
+    message: str,
+    errors: list[str] | None = None,
+    warnings: list[str] | None = None,
+    log: str = "",
+    log_truncated: bool = False,
+    steps: list[StepUsage] | None = None,
+) -> JSONResponse:
+    """Return a standardized JSON error response."""
+    body = ErrorResponse(
+        error_type=error_type,
+        message=message,
+        errors=errors or [],
+        warnings=warnings or [],
+        log=log,
+        log_truncated=log_truncated,
+        steps=steps or [],
+    )
+    return JSONResponse(status_code=status_code, content=body.model_dump())
+
+
+def _validation_error(exc: ValidationError) -> JSONResponse:
+    """Map a ValidationError to the correct HTTP status + body."""
+    if isinstance(exc, PayloadTooLargeError):
+        return _compile_error_response(413, exc.error_type, exc.message)
+    if isinstance(exc, MissingBlobsError):
+        # the missing digests are listed in ``errors``
+        return _compile_error_response(
+            409, exc.error_type, exc.message, errors=exc.missing
+        )
+    return _compile_error_response(422, exc.error_type, exc.message)
+
+
+def _log_overloaded(
+    exc: OverloadedError,
+    *,
+    request_id: str,
+    endpoint: str,
+    options: CompileOptions,
+    snapshot: Project | Session,
+    timer: PhaseTimer,
+    t0: float,
+) -> None:
+    """Compile event for a request rejected by admission control (-> 503)."""
+    log_compile_event(
+        request_id=request_id,
+        endpoint=endpoint,
+        main_file=options.main_file or "main.tex",
+        engine=options.engine,
+        passes=options.passes,
+        file_count=snapshot.file_count,
+        total_bytes=snapshot.total_bytes,
+        compile_time_ms=int((time.monotonic() - t0) * 1000),
+        outcome="overloaded",
+        error_message=exc.message,
+        queue_depth=exc.queue_depth,
+        queue_wait_ms=exc.queue_wait_ms,
+        phases=timer.as_dict(),
+    )
+
+
+def _log_disconnected(
+    *,
+    request_id: str,
+    endpoint: str,
+    options: CompileOptions,
+    snapshot: Project | Session,
+    timer: PhaseTimer,
+    t0: float,
+) -> None:
+    """Compile event for a compile cancelled because the client went away."""
+    log_compile_event(
+        request_id=request_id,
+        endpoint=endpoint,
+        main_file=options.main_file or "main.tex",
+        engine=options.engine,
+        passes=options.passes,
+        file_count=snapshot.file_count,
+        total_bytes=snapshot.total_bytes,
+        compile_time_ms=int((time.monotonic() - t0) * 1000),
+        outcome="cancelled",
+        error_message="client disconnected",
+        phases=timer.as_dict(),
+    )
+
+
+def _failure_body(result: CompileResult) -> ErrorResponse:
+    """The standardized error body for a compile without a PDF."""
+    return ErrorResponse(
+        error_type=failure_type(result),
+        message=result.error_message or "Compilation failed",
+        errors=result.errors,
+        warnings=result.warnings,
+        log=result.log,
+        log_truncated=result.log_truncated,
+        steps=result.steps,
+    )
+
+
+def _build_failure_response(result: CompileResult) -> JSONResponse:
+    """Build the standardized error response for a compile without a PDF."""
+    return JSONResponse(status_code=400, content=_failure_body(result).model_dump())
+
+
+def _pdf_headers(compile_time_ms: int, passes_run: int) -> dict[str, str]:
+    return {
+        "X-Compile-Time-Ms": str(compile_time_ms),
+        "X-Passes-Run": str(passes_run),
+    }
+
+
+def _success_metadata(compiled: CachedCompile) -> dict:
+    """Everything a JSON-consuming client gets besides the PDF itself."""
+    textcount = compiled.textcount
+    if textcount is None:
+        textcount = TextCountResponse(
+            status="error", message="textcount was not collected"
+        )
+    return {
+        "status": "ok",
+        "compile_time_ms": compiled.compile_time_ms,
+        "passes_run": compiled.passes_run,
+        "errors": compiled.errors,
+        "warnings": compiled.warnings,
+        "log": compiled.log,
+        "log_truncated": compiled.log_truncated,
+        "textcount": textcount.model_dump(),
+        "steps": [step.model_dump() for step in compiled.steps],
+    }
+
+
+def _build_success_response(
+    compiled: CachedCompile,
+    return_format: str,
+    on_close: Callable[[], None] | None = None,
+) -> Response:
+    """
+    Build a PDF, base64-in-JSON or multipart response from compile output.
+
+    Every format streams; the PDF is read from ``compiled.pdf_file`` when set.  *on_close* is
+    called once the response no longer needs that file.
+    """
+    headers = _pdf_headers(compiled.compile_time_ms, compiled.passes_run)
+
+    pdf = compiled.pdf_file if compiled.pdf_file is not None else compiled.pdf
+    if return_format == "json":
+        return Base64JsonResponse(
+            _success_metadata(compiled), pdf, on_close=on_close
+        )
+    if return_format == "multipart":
+        return MultipartPdfResponse(
+            _success_metadata(compiled), pdf, headers=headers, on_close=on_close
+        )
+
+    # default: return raw PDF
+    if isinstance(pdf, Path):
+        return PdfFileResponse(pdf, headers=headers, on_close=on_close)
+    if on_close is not None:
+        on_close()
+    return Response(
+        content=pdf,
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": 'attachment; filename="output.pdf"',
+            **headers,
+        },
+    )
+
+
+async def _spool_zip(file: UploadFile, timer: PhaseTimer) -> Path:
+    """Stream an uploaded zip to a temp file.  Raises PayloadTooLargeError."""
+    fd, path_str = tempfile.mkstemp(suffix=".zip")
+    path = Path(path_str)
+    total_uploaded = 0
+    try:
+        with os.fdopen(fd, "wb") as f, timer.phase("spool"):
+            while chunk := await file.read(1024 * 1024):
+                total_uploaded += len(chunk)
+                if total_uploaded > settings.MAX_UPLOAD_SIZE:
+                    raise PayloadTooLargeError(
+                        f"Uploaded zip exceeds {settings.MAX_UPLOAD_SIZE} bytes"
+                    )
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def _project_upload_error(
+    engine: str, files: list[UploadFile] | None, file: UploadFile | None
+) -> str | None:
+    """Why a ``files``-or-zip-``file`` upload form is invalid, if it is."""
+    if engine != "pdflatex":
+        return f"Unsupported engine: {engine!r}"
+    if (files is None) == (file is None):
+        return "Upload either 'files' (the project files) or 'file' (a zip archive)"
+    return None
+
+
+async def _compile_snapshot(
+    *,
+    request: Request,
+    endpoint: str,
+    snapshot: Project,
+    main_file: str,
+    options: CompileOptions,
+    return_format: str,
+    t0: float,
+) -> Response | JSONResponse:
+    """
+    Compile a validated project snapshot or manifest and build the HTTP
+    response.
+
+    Successful results are cached under the project digest + options; a hit
+    skips the work dir and every subprocess and is marked ``X-Cache: HIT``.
+    Concurrent requests for the same key share a single compile, which is
+    cancelled if all of their clients disconnect.  PDF responses stream from
+    the work dir, which is kept until the body is sent.
+    """
+    request_id = _get_request_id(request)
+    timer = get_phase_timer(request)
+    timer.update(snapshot.phases)
+    with timer.phase("digest"):
+        project_digest = await run_in_compile_executor(snapshot.digest)
+    compile_key = compile_cache_key(project_digest, options)
+    cached = await _cached_response(
+        request_id=request_id,
+        endpoint=endpoint,
+        project=snapshot,
+        options=options,
+        return_format=return_format,
+        compile_key=compile_key,
+        timer=timer,
+        t0=t0,
+    )
+    if cached is not None:
+        return cached
+
+    # --- compile, sharing the run with identical in-flight requests ---
+    try:
+        lease = await cancel_on_disconnect(
+            request,
+            _compile_flights.join(
+                compile_key,
+                lambda: _compile_in_new_workdir(snapshot, main_file, options, timer),
+                finalize=_cleanup_shared_compile,
+            ),
+        )
+    except OverloadedError as exc:
+        _log_overloaded(
+            exc,
+            request_id=request_id,
+            endpoint=endpoint,
+            options=options,
+            snapshot=snapshot,
+            timer=timer,
+            t0=t0,
+        )
+        raise
+    except ClientDisconnectedError:
+        _log_disconnected(
+            request_id=request_id,
+            endpoint=endpoint,
+            options=options,
+            snapshot=snapshot,
+            timer=timer,
+            t0=t0,
+        )
+        raise
+
+    result, ticket = lease.result
+    return await _compiled_response(
+        request_id=request_id,
+        endpoint=endpoint,
+        project=snapshot,
+        options=options,
+        return_format=return_format,
+        compile_key=compile_key,
+        result=result,
+        ticket=ticket,
+        shared=lease.shared,
+        on_close=lease.release,
+        timer=timer,
+        t0=t0,
+    )
+
+
+async def _cached_response(
+    *,
+    request_id: str,
+    endpoint: str,
+    project: Project,
+    options: CompileOptions,
+    return_format: str,
+    compile_key: str,
+    timer: PhaseTimer,
+    t0: float,
+) -> Response | None:
+    """
+    The response for a result-cache hit on *compile_key*, if there is one.
+
+    The compile event is logged once the response has been sent.
+    """
+    if not settings.RESULT_CACHE_ENABLED:
+        return None
+    with timer.phase("cache"):
+        cached = await asyncio.to_thread(result_cache.get, compile_key)
+    if cached is None or (return_format != "pdf" and cached.textcount is None):
+        return None
+
+    elapsed_ms = int((time.monotonic() - t0) * 1000)
+
+    def log_event() -> None:
+        log_compile_event(
+            request_id=request_id,
+            endpoint=endpoint,
+            main_file=options.main_file or "main.tex",
+            engine=options.engine,
+            passes=options.passes,
+            passes_run=cached.passes_run,
+            file_count=project.file_count,
+            total_bytes=project.total_bytes,
+            compile_time_ms=elapsed_ms,
+            outcome="success",
+            cache_hit=True,
+            phases=timer.as_dict(),
+        )
+
+    response = _build_success_response(
+        cached, return_format, on_close=_timed_close(timer, None, log_event)
+    )
+    response.headers["X-Cache"] = "HIT"
+    return response
+
+
+def _timed_close(
+    timer: PhaseTimer,
+    on_close: Callable[[], None] | None,
+    log_event: Callable[[], None],
+) -> Callable[[], None]:
+    """
+    ``on_close`` for a success response: records the time from now until the
+    body has been sent as ``pdf`` (reading and encoding the PDF), then calls
+    *on_close* as ``cleanup`` and logs the compile event.
+    """
+    started = time.perf_counter()
+
+    def close() -> None:
+        timer.add("pdf", (time.perf_counter() - started) * 1000)
+        if on_close is not None:
+            with timer.phase("cleanup"):
+                on_close()
+        log_event()
+
+    return close
+
+
+async def _compiled_response(
+    *,
+    request_id: str,
+    endpoint: str,
+    project: Project | Session,
+    options: CompileOptions,
+    return_format: str,
+    compile_key: str | None,
+    result: CompileResult,
+    ticket: AdmissionTicket,
+    shared: bool,
+    on_close: Callable[[], None],
+    timer: PhaseTimer,
+    t0: float,
+) -> Response | JSONResponse:
+    """
+    Cache a finished compile if it succeeded (unless *compile_key* is None),
+    build the response and log the compile event.
+
+    The PDF is streamed from ``result.work_dir``; *on_close* is called once
+    the response no longer needs the work dir, and the event is logged after
+    that so it includes the ``pdf`` and ``cleanup`` phases.
+    """
+    main_file = options.main_file or "main.tex"
+    elapsed_ms = int((time.monotonic() - t0) * 1000)
+    timer.add("queue", ticket.queue_wait_ms)
+    timer.update(result.phases)
+    timer.add_steps(result.steps)
+
+    def log_event() -> None:
+        log_compile_event(
+            request_id=request_id,
+            endpoint=endpoint,
+            main_file=main_file,
+            engine=options.engine,
+            passes=options.passes,
+            passes_run=result.passes_run,
+            file_count=project.file_count,
+            total_bytes=project.total_bytes,
+            compile_time_ms=elapsed_ms,
+            outcome=compile_outcome(result),
+            error_message=result.error_message if not result.success else None,
+            queue_depth=ticket.queue_depth,
+            queue_wait_ms=ticket.queue_wait_ms,
+            shared_compile=shared,
+            steps=[step.model_dump() for step in result.steps],
+            phases=timer.as_dict(),
+        )
+
+    close_now = True
+    try:
+        work_dir = result.work_dir
+        assert work_dir is not None
+
+        textcount: TextCountResponse | None = None
+        if result.success and return_format != "pdf":
+            with timer.phase("texcount"):
+                textcount = await run_in_compile_executor(
+                    collect_textcount, work_dir, main_file
+                )
+
+        # --- build response ---
+        response: Response
+        if result.success and result.pdf_path and result.pdf_path.exists():
+            if settings.RESULT_CACHE_ENABLED and compile_key is not None:
+                with timer.phase("cache"):
+                    await asyncio.to_thread(
+                        _cache_result, compile_key, result, textcount
+                    )
+            # The PDF is streamed from the work dir, which is released once
+            # the response is done with it
+            close_now = False
+            response = _build_success_response(
+                CachedCompile.from_result(result, textcount, read_pdf=False),
+                return_format,
+                on_close=_timed_close(timer, on_close, log_event),
+            )
+        else:
+            response = _build_failure_response(result)
+
+        if settings.RESULT_CACHE_ENABLED and compile_key is not None:
+            response.headers["X-Cache"] = "MISS"
+        return response
+
+    finally:
+        if close_now:
+            with timer.phase("cleanup"):
+                on_close()
+            log_event()
+
+
+def _cache_result(
+    compile_key: str,
+    result: CompileResult,
+    textcount: TextCountResponse | None = None,
+) -> None:
+    """Store a successful compile in the result cache.  Blocking."""
+    result_cache.put(compile_key, CachedCompile.from_result(result, textcount))
+
+
+async def _compile_in_new_workdir(
+    snapshot: Project,
+    main_file: str,
+    options: CompileOptions,
+    timer: PhaseTimer,
+    validate: bool = False,
+) -> tuple[CompileResult, AdmissionTicket]:
+    """
+    Lay out *snapshot* (or a manifest) in a fresh work dir and compile (or
+    validate) it.
+
+    The work dir is recorded on ``result.work_dir`` and removed by
+    `_cleanup_shared_compile` once every request sharing it is done.  Laying
+    it out is timed as the ``write`` phase on *timer*.
+    """
+    work_dir = create_workdir()
+    try:
+        with timer.phase("write"):
+            await asyncio.to_thread(write_project, snapshot, work_dir, main_file)
+        result, ticket = await _compile(work_dir, main_file, options, validate)
+    except BaseException:
+        cleanup_workdir(work_dir)
+        raise
+    result.work_dir = work_dir
+    return result, ticket
+
+
+def _cleanup_shared_compile(shared: tuple[CompileResult, AdmissionTicket]) -> None:
+    result, _ = shared
+    if result.work_dir is not None:
+        cleanup_workdir(result.work_dir)
+
+
+def _targets_error(main_files: list[str], return_format: str) -> str | None:
+    """Why *main_files* cannot be compiled into *return_format*, if they cannot."""
+    if len(main_files) == 1:
+        if return_format not in RETURN_FORMATS:
+            return (
+                f"Unsupported return format: {return_format!r}. "
+                "Must be 'pdf', 'json' or 'multipart'."
+            )
+        return None
+    if len(main_files) > settings.MAX_MAIN_FILES:
+        return f"Too many main files: {len(main_files)} (max {settings.MAX_MAIN_FILES})"
+    if len(set(main_files)) != len(main_files):
+        return "Each main_file may only be given once"
+    if return_format not in ("pdf", *BATCH_RETURN_FORMATS):
+        return (
+            f"Unsupported return format for several main files: {return_format!r}. "
+            "Must be 'zip' (or 'pdf') or 'ndjson'."
+        )
+    return None
+
+
+async def _compile_targets(
+    *,
+    request: Request,
+    endpoint: str,
+    snapshot: ProjectSnapshot,
+    main_files: list[str],
+    options: CompileOptions,
+    return_format: str,
+) -> Response:
+    """
+    Compile several main files of one validated upload, concurrently.
+
+    The project is laid out once; each target compiles in its own linked
+    view of that layout, so their aux files never collide.  Results are
+    streamed as for ``/v2/compile/batch``, with ``id`` the main file without
+    ``.tex``: a zip (``return=pdf`` or ``zip``) or NDJSON.
+    """
+    request_id = _get_request_id(request)
+    timer = get_phase_timer(request)
+    timer.update(snapshot.phases)
+    base_dir = create_workdir()
+    try:
+        with timer.phase("write"):
+            await asyncio.to_thread(write_snapshot, snapshot, base_dir)
+        with timer.phase("digest"):
+            project_digest = await run_in_compile_executor(snapshot.digest)
+    except BaseException:
+        cleanup_workdir(base_dir)
+        raise
+    view = ProjectView(snapshot=snapshot, base_dir=base_dir)
+
+    async def load() -> tuple[Project, str]:
+        return view, project_digest
+
+    async def compile_target(main_file: str) -> _BatchItemResult:
+        return await _compile_batch_item(
+            main_file.removesuffix(".tex"),
+            load,
+            options.model_copy(update={"main_file": main_file}),
+            endpoint=endpoint,
+            request_id=request_id,
+            timer=timer,
+        )
+
+    results = _iter_batch(main_files, compile_target, concurrency=len(main_files))
+    return _batch_response(
+        results,
+        "ndjson" if return_format == "ndjson" else "zip",
+        filename="output.zip",
+        on_close=lambda: cleanup_workdir(base_dir),
+    )
+
+
+# ---------------------------------------------------------------------------
+# POST /v2/compile/sync  —  multi-file compile
+# ---------------------------------------------------------------------------
+
+
+@router.post("/compile/sync")
+async def compile_sync_multifile(
+    request: Request,
+    main_files: list[str] = Form(..., alias="main_file"),
+    files: list[UploadFile] = File(...),
+    engine: str = Form("pdflatex"),
+    passes: int = Form(2),
+    adaptive: bool = Form(False),
+    return_format: str = Form("pdf", alias="return"),
+):
+    """
+    Compile a multi-file LaTeX project uploaded as individual files.
+
+    Each uploaded file's ``filename`` header is the project-relative path
+    (e.g. ``src/main.tex``, ``figures/diagram.png``).  Several ``main_file``
+    fields compile several targets of the one upload (see `_compile_targets`).
+    """
+    request_id = _get_request_id(request)
+    t0 = time.monotonic()
+    _start_timer(request)
+    main_file = ", ".join(main_files)
+
+    # --- engine guard ---
+    if engine != "pdflatex":
+        log_compile_event(
+            request_id=request_id,
+            endpoint="/v2/compile/sync",
+            main_file=main_file,
+            engine=engine,
+            passes=passes,
+            outcome="invalid_input",
+            error_message=f"Unsupported engine: {engine!r}",
+        )
+        return _compile_error_response(
+            422, "invalid_input", f"Unsupported engine: {engine!r}"
+        )
+
+    # --- return format guard ---
+    message = _targets_error(main_files, return_format)
+    if message is not None:
+        log_compile_event(
+            request_id=request_id,
+            endpoint="/v2/compile/sync",
+            main_file=main_file,
+            engine=engine,
+            passes=passes,
+            outcome="invalid_input",
+            error_message=message,
+        )
+        return _compile_error_response(422, "invalid_input", message)
+
+    # --- read + validate uploads ---
+    try:
+        snapshot = await read_multipart_snapshot(files, passes)
+    except (ValidationError, PayloadTooLargeError) as exc:
+        log_compile_event(
+            request_id=request_id,
+            endpoint="/v2/compile/sync",
+            main_file=main_file,
+            engine=engine,
+            passes=passes,
+            file_count=len(files),
+            outcome="invalid_input",
+            error_message=exc.message,
+        )
+        return _validation_error(exc)
+
+    # --- verify every main_file exists ---
+    missing = [path for path in main_files if not snapshot.has_file(path)]
+    if missing:
+        msg = f"main_file '{missing[0]}' was not found among the uploaded files"
+        log_compile_event(
+            request_id=request_id,
+            endpoint="/v2/compile/sync",
+            main_file=main_file,
+            engine=engine,
+            passes=passes,
+            file_count=snapshot.file_count,
+            total_bytes=snapshot.total_bytes,
+            outcome="invalid_input",
+            error_message=msg,
+        )
+        return _compile_error_response(422, "invalid_input", msg)
+
+    options = CompileOptions(
+        engine="pdflatex",
+        passes=passes,
+        main_file=main_files[0],
+        timeout_seconds=settings.TIMEOUT_SECONDS,
+        adaptive=adaptive,
+    )
+    if len(main_files) > 1:
+        return await _compile_targets(
+            request=request,
+            endpoint="/v2/compile/sync",
+            snapshot=snapshot,
+            main_files=main_files,
+            options=options,
+            return_format=return_format,
+        )
+    return await _compile_snapshot(
+        request=request,
+        endpoint="/v2/compile/sync",
+        snapshot=snapshot,
+        main_file=main_files[0],
+        options=options,
+        return_format=return_format,
+        t0=t0,
+    )
+
+
+# ---------------------------------------------------------------------------
+# POST /v2/compile/zip  —  zip compile
+# ---------------------------------------------------------------------------
+
+
+@router.post("/compile/zip")
+async def compile_zip(
+    request: Request,
+    file: UploadFile = File(...),
+    main_files: list[str] = Form(..., alias="main_file"),
+    engine: str = Form("pdflatex"),
+    passes: int = Form(2),
+    adaptive: bool = Form(False),
+    return_format: str = Form("pdf", alias="return"),
+):
+    """
+    Compile a LaTeX project from a zip archive.
+
+    The zip is extracted with full security validation (path traversal,
+    symlinks, size limits).  ``main_file`` is **required** — no auto-detection.
+    Several ``main_file`` fields compile several targets of the one archive
+    (see `_compile_targets`).
+    """
+    request_id = _get_request_id(request)
+    t0 = time.monotonic()
+    timer = _start_timer(request)
+    main_file = ", ".join(main_files)
+
+    # --- engine guard ---
+    if engine != "pdflatex":
+        log_compile_event(
+            request_id=request_id,
+            endpoint="/v2/compile/zip",
+            main_file=main_file,
+            engine=engine,
+            passes=passes,
+            outcome="invalid_input",
+            error_message=f"Unsupported engine: {engine!r}",
+        )
+        return _compile_error_response(
+            422, "invalid_input", f"Unsupported engine: {engine!r}"
+        )
+
+    # --- return format guard ---
+    message = _targets_error(main_files, return_format)
+    if message is not None:
+        log_compile_event(
+            request_id=request_id,
+            endpoint="/v2/compile/zip",
+            main_file=main_file,
+            engine=engine,
+            passes=passes,
+            outcome="invalid_input",
+            error_message=message,
+        )
+        return _compile_error_response(422, "invalid_input", message)
+
+    # --- spool the upload, then read + validate the archive ---
+    try:
+        zip_path = await _spool_zip(file, timer)
+        try:
+            snapshot = await run_in_compile_executor(read_zip_snapshot, zip_path, passes)
+        finally:
+            os.remove(zip_path)
+    except (ValidationError, PayloadTooLargeError) as exc:
+        log_compile_event(
+            request_id=request_id,
+            endpoint="/v2/compile/zip",
+            main_file=main_file,
+            engine=engine,
+            passes=passes,
+            outcome="invalid_input",
+            error_message=exc.message,
+        )
+        return _validation_error(exc)
+
+    # --- verify every main_file exists ---
+    missing = [path for path in main_files if not snapshot.has_file(path)]
+    if missing:
+        msg = f"main_file '{missing[0]}' was not found in the zip archive"
+        log_compile_event(
+            request_id=request_id,
+            endpoint="/v2/compile/zip",
+            main_file=main_file,
+            engine=engine,
+            passes=passes,
+            file_count=snapshot.file_count,
+            total_bytes=snapshot.total_bytes,
+            outcome="invalid_input",
+            error_message=msg,
+        )
+        return _compile_error_response(422, "invalid_input", msg)
+
+    options = CompileOptions(
+        engine="pdflatex",
+        passes=passes,
+        main_file=main_files[0],
+        timeout_seconds=settings.TIMEOUT_SECONDS,
+        adaptive=adaptive,
+    )
+    if len(main_files) > 1:
+        return await _compile_targets(
+            request=request,
+            endpoint="/v2/compile/zip",
+            snapshot=snapshot,
+            main_files=main_files,
+            options=options,
+            return_format=return_format,
+        )
+    return await _compile_snapshot(
+        request=request,
+        endpoint="/v2/compile/zip",
+        snapshot=snapshot,
+        main_file=main_files[0],
+        options=options,
+        return_format=return_format,
+        t0=t0,
+    )
+
+
+# ---------------------------------------------------------------------------
+# POST /v2/compile/stream  —  compile with Server-Sent Events progress
+# ---------------------------------------------------------------------------
+
+
+@router.post("/compile/stream")
+async def compile_stream(
+    request: Request,
+    main_file: str = Form(...),
+    files: list[UploadFile] | None = File(None),
+    file: UploadFile | None = File(None),
+    engine: str = Form("pdflatex"),
+    passes: int = Form(2),
+    adaptive: bool = Form(False),
+):
+    """
+    Compile a project, streaming progress as Server-Sent Events.
+
+    Upload the project as individual ``files`` or as a zip ``file``.  Events:
+    ``accepted``, ``extracted``, ``queued``, then ``step_started`` and
+    ``step_finished`` for every pdflatex/bibtex/biber run, ``texcount``, and
+    finally ``result`` -- the ``/v2/compile/sync`` JSON success body (with
+    ``pdf_base64``) or an error body.  Closing the connection cancels the
+    compile, so a client can give up as soon as a step reports errors.
+    """
+    request_id = _get_request_id(request)
+    t0 = time.monotonic()
+    timer = _start_timer(request)
+
+    message = _project_upload_error(engine, files, file)
+    if message is not None:
+        log_compile_event(
+            request_id=request_id,
+            endpoint="/v2/compile/stream",
+            main_file=main_file,
+            engine=engine,
+            passes=passes,
+            outcome="invalid_input",
+            error_message=message,
+        )
+        return _compile_error_response(422, "invalid_input", message)
+
+    zip_path: Path | None = None
+    if file is not None:
+        try:
+            zip_path = await _spool_zip(file, timer)
+        except PayloadTooLargeError as exc:
+            log_compile_event(
+                request_id=request_id,
+                endpoint="/v2/compile/stream",
+                main_file=main_file,
+                engine=engine,
+                passes=passes,
+                outcome="invalid_input",
+                error_message=exc.message,
+            )
+            return _validation_error(exc)
+
+    options = CompileOptions(
+        engine="pdflatex",
+        passes=passes,
+        main_file=main_file,
+        timeout_seconds=settings.TIMEOUT_SECONDS,
+        adaptive=adaptive,
+    )
+    return EventStreamResponse(
+        _compile_events(
+            request=request,
+            files=files,
+            zip_path=zip_path,
+            options=options,
+            timer=timer,
+            t0=t0,
+        ),
+        on_close=(lambda: zip_path.unlink(missing_ok=True)) if zip_path else None,
+    )
+
+
+async def _compile_events(
+    *,
+    request: Request,
+    files: list[UploadFile] | None,
+    zip_path: Path | None,
+    options: CompileOptions,
+    timer: PhaseTimer,
+    t0: float,
+) -> AsyncIterator[bytes]:
+    """
+    The event stream of `compile_stream`.
+
+    Always compiles with the asyncio pipeline driver, which reports each
+    step as it starts and finishes; the compile is neither served from nor
+    stored in the result cache.
+    """
+    request_id = _get_request_id(request)
+    main_file = options.main_file or "main.tex"
+    snapshot: ProjectSnapshot | None = None
+    result: CompileResult | None = None
+    ticket: AdmissionTicket | None = None
+    work_dir: Path | None = None
+    outcome = "internal"
+    error_message: str | None = None
+
+    try:
+        yield sse_event("accepted", {"request_id": request_id})
+
+        # --- read + validate the upload ---
+        try:
+            if zip_path is not None:
+                snapshot = await run_in_compile_executor(
+                    read_zip_snapshot, zip_path, options.passes
+                )
+            else:
+                assert files is not None
+                snapshot = await read_multipart_snapshot(files, options.passes)
+            timer.update(snapshot.phases)
+            if not snapshot.has_file(main_file):
+                raise ValidationError(
+                    f"main_file '{main_file}' was not found among the uploaded files"
+                )
+        except ValidationError as exc:
+            outcome, error_message = "invalid_input", exc.message
+            body = ErrorResponse(error_type=exc.error_type, message=exc.message)
+            yield sse_event("result", body.model_dump())
+            return
+        yield sse_event(
+            "extracted",
+            {"file_count": snapshot.file_count, "total_bytes": snapshot.total_bytes},
+        )
+
+        # --- compile, reporting each step ---
+        work_dir = create_workdir()
+        with timer.phase("write"):
+            await asyncio.to_thread(write_project, snapshot, work_dir, main_file)
+        try:
+            async with compile_admission.slot() as ticket:
+                timer.add("queue", ticket.queue_wait_ms)
+                yield sse_event("queued", {"queue_wait_ms": ticket.queue_wait_ms})
+                async with aclosing(
+                    compile_project_events(work_dir, main_file, options)
+                ) as events:
+                    while result is None:
+                        event = await anext(events)
+                        if event.kind == "step_started":
+                            yield sse_event("step_started", {"label": event.label})
+                        elif event.kind == "step_finished":
+                            assert event.usage is not None
+                            yield sse_event(
+                                "step_finished",
+                                {
+                                    **event.usage.model_dump(),
+                                    "status": event.status,
+                                    "errors": event.errors,
+                                    "warnings": event.warnings,
+                                },
+                            )
+                        else:
+                            result = event.result
+        except OverloadedError as exc:
+            outcome, error_message = "overloaded", exc.message
+            body = ErrorResponse(error_type="overloaded", message=exc.message)
+            yield sse_event(
+                "result", {**body.model_dump(), "retry_after": exc.retry_after}
+            )
+            return
+        assert result is not None
+        timer.update(result.phases)
+        timer.add_steps(result.steps)
+        outcome = compile_outcome(result)
+        if not result.success or not result.pdf_path or not result.pdf_path.exists():
+            error_message = result.error_message
+            yield sse_event("result", _failure_body(result).model_dump())
+            return
+
+        # --- texcount, then the PDF ---
+        with timer.phase("texcount"):
+            textcount = await run_in_compile_executor(
+                collect_textcount, work_dir, main_file
+            )
+        yield sse_event("texcount", textcount.model_dump())
+        compiled = CachedCompile.from_result(result, textcount, read_pdf=False)
+        with timer.phase("pdf"):
+            async for chunk in sse_pdf_event(
+                "result", _success_metadata(compiled), result.pdf_path
+            ):
+                yield chunk
+
+    except asyncio.CancelledError:
+        # The response is cancelled when the client disconnects; that
+        # cancels the running step, which kills its subprocess
+        outcome, error_message = "cancelled", "client disconnected"
+        raise
+    finally:
+        if work_dir is not None:
+            with timer.phase("cleanup"):
+                cleanup_workdir(work_dir)
+        log_compile_event(
+            request_id=request_id,
+            endpoint="/v2/compile/stream",
+            main_file=main_file,
+            engine=options.engine,
+            passes=options.passes,
+            passes_run=result.passes_run if result else None,
+            file_count=snapshot.file_count if snapshot else 0,
+            total_bytes=snapshot.total_bytes if snapshot else 0,
+            compile_time_ms=int((time.monotonic() - t0) * 1000),
+            outcome=outcome,
+            error_message=error_message,
+            queue_depth=ticket.queue_depth if ticket else 0,
+            queue_wait_ms=ticket.queue_wait_ms if ticket else 0,
+            steps=[step.model_dump() for step in result.steps] if result else None,
+            phases=timer.as_dict(),
+        )
+
+
+# ---------------------------------------------------------------------------
+# POST /v2/blobs/missing, POST /v2/blobs  —  blob store negotiation
+# ---------------------------------------------------------------------------
+
+
+@router.post("/blobs/missing")
+async def blobs_missing(payload: BlobQueryRequest):
+    """
+    Report which blobs of a ``{path: sha256}`` manifest are not stored.
+
+    The client uploads those to ``POST /v2/blobs`` and then compiles the
+    manifest with ``POST /v2/compile/manifest``.
+    """
+    for path, digest in payload.files.items():
+        if not is_blob_digest(digest):
+            return _compile_error_response(
+                422,
+                "invalid_input",
+                f"Digest for {path!r} is not a lowercase hex SHA-256",
+            )
+    missing = await asyncio.to_thread(blob_store.missing, payload.files.values())
+    return BlobQueryResponse(missing=missing)
+
+
+@router.post("/blobs")
+async def upload_blobs(files: list[UploadFile] = File(...)):
+    """
+    Store uploaded files in the blob store, keyed by the SHA-256 of their
+    contents.
+
+    Filenames are not interpreted, except that a filename which is itself a
+    SHA-256 must match the content (catches truncated uploads).
+    """
+    stored: list[StoredBlob] = []
+    total_bytes = 0
+    for upload in files:
+        content = await upload.read()
+        total_bytes += len(content)
+        if total_bytes > settings.MAX_UPLOAD_SIZE:
+            return _compile_error_response(
+                413,
+                "payload_too_large",
+                f"Total upload size exceeds {settings.MAX_UPLOAD_SIZE} bytes",
+            )
+
+        filename = upload.filename or ""
+        digest = await asyncio.to_thread(blob_store.put, content)
+        if is_blob_digest(filename) and digest != filename:
+            return _compile_error_response(
+                422,
+                "invalid_input",
+                f"Content of {filename!r} hashes to {digest}",
+            )
+        stored.append(StoredBlob(filename=filename, sha256=digest, size=len(content)))
+
+    return BlobUploadResponse(stored=stored)
+
+
+# ---------------------------------------------------------------------------
+# POST /v2/compile/manifest  —  compile stored blobs
+# ---------------------------------------------------------------------------
+
+
+@router.post("/compile/manifest")
+async def compile_manifest(payload: ManifestCompileRequest, request: Request):
+    """
+    Compile a project given as a ``{path: sha256}`` manifest of stored blobs.
+
+    Responds 409 (``error_type: "missing_blobs"``, digests in ``errors``) if
+    any blob is not stored; otherwise behaves like ``/v2/compile/sync``.
+    """
+    request_id = _get_request_id(request)
+    t0 = time.monotonic()
+    _start_timer(request)
+    main_file = payload.main_file
+
+    # --- engine guard ---
+    if payload.engine != "pdflatex":
+        log_compile_event(
+            request_id=request_id,
+            endpoint="/v2/compile/manifest",
+            main_file=main_file,
+            engine=payload.engine,
+            passes=payload.passes,
+            outcome="invalid_input",
+            error_message=f"Unsupported engine: {payload.engine!r}",
+        )
+        return _compile_error_response(
+            422, "invalid_input", f"Unsupported engine: {payload.engine!r}"
+        )
+
+    # --- return format guard ---
+    if payload.return_format not in RETURN_FORMATS:
+        return _compile_error_response(
+            422,
+            "invalid_input",
+            f"Unsupported return format: {payload.return_format!r}. "
+            "Must be 'pdf', 'json' or 'multipart'.",
+        )
+
+    # --- validate the manifest against the blob store ---
+    try:
+        manifest = await run_in_compile_executor(
+            read_manifest, payload.files, payload.passes
+        )
+    except (ValidationError, PayloadTooLargeError) as exc:
+        log_compile_event(
+            request_id=request_id,
+            endpoint="/v2/compile/manifest",
+            main_file=main_file,
+            engine=payload.engine,
+            passes=payload.passes,
+            file_count=len(payload.files),
+            outcome="invalid_input",
+            error_message=exc.message,
+        )
+        return _validation_error(exc)
+
+    # --- verify main_file exists ---
+    if not manifest.has_file(main_file):
+        msg = f"main_file '{main_file}' was not found in the manifest"
+        log_compile_event(
+            request_id=request_id,
+            endpoint="/v2/compile/manifest",
+            main_file=main_file,
+            engine=payload.engine,
+            passes=payload.passes,
+            file_count=manifest.file_count,
+            total_bytes=manifest.total_bytes,
+            outcome="invalid_input",
+            error_message=msg,
+        )
+        return _compile_error_response(422, "invalid_input", msg)
+
+    options = CompileOptions(
+        engine="pdflatex",
+        passes=payload.passes,
+        main_file=main_file,
+        timeout_seconds=settings.TIMEOUT_SECONDS,
+        adaptive=payload.adaptive,
+    )
+    try:
+        return await _compile_snapshot(
+            request=request,
+            endpoint="/v2/compile/manifest",
+            snapshot=manifest,
+            main_file=main_file,
+            options=options,
+            return_format=payload.return_format,
+            t0=t0,
+        )
+    except MissingBlobsError as exc:
+        # a blob was evicted between validation and layout
+        return _validation_error(exc)
+
+
+# ---------------------------------------------------------------------------
+# POST /v2/compile/batch  —  many independent documents
+# ---------------------------------------------------------------------------
+
+# Values of the batch ``return`` field
+BATCH_RETURN_FORMATS = ("ndjson", "zip")
+
+# Batch item ids name zip members, so they are kept to a safe alphabet
+_BATCH_ITEM_ID_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]{0,127}")
+
+T = TypeVar("T")
+
+
+@dataclass
+class _BatchItemResult:
+    """A finished batch item: its JSON metadata and, on success, its PDF."""
+
+    metadata: dict
+    pdf: Path | bytes | None = None
+    cleanup: Callable[[], None] | None = None  # releases the PDF's work dir
+
+
+@router.post("/compile/batch")
+async def compile_batch(payload: BatchCompileRequest, request: Request):
+    """
+    Compile many independent documents in one request.
+
+    Each item is inline source (``code``) or a manifest of stored blobs
+    (``files``).  Up to ``concurrency`` items compile at once, and each
+    result is streamed as soon as it is ready, in completion order: one
+    NDJSON line per item, or ``<id>.json`` (and ``<id>.pdf``) members of a
+    zip.  A failed item is reported in its result; it does not fail the
+    batch.
+    """
+    request_id = _get_request_id(request)
+    timer = _start_timer(request)
+
+    rejected = _batch_request_error(payload)
+    if rejected is not None:
+        return rejected
+
+    options = CompileOptions(
+        engine="pdflatex",
+        passes=payload.passes,
+        timeout_seconds=settings.TIMEOUT_SECONDS,
+        adaptive=payload.adaptive,
+    )
+
+    async def compile_item(item: BatchItem) -> _BatchItemResult:
+        return await _compile_batch_item(
+            item.id,
+            lambda: run_in_compile_executor(_load_batch_item, item, payload.passes),
+            options.model_copy(update={"main_file": item.main_file}),
+            endpoint="/v2/compile/batch",
+            request_id=request_id,
+            timer=timer,
+        )
+
+    results = _iter_batch(
+        payload.items,
+        compile_item,
+        concurrency=payload.concurrency or settings.BATCH_MAX_CONCURRENCY,
+    )
+    return _batch_response(results, payload.return_format, filename="batch.zip")
+
+
+def _batch_request_error(payload: BatchCompileRequest) -> JSONResponse | None:
+    """The error response for a batch that cannot start, if any."""
+    rejected = _batch_options_error(
+        payload.engine, payload.return_format, payload.concurrency
+    )
+    if rejected is not None:
+        return rejected
+    if not payload.items:
+        return _compile_error_response(422, "invalid_input", "No items provided")
+    if len(payload.items) > settings.BATCH_MAX_ITEMS:
+        return _compile_error_response(
+            413,
+            "payload_too_large",
+            f"Too many items: {len(payload.items)} (max {settings.BATCH_MAX_ITEMS})",
+        )
+
+    seen: set[str] = set()
+    for item in payload.items:
+        if not _BATCH_ITEM_ID_RE.fullmatch(item.id):
+            return _compile_error_response(
+                422,
+                "invalid_input",
+                f"Invalid item id {item.id!r}: use up to 128 letters, digits, "
+                "'.', '_' and '-'",
+            )
+        if item.id in seen:
+            return _compile_error_response(
+                422, "invalid_input", f"Duplicate item id {item.id!r}"
+            )
+        seen.add(item.id)
+    return None
+
+
+def _batch_options_error(
+    engine: str, return_format: str, concurrency: int | None
+) -> JSONResponse | None:
+    """The error response for batch or merge options that are invalid, if any."""
+    if engine != "pdflatex":
+        return _compile_error_response(
+            422, "invalid_input", f"Unsupported engine: {engine!r}"
+        )
+    if return_format not in BATCH_RETURN_FORMATS:
+        return _compile_error_response(
+            422,
+            "invalid_input",
+            f"Unsupported return format: {return_format!r}. "
+            "Must be 'ndjson' or 'zip'.",
+        )
+    if concurrency is not None and not 1 <= concurrency <= settings.BATCH_MAX_CONCURRENCY:
+        return _compile_error_response(
+            422,
+            "invalid_input",
+            f"concurrency must be between 1 and {settings.BATCH_MAX_CONCURRENCY}",
+        )
+    return None
+
+
+def _load_batch_item(item: BatchItem, passes: int) -> tuple[Project, str]:
+    """Validate one batch item's project; returns it and its digest.  Blocking."""
+    if (item.code is None) == (item.files is None):
+        raise ValidationError("Each item needs either 'code' or 'files'")
+    if item.code is not None:
+        project: Project = read_source_snapshot(item.code, item.main_file, passes)
+    else:
+        assert item.files is not None
+        project = read_manifest(item.files, passes)
+    if not project.has_file(item.main_file):
+        raise ValidationError(
+            f"main_file '{item.main_file}' is not among the item's files"
+        )
+    return project, project.digest()
+
+
+async def _compile_batch_item(
+    item_id: str,
+    load: Callable[[], Awaitable[tuple[Project, str]]],
+    options: CompileOptions,
+    *,
+    endpoint: str,
+    request_id: str,
+    timer: PhaseTimer,
+) -> _BatchItemResult:
+    """
+    Validate, compile and log one batch item or merge variant.  Never
+    raises: failures become error metadata.
+
+    *load* validates the item's project and returns it with its digest.
+    """
+    t0 = time.monotonic()
+    main_file = options.main_file or "main.tex"
+    project: Project | None = None
+    result: CompileResult | None = None
+    ticket: AdmissionTicket | None = None
+    cache_hit = False
+    outcome = "internal"
+    error: ErrorResponse | None = None
+    extra: dict = {}
+
+    try:
+        project, project_digest = await load()
+        compile_key = compile_cache_key(project_digest, options)
+
+        cached = None
+        if settings.RESULT_CACHE_ENABLED:
+            cached = await asyncio.to_thread(result_cache.get, compile_key)
+        if cached is not None:
+            outcome, cache_hit = "success", True
+            pdf = cached.pdf_file if cached.pdf_file is not None else cached.pdf
+            return _BatchItemResult(_batch_success_metadata(item_id, cached), pdf)
+
+        result, ticket = await _compile_in_new_workdir(
+            project, main_file, options, timer
+        )
+        work_dir = result.work_dir
+        assert work_dir is not None
+        outcome = compile_outcome(result)
+        if not result.success or not result.pdf_path or not result.pdf_path.exists():
+            error = _failure_body(result)
+            cleanup_workdir(work_dir)
+            return _BatchItemResult({"id": item_id, **error.model_dump()})
+
+        if settings.RESULT_CACHE_ENABLED:
+            await asyncio.to_thread(_cache_result, compile_key, result)
+        compiled = CachedCompile.from_result(result, read_pdf=False)
+        return _BatchItemResult(
+            _batch_success_metadata(item_id, compiled),
+            result.pdf_path,
+            cleanup=lambda: cleanup_workdir(work_dir),
+        )
+
+    except ValidationError as exc:
+        outcome = "invalid_input"
+        error = ErrorResponse(
+            error_type=exc.error_type,
+            message=exc.message,
+            errors=exc.missing if isinstance(exc, MissingBlobsError) else [],
+        )
+    except OverloadedError as exc:
+        outcome = "overloaded"
+        error = ErrorResponse(error_type="overloaded", message=exc.message)
+        extra = {"retry_after": exc.retry_after}
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    except Exception as exc:
+        logger.exception("Batch item %r failed", item_id)
+        error = ErrorResponse(error_type="internal", message=f"Internal error: {exc}")
+    finally:
+        log_compile_event(
+            request_id=request_id,
+            endpoint=endpoint,
+            main_file=main_file,
+            engine=options.engine,
+            passes=options.passes,
+            passes_run=result.passes_run if result else None,
+            file_count=project.file_count if project else 0,
+            total_bytes=project.total_bytes if project else 0,
+            compile_time_ms=int((time.monotonic() - t0) * 1000),
+            outcome=outcome,
+            error_message=error.message if error else None,
+            queue_depth=ticket.queue_depth if ticket else 0,
+            queue_wait_ms=ticket.queue_wait_ms if ticket else 0,
+            cache_hit=cache_hit,
+            steps=[step.model_dump() for step in result.steps] if result else None,
+        )
+    return _BatchItemResult({"id": item_id, **error.model_dump(), **extra})
+
+
+def _batch_success_metadata(item_id: str, compiled: CachedCompile) -> dict:
+    """Result metadata of a compiled batch item; the log is left out."""
+    return {
+        "id": item_id,
+        "status": "ok",
+        "compile_time_ms": compiled.compile_time_ms,
+        "passes_run": compiled.passes_run,
+        "warnings": compiled.warnings,
+        "steps": [step.model_dump() for step in compiled.steps],
+    }
+
+
+async def _iter_batch(
+    items: list[T],
+    compile_item: Callable[[T], Awaitable[_BatchItemResult]],
+    concurrency: int,
+) -> AsyncIterator[_BatchItemResult]:
+    """
+    Run *compile_item* over *items*, *concurrency* at a time, yielding each
+    result as it finishes.
+
+    A result's work dir is released when the consumer asks for the next
+    one, and a new item only starts once a finished one has been taken, so a
+    slow client holds back the batch rather than filling the disk.  Closing
+    the iterator cancels the items still running.
+    """
+    remaining = iter(items)
+    running: set[asyncio.Future[_BatchItemResult]] = set()
+    finished: list[asyncio.Future[_BatchItemResult]] = []
+    try:
+        while True:
+            while len(running) + len(finished) < concurrency:
+                item = next(remaining, None)
+                if item is None:
+                    break
+                running.add(asyncio.ensure_future(compile_item(item)))
+            if not finished:
+                if not running:
+                    return
+                done, running = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                finished.extend(done)
+
+            result = finished.pop(0).result()
+            try:
+                yield result
+            finally:
+                if result.cleanup is not None:
+                    result.cleanup()
+    finally:
+        for task in running:
+            task.cancel()
+            task.add_done_callback(_cleanup_batch_task)
+        for task in finished:
+            _cleanup_batch_task(task)
+
+
+def _cleanup_batch_task(task: asyncio.Future[_BatchItemResult]) -> None:
+    if task.cancelled() or task.exception() is not None:
+        return
+    cleanup = task.result().cleanup
+    if cleanup is not None:
+        cleanup()
+
+
+def _batch_response(
+    results: AsyncIterator[_BatchItemResult],
+    return_format: str,
+    filename: str,
+    on_close: Callable[[], None] | None = None,
+) -> Response:
+    """Stream batch *results* as NDJSON or as a zip named *filename*."""
+    if return_format == "zip":
+        return ClosingStreamingResponse(
+            _batch_zip_body(results),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+            on_close=on_close,
+        )
+    return ClosingStreamingResponse(
+        _batch_ndjson_body(results),
+        media_type="application/x-ndjson",
+        on_close=on_close,
+    )
+
+
+async def _batch_ndjson_body(
+    results: AsyncIterator[_BatchItemResult],
+) -> AsyncIterator[bytes]:
+    async with aclosing(results):
+        async for result in results:
+            if result.pdf is None:
+                yield ndjson_line(result.metadata)
+            else:
+                async for chunk in ndjson_pdf_line(result.metadata, result.pdf):
+                    yield chunk
+
+
+async def _batch_zip_body(
+    results: AsyncIterator[_BatchItemResult],
+) -> AsyncIterator[bytes]:
+    archive = ZipStream()
+    async with aclosing(results):
+        async for result in results:
+            item_id = result.metadata["id"]
+            if result.pdf is not None:
+                async for chunk in archive.add_pdf(f"{item_id}.pdf", result.pdf):
+                    yield chunk
+            metadata = json.dumps(result.metadata).encode("utf-8")
+            yield await asyncio.to_thread(archive.add, f"{item_id}.json", metadata)
+    yield await asyncio.to_thread(archive.close)
+
+
+# ---------------------------------------------------------------------------
+# POST /v2/compile/merge  —  one template, many sets of variables
+# ---------------------------------------------------------------------------
+
+
+@router.post("/compile/merge")
+async def compile_merge(
+    request: Request,
+    main_file: str = Form(...),
+    variables: str = Form(...),
+    files: list[UploadFile] | None = File(None),
+    file: UploadFile | None = File(None),
+    data_file: str | None = Form(None),
+    engine: str = Form("pdflatex"),
+    passes: int = Form(2),
+    adaptive: bool = Form(False),
+    concurrency: int | None = Form(None),
+    return_format: str = Form("ndjson", alias="return"),
+):
+    """
+    Compile one template project once per variable map (mail merge).
+
+    Upload the template as individual ``files`` or as a zip ``file``.
+    ``variables`` is a JSON array of ``{name: value}`` objects; each becomes
+    ``\\def`` macros after ``\\begin{document}`` of the main file, or in
+    ``data_file`` for the template to ``\\input``.  The upload is validated,
+    scanned and laid out once, the preamble format is dumped once, and each
+    variant compiles in a hardlinked view of that layout.  Results stream
+    back as for ``/v2/compile/batch``, with the variant's index as ``id``.
+    """
+    request_id = _get_request_id(request)
+    t0 = time.monotonic()
+    timer = _start_timer(request)
+
+    def reject(response: JSONResponse, message: str) -> JSONResponse:
+        log_compile_event(
+            request_id=request_id,
+            endpoint="/v2/compile/merge",
+            main_file=main_file,
+            engine=engine,
+            passes=passes,
+            compile_time_ms=int((time.monotonic() - t0) * 1000),
+            outcome="invalid_input",
+            error_message=message,
+        )
+        return response
+
+    message = _project_upload_error(engine, files, file)
+    if message is not None:
+        return reject(_compile_error_response(422, "invalid_input", message), message)
+    rejected = _batch_options_error(engine, return_format, concurrency)
+    if rejected is not None:
+        return rejected
+
+    # --- read, validate and lay out the template once ---
+    base_dir = create_workdir()
+    try:
+        variable_maps = parse_merge_variables(variables)
+        if file is not None:
+            zip_path = await _spool_zip(file, timer)
+            try:
+                snapshot = await run_in_compile_executor(
+                    read_zip_snapshot, zip_path, passes
+                )
+            finally:
+                zip_path.unlink(missing_ok=True)
+        else:
+            assert files is not None
+            snapshot = await read_multipart_snapshot(files, passes)
+        template = await asyncio.to_thread(
+            read_merge_template, snapshot, main_file, data_file, base_dir
+        )
+        timer.update(snapshot.phases)
+    except ValidationError as exc:
+        cleanup_workdir(base_dir)
+        return reject(_validation_error(exc), exc.message)
+    except BaseException:
+        cleanup_workdir(base_dir)
+        raise
+
+    options = CompileOptions(
+        engine="pdflatex",
+        passes=passes,
+        main_file=template.main_file,
+        timeout_seconds=settings.TIMEOUT_SECONDS,
+        adaptive=adaptive,
+    )
+
+    async def compile_variant(index: int) -> _BatchItemResult:
+        return await _compile_batch_item(
+            str(index),
+            lambda: asyncio.to_thread(
+                _load_merge_variant, template, variable_maps[index]
+            ),
+            options,
+            endpoint="/v2/compile/merge",
+            request_id=request_id,
+            timer=timer,
+        )
+
+    results = _merge_results(
+        template,
+        options,
+        compile_variant,
+        concurrency=concurrency or settings.BATCH_MAX_CONCURRENCY,
+        count=len(variable_maps),
+    )
+    return _batch_response(
+        results,
+        return_format,
+        filename="merge.zip",
+        on_close=lambda: cleanup_workdir(base_dir),
+    )
+
 
-logger = logging.getLogger(__name__)
+def _load_merge_variant(
+    template: MergeTemplate, variables: dict[str, str]
+) -> tuple[Project, str]:
+    """One variant of *template*, and its digest.  Blocking."""
+    variant = template.variant(variables)
+    return variant, variant.digest()
 
-router = APIRouter(prefix="/v2")
+
+async def _merge_results(
+    template: MergeTemplate,
+    options: CompileOptions,
+    compile_variant: Callable[[int], Awaitable[_BatchItemResult]],
+    *,
+    concurrency: int,
+    count: int,
+) -> AsyncIterator[_BatchItemResult]:
+    """
+    The results of `compile_merge`: the template's preamble format first,
+    so the variants all install it instead of each dumping their own.
+    """
+    if settings.FORMAT_CACHE_ENABLED:
+        try:
+            async with compile_admission.slot():
+                await run_cancellable_in_compile_executor(
+                    prepare_format, template.base_dir, template.main_file, options
+                )
+        except OverloadedError:
+            pass  # the variants queue on their own and report it
+    async with aclosing(
+        _iter_batch(list(range(count)), compile_variant, concurrency)
+    ) as results:
+        async for result in results:
+            yield result
 
 
 # ---------------------------------------------------------------------------
-# helpers
+# /v2/sessions  —  persistent sessions with warm work dirs
 # ---------------------------------------------------------------------------
 
 
-def _get_request_id(request: Request) -> str:
-    return getattr(request.state, "request_id", "unknown")
-
-
-def _compile_error_response(
-    status_code: int,
-    error_type: str,
-    message: str,
-    errors: list[str] | None = None,
-    warnings: list[str] | None = None,
-    log: str = "",
-    log_truncated: bool = False,
-) -> JSONResponse:
-    """Return a standardized JSON error response."""
-    body = ErrorResponse(
-        error_type=error_type,
-        message=message,
-        errors=errors or [],
-        warnings=warnings or [],
-        log=log,
-        log_truncated=log_truncated,
+def _session_response(session: Session, status_code: int = 200) -> JSONResponse:
+    body = SessionResponse(
+        session_id=session.session_id,
+        files=session.file_digests(),
+        file_count=session.file_count,
+        total_bytes=session.total_bytes,
+        ttl_seconds=settings.SESSION_TTL_SECONDS,
     )
     return JSONResponse(status_code=status_code, content=body.model_dump())
 
 
-def _validation_error(exc: ValidationError) -> JSONResponse:
-    """Map a ValidationError to the correct HTTP status + body."""
-    if isinstance(exc, PayloadTooLargeError):
-        return _compile_error_response(413, exc.error_type, exc.message)
-    return _compile_error_response(422, exc.error_type, exc.message)
+def _session_not_found(exc: SessionNotFoundError) -> JSONResponse:
+    return _compile_error_response(404, "not_found", str(exc))
 
 
-def _build_compile_response(
-    result: CompileResult,
-    return_format: str,
-    textcount: TextCountResponse | None = None,
-) -> Response | JSONResponse:
+@router.post("/sessions")
+async def create_session(
+    request: Request, files: list[UploadFile] | None = File(None)
+):
     """
-    Build the HTTP response from a CompileResult.
+    Create a session, optionally uploading its initial files.
 
-    On success returns PDF (binary or base64-in-JSON).
-    On failure returns a standardized error response.
+    The session's work dir, including the auxiliary files of each compile,
+    is kept until the session is deleted, expires or is evicted.
     """
-    if result.success and result.pdf_path and result.pdf_path.exists():
-        if return_format == "json":
-            pdf_b64 = base64.b64encode(result.pdf_path.read_bytes()).decode("ascii")
-            if textcount is None:
-                textcount = TextCountResponse(
-                    status="error", message="textcount was not collected"
-                )
-            return JSONResponse(
-                content={
-                    "status": "ok",
-                    "pdf_base64": pdf_b64,
-                    "compile_time_ms": result.compile_time_ms,
-                    "errors": result.errors,
-                    "warnings": result.warnings,
-                    "log": result.log,
-                    "log_truncated": result.log_truncated,
-                    "textcount": textcount.model_dump(),
-                }
-            )
+    timer = _start_timer(request)
+    snapshot = None
+    if files:
+        try:
+            snapshot = await read_multipart_snapshot(files, passes=1)
+        except (ValidationError, PayloadTooLargeError) as exc:
+            return _validation_error(exc)
+        timer.update(snapshot.phases)
 
-        # default: return raw PDF
-        pdf_bytes = result.pdf_path.read_bytes()
-        return Response(
-            content=pdf_bytes,
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": 'attachment; filename="output.pdf"',
-                "X-Compile-Time-Ms": str(result.compile_time_ms),
-            },
-        )
-
-    # compile failed
-    error_type = (
-        "timeout"
-        if "timed out" in (result.error_message or "")
-        else "latex_compile_error"
-    )
-    return _compile_error_response(
-        400,
-        error_type,
-        result.error_message or "Compilation failed",
-        errors=result.errors,
-        warnings=result.warnings,
-        log=result.log,
-        log_truncated=result.log_truncated,
-    )
+    session = await asyncio.to_thread(session_store.create)
+    if snapshot is not None:
+        with timer.phase("write"):
+            await asyncio.to_thread(session.write_files, snapshot)
+    return _session_response(session, status_code=201)
 
 
-# ---------------------------------------------------------------------------
-# POST /v2/compile/sync  —  multi-file compile
-# ---------------------------------------------------------------------------
+@router.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    """List the source files of a session."""
+    try:
+        handle = await session_store.open(session_id)
+    except SessionNotFoundError as exc:
+        return _session_not_found(exc)
+    handle.release()
+    return _session_response(handle.session)
 
 
-@router.post("/compile/sync")
-async def compile_sync_multifile(
+@router.patch("/sessions/{session_id}/files")
+async def update_session_files(
+    request: Request, session_id: str, files: list[UploadFile] = File(...)
+):
+    """Add or replace files; each upload's ``filename`` is its project path."""
+    timer = _start_timer(request)
+    try:
+        snapshot = await read_multipart_snapshot(files, passes=1)
+    except (ValidationError, PayloadTooLargeError) as exc:
+        return _validation_error(exc)
+    timer.update(snapshot.phases)
+
+    try:
+        handle = await session_store.open(session_id)
+    except SessionNotFoundError as exc:
+        return _session_not_found(exc)
+    try:
+        with timer.phase("write"):
+            await asyncio.to_thread(handle.session.write_files, snapshot)
+    except PayloadTooLargeError as exc:
+        return _validation_error(exc)
+    finally:
+        handle.release()
+    session_store.schedule_sweep()
+    return _session_response(handle.session)
+
+
+@router.delete("/sessions/{session_id}/files/{path:path}")
+async def delete_session_file(session_id: str, path: str):
+    """Remove one source file from a session."""
+    try:
+        handle = await session_store.open(session_id)
+    except SessionNotFoundError as exc:
+        return _session_not_found(exc)
+    try:
+        await asyncio.to_thread(handle.session.delete_file, path)
+    except ValidationError as exc:
+        return _validation_error(exc)
+    except KeyError:
+        return _compile_error_response(
+            404, "not_found", f"File {path!r} is not in the session"
+        )
+    finally:
+        handle.release()
+    return _session_response(handle.session)
+
+
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Remove a session and its work dir."""
+    try:
+        handle = await session_store.open(session_id)
+    except SessionNotFoundError as exc:
+        return _session_not_found(exc)
+    await asyncio.to_thread(session_store.delete, handle)
+    return Response(status_code=204)
+
+
+@router.post("/sessions/{session_id}/compile")
+async def compile_session(
     request: Request,
+    session_id: str,
     main_file: str = Form(...),
-    files: list[UploadFile] = File(...),
     engine: str = Form("pdflatex"),
     passes: int = Form(2),
+    adaptive: bool = Form(True),
     return_format: str = Form("pdf", alias="return"),
 ):
     """
-    Compile a multi-file LaTeX project uploaded as individual files.
+    Compile the session's files in its persistent work dir.
 
-    Each uploaded file's ``filename`` header is the project-relative path
-    (e.g. ``src/main.tex``, ``figures/diagram.png``).
+    Auxiliary files of the previous compile are reused, so ``adaptive``
+    defaults to true here: passes stop as soon as they converge, which after
+    a small edit is usually the first one.  Responses are the same as for
+    ``/v2/compile/sync``.
     """
     request_id = _get_request_id(request)
     t0 = time.monotonic()
+    timer = _start_timer(request)
+    endpoint = "/v2/sessions/{session_id}/compile"
 
     # --- engine guard ---
     if engine != "pdflatex":
         log_compile_event(
             request_id=request_id,
-            endpoint="/v2/compile/sync",
+            endpoint=endpoint,
             main_file=main_file,
             engine=engine,
             passes=passes,
@@ -178,252 +2001,270 @@ async def compile_sync_multifile(
         )
 
     # --- return format guard ---
-    if return_format not in ("pdf", "json"):
+    if return_format not in RETURN_FORMATS:
         return _compile_error_response(
             422,
             "invalid_input",
-            f"Unsupported return format: {return_format!r}. Must be 'pdf' or 'json'.",
+            f"Unsupported return format: {return_format!r}. "
+            "Must be 'pdf', 'json' or 'multipart'.",
         )
 
-    work_dir = create_workdir()
+    # --- validate passes ---
+    try:
+        validate_limits(file_count=0, total_bytes=0, passes=passes)
+    except ValidationError as exc:
+        return _validation_error(exc)
 
     try:
-        # --- populate work dir from uploads ---
-        try:
-            meta = await build_workdir_from_multipart(files, work_dir, passes)
-        except (ValidationError, PayloadTooLargeError) as exc:
-            log_compile_event(
-                request_id=request_id,
-                endpoint="/v2/compile/sync",
-                main_file=main_file,
-                engine=engine,
-                passes=passes,
-                file_count=len(files),
-                outcome="invalid_input",
-                error_message=exc.message,
-            )
-            return _validation_error(exc)
+        handle = await session_store.open(session_id)
+    except SessionNotFoundError as exc:
+        return _session_not_found(exc)
+
+    # The session stays locked until the response has been sent
+    try:
+        session = handle.session
 
         # --- verify main_file exists ---
-        if not (work_dir / main_file).exists():
-            msg = f"main_file '{main_file}' was not found among the uploaded files"
+        if not session.has_file(main_file):
+            msg = f"main_file '{main_file}' was not found in the session"
             log_compile_event(
                 request_id=request_id,
-                endpoint="/v2/compile/sync",
+                endpoint=endpoint,
                 main_file=main_file,
                 engine=engine,
                 passes=passes,
-                file_count=meta.get("file_count", len(files)),
-                total_bytes=meta.get("total_bytes", 0),
+                file_count=session.file_count,
+                total_bytes=session.total_bytes,
                 outcome="invalid_input",
                 error_message=msg,
             )
+            handle.release()
             return _compile_error_response(422, "invalid_input", msg)
 
-        # --- compile ---
         options = CompileOptions(
             engine="pdflatex",
             passes=passes,
             main_file=main_file,
             timeout_seconds=settings.TIMEOUT_SECONDS,
+            adaptive=adaptive,
         )
-        result = compile_project(work_dir, main_file, options)
-        elapsed_ms = int((time.monotonic() - t0) * 1000)
-
-        # --- log compile event ---
-        outcome = (
-            "success"
-            if result.success
-            else (
-                "timeout"
-                if "timed out" in (result.error_message or "")
-                else "compile_error"
+        # No result cache: the output also depends on the aux files of
+        # earlier compiles, and a compile has to refresh them
+        try:
+            result, ticket = await cancel_on_disconnect(
+                request, _compile(session.work_dir, main_file, options)
             )
-        )
-        log_compile_event(
-            request_id=request_id,
-            endpoint="/v2/compile/sync",
-            main_file=main_file,
-            engine=engine,
-            passes=passes,
-            file_count=meta.get("file_count", len(files)),
-            total_bytes=meta.get("total_bytes", 0),
-            compile_time_ms=elapsed_ms,
-            outcome=outcome,
-            error_message=result.error_message if not result.success else None,
-        )
-
-        textcount: TextCountResponse | None = None
-        if result.success and return_format == "json":
-            textcount = collect_textcount(work_dir, main_file)
-
-        # --- build response ---
-        return _build_compile_response(result, return_format, textcount=textcount)
+        except OverloadedError as exc:
+            _log_overloaded(
+                exc,
+                request_id=request_id,
+                endpoint=endpoint,
+                options=options,
+                snapshot=session,
+                timer=timer,
+                t0=t0,
+            )
+            raise
+        except ClientDisconnectedError:
+            _log_disconnected(
+                request_id=request_id,
+                endpoint=endpoint,
+                options=options,
+                snapshot=session,
+                timer=timer,
+                t0=t0,
+            )
+            raise
+    except BaseException:
+        handle.release()
+        raise
 
-    finally:
-        cleanup_workdir(work_dir)
+    def release() -> None:
+        handle.release()
+        session_store.schedule_sweep()  # the work dir may have grown
+
+    result.work_dir = session.work_dir
+    return await _compiled_response(
+        request_id=request_id,
+        endpoint=endpoint,
+        project=session,
+        options=options,
+        return_format=return_format,
+        compile_key=None,
+        result=result,
+        ticket=ticket,
+        shared=False,
+        on_close=release,
+        timer=timer,
+        t0=t0,
+    )
 
 
 # ---------------------------------------------------------------------------
-# POST /v2/compile/zip  —  zip compile
+# /v2/jobs  —  asynchronous compile jobs
 # ---------------------------------------------------------------------------
 
 
-@router.post("/compile/zip")
-async def compile_zip(
+def _job_response(
+    state: JobResponse, status_code: int = 200, headers: dict | None = None
+) -> JSONResponse:
+    url = f"/v2/jobs/{state.job_id}"
+    if state.status == "succeeded":
+        state.pdf_url = f"{url}/pdf"
+    if state.status in FINISHED_STATUSES:
+        state.log_url = f"{url}/log"
+    return JSONResponse(
+        status_code=status_code, content=state.model_dump(), headers=headers
+    )
+
+
+def _job_not_found(exc: JobNotFoundError) -> JSONResponse:
+    return _compile_error_response(404, "not_found", str(exc))
+
+
+def _job_not_finished(state: JobResponse) -> JSONResponse:
+    return _compile_error_response(
+        409, "job_not_finished", f"Job {state.job_id!r} is {state.status}"
+    )
+
+
+@router.post("/jobs")
+async def create_job(
     request: Request,
-    file: UploadFile = File(...),
     main_file: str = Form(...),
+    files: list[UploadFile] | None = File(None),
+    file: UploadFile | None = File(None),
     engine: str = Form("pdflatex"),
     passes: int = Form(2),
-    return_format: str = Form("pdf", alias="return"),
+    adaptive: bool = Form(False),
 ):
     """
-    Compile a LaTeX project from a zip archive.
+    Queue a compile and return its job id at once (202).
 
-    The zip is extracted with full security validation (path traversal,
-    symlinks, size limits).  ``main_file`` is **required** — no auto-detection.
+    Upload the project either as individual ``files`` (as for
+    ``/v2/compile/sync``) or as a zip ``file`` (as for ``/v2/compile/zip``).
+    Poll ``GET /v2/jobs/{id}`` until the job has finished, then fetch its
+    PDF and log.
     """
     request_id = _get_request_id(request)
-    t0 = time.monotonic()
+    timer = _start_timer(request)
+    metadata = {"file_count": len(files or ()), "total_bytes": 0}
 
-    # --- engine guard ---
-    if engine != "pdflatex":
+    def log_rejected(outcome: str, message: str, **extra) -> None:
         log_compile_event(
             request_id=request_id,
-            endpoint="/v2/compile/zip",
+            endpoint="/v2/jobs",
             main_file=main_file,
             engine=engine,
             passes=passes,
-            outcome="invalid_input",
-            error_message=f"Unsupported engine: {engine!r}",
-        )
-        return _compile_error_response(
-            422, "invalid_input", f"Unsupported engine: {engine!r}"
-        )
-
-    # --- return format guard ---
-    if return_format not in ("pdf", "json"):
-        return _compile_error_response(
-            422,
-            "invalid_input",
-            f"Unsupported return format: {return_format!r}. Must be 'pdf' or 'json'.",
+            file_count=metadata["file_count"],
+            total_bytes=metadata["total_bytes"],
+            outcome=outcome,
+            error_message=message,
+            phases=timer.as_dict(),
+            **extra,
         )
 
-    # --- stream upload to a temp file, enforcing size ---
-    tmp_zip_fd, tmp_zip_path_str = tempfile.mkstemp(suffix=".zip")
-    tmp_zip_path = Path(tmp_zip_path_str)
-    total_uploaded = 0
-
-    try:
-        with os.fdopen(tmp_zip_fd, "wb") as f:
-            while True:
-                chunk = await file.read(1024 * 1024)
-                if not chunk:
-                    break
-                total_uploaded += len(chunk)
-                if total_uploaded > settings.MAX_UPLOAD_SIZE:
-                    log_compile_event(
-                        request_id=request_id,
-                        endpoint="/v2/compile/zip",
-                        main_file=main_file,
-                        engine=engine,
-                        passes=passes,
-                        total_bytes=total_uploaded,
-                        outcome="invalid_input",
-                        error_message="Uploaded zip exceeds size limit",
-                    )
-                    return _compile_error_response(
-                        413,
-                        "payload_too_large",
-                        f"Uploaded zip exceeds {settings.MAX_UPLOAD_SIZE} bytes",
-                    )
-                f.write(chunk)
-    except Exception:
-        # If streaming failed, clean up temp file
-        if tmp_zip_path.exists():
-            os.remove(tmp_zip_path)
-        raise
-
-    work_dir = create_workdir()
+    # --- engine / upload guards ---
+    message = _project_upload_error(engine, files, file)
+    if message is not None:
+        log_rejected("invalid_input", message)
+        return _compile_error_response(422, "invalid_input", message)
 
+    # --- lay out the work dir and queue the job ---
+    job = await asyncio.to_thread(job_store.create, main_file)
     try:
-        # --- extract zip into work dir ---
-        try:
-            meta = build_workdir_from_zip(tmp_zip_path, work_dir, passes)
-        except (ValidationError, PayloadTooLargeError) as exc:
-            log_compile_event(
-                request_id=request_id,
-                endpoint="/v2/compile/zip",
-                main_file=main_file,
-                engine=engine,
-                passes=passes,
-                total_bytes=total_uploaded,
-                outcome="invalid_input",
-                error_message=exc.message,
-            )
-            return _validation_error(exc)
-
-        # --- verify main_file exists ---
-        if not (work_dir / main_file).exists():
-            msg = f"main_file '{main_file}' was not found in the zip archive"
-            log_compile_event(
-                request_id=request_id,
-                endpoint="/v2/compile/zip",
-                main_file=main_file,
-                engine=engine,
-                passes=passes,
-                file_count=meta.get("file_count", 0),
-                total_bytes=meta.get("total_bytes", 0),
-                outcome="invalid_input",
-                error_message=msg,
+        if file is not None:
+            zip_path = await _spool_zip(file, timer)
+            try:
+                metadata = await run_in_compile_executor(
+                    build_workdir_from_zip, zip_path, job.work_dir, passes
+                )
+            finally:
+                os.remove(zip_path)
+        else:
+            metadata = await build_workdir_from_multipart(files, job.work_dir, passes)
+        timer.update(metadata["phases"])
+
+        if not (job.work_dir / validate_file_path(main_file)).is_file():
+            raise ValidationError(
+                f"main_file '{main_file}' was not found among the uploaded files"
             )
-            return _compile_error_response(422, "invalid_input", msg)
 
-        # --- compile ---
         options = CompileOptions(
             engine="pdflatex",
             passes=passes,
             main_file=main_file,
             timeout_seconds=settings.TIMEOUT_SECONDS,
+            adaptive=adaptive,
         )
-        result = compile_project(work_dir, main_file, options)
-        elapsed_ms = int((time.monotonic() - t0) * 1000)
-
-        # --- log compile event ---
-        outcome = (
-            "success"
-            if result.success
-            else (
-                "timeout"
-                if "timed out" in (result.error_message or "")
-                else "compile_error"
-            )
-        )
-        log_compile_event(
+        job_store.submit(
+            job,
+            options,
             request_id=request_id,
-            endpoint="/v2/compile/zip",
-            main_file=main_file,
-            engine=engine,
-            passes=passes,
-            file_count=meta.get("file_count", 0),
-            total_bytes=meta.get("total_bytes", 0),
-            compile_time_ms=elapsed_ms,
-            outcome=outcome,
-            error_message=result.error_message if not result.success else None,
+            file_count=metadata["file_count"],
+            total_bytes=metadata["total_bytes"],
         )
+    except ValidationError as exc:
+        await asyncio.to_thread(job_store.delete, job)
+        log_rejected("invalid_input", exc.message)
+        return _validation_error(exc)
+    except OverloadedError as exc:
+        await asyncio.to_thread(job_store.delete, job)
+        log_rejected("overloaded", exc.message, queue_depth=exc.queue_depth)
+        raise
+    except BaseException:
+        await asyncio.to_thread(job_store.delete, job)
+        raise
 
-        textcount: TextCountResponse | None = None
-        if result.success and return_format == "json":
-            textcount = collect_textcount(work_dir, main_file)
+    _, state = await asyncio.to_thread(job_store.get, job.job_id)
+    return _job_response(
+        state, status_code=202, headers={"Location": f"/v2/jobs/{job.job_id}"}
+    )
 
-        # --- build response ---
-        return _build_compile_response(result, return_format, textcount=textcount)
 
-    finally:
-        cleanup_workdir(work_dir)
-        if tmp_zip_path.exists():
-            os.remove(tmp_zip_path)
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status of a job; ``pdf_url`` and ``log_url`` are set once available."""
+    try:
+        _, state = await asyncio.to_thread(job_store.get, job_id)
+    except JobNotFoundError as exc:
+        return _job_not_found(exc)
+    return _job_response(state)
+
+
+@router.get("/jobs/{job_id}/pdf")
+async def get_job_pdf(job_id: str):
+    """The PDF of a succeeded job; 409 while the job has not finished."""
+    try:
+        job, state = await asyncio.to_thread(job_store.get, job_id)
+    except JobNotFoundError as exc:
+        return _job_not_found(exc)
+    if state.status not in FINISHED_STATUSES:
+        return _job_not_finished(state)
+    if state.status == "failed" or not job.pdf_path.is_file():
+        return _compile_error_response(
+            404, "not_found", f"Job {job_id!r} failed and has no PDF"
+        )
+    return PdfFileResponse(
+        job.pdf_path, headers=_pdf_headers(state.compile_time_ms, state.passes_run)
+    )
+
+
+@router.get("/jobs/{job_id}/log")
+async def get_job_log(job_id: str):
+    """The full compile log of a finished job, as text."""
+    try:
+        job, state = await asyncio.to_thread(job_store.get, job_id)
+    except JobNotFoundError as exc:
+        return _job_not_found(exc)
+    if state.status not in FINISHED_STATUSES:
+        return _job_not_finished(state)
+    try:
+        log = await asyncio.to_thread(job.log_path.read_text, encoding="utf-8")
+    except FileNotFoundError:
+        log = ""  # failed before TeX ran
+    return PlainTextResponse(log)
 
 
 # ---------------------------------------------------------------------------
@@ -439,10 +2280,13 @@ async def validate_compile(payload: ValidateRequest, request: Request):
     """
     Validate whether LaTeX code compiles, without returning a PDF.
 
-    Accepts a JSON body and returns structured diagnostics.
+    Accepts a JSON body and returns structured diagnostics.  Obviously broken
+    input is rejected by the pre-lint; anything else gets one pdflatex pass
+    in draft mode.  ``stage`` in the response says which one decided.
     """
     request_id = _get_request_id(request)
     t0 = time.monotonic()
+    timer = _start_timer(request)
 
     code = payload.code or ""
     if not code.strip():
@@ -497,7 +2341,8 @@ async def validate_compile(payload: ValidateRequest, request: Request):
 
     # --- macro scan ---
     try:
-        scan_dangerous_macros(code_bytes, "main.tex")
+        with timer.phase("scan"):
+            scan_dangerous_macros(code_bytes, "main.tex")
     except ValidationError as exc:
         log_compile_event(
             request_id=request_id,
@@ -511,51 +2356,96 @@ async def validate_compile(payload: ValidateRequest, request: Request):
         )
         return _validation_error(exc)
 
-    work_dir = create_workdir()
-
-    try:
-        safe_write_file(work_dir, "main.tex", code_bytes)
-
+    # --- pre-lint: obviously broken input never touches the disk ---
+    with timer.phase("prelint"):
+        result = prelint_source(code) if payload.prelint else None
+    lease = None
+    if result is not None:
+        stage = "prelint"
+        ticket = AdmissionTicket(queue_depth=0, queue_wait_ms=0)
+    else:
+        stage = "pdflatex"
+        snapshot = ProjectSnapshot(
+            files={"main.tex": code_bytes}, file_count=1, total_bytes=len(code_bytes)
+        )
         options = CompileOptions(
             engine=payload.engine,
             passes=payload.passes,
             main_file="main.tex",
             timeout_seconds=settings.TIMEOUT_SECONDS,
+            draft=True,
         )
-        result = compile_project(work_dir, "main.tex", options)
-        elapsed_ms = int((time.monotonic() - t0) * 1000)
-
-        # --- log compile event ---
-        outcome = (
-            "success"
-            if result.success
-            else (
-                "timeout"
-                if "timed out" in (result.error_message or "")
-                else "compile_error"
+        with timer.phase("digest"):
+            project_digest = await run_in_compile_executor(snapshot.digest)
+        # Identical concurrent validations share one pdflatex run
+        try:
+            lease = await cancel_on_disconnect(
+                request,
+                _compile_flights.join(
+                    "validate:" + compile_cache_key(project_digest, options),
+                    lambda: _compile_in_new_workdir(
+                        snapshot, "main.tex", options, timer, validate=True
+                    ),
+                    finalize=_cleanup_shared_compile,
+                ),
             )
-        )
-        log_compile_event(
-            request_id=request_id,
-            endpoint="/v2/compile/validate",
-            main_file="main.tex",
-            engine=payload.engine,
-            passes=payload.passes,
-            file_count=1,
-            total_bytes=len(code_bytes),
-            compile_time_ms=elapsed_ms,
-            outcome=outcome,
-            error_message=result.error_message if not result.success else None,
-        )
-
-        return ValidateResponse(
-            compilable=result.success,
-            errors=result.errors,
-            warnings=result.warnings,
-            log=result.log,
-            log_truncated=result.log_truncated,
-            compile_time_ms=result.compile_time_ms,
-        )
+        except OverloadedError as exc:
+            _log_overloaded(
+                exc,
+                request_id=request_id,
+                endpoint="/v2/compile/validate",
+                options=options,
+                snapshot=snapshot,
+                timer=timer,
+                t0=t0,
+            )
+            raise
+        except ClientDisconnectedError:
+            _log_disconnected(
+                request_id=request_id,
+                endpoint="/v2/compile/validate",
+                options=options,
+                snapshot=snapshot,
+                timer=timer,
+                t0=t0,
+            )
+            raise
+        result, ticket = lease.result
+        timer.add("queue", ticket.queue_wait_ms)
+        timer.add_steps(result.steps)
+
+    elapsed_ms = int((time.monotonic() - t0) * 1000)
+    if lease is not None:
+        with timer.phase("cleanup"):
+            lease.release()
+
+    # --- log compile event ---
+    log_compile_event(
+        request_id=request_id,
+        endpoint="/v2/compile/validate",
+        main_file="main.tex",
+        engine=payload.engine,
+        passes=payload.passes,
+        passes_run=result.passes_run,
+        file_count=1,
+        total_bytes=len(code_bytes),
+        compile_time_ms=elapsed_ms,
+        outcome=compile_outcome(result),
+        error_message=result.error_message if not result.success else None,
+        queue_depth=ticket.queue_depth,
+        queue_wait_ms=ticket.queue_wait_ms,
+        shared_compile=lease.shared if lease is not None else False,
+        steps=[step.model_dump() for step in result.steps],
+        phases=timer.as_dict(),
+    )
 
-    finally:
-        cleanup_workdir(work_dir)
+    return ValidateResponse(
+        compilable=result.success,
+        errors=result.errors,
+        warnings=result.warnings,
+        log=result.log,
+        log_truncated=result.log_truncated,
+        compile_time_ms=result.compile_time_ms,
+        stage=stage,
+        steps=result.steps,
+    )
@@ -1,3 +1,5 @@
+from typing import Literal, Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -22,8 +24,75 @@ class Settings(BaseSettings):
     MAX_UPLOAD_SIZE: int = 20 * 1024 * 1024  # 20 MB (bumped from 10 MB for v2)
     MAX_FILE_COUNT: int = 500
     MAX_PASSES: int = 5
+    MAX_MAIN_FILES: int = 8  # main files compiled from one upload
     MAX_LOG_SIZE: int = 64 * 1024  # 64 KB
     MAX_PATH_LENGTH: int = 300
 
+    # Per-process limits for pdflatex, bibtex, biber and texcount (0 = off)
+    COMPILE_MEMORY_LIMIT_BYTES: int = 1024 * 1024 * 1024  # 1 GB address space
+    COMPILE_CPU_LIMIT_SECONDS: int = 60
+    COMPILE_FILE_SIZE_LIMIT_BYTES: int = 256 * 1024 * 1024  # 256 MB per file
+    COMPILE_OPEN_FILES_LIMIT: int = 1024
+    # Delegated cgroup v2 directory; each step then gets its own child cgroup
+    # with memory.max (replacing the address-space rlimit) and cpu.max.
+    COMPILE_CGROUP_DIR: Optional[str] = None
+    COMPILE_CGROUP_CPU_QUOTA: float = 0.0  # CPUs per step, 0 = no quota
+
+    # Concurrency
+    COMPILE_EXECUTOR: Literal["thread", "process"] = "thread"
+    COMPILE_WORKERS: int = 4  # compiles in flight per uvicorn worker
+    # "executor" runs compile_project() on the compile executor; "asyncio"
+    # awaits compile_project_async() directly on the event loop.
+    COMPILE_BACKEND: Literal["executor", "asyncio"] = "executor"
+
+    # Admission control (per uvicorn worker)
+    MAX_CONCURRENT_COMPILES: int = 4
+    COMPILE_QUEUE_SIZE: int = 32  # requests allowed to wait for a slot
+    COMPILE_QUEUE_TIMEOUT_SECONDS: float = 30.0  # max time spent waiting
+
+    # Compile result cache
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # 64 MB in memory
+    RESULT_CACHE_MAX_ENTRY_BYTES: int = 8 * 1024 * 1024  # larger PDFs skip memory
+    RESULT_CACHE_DIR: Optional[str] = None  # optional on-disk tier
+    RESULT_CACHE_DISK_MAX_BYTES: int = 1024 * 1024 * 1024  # 1 GB
+
+    # Precompiled preamble formats (mylatexformat)
+    FORMAT_CACHE_ENABLED: bool = False
+    FORMAT_CACHE_DIR: Optional[str] = None  # defaults to <tmp>/latex_fmt_cache
+    FORMAT_CACHE_MAX_BYTES: int = 512 * 1024 * 1024  # 512 MB
+
+    # Cached bibtex/biber results (.bbl)
+    BIB_CACHE_ENABLED: bool = True
+    BIB_CACHE_DIR: Optional[str] = None  # defaults to <tmp>/latex_bib_cache
+    BIB_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # 256 MB
+
+    # Content-addressed blob store (manifest compiles)
+    BLOB_STORE_DIR: Optional[str] = None  # defaults to <tmp>/latex_blob_store
+    BLOB_STORE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024  # 2 GB
+
+    # Persistent sessions (warm work dirs)
+    SESSION_DIR: Optional[str] = None  # defaults to <tmp>/latex_sessions
+    SESSION_TTL_SECONDS: int = 60 * 60  # removed after an hour unused
+    SESSION_MAX_BYTES: int = 1024 * 1024 * 1024  # 1 GB across all sessions
+    SESSION_JANITOR_INTERVAL_SECONDS: float = 60.0
+
+    # Asynchronous compile jobs (/v2/jobs)
+    JOB_DIR: Optional[str] = None  # defaults to <tmp>/latex_jobs
+    JOB_WORKERS: int = 2  # jobs compiled at once per uvicorn worker
+    JOB_QUEUE_SIZE: int = 64  # jobs allowed to wait for a job worker
+    JOB_TTL_SECONDS: int = 60 * 60  # artifacts kept this long after finishing
+    JOB_JANITOR_INTERVAL_SECONDS: float = 60.0
+
+    # Batch and mail-merge compiles (/v2/compile/batch, /v2/compile/merge)
+    BATCH_MAX_ITEMS: int = 1000
+    BATCH_MAX_CONCURRENCY: int = 4  # items of one batch compiled at once
+
+    # Metrics (/metrics).  With several worker processes, point METRICS_DIR
+    # at a directory they share (cleared on deploy) so every scrape reports
+    # all of them.
+    METRICS_DIR: Optional[str] = None
+    METRICS_FLUSH_INTERVAL_SECONDS: float = 1.0
+
 
 settings = Settings()
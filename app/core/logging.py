@@ -12,6 +12,8 @@ import os
 import sys
 from typing import Optional
 
+from app.core.metrics import COMPILE_DURATION, COMPILE_REQUESTS, PHASE_DURATION
+
 
 class JSONFormatter(logging.Formatter):
     """Emit each log record as a single JSON line."""
@@ -74,16 +76,29 @@ def log_compile_event(
     main_file: str,
     engine: str,
     passes: int,
+    passes_run: Optional[int] = None,
     file_count: int = 1,
     total_bytes: int = 0,
     compile_time_ms: int = 0,
-    outcome: str,  # "success" | "compile_error" | "timeout" | "invalid_input" | "internal"
+    outcome: str,  # "success" | "compile_error" | "timeout" | "resource_limit" | "invalid_input" | "overloaded" | "cancelled" | "internal"
     error_message: Optional[str] = None,
+    queue_depth: int = 0,
+    queue_wait_ms: int = 0,
+    cache_hit: bool = False,
+    shared_compile: bool = False,
+    steps: Optional[list[dict]] = None,
+    phases: Optional[dict[str, float]] = None,
 ) -> None:
     """
     Emit a structured log line for a compile request.
 
     Call this once per request, after the compilation has finished (or failed).
+    The event is also counted in the /metrics compile counters and histograms.
+    *steps* are the `StepUsage` dicts of the subprocesses the compile ran;
+    their CPU time and peak RSS are also summed up as ``cpu_ms`` and
+    ``max_rss_kb``.  *phases* maps each phase of the request (``upload``,
+    ``extract``, ``pass1``, ``pdf``, ...) to its wall time in milliseconds,
+    as in the ``Server-Timing`` header.
     """
     fields = {
         "request_id": request_id,
@@ -91,19 +106,42 @@ def log_compile_event(
         "main_file": main_file,
         "engine": engine,
         "passes": passes,
+        "passes_run": passes_run,
         "file_count": file_count,
         "total_bytes": total_bytes,
         "compile_time_ms": compile_time_ms,
         "outcome": outcome,
+        "queue_depth": queue_depth,
+        "queue_wait_ms": queue_wait_ms,
+        "cache_hit": cache_hit,
+        "shared_compile": shared_compile,
     }
     if error_message:
         fields["error_message"] = error_message
+    if steps:
+        fields["steps"] = steps
+        fields["cpu_ms"] = sum(
+            (step["user_cpu_ms"] or 0) + (step["system_cpu_ms"] or 0)
+            for step in steps
+        )
+        fields["max_rss_kb"] = max(step["max_rss_kb"] or 0 for step in steps)
+    if phases:
+        fields["phases"] = phases
+
+    COMPILE_REQUESTS.inc(endpoint=endpoint, outcome=outcome)
+    if outcome != "invalid_input":
+        COMPILE_DURATION.observe(compile_time_ms / 1000, endpoint=endpoint)
+    for phase, ms in (phases or {}).items():
+        PHASE_DURATION.observe(ms / 1000, phase=phase)
 
     # Attach fields so the JSONFormatter can serialize them
     record_msg = (
         f"compile {outcome}  request_id={request_id}  "
         f"main_file={main_file}  engine={engine}  passes={passes}  "
-        f"files={file_count}  bytes={total_bytes}  time={compile_time_ms}ms"
+        f"passes_run={passes_run}  "
+        f"files={file_count}  bytes={total_bytes}  time={compile_time_ms}ms  "
+        f"queue_depth={queue_depth}  queue_wait={queue_wait_ms}ms  "
+        f"cache_hit={cache_hit}  shared={shared_compile}"
     )
 
     extra_record = _compile_logger.makeRecord(
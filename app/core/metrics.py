@@ -0,0 +1,396 @@
+"""
+Service metrics in the Prometheus text exposition format.
+
+Counters and histograms live in a per-process registry.  uvicorn runs
+several worker processes (and ``COMPILE_EXECUTOR=process`` adds a pool of
+its own), and ``/metrics`` is answered by whichever worker gets the scrape,
+so with ``METRICS_DIR`` set every process writes its values to
+``<METRICS_DIR>/<pid>_<token>.json`` (atomically, at most every
+``METRICS_FLUSH_INTERVAL_SECONDS``) and the scraping process adds up the
+files of all processes:
+
+- counters and histograms are summed over every file, including those of
+  processes that have exited, so totals never go backwards;
+- per-process gauges (in-flight compiles, queue depth) are summed over the
+  processes that are still alive;
+- host gauges (work dir disk usage) are computed by the scraping process.
+
+Clear ``METRICS_DIR`` when the service is deployed, as with the
+multiprocess mode of the official Prometheus client.  Without
+``METRICS_DIR`` only the scraping process is reported.
+"""
+
+import atexit
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds: validation and cache hits up to long theses
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        registry: Optional["Registry"] = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry if registry is not None else REGISTRY
+        self.registry.register(self)
+
+    def _key(self, labels: dict[str, str]) -> str:
+        """The sample's label set as rendered: ``a="x",b="y"``."""
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return ",".join(f'{n}="{_escape(str(labels[n]))}"' for n in self.labelnames)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        self._values: dict[str, float] = {}
+        super().__init__(*args, **kwargs)
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self.registry.lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+        self.registry.changed()
+
+
+class Histogram(_Metric):
+    """Distribution of observations over fixed buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS, **kwargs):
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: a count per bucket, one for +Inf, then sum and count
+        self._values: dict[str, list[float]] = {}
+        super().__init__(*args, **kwargs)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self.registry.lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0.0] * (len(self.buckets) + 3)
+            counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+        self.registry.changed()
+
+
+class Gauge(_Metric):
+    """
+    Value read from *function* whenever metrics are collected.
+
+    ``per_process`` gauges are summed over the live worker processes; host
+    gauges are computed by the process answering the scrape only.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, *args, per_process: bool = True, **kwargs):
+        self.per_process = per_process
+        self._function: Optional[Callable[[], float]] = None
+        super().__init__(*args, **kwargs)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._function = function
+
+    def value(self) -> Optional[float]:
+        if self._function is None:
+            return None
+        try:
+            return float(self._function())
+        except Exception:
+            logger.exception("Failed to read gauge %s", self.name)
+            return None
+
+
+class Registry:
+    """The metrics of this process, and their aggregation across processes."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self._metrics: dict[str, _Metric] = {}
+        self._start()
+        os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self.flush)
+
+    def _start(self) -> None:
+        self._token = uuid.uuid4().hex[:12]
+        self._flusher: Optional[threading.Thread] = None
+        self._last_written: Optional[str] = None
+
+    def _after_fork(self) -> None:
+        # A forked pool worker starts from zero; its parent reports its own
+        self.lock = threading.Lock()
+        for metric in self._metrics.values():
+            if isinstance(metric, (Counter, Histogram)):
+                metric._values.clear()
+        self._start()
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def changed(self) -> None:
+        """Called after every update: makes sure the values get written."""
+        if settings.METRICS_DIR and self._flusher is None:
+            self.start_flushing()
+
+    def start_flushing(self) -> None:
+        """Write this process's values to ``METRICS_DIR`` periodically."""
+        with self.lock:
+            if self._flusher is not None or not settings.METRICS_DIR:
+                return
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name="metrics-flush", daemon=True
+            )
+        self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL_SECONDS)
+            self.flush()
+
+    # -- per-process values ----------------------------------------------------
+
+    def local_values(self) -> dict[str, dict[str, object]]:
+        """``{metric: {labels: value}}`` of this process's stored metrics."""
+        values: dict[str, dict[str, object]] = {}
+        with self.lock:
+            for metric in self._metrics.values():
+                if isinstance(metric, Counter):
+                    values[metric.name] = dict(metric._values)
+                elif isinstance(metric, Histogram):
+                    values[metric.name] = {
+                        key: list(counts) for key, counts in metric._values.items()
+                    }
+        for metric in self._metrics.values():
+            if isinstance(metric, Gauge) and metric.per_process:
+                value = metric.value()
+                if value is not None:
+                    values[metric.name] = {"": value}
+        return values
+
+    def _path(self) -> Optional[Path]:
+        if not settings.METRICS_DIR:
+            return None
+        return Path(settings.METRICS_DIR) / f"{os.getpid()}_{self._token}.json"
+
+    def flush(self) -> None:
+        """Write this process's values to ``METRICS_DIR`` if they changed."""
+        path = self._path()
+        if path is None:
+            return
+        data = json.dumps(self.local_values(), sort_keys=True)
+        if data == self._last_written:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(data, encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError as exc:
+            logger.warning("Failed to write metrics to %s: %s", path, exc)
+            return
+        self._last_written = data
+
+    # -- aggregation -----------------------------------------------------------
+
+    def collect(self) -> dict[str, dict[str, object]]:
+        """Values of every metric, added up over all processes."""
+        merged = self.local_values()
+        own = self._path()
+        if own is not None:
+            for path in own.parent.glob("*.json"):
+                if path == own:
+                    continue
+                try:
+                    values = json.loads(path.read_text(encoding="utf-8"))
+                    pid = int(path.stem.split("_", 1)[0])
+                except (OSError, ValueError):
+                    continue
+                self._merge(merged, values, alive=_pid_alive(pid))
+
+        for metric in self._metrics.values():
+            if isinstance(metric, Gauge) and not metric.per_process:
+                value = metric.value()
+                if value is not None:
+                    merged[metric.name] = {"": value}
+        return merged
+
+    def _merge(
+        self,
+        merged: dict[str, dict[str, object]],
+        values: dict[str, dict[str, object]],
+        alive: bool,
+    ) -> None:
+        for name, samples in values.items():
+            metric = self._metrics.get(name)
+            if metric is None or (isinstance(metric, Gauge) and not alive):
+                continue
+            target = merged.setdefault(name, {})
+            for key, value in samples.items():
+                if isinstance(metric, Histogram):
+                    if len(value) != len(metric.buckets) + 3:
+                        continue  # written with other buckets
+                    current = target.get(key) or [0.0] * len(value)
+                    target[key] = [a + b for a, b in zip(current, value)]
+                else:
+                    target[key] = target.get(key, 0.0) + value
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        values = self.collect()
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            samples = values.get(metric.name, {})
+            if not samples and not metric.labelnames:
+                if isinstance(metric, Histogram):
+                    samples = {"": [0.0] * (len(metric.buckets) + 3)}
+                elif isinstance(metric, Counter):
+                    samples = {"": 0.0}
+            for key in sorted(samples):
+                if isinstance(metric, Histogram):
+                    lines.extend(_histogram_lines(metric, key, samples[key]))
+                else:
+                    labels = f"{{{key}}}" if key else ""
+                    value = _format_value(samples[key])
+                    lines.append(f"{metric.name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _histogram_lines(metric: Histogram, key: str, counts: list[float]) -> list[str]:
+    prefix = f"{key}," if key else ""
+    lines = []
+    cumulative = 0.0
+    for bound, count in zip((*metric.buckets, math.inf), counts):
+        cumulative += count
+        le = _format_value(float(bound))
+        lines.append(
+            f'{metric.name}_bucket{{{prefix}le="{le}"}} {_format_value(cumulative)}'
+        )
+    labels = f"{{{key}}}" if key else ""
+    lines.append(f"{metric.name}_sum{labels} {_format_value(counts[-2])}")
+    lines.append(f"{metric.name}_count{labels} {_format_value(counts[-1])}")
+    return lines
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+REGISTRY = Registry()
+
+
+# ---------------------------------------------------------------------------
+# Service metrics
+# ---------------------------------------------------------------------------
+
+COMPILE_REQUESTS = Counter(
+    "latex_compile_requests_total",
+    "Compile requests by endpoint and outcome.",
+    ("endpoint", "outcome"),
+)
+COMPILE_DURATION = Histogram(
+    "latex_compile_duration_seconds",
+    "End-to-end latency of compile requests that were not rejected as invalid.",
+    ("endpoint",),
+)
+PHASE_DURATION = Histogram(
+    "latex_compile_phase_duration_seconds",
+    "Wall time of each request phase, as in the Server-Timing header.",
+    ("phase",),
+)
+HTTP_REQUESTS = Counter(
+    "latex_http_requests_total",
+    "HTTP requests by route and status code.",
+    ("route", "status"),
+)
+HTTP_DURATION = Histogram(
+    "latex_http_request_duration_seconds",
+    "Time until the response started, by route.",
+    ("route",),
+)
+CACHE_LOOKUPS = Counter(
+    "latex_cache_lookups_total",
+    "Lookups in the result, bibliography and format caches.",
+    ("cache", "result"),
+)
+COMPILES_IN_FLIGHT = Gauge(
+    "latex_compiles_in_flight",
+    "Compiles holding an admission slot.",
+)
+COMPILE_QUEUE_DEPTH = Gauge(
+    "latex_compile_queue_depth",
+    "Requests waiting for an admission slot.",
+)
+WORKDIR_DISK_BYTES = Gauge(
+    "latex_workdir_disk_bytes",
+    "Bytes used by compile work dirs on this host.",
+    per_process=False,
+)
+SESSION_DISK_BYTES = Gauge(
+    "latex_session_disk_bytes",
+    "Bytes used by session directories on this host.",
+    per_process=False,
+)
+
+
+def observe_cache(cache: str, hit: bool) -> None:
+    """Count a lookup in one of the caches."""
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
@@ -0,0 +1,103 @@
+"""
+Per-request phase timings.
+
+A `PhaseTimer` records the wall time of the named phases of one request --
+reading the upload, extraction, validation, each TeX pass, texcount, sending
+the PDF, cleanup -- in the order they first ran.  The timings go out as a
+``Server-Timing`` header (set by the middleware in app.main, so only phases
+that finished before the response started are included) and as the
+``phases`` field of the compile event log.
+
+Work that runs on the compile executor cannot share a timer with the route
+(a process pool pickles its arguments), so it records into a plain
+``{phase: ms}`` dict with `timed()` and the route merges that in.
+"""
+
+import re
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional, Protocol
+
+
+class _Step(Protocol):
+    label: str
+    wall_ms: int
+
+
+@contextmanager
+def timed(phases: dict[str, float], name: str) -> Iterator[None]:
+    """Add the wall time of the ``with`` block to ``phases[name]`` (in ms)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        phases[name] = phases.get(name, 0.0) + elapsed_ms
+
+
+def step_phase_name(label: str) -> str:
+    """Phase name for a pipeline step label: ``"Pass 1"`` -> ``"pass1"``."""
+    if label.startswith("Bibliography"):
+        return "bib"
+    return re.sub(r"[^a-z0-9]", "", label.lower()) or "step"
+
+
+class PhaseTimer:
+    """Wall-clock durations of the phases of one request, in milliseconds."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self._descriptions: dict[str, str] = {}
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def phase(self, name: str):
+        """Context manager timing a block as (part of) phase *name*."""
+        return timed(self.phases, name)
+
+    def add(self, name: str, ms: float, description: Optional[str] = None) -> None:
+        """Add *ms* to phase *name*; repeated phases accumulate."""
+        self.phases[name] = self.phases.get(name, 0.0) + ms
+        if description is not None:
+            self._descriptions[name] = description
+
+    def update(self, phases: dict[str, float]) -> None:
+        """Merge timings recorded with `timed()`."""
+        for name, ms in phases.items():
+            self.add(name, ms)
+
+    def add_steps(self, steps: Iterable[_Step]) -> None:
+        """Add the pipeline's subprocess steps (`StepUsage`) as phases."""
+        for step in steps:
+            self.add(step_phase_name(step.label), step.wall_ms, step.label)
+
+    def as_dict(self) -> dict[str, float]:
+        return {name: round(ms, 1) for name, ms in self.phases.items()}
+
+    def header_value(self) -> str:
+        """``Server-Timing`` value of every phase so far, plus the total."""
+        metrics = []
+        for name, ms in self.phases.items():
+            metric = f"{name};dur={ms:.1f}"
+            description = self._descriptions.get(name)
+            if description is not None:
+                metric += f';desc="{description}"'
+            metrics.append(metric)
+        metrics.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(metrics)
+
+
+def get_phase_timer(request) -> PhaseTimer:
+    """
+    The timer of *request* (anything with a Starlette ``state``).
+
+    Created on first use; the Server-Timing middleware creates it as the
+    request comes in, so that ``total`` covers the whole request.
+    """
+    timer = getattr(request.state, "phase_timer", None)
+    if timer is None:
+        timer = PhaseTimer()
+        request.state.phase_timer = timer
+    return timer
@@ -1,5 +1,8 @@
+import asyncio
 import shutil
+import time
 import uuid
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from starlette.middleware.base import BaseHTTPMiddleware
@@ -8,7 +11,14 @@ from starlette.responses import Response as StarletteResponse
 from app.api import routes_compile, routes_v2
 from app.api.exception_handlers import register_exception_handlers
 from app.core.config import settings
+from app.core import metrics
 from app.core.logging import setup_logging
+from app.core.timing import get_phase_timer
+from app.services.executor import shutdown_compile_executor
+from app.services.jobs import job_store
+from app.services.result_cache import toolchain_version
+from app.services.sessions import session_store
+from app.services.workdir import workdir_disk_usage
 
 # ---------------------------------------------------------------------------
 # Logging — configure once at import time so all loggers inherit settings
@@ -18,9 +28,26 @@ setup_logging()
 # ---------------------------------------------------------------------------
 # App
 # ---------------------------------------------------------------------------
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Probe the TeX toolchain version (part of every cache key) once, off the
+    # event loop, so the first request does not block on --version calls
+    await asyncio.to_thread(toolchain_version)
+    metrics.REGISTRY.start_flushing()
+    yield
+    # Let running jobs and in-flight compiles finish so their work dirs are
+    # cleaned up; queued jobs are failed.  Jobs compile through the event
+    # loop, so it must keep running while they finish.
+    await asyncio.to_thread(job_store.shutdown)
+    shutdown_compile_executor(wait=True)
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
+    lifespan=lifespan,
 )
 
 # Register exception handlers for v2 error schema
@@ -51,6 +78,42 @@ class RequestIDMiddleware(BaseHTTPMiddleware):
         return response
 
 
+class ServerTimingMiddleware(BaseHTTPMiddleware):
+    """Attach a ``Server-Timing`` header with the request's phase timings.
+
+    The request's `PhaseTimer` is created here, so ``total`` spans the whole
+    request, and stashed on ``request.state.phase_timer`` for the handlers to
+    record into.  Phases that end after the response has started (sending
+    the PDF, cleanup) are only in the compile event log.
+    """
+
+    async def dispatch(self, request: Request, call_next) -> StarletteResponse:  # type: ignore[override]
+        timer = get_phase_timer(request)
+        response = await call_next(request)
+        response.headers["Server-Timing"] = timer.header_value()
+        return response
+
+
+class MetricsMiddleware(BaseHTTPMiddleware):
+    """Count every request by route template and status for ``/metrics``."""
+
+    async def dispatch(self, request: Request, call_next) -> StarletteResponse:  # type: ignore[override]
+        t0 = time.monotonic()
+        response = await call_next(request)
+        route = _route_template(request)
+        metrics.HTTP_DURATION.observe(time.monotonic() - t0, route=route)
+        metrics.HTTP_REQUESTS.inc(route=route, status=str(response.status_code))
+        return response
+
+
+def _route_template(request: Request) -> str:
+    """``/v2/sessions/{session_id}`` rather than the path, to bound labels."""
+    # Set by the router on the shared scope once a route matched
+    return getattr(request.scope.get("route"), "path", "unmatched")
+
+
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ServerTimingMiddleware)
 app.add_middleware(RequestIDMiddleware)
 
 # ---------------------------------------------------------------------------
@@ -76,6 +139,9 @@ async def root():
 
 _ENGINE_CANDIDATES = ["pdflatex", "xelatex", "lualatex"]
 
+metrics.WORKDIR_DISK_BYTES.set_function(workdir_disk_usage)
+metrics.SESSION_DISK_BYTES.set_function(session_store.disk_usage)
+
 
 @app.get("/health")
 async def health_check():
@@ -85,3 +151,10 @@ async def health_check():
         "version": settings.VERSION,
         "engines": engines,
     }
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Service metrics in the Prometheus text format, for all workers."""
+    body = await asyncio.to_thread(metrics.REGISTRY.render)
+    return StarletteResponse(content=body, media_type=metrics.CONTENT_TYPE)
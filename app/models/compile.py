@@ -1,7 +1,7 @@
 from pathlib import Path
-from typing import List, Literal, Optional
+from typing import Dict, List, Literal, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class CompileOptions(BaseModel):
@@ -11,6 +11,26 @@ class CompileOptions(BaseModel):
     passes: int = 2
     main_file: Optional[str] = None
     timeout_seconds: int = 20
+    # Run passes until auxiliary files converge (up to MAX_PASSES) instead of
+    # exactly ``passes``
+    adaptive: bool = False
+    # Run every pass with -draftmode: check that the document compiles
+    # without writing a PDF
+    draft: bool = False
+
+
+class StepUsage(BaseModel):
+    """Wall time and resource usage of one pipeline step (one subprocess)."""
+
+    label: str  # "Pass 1", "Bibliography (biber)", ...
+    wall_ms: int
+    # From rusage; None when the step did not run to completion (timeout,
+    # missing binary) or ran on the asyncio backend
+    user_cpu_ms: Optional[int] = None
+    system_cpu_ms: Optional[int] = None
+    max_rss_kb: Optional[int] = None
+    blocks_in: Optional[int] = None  # 512-byte blocks read from disk
+    blocks_out: Optional[int] = None
 
 
 class CompileResult(BaseModel):
@@ -25,6 +45,14 @@ class CompileResult(BaseModel):
     log_truncated: bool = False
     warnings: List[str] = Field(default_factory=list)
     errors: List[str] = Field(default_factory=list)
+    passes_run: int = 0  # pdflatex passes actually run
+    # "memory" | "cpu_time" | "file_size" | "open_files" when a step was
+    # stopped by its resource limits
+    resource_limit: Optional[str] = None
+    steps: List[StepUsage] = Field(default_factory=list)  # in run order
+    # Wall ms of the non-subprocess work done with the compile, by phase
+    # ("extract", "scan", "write", ...; see app.core.timing)
+    phases: Dict[str, float] = Field(default_factory=dict)
 
 
 class TextCountTotals(BaseModel):
@@ -68,18 +96,21 @@ class ErrorResponse(BaseModel):
     """Standardized error response for all v2 endpoints."""
 
     status: Literal["error"] = "error"
-    error_type: str  # "invalid_input" | "payload_too_large" | "latex_compile_error" | "timeout" | "internal"
+    error_type: str  # "invalid_input" | "payload_too_large" | "latex_compile_error" | "timeout" | "resource_limit" | "overloaded" | "missing_blobs" | "not_found" | "client_disconnected" | "internal"
     message: str
     errors: List[str] = Field(default_factory=list)
     warnings: List[str] = Field(default_factory=list)
     log: str = ""
     log_truncated: bool = False
+    # Per-step timing and resource usage of a compile that ran
+    steps: List[StepUsage] = Field(default_factory=list)
 
 
 class ValidateRequest(BaseModel):
     code: str
-    passes: int = 1
+    passes: int = 1  # accepted for compatibility; validation runs one pass
     engine: Literal["pdflatex"] = "pdflatex"
+    prelint: bool = True  # reject obviously broken input without pdflatex
 
 
 class ValidateResponse(BaseModel):
@@ -89,3 +120,85 @@ class ValidateResponse(BaseModel):
     log: str
     log_truncated: bool
     compile_time_ms: int
+    # Which stage decided the result: the pure-Python pre-lint or pdflatex
+    stage: Literal["prelint", "pdflatex"] = "pdflatex"
+    steps: List[StepUsage] = Field(default_factory=list)
+
+
+class BlobQueryRequest(BaseModel):
+    # project-relative path -> SHA-256 of the file contents
+    files: Dict[str, str]
+
+
+class BlobQueryResponse(BaseModel):
+    missing: List[str]  # digests the client still has to upload
+
+
+class StoredBlob(BaseModel):
+    filename: str
+    sha256: str
+    size: int
+
+
+class BlobUploadResponse(BaseModel):
+    stored: List[StoredBlob]
+
+
+class ManifestCompileRequest(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    main_file: str
+    files: Dict[str, str]  # project-relative path -> SHA-256 of a stored blob
+    engine: str = "pdflatex"
+    passes: int = 2
+    adaptive: bool = False
+    return_format: str = Field("pdf", alias="return")
+
+
+class BatchItem(BaseModel):
+    """One document of a batch compile: inline source or stored blobs."""
+
+    id: str  # names the item's results; letters, digits, ".", "_", "-"
+    code: Optional[str] = None  # the main file's source, for single-file items
+    files: Optional[Dict[str, str]] = None  # or a manifest, as for /v2/compile/manifest
+    main_file: str = "main.tex"
+
+
+class BatchCompileRequest(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    items: List[BatchItem]
+    engine: str = "pdflatex"
+    passes: int = 2
+    adaptive: bool = False
+    concurrency: Optional[int] = None  # defaults to BATCH_MAX_CONCURRENCY
+    return_format: str = Field("ndjson", alias="return")  # "ndjson" | "zip"
+
+
+class SessionResponse(BaseModel):
+    session_id: str
+    files: Dict[str, str]  # source path -> SHA-256
+    file_count: int
+    total_bytes: int
+    ttl_seconds: int  # removed after this long without a request
+
+
+class JobResponse(BaseModel):
+    """State of an asynchronous compile job (``/v2/jobs``)."""
+
+    job_id: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    main_file: str
+    created_at: float  # Unix timestamps
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    expires_at: Optional[float] = None  # artifacts are removed after this
+    compile_time_ms: int = 0
+    passes_run: int = 0
+    error_type: Optional[str] = None  # as in ErrorResponse, when failed
+    message: Optional[str] = None
+    errors: List[str] = Field(default_factory=list)
+    warnings: List[str] = Field(default_factory=list)
+    steps: List[StepUsage] = Field(default_factory=list)
+    pdf_url: Optional[str] = None  # set once a PDF is available
+    log_url: Optional[str] = None  # set once the job has finished
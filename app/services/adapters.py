@@ -1,21 +1,33 @@
 """
 Input adapters for the v2 compilation endpoints.
 
-Each adapter takes raw input (multipart files or a zip archive) and populates
-a work directory with validated, safe project files.  Both adapters share the
-same validation rules from app.services.validators.
+Each adapter takes raw input (multipart files, a zip archive or source text)
+and produces a validated in-memory `ProjectSnapshot`, which `write_snapshot()`
+then lays out in a work directory.  Manifest compiles produce a
+`ProjectManifest` instead, whose files are already in the blob store.  All
+adapters share the same validation rules from app.services.validators, and
+record how long reading, validating and scanning took in ``phases`` (see
+app.core.timing).
 """
 
+import hashlib
+import json
 import logging
+import os
+import re
 import stat
 import zipfile
-from pathlib import Path
-from typing import BinaryIO
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
+from typing import Iterable, Optional, Union
 
 from fastapi import UploadFile
 
 from app.core.config import settings
+from app.core.timing import timed
+from app.services.blob_store import blob_store, is_blob_digest
 from app.services.validators import (
+    SCANNABLE_EXTENSIONS,
     PayloadTooLargeError,
     ValidationError,
     scan_dangerous_macros,
@@ -23,31 +35,524 @@ from app.services.validators import (
     validate_file_path,
     validate_limits,
 )
-from app.services.workdir import safe_write_file
+from app.services.workdir import clone_file, safe_workdir_path, safe_write_file
 
 logger = logging.getLogger(__name__)
 
 
+# ---------------------------------------------------------------------------
+# Project snapshot
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class ProjectSnapshot:
+    """
+    A validated project held in memory, before it is written to a work dir.
+
+    ``files`` maps normalized project-relative paths to contents.  Every entry
+    has already passed path, extension, size and macro validation.
+    ``phases`` holds the milliseconds the adapter spent per phase.
+    """
+
+    files: dict[str, bytes] = field(default_factory=dict)
+    file_count: int = 0
+    total_bytes: int = 0
+    phases: dict[str, float] = field(default_factory=dict)
+
+    def has_file(self, relative_path: str) -> bool:
+        return str(PurePosixPath(relative_path)) in self.files
+
+    def file_digests(self) -> dict[str, str]:
+        """Map each path to the SHA-256 hex digest of its contents."""
+        return {
+            path: hashlib.sha256(content).hexdigest()
+            for path, content in self.files.items()
+        }
+
+    def digest(self) -> str:
+        """Content hash of the whole project, independent of upload order."""
+        return digest_manifest(self.file_digests())
+
+
+def digest_manifest(file_digests: dict[str, str]) -> str:
+    """Hash a ``{path: sha256}`` mapping into a single project digest."""
+    h = hashlib.sha256()
+    for path in sorted(file_digests):
+        h.update(path.encode("utf-8"))
+        h.update(b"\0")
+        h.update(file_digests[path].encode("ascii"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def write_snapshot(snapshot: ProjectSnapshot, work_dir: Path) -> None:
+    """Lay out every file of *snapshot* inside *work_dir*."""
+    for rel_path, content in snapshot.files.items():
+        safe_write_file(work_dir, rel_path, content)
+
+
+# ---------------------------------------------------------------------------
+# Project manifest  (POST /v2/compile/manifest)
+# ---------------------------------------------------------------------------
+
+# Inputs TeX and its helpers only ever read, so they can be hardlinked from
+# the blob store.  Everything else is copied: a package could open any
+# .tex/.sty for writing.  PDFs are linkable too, except ``<main>.pdf``, which
+# pdflatex truncates in place.
+_LINKABLE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".eps", ".svg", ".bib", ".bst", ".csv"}
+
+
+class MissingBlobsError(ValidationError):
+    """Raised when a manifest references blobs the store does not hold."""
+
+    def __init__(self, missing: list[str]):
+        self.missing = missing
+        super().__init__(
+            f"{len(missing)} blob(s) referenced by the manifest are not stored; "
+            "upload them to /v2/blobs and retry",
+            error_type="missing_blobs",
+        )
+
+
+@dataclass
+class ProjectManifest:
+    """
+    A validated project whose file contents live in the blob store.
+
+    ``files`` maps normalized project-relative paths to SHA-256 digests.  The
+    project digest equals that of a `ProjectSnapshot` with the same contents,
+    so both share result cache entries.
+    """
+
+    files: dict[str, str] = field(default_factory=dict)
+    file_count: int = 0
+    total_bytes: int = 0
+    phases: dict[str, float] = field(default_factory=dict)
+
+    def has_file(self, relative_path: str) -> bool:
+        return str(PurePosixPath(relative_path)) in self.files
+
+    def file_digests(self) -> dict[str, str]:
+        return dict(self.files)
+
+    def digest(self) -> str:
+        return digest_manifest(self.files)
+
+
+def read_manifest(file_digests: dict[str, str], passes: int) -> ProjectManifest:
+    """
+    Validate a ``{path: sha256}`` manifest against the blob store.
+
+    Blocking (stats and reads blobs); run it on the compile executor.
+
+    Raises:
+        ValidationError  – on bad paths, disallowed extensions, malformed
+                           digests, dangerous macros
+        MissingBlobsError – when referenced blobs are not stored
+        PayloadTooLargeError – when limits are exceeded
+    """
+    if not file_digests:
+        raise ValidationError("No files provided")
+
+    validate_limits(file_count=len(file_digests), total_bytes=0, passes=passes)
+
+    manifest = ProjectManifest(file_count=len(file_digests))
+    with timed(manifest.phases, "validate"):
+        for raw_path, digest in file_digests.items():
+            rel_path = validate_file_path(raw_path)
+            validate_file_extension(rel_path)
+            if not is_blob_digest(digest):
+                raise ValidationError(
+                    f"Digest for {rel_path!r} is not a lowercase hex SHA-256"
+                )
+            manifest.files[rel_path] = digest
+
+        missing = blob_store.missing(manifest.files.values())
+        if missing:
+            raise MissingBlobsError(missing)
+
+    for rel_path, digest in manifest.files.items():
+        try:
+            manifest.total_bytes += blob_store.size(digest)
+        except FileNotFoundError:
+            # evicted since the check above
+            raise MissingBlobsError([digest]) from None
+        if manifest.total_bytes > settings.MAX_UPLOAD_SIZE:
+            raise PayloadTooLargeError(
+                f"Total project size exceeds {settings.MAX_UPLOAD_SIZE} bytes"
+            )
+
+        if os.path.splitext(rel_path)[1].lower() in SCANNABLE_EXTENSIONS:
+            with timed(manifest.phases, "scan"):
+                scan_dangerous_macros(blob_store.read(digest), rel_path)
+
+    return manifest
+
+
+def write_manifest(manifest: ProjectManifest, work_dir: Path, main_file: str) -> None:
+    """
+    Lay out every file of *manifest* inside *work_dir* from the blob store.
+
+    Read-only inputs are hardlinked; everything else is reflinked or copied.
+    Raises MissingBlobsError if a blob was evicted in the meantime.
+    """
+    main_stem = PurePosixPath(main_file).stem
+    for rel_path, digest in manifest.files.items():
+        dest = safe_workdir_path(work_dir, rel_path)
+        dest.unlink(missing_ok=True)
+        try:
+            blob_store.materialize(
+                digest, dest, link=_is_linkable(rel_path, main_stem)
+            )
+        except FileNotFoundError:
+            # evicted since read_manifest()
+            raise MissingBlobsError([digest]) from None
+
+
+def _is_linkable(rel_path: str, main_stem: str) -> bool:
+    ext = os.path.splitext(rel_path)[1].lower()
+    return ext in _LINKABLE_EXTENSIONS or (
+        ext == ".pdf" and PurePosixPath(rel_path).stem != main_stem
+    )
+
+
+def link_project(
+    base_dir: Path, work_dir: Path, paths: Iterable[str], main_file: str
+) -> None:
+    """
+    Lay out *paths* of a project already laid out in *base_dir* inside
+    *work_dir*.
+
+    Read-only inputs are hardlinked and everything else is reflinked or
+    copied, so compiling in *work_dir* never changes *base_dir*.
+    """
+    main_stem = PurePosixPath(main_file).stem
+    for rel_path in paths:
+        src = base_dir / rel_path
+        dest = safe_workdir_path(work_dir, rel_path)
+        dest.unlink(missing_ok=True)
+        if _is_linkable(rel_path, main_stem):
+            try:
+                os.link(src, dest)
+                continue
+            except OSError:
+                pass  # different filesystem, fall back to a copy
+        clone_file(src, dest)
+
+
+@dataclass
+class ProjectView:
+    """
+    A snapshot already laid out in ``base_dir``, compiled elsewhere through
+    a linked view (`link_project`) rather than written out again.  Lets
+    several main files of one upload compile side by side.
+    """
+
+    snapshot: ProjectSnapshot
+    base_dir: Path
+    phases: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def file_count(self) -> int:
+        return self.snapshot.file_count
+
+    @property
+    def total_bytes(self) -> int:
+        return self.snapshot.total_bytes
+
+    def has_file(self, relative_path: str) -> bool:
+        return self.snapshot.has_file(relative_path)
+
+    def file_digests(self) -> dict[str, str]:
+        return self.snapshot.file_digests()
+
+    def digest(self) -> str:
+        return self.snapshot.digest()
+
+
+# ---------------------------------------------------------------------------
+# Merge adapter  (POST /v2/compile/merge)
+# ---------------------------------------------------------------------------
+
+# Merge variables become macros, so their names are TeX control words
+_MERGE_VARIABLE_RE = re.compile(r"[A-Za-z]{1,64}")
+
+_BEGIN_DOCUMENT_RE = re.compile(r"\\begin\s*\{document\}")
+
+# Characters TeX treats specially, spelled as text
+_LATEX_ESCAPES = {
+    "\\": r"\textbackslash{}",
+    "{": r"\{",
+    "}": r"\}",
+    "$": r"\$",
+    "&": r"\&",
+    "#": r"\#",
+    "%": r"\%",
+    "_": r"\_",
+    "^": r"\textasciicircum{}",
+    "~": r"\textasciitilde{}",
+}
+
+
+def escape_latex(value: str) -> str:
+    """*value* as LaTeX text: special characters escaped, line breaks as spaces."""
+    text = " ".join(value.splitlines())
+    return "".join(_LATEX_ESCAPES.get(char, char) for char in text)
+
+
+def parse_merge_variables(text: str) -> list[dict[str, str]]:
+    """
+    Parse the ``variables`` field of a merge: a JSON array holding one
+    ``{name: value}`` object per variant.  Numbers are formatted as text.
+
+    Raises:
+        ValidationError  – on malformed JSON, names that are not 1-64 ASCII
+                           letters, values that are not strings or numbers
+        PayloadTooLargeError – on more than ``BATCH_MAX_ITEMS`` variants
+    """
+    try:
+        data = json.loads(text)
+    except ValueError as exc:
+        raise ValidationError(f"'variables' is not valid JSON: {exc}") from None
+    if not isinstance(data, list) or not all(isinstance(v, dict) for v in data):
+        raise ValidationError("'variables' must be a JSON array of objects")
+    if not data:
+        raise ValidationError("'variables' must list at least one variant")
+    if len(data) > settings.BATCH_MAX_ITEMS:
+        raise PayloadTooLargeError(
+            f"Too many variants: {len(data)} (max {settings.BATCH_MAX_ITEMS})"
+        )
+
+    variants = []
+    for index, variables in enumerate(data):
+        parsed = {}
+        for name, value in variables.items():
+            if not _MERGE_VARIABLE_RE.fullmatch(name):
+                raise ValidationError(
+                    f"Variant {index}: invalid variable name {name!r}, "
+                    "use 1-64 ASCII letters"
+                )
+            if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+                raise ValidationError(
+                    f"Variant {index}: variable {name!r} must be a string or a number"
+                )
+            parsed[name] = str(value)
+        variants.append(parsed)
+    return variants
+
+
+@dataclass
+class MergeTemplate:
+    """
+    A validated project, laid out once in ``base_dir``, that merge variants
+    are derived from.
+
+    Variables are defined in ``data_file`` if it is set, otherwise right
+    after ``\\begin{document}`` of ``main_file``.  Either way every variant
+    keeps the template's preamble, and so its precompiled format.
+    """
+
+    snapshot: ProjectSnapshot
+    base_dir: Path
+    main_file: str
+    data_file: Optional[str] = None
+    file_digests: dict[str, str] = field(default_factory=dict)
+
+    def variant(self, variables: dict[str, str]) -> "ProjectVariant":
+        """
+        The project for one variable map.
+
+        Only the definitions are scanned: the template was scanned when it
+        was read, and values are escaped.  Raises ValidationError if a
+        definition names a dangerous macro.
+        """
+        definitions = [
+            f"\\def\\{name}{{{escape_latex(value)}}}"
+            for name, value in variables.items()
+        ]
+        path = self.data_file or self.main_file
+        if self.data_file is not None:
+            text = "".join(f"{line}\n" for line in definitions)
+            scan_dangerous_macros(text.encode("utf-8"), path)
+            content = text.encode("utf-8")
+        else:
+            # All on the line of \begin{document}, so log line numbers still
+            # match the template
+            text = "".join(definitions)
+            scan_dangerous_macros(text.encode("utf-8"), path)
+            source = self.snapshot.files[path].decode("utf-8")
+            offset = _find_begin_document(source)
+            assert offset is not None
+            content = (source[:offset] + text + source[offset:]).encode("utf-8")
+        return ProjectVariant(template=self, path=path, content=content)
+
+
+@dataclass
+class ProjectVariant:
+    """A merge template with one file, ``path``, replaced by ``content``."""
+
+    template: MergeTemplate
+    path: str
+    content: bytes
+    phases: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def file_count(self) -> int:
+        return self.template.snapshot.file_count + (not self._replaces_file())
+
+    @property
+    def total_bytes(self) -> int:
+        replaced = self.template.snapshot.files.get(self.path, b"")
+        return self.template.snapshot.total_bytes - len(replaced) + len(self.content)
+
+    def has_file(self, relative_path: str) -> bool:
+        return str(PurePosixPath(relative_path)) == self.path or (
+            self.template.snapshot.has_file(relative_path)
+        )
+
+    def file_digests(self) -> dict[str, str]:
+        return {
+            **self.template.file_digests,
+            self.path: hashlib.sha256(self.content).hexdigest(),
+        }
+
+    def digest(self) -> str:
+        return digest_manifest(self.file_digests())
+
+    def _replaces_file(self) -> bool:
+        return self.path in self.template.snapshot.files
+
+
+def read_merge_template(
+    snapshot: ProjectSnapshot,
+    main_file: str,
+    data_file: Optional[str],
+    base_dir: Path,
+) -> MergeTemplate:
+    """
+    Check that *snapshot* can take merge variables and lay it out in
+    *base_dir*.  Blocking.
+
+    Raises ValidationError if *main_file* is not in the project, if
+    *data_file* is not a .tex path other than the main file, or if the
+    variables go into the main file and it has no ``\\begin{document}``.
+    """
+    if not snapshot.has_file(main_file):
+        raise ValidationError(
+            f"main_file '{main_file}' was not found among the uploaded files"
+        )
+    main_file = validate_file_path(main_file)
+    if data_file is not None:
+        data_file = validate_file_path(data_file)
+        if os.path.splitext(data_file)[1].lower() != ".tex":
+            raise ValidationError(f"data_file must be a .tex file, got {data_file!r}")
+        if data_file == main_file:
+            raise ValidationError("data_file must not be the main file")
+    else:
+        source = snapshot.files[main_file].decode("utf-8", errors="replace")
+        if _find_begin_document(source) is None:
+            raise ValidationError(
+                f"{main_file!r} has no \\begin{{document}} to define the "
+                "variables after; use data_file instead"
+            )
+
+    with timed(snapshot.phases, "write"):
+        write_snapshot(snapshot, base_dir)
+    return MergeTemplate(
+        snapshot=snapshot,
+        base_dir=base_dir,
+        main_file=main_file,
+        data_file=data_file,
+        file_digests=snapshot.file_digests(),
+    )
+
+
+def write_variant(variant: ProjectVariant, work_dir: Path, main_file: str) -> None:
+    """Lay out a merge variant from its template's base dir."""
+    template = variant.template
+    paths = [path for path in template.snapshot.files if path != variant.path]
+    link_project(template.base_dir, work_dir, paths, main_file)
+    safe_write_file(work_dir, variant.path, variant.content)
+
+
+def _find_begin_document(source: str) -> Optional[int]:
+    """Offset just past the first uncommented ``\\begin{document}``."""
+    offset = 0
+    for line in source.splitlines(keepends=True):
+        comment = re.search(r"(?<!\\)%", line)
+        code = line[: comment.start()] if comment else line
+        match = _BEGIN_DOCUMENT_RE.search(code)
+        if match:
+            return offset + match.end()
+        offset += len(line)
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Any project
+# ---------------------------------------------------------------------------
+
+# Anything `write_project` can lay out
+Project = Union[ProjectSnapshot, ProjectManifest, ProjectView, ProjectVariant]
+
+
+def write_project(project: Project, work_dir: Path, main_file: str) -> None:
+    """Lay out a snapshot, a manifest, a view or a merge variant in *work_dir*."""
+    if isinstance(project, ProjectManifest):
+        write_manifest(project, work_dir, main_file)
+    elif isinstance(project, ProjectView):
+        link_project(project.base_dir, work_dir, project.snapshot.files, main_file)
+    elif isinstance(project, ProjectVariant):
+        write_variant(project, work_dir, main_file)
+    else:
+        write_snapshot(project, work_dir)
+
+
+# ---------------------------------------------------------------------------
+# Source adapter  (POST /v2/compile/batch)
+# ---------------------------------------------------------------------------
+
+
+def read_source_snapshot(code: str, main_file: str, passes: int) -> ProjectSnapshot:
+    """
+    Validate LaTeX source text as a one-file project named *main_file*.
+
+    Raises:
+        ValidationError  – on an empty source, a bad path or extension,
+                           dangerous macros
+        PayloadTooLargeError – when limits are exceeded
+    """
+    if not code.strip():
+        raise ValidationError("'code' must be provided and non-empty")
+    content = code.encode("utf-8")
+    validate_limits(file_count=1, total_bytes=len(content), passes=passes)
+
+    snapshot = ProjectSnapshot(file_count=1, total_bytes=len(content))
+    with timed(snapshot.phases, "validate"):
+        rel_path = validate_file_path(main_file)
+        validate_file_extension(rel_path)
+    with timed(snapshot.phases, "scan"):
+        scan_dangerous_macros(content, rel_path)
+    snapshot.files[rel_path] = content
+    return snapshot
+
+
 # ---------------------------------------------------------------------------
 # Multi-file adapter  (POST /v2/compile/sync)
 # ---------------------------------------------------------------------------
 
 
-async def build_workdir_from_multipart(
+async def read_multipart_snapshot(
     files: list[UploadFile],
-    work_dir: Path,
     passes: int,
-) -> dict:
+) -> ProjectSnapshot:
     """
-    Populate *work_dir* from a list of multipart-uploaded files.
+    Read and validate a list of multipart-uploaded files into memory.
 
     Each file's ``filename`` header is treated as the project-relative path
     (e.g. ``src/main.tex``, ``figures/diagram.png``).
 
-    Returns a metadata dict::
-
-        {"file_count": int, "total_bytes": int}
-
     Raises:
         ValidationError  – on bad paths, disallowed extensions, dangerous macros
         PayloadTooLargeError – when limits are exceeded
@@ -59,59 +564,77 @@ async def build_workdir_from_multipart(
     # checked incrementally as each file is read in the loop below)
     validate_limits(file_count=len(files), total_bytes=0, passes=passes)
 
-    total_bytes = 0
+    snapshot = ProjectSnapshot(file_count=len(files))
 
     for upload in files:
-        # --- path safety ---
-        raw_path = upload.filename
-        if raw_path is None:
-            raise ValidationError("Uploaded file is missing a filename")
-        rel_path = validate_file_path(raw_path)
+        with timed(snapshot.phases, "validate"):
+            # --- path safety ---
+            raw_path = upload.filename
+            if raw_path is None:
+                raise ValidationError("Uploaded file is missing a filename")
+            rel_path = validate_file_path(raw_path)
 
-        # --- extension whitelist ---
-        validate_file_extension(rel_path)
+            # --- extension whitelist ---
+            validate_file_extension(rel_path)
 
         # --- read content & enforce cumulative size ---
-        content = await upload.read()
-        total_bytes += len(content)
+        with timed(snapshot.phases, "upload"):
+            content = await upload.read()
+        snapshot.total_bytes += len(content)
 
-        if total_bytes > settings.MAX_UPLOAD_SIZE:
+        if snapshot.total_bytes > settings.MAX_UPLOAD_SIZE:
             raise PayloadTooLargeError(
                 f"Total upload size exceeds {settings.MAX_UPLOAD_SIZE} bytes"
             )
 
         # --- dangerous macro scan (tex/sty/cls only) ---
-        scan_dangerous_macros(content, rel_path)
-
-        # --- write into work_dir ---
-        safe_write_file(work_dir, rel_path, content)
-
-    return {"file_count": len(files), "total_bytes": total_bytes}
+        with timed(snapshot.phases, "scan"):
+            scan_dangerous_macros(content, rel_path)
 
+        # Duplicate paths: the last upload wins, as it did on disk
+        snapshot.files[rel_path] = content
 
-# ---------------------------------------------------------------------------
-# Zip adapter  (POST /v2/compile/zip)
-# ---------------------------------------------------------------------------
+    return snapshot
 
 
-def build_workdir_from_zip(
-    zip_path: Path,
+async def build_workdir_from_multipart(
+    files: list[UploadFile],
     work_dir: Path,
     passes: int,
 ) -> dict:
     """
-    Extract a zip archive into *work_dir* with full security validation.
+    Populate *work_dir* from a list of multipart-uploaded files.
 
     Returns a metadata dict::
 
-        {"file_count": int, "total_bytes": int}
+        {"file_count": int, "total_bytes": int, "phases": {str: float}}
+
+    Raises:
+        ValidationError  – on bad paths, disallowed extensions, dangerous macros
+        PayloadTooLargeError – when limits are exceeded
+    """
+    snapshot = await read_multipart_snapshot(files, passes)
+    return _write_snapshot_metadata(snapshot, work_dir)
+
+
+# ---------------------------------------------------------------------------
+# Zip adapter  (POST /v2/compile/zip)
+# ---------------------------------------------------------------------------
+
+
+def read_zip_snapshot(zip_path: Path, passes: int) -> ProjectSnapshot:
+    """
+    Read and validate a zip archive into memory.
 
     Raises:
         ValidationError  – on bad member paths, symlinks, disallowed extensions,
                            dangerous macros
         PayloadTooLargeError – when limits are exceeded
     """
-    with zipfile.ZipFile(zip_path, "r") as zf:
+    phases: dict[str, float] = {}
+    with timed(phases, "extract"):
+        zf = zipfile.ZipFile(zip_path, "r")
+    with zf:
         members = zf.infolist()
 
         # --- validate member count ---
@@ -121,43 +644,77 @@ def build_workdir_from_zip(
         # The cumulative size limit is enforced incrementally in the loop below.
         validate_limits(file_count=len(file_members), total_bytes=0, passes=passes)
 
-        total_bytes = 0
+        snapshot = ProjectSnapshot(file_count=len(file_members), phases=phases)
 
         for member in file_members:
-            # --- reject symlinks ---
-            # Unix symlinks in zip have the symlink bit set in external_attr
-            unix_attrs = member.external_attr >> 16
-            if unix_attrs and stat.S_ISLNK(unix_attrs):
-                raise ValidationError(
-                    f"Symlinks are not allowed in zip: {member.filename!r}"
-                )
+            with timed(phases, "validate"):
+                # --- reject symlinks ---
+                # Unix symlinks in zip have the symlink bit set in external_attr
+                unix_attrs = member.external_attr >> 16
+                if unix_attrs and stat.S_ISLNK(unix_attrs):
+                    raise ValidationError(
+                        f"Symlinks are not allowed in zip: {member.filename!r}"
+                    )
+
+                # --- path safety ---
+                rel_path = validate_file_path(member.filename)
+
+                # --- extension whitelist ---
+                validate_file_extension(rel_path)
+
+                # --- enforce individual + cumulative size ---
+                if member.file_size > settings.MAX_UPLOAD_SIZE:
+                    raise PayloadTooLargeError(
+                        f"File {rel_path!r} uncompressed size "
+                        f"({member.file_size} bytes) exceeds limit"
+                    )
+
+                snapshot.total_bytes += member.file_size
+                if snapshot.total_bytes > settings.MAX_UPLOAD_SIZE:
+                    raise PayloadTooLargeError(
+                        "Total uncompressed size exceeds "
+                        f"{settings.MAX_UPLOAD_SIZE} bytes"
+                    )
 
-            # --- path safety ---
-            rel_path = validate_file_path(member.filename)
+            # --- extract content ---
+            with timed(phases, "extract"):
+                content = zf.read(member.filename)
 
-            # --- extension whitelist ---
-            validate_file_extension(rel_path)
+            # --- dangerous macro scan ---
+            with timed(phases, "scan"):
+                scan_dangerous_macros(content, rel_path)
 
-            # --- enforce individual + cumulative size ---
-            if member.file_size > settings.MAX_UPLOAD_SIZE:
-                raise PayloadTooLargeError(
-                    f"File {rel_path!r} uncompressed size "
-                    f"({member.file_size} bytes) exceeds limit"
-                )
+            snapshot.files[rel_path] = content
 
-            total_bytes += member.file_size
-            if total_bytes > settings.MAX_UPLOAD_SIZE:
-                raise PayloadTooLargeError(
-                    f"Total uncompressed size exceeds {settings.MAX_UPLOAD_SIZE} bytes"
-                )
+    return snapshot
 
-            # --- extract content ---
-            content = zf.read(member.filename)
 
-            # --- dangerous macro scan ---
-            scan_dangerous_macros(content, rel_path)
+def build_workdir_from_zip(
+    zip_path: Path,
+    work_dir: Path,
+    passes: int,
+) -> dict:
+    """
+    Extract a zip archive into *work_dir* with full security validation.
+
+    Returns a metadata dict::
 
-            # --- write into work_dir ---
-            safe_write_file(work_dir, rel_path, content)
+        {"file_count": int, "total_bytes": int, "phases": {str: float}}
 
-    return {"file_count": len(file_members), "total_bytes": total_bytes}
+    Raises:
+        ValidationError  – on bad member paths, symlinks, disallowed extensions,
+                           dangerous macros
+        PayloadTooLargeError – when limits are exceeded
+    """
+    snapshot = read_zip_snapshot(zip_path, passes)
+    return _write_snapshot_metadata(snapshot, work_dir)
+
+
+def _write_snapshot_metadata(snapshot: ProjectSnapshot, work_dir: Path) -> dict:
+    with timed(snapshot.phases, "write"):
+        write_snapshot(snapshot, work_dir)
+    return {
+        "file_count": snapshot.file_count,
+        "total_bytes": snapshot.total_bytes,
+        "phases": snapshot.phases,
+    }
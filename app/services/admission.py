@@ -0,0 +1,196 @@
+"""
+Admission control for compile requests.
+
+Caps how many compiles a worker runs at once and how many may wait for a
+slot.  Requests beyond the wait queue -- or that wait longer than the
+queue-time deadline -- are rejected immediately with `OverloadedError`, which
+carries a ``Retry-After`` hint derived from observed compile latency.
+
+Slots are handed directly from a finishing compile to the oldest waiter, so
+the queue is strictly FIFO.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+from app.core.config import settings
+from app.core.metrics import COMPILE_QUEUE_DEPTH, COMPILES_IN_FLIGHT
+
+# Weight of the newest observation in the compile latency moving average
+_LATENCY_EWMA_ALPHA = 0.2
+
+
+class OverloadedError(Exception):
+    """Raised when a compile cannot be admitted (queue full or wait too long)."""
+
+    def __init__(
+        self,
+        message: str,
+        retry_after: int,
+        queue_depth: int = 0,
+        queue_wait_ms: int = 0,
+    ):
+        self.message = message
+        self.retry_after = retry_after
+        self.queue_depth = queue_depth  # requests waiting when this one arrived
+        self.queue_wait_ms = queue_wait_ms
+        super().__init__(message)
+
+
+@dataclass
+class AdmissionTicket:
+    """Queueing facts about an admitted compile, for logging."""
+
+    queue_depth: int  # requests already waiting when this one arrived
+    queue_wait_ms: int
+
+
+class AdmissionController:
+    """
+    FIFO admission gate in front of the compile pipeline.
+
+    Limits default to ``MAX_CONCURRENT_COMPILES``, ``COMPILE_QUEUE_SIZE`` and
+    ``COMPILE_QUEUE_TIMEOUT_SECONDS`` and are read at call time, so settings
+    overrides take effect without rebuilding the controller.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        queue_timeout_seconds: Optional[float] = None,
+    ):
+        self._max_concurrency = max_concurrency
+        self._max_queue = max_queue
+        self._queue_timeout_seconds = queue_timeout_seconds
+        self._active = 0
+        self._waiters: deque[asyncio.Future[None]] = deque()
+        self._latency_ewma: Optional[float] = None
+
+    @property
+    def max_concurrency(self) -> int:
+        if self._max_concurrency is not None:
+            return self._max_concurrency
+        return settings.MAX_CONCURRENT_COMPILES
+
+    @property
+    def max_queue(self) -> int:
+        if self._max_queue is not None:
+            return self._max_queue
+        return settings.COMPILE_QUEUE_SIZE
+
+    @property
+    def queue_timeout_seconds(self) -> float:
+        if self._queue_timeout_seconds is not None:
+            return self._queue_timeout_seconds
+        return settings.COMPILE_QUEUE_TIMEOUT_SECONDS
+
+    @property
+    def active(self) -> int:
+        """Number of compiles currently holding a slot."""
+        return self._active
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of requests currently waiting for a slot."""
+        return len(self._waiters)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[AdmissionTicket]:
+        """Hold a compile slot for the duration of the ``async with`` block."""
+        ticket = await self.acquire()
+        started = time.monotonic()
+        try:
+            yield ticket
+        finally:
+            self._observe_latency(time.monotonic() - started)
+            self.release()
+
+    async def acquire(self) -> AdmissionTicket:
+        """
+        Wait for a compile slot.
+
+        Raises OverloadedError when the wait queue is full or the slot does
+        not free up within the queue-time deadline.
+        """
+        queue_depth = len(self._waiters)
+        if not self._waiters and self._active < self.max_concurrency:
+            self._active += 1
+            return AdmissionTicket(queue_depth=0, queue_wait_ms=0)
+
+        if queue_depth >= self.max_queue:
+            raise OverloadedError(
+                "Compile queue is full, try again later",
+                retry_after=self.retry_after(),
+                queue_depth=queue_depth,
+            )
+
+        waiter: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        t0 = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout_seconds)
+        except TimeoutError:
+            if not self._abandon(waiter):
+                raise OverloadedError(
+                    "Timed out waiting for a compile slot",
+                    retry_after=self.retry_after(),
+                    queue_depth=queue_depth,
+                    queue_wait_ms=int((time.monotonic() - t0) * 1000),
+                )
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                # The slot was handed over as we were cancelled; pass it on.
+                self.release()
+            raise
+
+        return AdmissionTicket(
+            queue_depth=queue_depth,
+            queue_wait_ms=int((time.monotonic() - t0) * 1000),
+        )
+
+    def release(self) -> None:
+        """Free a slot, handing it to the oldest waiter if there is one."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait, from observed compile latency."""
+        latency = self._latency_ewma or 1.0
+        backlog = len(self._waiters) + 1
+        return max(1, math.ceil(latency * backlog / max(1, self.max_concurrency)))
+
+    def _abandon(self, waiter: asyncio.Future[None]) -> bool:
+        """
+        Withdraw a waiter that stopped waiting.
+
+        Returns True if the slot had already been handed to it.
+        """
+        if waiter.done():
+            return True
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        return False
+
+    def _observe_latency(self, seconds: float) -> None:
+        if self._latency_ewma is None:
+            self._latency_ewma = seconds
+        else:
+            self._latency_ewma += _LATENCY_EWMA_ALPHA * (seconds - self._latency_ewma)
+
+
+compile_admission = AdmissionController()
+COMPILES_IN_FLIGHT.set_function(lambda: compile_admission.active)
+COMPILE_QUEUE_DEPTH.set_function(lambda: compile_admission.queue_depth)
@@ -0,0 +1,205 @@
+"""
+On-disk cache of bibliography tool results.
+
+bibtex and biber run on every compile that has a bibliography, even when
+neither the citations nor the databases changed -- and biber alone costs
+1-3 s of Perl startup.  Their only product the pipeline needs is the
+``.bbl`` file, which is fully determined by:
+
+- biber: the ``.bcf`` control file, plus the project-local data sources it
+  lists;
+- bibtex: the ``\\citation``, ``\\bibdata`` and ``\\bibstyle`` lines of the
+  ``.aux`` (following ``\\@input`` into included .aux files), plus the
+  project-local ``.bib`` and ``.bst`` files they name;
+
+and the TeX toolchain version.  With ``BIB_CACHE_ENABLED`` the pipeline
+restores a cached ``.bbl`` (and replays the tool's output, so warnings are
+unchanged) instead of running the tool.
+
+Entries live in ``BIB_CACHE_DIR`` (shared by all workers on the host),
+bounded by ``BIB_CACHE_MAX_BYTES`` and evicted least-recently-used by mtime.
+Remote or globbed biber data sources are never cached.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import settings
+from app.core.metrics import observe_cache
+from app.services.result_cache import toolchain_version
+
+logger = logging.getLogger(__name__)
+
+# The .aux lines bibtex reads
+_BIBTEX_AUX_LINE_RE = re.compile(r"^\\(?:citation|bibdata|bibstyle)\{.*$", re.MULTILINE)
+_AUX_INPUT_RE = re.compile(r"^\\@input\{([^}]+)\}", re.MULTILINE)
+_BIBDATA_RE = re.compile(r"^\\bibdata\{([^}]*)\}", re.MULTILINE)
+_BIBSTYLE_RE = re.compile(r"^\\bibstyle\{([^}]*)\}", re.MULTILINE)
+
+_BCF_DATASOURCE_RE = re.compile(r"<bcf:datasource([^>]*)>([^<]*)</bcf:datasource>")
+
+# Guard against \@input cycles and pathological include trees
+_MAX_AUX_FILES = 256
+
+
+def bibliography_key(work_dir: Path, main_stem: str, backend: str) -> Optional[str]:
+    """
+    Cache key for the bibliography of *main_stem*, or None if it must not be
+    cached (missing control file, remote data sources, ...).
+    """
+    try:
+        if backend == "biber":
+            material = _biber_material(work_dir, main_stem)
+        else:
+            material = _bibtex_material(work_dir, main_stem)
+    except OSError:
+        return None
+    if material is None:
+        return None
+
+    material["backend"] = backend
+    material["toolchain"] = toolchain_version()
+    encoded = json.dumps(material, sort_keys=True).encode("utf-8")
+    return "bbl_" + hashlib.sha256(encoded).hexdigest()[:32]
+
+
+def _biber_material(work_dir: Path, main_stem: str) -> Optional[dict]:
+    bcf = (work_dir / f"{main_stem}.bcf").read_bytes()
+    text = bcf.decode("utf-8", errors="replace")
+
+    sources = {}
+    for attributes, name in _BCF_DATASOURCE_RE.findall(text):
+        if 'type="file"' not in attributes or 'glob="true"' in attributes:
+            return None
+        if "://" in name:
+            return None
+        sources[name] = _local_file_digest(work_dir, name)
+
+    return {"bcf": hashlib.sha256(bcf).hexdigest(), "sources": sources}
+
+
+def _bibtex_material(work_dir: Path, main_stem: str) -> Optional[dict]:
+    lines: list[str] = []
+    pending = [f"{main_stem}.aux"]
+    seen: set[str] = set()
+    while pending:
+        name = pending.pop(0)
+        if name in seen:
+            continue
+        seen.add(name)
+        if len(seen) > _MAX_AUX_FILES:
+            return None
+        try:
+            text = (work_dir / name).read_text(encoding="utf-8", errors="replace")
+        except FileNotFoundError:
+            continue  # bibtex skips missing included .aux files too
+        lines.extend(_BIBTEX_AUX_LINE_RE.findall(text))
+        pending.extend(_AUX_INPUT_RE.findall(text))
+
+    aux_lines = "\n".join(lines)
+    databases = {}
+    for names in _BIBDATA_RE.findall(aux_lines):
+        for name in names.split(","):
+            name = name.strip()
+            if name:
+                filename = name if name.endswith(".bib") else f"{name}.bib"
+                databases[filename] = _local_file_digest(work_dir, filename)
+    styles = {}
+    for name in _BIBSTYLE_RE.findall(aux_lines):
+        filename = f"{name.strip()}.bst"
+        styles[filename] = _local_file_digest(work_dir, filename)
+
+    return {"aux": aux_lines, "databases": databases, "styles": styles}
+
+
+def _local_file_digest(work_dir: Path, name: str) -> Optional[str]:
+    """Digest of a project file, or None if the toolchain has to find it."""
+    path = (work_dir / name).resolve()
+    if not path.is_relative_to(work_dir.resolve()) or not path.is_file():
+        return None
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+class BibliographyCache:
+    """Directory of ``<key>.bbl`` + ``<key>.out`` pairs with an LRU budget."""
+
+    def __init__(self) -> None:
+        self._evict_lock = threading.Lock()
+
+    def cache_dir(self) -> Path:
+        if settings.BIB_CACHE_DIR:
+            return Path(settings.BIB_CACHE_DIR)
+        return Path(tempfile.gettempdir()) / "latex_bib_cache"
+
+    def restore(self, key: str, bbl_path: Path) -> Optional[str]:
+        """
+        Copy the cached ``.bbl`` for *key* to *bbl_path* and return the tool
+        output recorded with it, or None on a cache miss.
+        """
+        cache_dir = self.cache_dir()
+        cached_bbl = cache_dir / f"{key}.bbl"
+        try:
+            output = (cache_dir / f"{key}.out").read_text(encoding="utf-8")
+            # Copied, not linked: a later bibtex/biber run in a session work
+            # dir rewrites the .bbl in place
+            shutil.copyfile(cached_bbl, bbl_path)
+            os.utime(cached_bbl)
+        except OSError:
+            observe_cache("bibliography", hit=False)
+            return None
+        observe_cache("bibliography", hit=True)
+        return output
+
+    def store(self, key: str, bbl_path: Path, output: str) -> None:
+        """Add the ``.bbl`` a successful bibtex/biber run produced."""
+        cache_dir = self.cache_dir()
+        suffix = f"{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            # The output goes first: restore() only trusts a .bbl whose
+            # output file exists
+            tmp_out = cache_dir / f"{key}.out.{suffix}"
+            tmp_out.write_text(output, encoding="utf-8")
+            os.replace(tmp_out, cache_dir / f"{key}.out")
+            tmp_bbl = cache_dir / f"{key}.bbl.{suffix}"
+            shutil.copyfile(bbl_path, tmp_bbl)
+            os.replace(tmp_bbl, cache_dir / f"{key}.bbl")
+            self._evict(cache_dir)
+        except OSError as exc:
+            logger.warning("Failed to cache bibliography %s: %s", key, exc)
+
+    def _evict(self, cache_dir: Path) -> None:
+        with self._evict_lock:
+            entries = []
+            total = 0
+            for path in cache_dir.glob("*.bbl"):
+                out = path.with_suffix(".out")
+                try:
+                    st = path.stat()
+                    size = st.st_size + out.stat().st_size
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, size, path, out))
+                total += size
+
+            entries.sort()
+            for _, size, bbl, out in entries:
+                if total <= settings.BIB_CACHE_MAX_BYTES:
+                    break
+                try:
+                    bbl.unlink()
+                    out.unlink()
+                except OSError:
+                    continue
+                total -= size
+
+
+bib_cache = BibliographyCache()
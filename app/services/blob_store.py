@@ -0,0 +1,137 @@
+"""
+Content-addressed store of uploaded project files.
+
+Editor clients keep re-sending the same figures and .bib files.  With the
+manifest API they post ``{path: sha256}`` for the whole project, upload only
+the blobs the server reports missing, then compile by manifest; the work dir
+is populated from this store instead of from request bodies.
+
+Blobs live in ``BLOB_STORE_DIR`` (shared by all workers on the host) named by
+their SHA-256, bounded by ``BLOB_STORE_MAX_BYTES`` and evicted
+least-recently-used by mtime.  Stored files are read-only; they are hardlinked
+into work dirs only when TeX never writes to that kind of file (see
+`write_manifest` in adapters.py), otherwise reflinked or copied.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+from typing import Iterable
+
+from app.core.config import settings
+from app.services.workdir import clone_file
+
+logger = logging.getLogger(__name__)
+
+_DIGEST_RE = re.compile(r"[0-9a-f]{64}")
+
+def is_blob_digest(value: str) -> bool:
+    """True if *value* is a lowercase hex SHA-256, i.e. a valid blob name."""
+    return _DIGEST_RE.fullmatch(value) is not None
+
+
+class BlobStore:
+    """Directory of ``<sha256>`` files with an mtime-based LRU budget."""
+
+    def __init__(self) -> None:
+        self._evict_lock = threading.Lock()
+
+    def store_dir(self) -> Path:
+        if settings.BLOB_STORE_DIR:
+            return Path(settings.BLOB_STORE_DIR)
+        return Path(tempfile.gettempdir()) / "latex_blob_store"
+
+    def path(self, digest: str) -> Path:
+        if not is_blob_digest(digest):
+            raise ValueError(f"Not a SHA-256 digest: {digest!r}")
+        return self.store_dir() / digest
+
+    def size(self, digest: str) -> int:
+        """Size of a stored blob.  Raises FileNotFoundError if it is missing."""
+        return self.path(digest).stat().st_size
+
+    def missing(self, digests: Iterable[str]) -> list[str]:
+        """
+        The subset of *digests* not in the store, sorted.
+
+        Blobs that are present are touched, so they are unlikely to be evicted
+        before the compile that asked about them.
+        """
+        absent = set()
+        for digest in set(digests):
+            try:
+                os.utime(self.path(digest))
+            except FileNotFoundError:
+                absent.add(digest)
+        return sorted(absent)
+
+    def put(self, content: bytes) -> str:
+        """Store *content* and return its SHA-256."""
+        digest = hashlib.sha256(content).hexdigest()
+        target = self.path(digest)
+        if target.exists():
+            os.utime(target)
+            return digest
+
+        store_dir = self.store_dir()
+        store_dir.mkdir(parents=True, exist_ok=True)
+        tmp = store_dir / f"{digest}.{os.getpid()}.{threading.get_ident()}.tmp"
+        tmp.write_bytes(content)
+        tmp.chmod(0o444)
+        os.replace(tmp, target)
+        self._evict(store_dir)
+        return digest
+
+    def read(self, digest: str) -> bytes:
+        return self.path(digest).read_bytes()
+
+    def materialize(self, digest: str, dest: Path, link: bool) -> None:
+        """
+        Place blob *digest* at *dest*.
+
+        With ``link=True`` the blob is hardlinked (the caller guarantees
+        nothing will write to *dest*); otherwise it is reflinked where the
+        filesystem supports it, else copied.  Raises FileNotFoundError if the
+        blob is missing.
+        """
+        src = self.path(digest)
+        if link:
+            try:
+                os.link(src, dest)
+                return
+            except FileNotFoundError:
+                raise
+            except OSError:
+                pass  # different filesystem, fall back to a copy
+        clone_file(src, dest)
+
+    def _evict(self, store_dir: Path) -> None:
+        with self._evict_lock:
+            entries = []
+            total = 0
+            for path in store_dir.iterdir():
+                if not is_blob_digest(path.name):
+                    continue
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= settings.BLOB_STORE_MAX_BYTES:
+                    break
+                try:
+                    path.unlink()
+                except OSError:
+                    continue
+                total -= size
+
+
+blob_store = BlobStore()
@@ -0,0 +1,109 @@
+"""
+Bounded compile executor for the LaTeX compiler service.
+
+Compilation (pdflatex, bibtex/biber) and texcount are blocking subprocess
+calls.  Route handlers are ``async def``, so running that work inline would
+freeze the whole uvicorn worker -- including ``/health`` and uploads for other
+clients -- for the duration of a compile.  Instead, routes submit the work to
+a single, process-wide executor sized from settings and await the future.
+
+A compile whose client went away can be cancelled:
+`run_cancellable_in_compile_executor()` hands the callable a `CancelToken`
+and, when the awaiting task is cancelled, trips the token and waits for the
+worker to kill its subprocesses and return.
+
+The executor is created lazily on first use and shut down from the app
+lifespan hook via `shutdown_compile_executor()`.
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from app.core.config import settings
+from app.services.process import CancelToken
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+
+
+def get_compile_executor() -> Executor:
+    """Return the shared compile executor, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = _create_executor()
+        return _executor
+
+
+def shutdown_compile_executor(wait: bool = True) -> None:
+    """
+    Shut down the shared compile executor.
+
+    Safe to call when no executor has been created.  A later call to
+    `get_compile_executor()` creates a fresh one.
+    """
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+
+async def run_in_compile_executor(
+    func: Callable[..., T], /, *args: Any, **kwargs: Any
+) -> T:
+    """
+    Run ``func(*args, **kwargs)`` on the compile executor and await the result.
+
+    With ``COMPILE_EXECUTOR="process"`` the callable and its arguments must be
+    picklable (module-level functions, paths, Pydantic models).
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+    return await loop.run_in_executor(get_compile_executor(), call)
+
+
+async def run_cancellable_in_compile_executor(
+    func: Callable[..., T], /, *args: Any, **kwargs: Any
+) -> T:
+    """
+    Like `run_in_compile_executor`, passing ``cancel=<CancelToken>`` to *func*.
+
+    Cancelling the awaiting task cancels the token and then waits for *func*
+    to stop before re-raising, so the caller's admission slot and work
+    directory are not released while subprocesses are still running.
+    """
+    token = CancelToken()
+    call = functools.partial(func, *args, cancel=token, **kwargs)
+    submitted = get_compile_executor().submit(call)
+    future = asyncio.wrap_future(submitted)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # A call still queued never starts; a running one sees the token
+        if not submitted.cancel():
+            token.cancel()
+            await asyncio.wait([future])
+            if not future.cancelled():
+                future.exception()  # mark retrieved; the caller has gone
+        raise
+    finally:
+        token.close()
+
+
+def _create_executor() -> Executor:
+    workers = max(1, settings.COMPILE_WORKERS)
+    if settings.COMPILE_EXECUTOR == "process":
+        logger.info("Starting compile process pool with %d workers", workers)
+        return ProcessPoolExecutor(max_workers=workers)
+
+    logger.info("Starting compile thread pool with %d workers", workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="compile")
@@ -0,0 +1,205 @@
+"""
+On-disk cache of precompiled preamble formats.
+
+Loading a heavy preamble (tikz, amsmath, biblatex, hyperref, ...) dominates
+the time of every pdflatex pass.  With ``FORMAT_CACHE_ENABLED`` the pipeline
+dumps the main file's preamble into a custom format once, using
+``mylatexformat``, and runs later passes with ``-fmt=<name>`` so TeX starts
+with the preamble already loaded.
+
+Formats are keyed on the preamble text, the contents of project-local
+package/class files, and the TeX toolchain version.  They live in
+``FORMAT_CACHE_DIR`` (shared by all workers on the host), bounded by
+``FORMAT_CACHE_MAX_BYTES`` and evicted least-recently-used by mtime.
+
+Preambles whose meaning depends on other project files or on the job name
+(``\\input``, ``\\makeindex``, ...) are never dumped.  Dump failures are
+remembered per process so a preamble that cannot be dumped costs at most one
+extra pdflatex run.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import settings
+from app.core.metrics import observe_cache
+from app.services.result_cache import toolchain_version
+
+logger = logging.getLogger(__name__)
+
+_BEGIN_DOCUMENT_RE = re.compile(r"\\begin\s*\{document\}")
+
+# Preamble commands that pull in other project files, open output files, or
+# depend on \jobname: a dumped format would freeze or break them.
+_UNDUMPABLE_RE = re.compile(
+    r"\\(?:input|include|includeonly|InputIfFileExists|IfFileExists|subfile"
+    r"|import|subimport|makeindex|makeglossaries|makenomenclature|jobname"
+    r"|openout|immediate|endofdump)(?![A-Za-z@])"
+)
+
+# Project-local files a preamble may load: packages and classes, biblatex
+# styles (.bbx/.cbx/.lbx/.dbx), babel languages (.ldf), and tikz/pgf
+# libraries (tikzlibrary<name>.code.tex)
+_LOCAL_STYLE_SUFFIXES = {
+    ".sty", ".cls", ".clo", ".cfg", ".def", ".fd",
+    ".bbx", ".cbx", ".lbx", ".dbx", ".ldf",
+}
+_LOCAL_STYLE_NAME_SUFFIXES = (".code.tex",)
+
+# Remember at most this many undumpable preambles per process
+_MAX_FAILED_KEYS = 1024
+
+
+def extract_preamble(source: str) -> Optional[str]:
+    """Everything before ``\\begin{document}``, ignoring commented-out lines."""
+    lines = []
+    for line in source.splitlines():
+        if line.lstrip().startswith("%"):
+            continue
+        match = _BEGIN_DOCUMENT_RE.search(_strip_comment(line))
+        if match:
+            lines.append(line[: match.start()])
+            return "\n".join(lines)
+        lines.append(line)
+    return None
+
+
+def format_key(work_dir: Path, main_file: str) -> Optional[str]:
+    """
+    Cache key for the main file's preamble, or None if it must not be dumped.
+    """
+    try:
+        source = (work_dir / main_file).read_text(encoding="utf-8", errors="replace")
+    except OSError:
+        return None
+
+    preamble = extract_preamble(source)
+    if not preamble or "\\documentclass" not in preamble:
+        return None
+    uncommented = "\n".join(_strip_comment(line) for line in preamble.splitlines())
+    if _UNDUMPABLE_RE.search(uncommented):
+        return None
+
+    local_files = {}
+    for path in sorted(work_dir.rglob("*")):
+        if (
+            path.suffix in _LOCAL_STYLE_SUFFIXES
+            or path.name.endswith(_LOCAL_STYLE_NAME_SUFFIXES)
+        ) and path.is_file():
+            rel = path.relative_to(work_dir).as_posix()
+            local_files[rel] = hashlib.sha256(path.read_bytes()).hexdigest()
+
+    material = {
+        "preamble": preamble,
+        "local_files": local_files,
+        "toolchain": toolchain_version(),
+    }
+    encoded = json.dumps(material, sort_keys=True).encode("utf-8")
+    return "fmt_" + hashlib.sha256(encoded).hexdigest()[:32]
+
+
+def _strip_comment(line: str) -> str:
+    # A % not preceded by a backslash starts a comment
+    match = re.search(r"(?<!\\)%", line)
+    return line[: match.start()] if match else line
+
+
+class FormatCache:
+    """Directory of ``<key>.fmt`` files with an mtime-based LRU budget."""
+
+    def __init__(self) -> None:
+        self._failed: set[str] = set()
+        self._lock = threading.Lock()
+
+    def cache_dir(self) -> Path:
+        if settings.FORMAT_CACHE_DIR:
+            return Path(settings.FORMAT_CACHE_DIR)
+        return Path(tempfile.gettempdir()) / "latex_fmt_cache"
+
+    def install(self, key: str, work_dir: Path) -> bool:
+        """
+        Link the cached format for *key* into *work_dir* as ``<key>.fmt``.
+
+        Returns False on a cache miss.
+        """
+        cached = self.cache_dir() / f"{key}.fmt"
+        target = work_dir / f"{key}.fmt"
+        try:
+            _link_or_copy(cached, target)
+            os.utime(cached)
+        except OSError:
+            observe_cache("format", hit=False)
+            return False
+        observe_cache("format", hit=True)
+        return True
+
+    def store(self, key: str, fmt_path: Path) -> None:
+        """Add a freshly dumped format to the cache."""
+        cache_dir = self.cache_dir()
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            # Concurrent builders of the same key produce equivalent files;
+            # whichever rename lands last wins.
+            tmp = cache_dir / f"{key}.fmt.{os.getpid()}.{threading.get_ident()}.tmp"
+            _link_or_copy(fmt_path, tmp)
+            os.replace(tmp, cache_dir / f"{key}.fmt")
+            self._evict(cache_dir)
+        except OSError as exc:
+            logger.warning("Failed to store preamble format %s: %s", key, exc)
+
+    def known_bad(self, key: str) -> bool:
+        """True if dumping this preamble already failed in this process."""
+        with self._lock:
+            return key in self._failed
+
+    def mark_bad(self, key: str) -> None:
+        with self._lock:
+            if len(self._failed) >= _MAX_FAILED_KEYS:
+                self._failed.clear()
+            self._failed.add(key)
+
+    def clear(self) -> None:
+        """Forget remembered dump failures (the cached formats are kept)."""
+        with self._lock:
+            self._failed.clear()
+
+    def _evict(self, cache_dir: Path) -> None:
+        entries = []
+        total = 0
+        for path in cache_dir.glob("*.fmt"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= settings.FORMAT_CACHE_MAX_BYTES:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        if not src.exists():
+            raise
+        shutil.copyfile(src, dst)
+
+
+format_cache = FormatCache()
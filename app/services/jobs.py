@@ -0,0 +1,380 @@
+"""
+Asynchronous compile jobs.
+
+Long compiles outlive load balancer idle timeouts on the synchronous routes.
+A job's work dir is populated by the same adapters as a synchronous compile
+(`build_workdir_from_multipart`, `build_workdir_from_zip`), then the job is
+queued for a bounded pool of job workers.  A job worker waits for a compile
+admission slot, like a synchronous request, and runs `compile_project` on
+the compile executor.  Its PDF and log are kept for ``JOB_TTL_SECONDS``
+after it finishes::
+
+    <JOB_DIR>/<job_id>/
+        job.json     JobResponse fields, plus the process that owns the job
+        work/        the work dir, removed once the job has finished
+        output.pdf   the PDF of a successful job
+        output.log   the compile log
+
+State lives in ``job.json``, so any worker process can answer status and
+artifact requests.  A janitor thread removes expired jobs, and fails queued
+or running jobs whose owning process has exited.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Coroutine, Optional, TypeVar
+
+from app.core.config import settings
+from app.core.logging import log_compile_event
+from app.models.compile import CompileOptions, CompileResult, JobResponse
+from app.services.admission import OverloadedError, compile_admission
+from app.services.executor import run_cancellable_in_compile_executor
+from app.services.pipeline import compile_outcome, compile_project, failure_type
+from app.services.workdir import cleanup_workdir
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_JOB_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+FINISHED_STATUSES = ("succeeded", "failed")
+
+# Pause before a job asks again for a compile slot the admission queue refused
+_ADMISSION_RETRY_SECONDS = 1.0
+# How often a job worker checks that the event loop running its compile is up
+_LOOP_POLL_SECONDS = 1.0
+
+
+class JobNotFoundError(Exception):
+    """Raised for an unknown or expired job."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        super().__init__(f"Job {job_id!r} does not exist or has expired")
+
+
+@dataclass
+class Job:
+    """The directory of one job."""
+
+    job_id: str
+    root: Path
+
+    @property
+    def work_dir(self) -> Path:
+        return self.root / "work"
+
+    @property
+    def pdf_path(self) -> Path:
+        return self.root / "output.pdf"
+
+    @property
+    def log_path(self) -> Path:
+        return self.root / "output.log"
+
+
+class JobStore:
+    """Create, run, look up and expire jobs under ``JOB_DIR``."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._janitor: Optional[threading.Thread] = None
+        self._pending: dict[str, tuple[Job, Future]] = {}  # queued or running
+        # Tells this process's jobs apart from those of an earlier process
+        # that had the same pid
+        self._owner = f"{os.getpid()}_{uuid.uuid4().hex[:12]}"
+
+    def jobs_dir(self) -> Path:
+        if settings.JOB_DIR:
+            return Path(settings.JOB_DIR)
+        return Path(tempfile.gettempdir()) / "latex_jobs"
+
+    def create(self, main_file: str) -> Job:
+        """Create a queued job with an empty work dir.  Blocking."""
+        self._start_janitor()
+        job_id = uuid.uuid4().hex
+        job = Job(job_id=job_id, root=self.jobs_dir() / job_id)
+        job.work_dir.mkdir(parents=True)
+        state = JobResponse(
+            job_id=job.job_id,
+            status="queued",
+            main_file=main_file,
+            created_at=time.time(),
+        )
+        self._save(job, state)
+        return job
+
+    def delete(self, job: Job) -> None:
+        """Remove a job that was never submitted (e.g. invalid upload)."""
+        shutil.rmtree(job.root, ignore_errors=True)
+
+    def submit(
+        self,
+        job: Job,
+        options: CompileOptions,
+        *,
+        request_id: str,
+        file_count: int,
+        total_bytes: int,
+    ) -> None:
+        """
+        Queue *job* for a job worker.
+
+        Must be called on the event loop, which admits and runs the compile.
+        Raises OverloadedError when ``JOB_QUEUE_SIZE`` jobs are already
+        waiting in this process.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            waiting = len(self._pending) - max(1, settings.JOB_WORKERS)
+            if waiting >= settings.JOB_QUEUE_SIZE:
+                raise OverloadedError(
+                    "Job queue is full, try again later",
+                    retry_after=settings.TIMEOUT_SECONDS,
+                    queue_depth=waiting,
+                )
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max(1, settings.JOB_WORKERS),
+                    thread_name_prefix="job",
+                )
+            future = self._executor.submit(
+                self._run,
+                job,
+                options,
+                loop=loop,
+                request_id=request_id,
+                file_count=file_count,
+                total_bytes=total_bytes,
+            )
+            self._pending[job.job_id] = (job, future)
+
+    def get(self, job_id: str) -> tuple[Job, JobResponse]:
+        """The job and its current state.  Raises JobNotFoundError."""
+        if not _JOB_ID_RE.fullmatch(job_id):
+            raise JobNotFoundError(job_id)
+        job = Job(job_id=job_id, root=self.jobs_dir() / job_id)
+        data = self._read(job)
+        if data is None:
+            raise JobNotFoundError(job_id)
+        return job, JobResponse.model_validate(data)
+
+    def shutdown(self) -> None:
+        """
+        Stop the job workers: running jobs finish, queued ones are failed.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            cancelled = [job for job, future in self._pending.values() if future.cancelled()]
+            self._pending.clear()
+        for job in cancelled:
+            self._fail(job, "The service shut down before the job started")
+
+    def sweep(self) -> None:
+        """Remove expired jobs and fail jobs orphaned by an exited process."""
+        jobs_dir = self.jobs_dir()
+        if not jobs_dir.is_dir():
+            return
+        now = time.time()
+        for root in jobs_dir.iterdir():
+            if not _JOB_ID_RE.fullmatch(root.name):
+                continue
+            job = Job(job_id=root.name, root=root)
+            data = self._read(job)
+            if data is None:
+                # Half-created or half-removed
+                try:
+                    stale = now - root.stat().st_mtime > settings.JOB_TTL_SECONDS
+                except OSError:
+                    continue
+                if stale:
+                    shutil.rmtree(root, ignore_errors=True)
+                continue
+
+            state = JobResponse.model_validate(data)
+            if state.status in FINISHED_STATUSES:
+                if state.expires_at is not None and state.expires_at <= now:
+                    shutil.rmtree(root, ignore_errors=True)
+                    logger.info("Expired job %s", job.job_id)
+            elif not self._owner_alive(data.get("owner", "")):
+                self._fail(job, "The worker process running this job exited")
+
+    # -- running jobs ------------------------------------------------------------
+
+    def _run(
+        self,
+        job: Job,
+        options: CompileOptions,
+        *,
+        loop: asyncio.AbstractEventLoop,
+        request_id: str,
+        file_count: int,
+        total_bytes: int,
+    ) -> None:
+        data = self._read(job)
+        if data is None:
+            return  # removed while queued
+        state = JobResponse.model_validate(data)
+        state.status = "running"
+        state.started_at = time.time()
+        self._save(job, state)
+
+        t0 = time.monotonic()
+        outcome = "internal"
+        try:
+            result = _run_on_loop(
+                loop, _admitted_compile(job.work_dir, state.main_file, options)
+            )
+            if result.success and result.pdf_path and result.pdf_path.exists():
+                os.replace(result.pdf_path, job.pdf_path)
+            job.log_path.write_text(result.log, encoding="utf-8")
+            outcome = compile_outcome(result)
+            state.status = "succeeded" if outcome == "success" else "failed"
+            state.compile_time_ms = result.compile_time_ms
+            state.passes_run = result.passes_run
+            state.errors = result.errors
+            state.warnings = result.warnings
+            state.steps = result.steps
+            if outcome != "success":
+                state.error_type = failure_type(result)
+                state.message = result.error_message or "Compilation failed"
+        except Exception as exc:
+            logger.exception("Job %s failed", job.job_id)
+            state.status = "failed"
+            state.error_type = "internal"
+            state.message = f"Internal error: {exc}"
+        finally:
+            cleanup_workdir(job.work_dir)
+            self._finish(job, state)
+            with self._lock:
+                self._pending.pop(job.job_id, None)
+
+        log_compile_event(
+            request_id=request_id,
+            endpoint="/v2/jobs",
+            main_file=state.main_file,
+            engine=options.engine,
+            passes=options.passes,
+            passes_run=state.passes_run,
+            file_count=file_count,
+            total_bytes=total_bytes,
+            compile_time_ms=int((time.monotonic() - t0) * 1000),
+            outcome=outcome,
+            error_message=state.message,
+            steps=[step.model_dump() for step in state.steps],
+        )
+
+    def _fail(self, job: Job, message: str) -> None:
+        data = self._read(job)
+        if data is None:
+            return
+        state = JobResponse.model_validate(data)
+        state.status = "failed"
+        state.error_type = "internal"
+        state.message = message
+        cleanup_workdir(job.work_dir)
+        self._finish(job, state)
+
+    def _finish(self, job: Job, state: JobResponse) -> None:
+        state.finished_at = time.time()
+        state.expires_at = state.finished_at + settings.JOB_TTL_SECONDS
+        self._save(job, state)
+
+    # -- janitor ---------------------------------------------------------------
+
+    def _start_janitor(self) -> None:
+        with self._lock:
+            if self._janitor is not None:
+                return
+            self._janitor = threading.Thread(
+                target=self._janitor_loop, name="job-janitor", daemon=True
+            )
+        self._janitor.start()
+
+    def _janitor_loop(self) -> None:
+        while True:
+            time.sleep(settings.JOB_JANITOR_INTERVAL_SECONDS)
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Job janitor failed")
+
+    def _owner_alive(self, owner: str) -> bool:
+        pid_text, _, _ = owner.partition("_")
+        try:
+            pid = int(pid_text)
+        except ValueError:
+            return False
+        if pid == os.getpid():
+            return owner == self._owner
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    # -- job.json ----------------------------------------------------------------
+
+    def _read(self, job: Job) -> Optional[dict]:
+        try:
+            return json.loads((job.root / "job.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, job: Job, state: JobResponse) -> None:
+        data = {**state.model_dump(), "owner": self._owner}
+        tmp = job.root / f"job.json.{threading.get_ident()}.tmp"
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, job.root / "job.json")
+
+
+async def _admitted_compile(
+    work_dir: Path, main_file: str, options: CompileOptions
+) -> CompileResult:
+    """
+    `compile_project` under a compile admission slot, so jobs count against
+    ``MAX_CONCURRENT_COMPILES``.  A job waits as long as it takes: when the
+    admission queue refuses it, it asks again.
+    """
+    while True:
+        try:
+            async with compile_admission.slot():
+                return await run_cancellable_in_compile_executor(
+                    compile_project, work_dir, main_file, options
+                )
+        except OverloadedError:
+            await asyncio.sleep(_ADMISSION_RETRY_SECONDS)
+
+
+def _run_on_loop(loop: asyncio.AbstractEventLoop, coro: Coroutine[Any, Any, T]) -> T:
+    """Run *coro* on *loop* from a job worker and wait for its result."""
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    while True:
+        try:
+            return future.result(timeout=_LOOP_POLL_SECONDS)
+        except TimeoutError:
+            if not loop.is_running():
+                future.cancel()
+                raise RuntimeError("The event loop stopped before the job finished")
+
+
+job_store = JobStore()
@@ -12,9 +12,11 @@ import time
 from pathlib import Path
 from typing import Optional
 
+from app.core.timing import timed
 from app.models.compile import CompileOptions, CompileResult
 from app.services.adapters import build_workdir_from_zip
-from app.services.pipeline import compile_project
+from app.services.pipeline import compile_project, validate_project
+from app.services.process import CancelToken, CompileCancelledError
 from app.services.validators import scan_dangerous_macros, ValidationError
 from app.services.workdir import create_workdir, cleanup_workdir, safe_write_file
 
@@ -22,6 +24,8 @@ from app.services.workdir import create_workdir, cleanup_workdir, safe_write_fil
 def compile_latex_sync(
     source_file_path: Path,
     options: CompileOptions,
+    validate: bool = False,
+    cancel: Optional[CancelToken] = None,
 ) -> CompileResult:
     """
     Compiles a LaTeX project synchronously (v1 interface).
@@ -29,6 +33,10 @@ def compile_latex_sync(
     Args:
         source_file_path: Path to the uploaded .tex or .zip file.
         options: Compilation options.
+        validate: Run the pipeline's single-draft-pass validation mode
+                  (validate_project) instead of a full compile.
+        cancel: Token that aborts the compile; the work directory is removed
+                and CompileCancelledError raised.
 
     Returns:
         CompileResult object. If successful, pdf_path points into a temporary
@@ -42,9 +50,12 @@ def compile_latex_sync(
     """
     start_time = time.time()
     work_dir = create_workdir()
+    phases: dict[str, float] = {}
 
     try:
-        main_file = _setup_workdir_from_source(source_file_path, work_dir, options)
+        main_file = _setup_workdir_from_source(
+            source_file_path, work_dir, options, phases
+        )
         if main_file is None:
             # _setup_workdir_from_source returns None on error,
             # but we need to return a proper CompileResult.
@@ -58,10 +69,14 @@ def compile_latex_sync(
                 errors=[],
             )
 
-        result = compile_project(work_dir, main_file, options)
+        if validate:
+            result = validate_project(work_dir, main_file, options, cancel)
+        else:
+            result = compile_project(work_dir, main_file, options, cancel)
 
         # Store work_dir on result so cleanup_work_dir can find it reliably
         result.work_dir = work_dir
+        result.phases = phases
 
         # If compilation failed, clean up immediately since there's no PDF
         # to return.
@@ -72,6 +87,10 @@ def compile_latex_sync(
         # the PDF from result.pdf_path.
         return result
 
+    except CompileCancelledError:
+        cleanup_workdir(work_dir)
+        raise
+
     except ValidationError as e:
         cleanup_workdir(work_dir)
         return CompileResult(
@@ -130,28 +149,34 @@ def _setup_workdir_from_source(
     source_file_path: Path,
     work_dir: Path,
     options: CompileOptions,
+    phases: dict[str, float],
 ) -> Optional[str]:
     """
     Set up the work directory from a .tex or .zip source file.
 
-    Returns the main_file relative path to use for compilation.
+    Returns the main_file relative path to use for compilation, and adds the
+    time spent per phase to *phases*.
     Raises ValueError or ValidationError on problems.
     """
     if source_file_path.suffix == ".tex":
-        return _setup_from_tex(source_file_path, work_dir)
+        return _setup_from_tex(source_file_path, work_dir, phases)
 
     elif source_file_path.suffix == ".zip":
-        return _setup_from_zip(source_file_path, work_dir, options)
+        return _setup_from_zip(source_file_path, work_dir, options, phases)
 
     else:
         raise ValueError("Unsupported file type. Only .tex and .zip supported.")
 
 
-def _setup_from_tex(source_file_path: Path, work_dir: Path) -> str:
+def _setup_from_tex(
+    source_file_path: Path, work_dir: Path, phases: dict[str, float]
+) -> str:
     """Copy a single .tex file into work_dir as main.tex, scanning for macros."""
     content = source_file_path.read_bytes()
-    scan_dangerous_macros(content, "main.tex")
-    safe_write_file(work_dir, "main.tex", content)
+    with timed(phases, "scan"):
+        scan_dangerous_macros(content, "main.tex")
+    with timed(phases, "write"):
+        safe_write_file(work_dir, "main.tex", content)
     return "main.tex"
 
 
@@ -159,6 +184,7 @@ def _setup_from_zip(
     source_file_path: Path,
     work_dir: Path,
     options: CompileOptions,
+    phases: dict[str, float],
 ) -> str:
     """
     Extract a zip file into work_dir using the shared v2 adapter.
@@ -166,7 +192,8 @@ def _setup_from_zip(
     Delegates to build_workdir_from_zip so v1 and v2 have identical security
     enforcement and consistent error types (ValidationError / PayloadTooLargeError).
     """
-    build_workdir_from_zip(source_file_path, work_dir, options.passes)
+    metadata = build_workdir_from_zip(source_file_path, work_dir, options.passes)
+    phases.update(metadata["phases"])
 
     # Determine main file after extraction
     main_file = _determine_main_file(work_dir, options)
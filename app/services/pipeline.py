@@ -1,34 +1,100 @@
 """
 Core compilation pipeline for the LaTeX compiler service.
 
-This module provides the single `compile_project()` function that all endpoints
-(v1 and v2) funnel through. It handles:
+This module provides the `compile_project()` function that all endpoints
+(v1 and v2) funnel through, plus its asyncio twin `compile_project_async()`,
+the progress-reporting `compile_project_events()`, and the validation-only
+`validate_project()` / `validate_project_async()`.  All of them drive the
+same step generator. It handles:
 - Main file verification
 - Multi-pass pdflatex invocation with -no-shell-escape
-- Automatic bibliography orchestration via bibtex / biber
+- Adaptive pass count (stop once .aux/.toc/.out/.bbl have converged)
+- -draftmode for passes whose PDF would be thrown away
+- Optional precompiled preamble formats (format_cache.py)
+- Automatic bibliography orchestration via bibtex / biber, with cached
+  .bbl results (bib_cache.py)
 - Output PDF detection based on actual main_file stem
 - Log parsing for errors and warnings
 - Log truncation
-- Compile timeout handling
+- Compile timeout handling, killing each step's whole process tree
+- Per-step resource limits (rlimits, optional cgroup v2)
+- Per-step wall time and rusage accounting (CompileResult.steps)
+- Progress events as each step starts and finishes (CompileEvent)
+- Cancellation of running compiles (process.py)
 """
 
+import asyncio
+import hashlib
 import re
 import subprocess
 import time
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Literal, Optional
+from typing import AsyncIterator, Callable, Generator, Literal, Optional
 
 from app.core.config import settings
-from app.models.compile import CompileOptions, CompileResult
+from app.models.compile import CompileOptions, CompileResult, StepUsage
+from app.services.bib_cache import bib_cache, bibliography_key
+from app.services.format_cache import format_cache, format_key
+from app.services.prelint import prelint
+from app.services.process import (
+    CancelToken,
+    ProcessUsage,
+    ResourceLimitExceeded,
+    Sandbox,
+    kill_process_group,
+    run_process,
+)
 
 # Pre-compiled regex for -file-line-error format: ./file.tex:123: Error message
 _FILE_LINE_RE = re.compile(r"^\./[^:]+:\d+:\s+(.+)")
 _BIBER_ERROR_RE = re.compile(r"^(?:ERROR|FATAL)\s*-\s*(.+)$")
 _BIBER_WARNING_RE = re.compile(r"^(?:WARN(?:ING)?)\s*-\s*(.+)$")
 
+# Log messages asking for another LaTeX run.  "There were undefined
+# references" is deliberately absent: it persists on documents with broken
+# \ref's, and the auxiliary-file check already covers the fixable case.
+_RERUN_RE = re.compile(
+    r"Rerun to get|Label\(s\) may have changed|Please rerun LaTeX|Rerun LaTeX"
+)
+
+# Files a pdflatex pass writes and the next pass reads back
+_AUX_SUFFIXES = {".aux", ".toc", ".lof", ".lot", ".out", ".bbl", ".nav", ".snm"}
+
+# .aux lines that do not change how the next pass typesets anything
+_INERT_AUX_LINE_RE = re.compile(
+    r"^(?:\\relax"
+    r"|\\gdef\s*\\@abspage@last\{\d+\}"
+    r"|\\providecommand\s*\*?\s*\\[A-Za-z@]+(?:\[\d\])?\{\}"
+    r"|\\babel@aux\{[^}]*\}\{\}"
+    r"|\\@writefile\{.*"
+    r"|\\@input\{[^}]*\}"
+    r"|\\(?:citation|bibstyle|bibdata)\{[^}]*\})$"
+)
+
+# Commands whose output depends on a previous pass's auxiliary files
+_CROSS_REFERENCE_RE = re.compile(
+    r"\\(?:ref|pageref|eqref|autoref|nameref|cref|Cref|cite[A-Za-z]*|nocite"
+    r"|tableofcontents|listoffigures|listoftables|bibliography"
+    r"|printbibliography|addbibresource)(?![A-Za-z@])"
+)
+
 BackendName = Literal["bibtex", "biber"]
 
+# (errors, warnings) found in a step's output
+MessageParser = Callable[[str], tuple[list[str], list[str]]]
+
+
+@dataclass
+class _StepRequest:
+    """A subprocess the pipeline wants run, before it is executed."""
+
+    label: str
+    cmd: list[str]
+    timeout_seconds: int
+    missing_binary_message: str
+    parse_messages: Optional[MessageParser] = None
+
 
 @dataclass
 class _StepExecution:
@@ -39,12 +105,36 @@ class _StepExecution:
     returncode: Optional[int] = None
     timed_out: bool = False
     missing_binary_message: Optional[str] = None
+    limit_exceeded: Optional[str] = None  # ResourceLimitExceeded.limit
+    usage: Optional[ProcessUsage] = None
+
+
+@dataclass
+class CompileEvent:
+    """
+    Progress of a compile, yielded by `compile_project_events()`.
+
+    ``step_started`` and ``step_finished`` bracket every subprocess (labels
+    as in `StepUsage`); a finished step carries its usage, its status
+    (``ok``, ``failed``, ``timeout``, ``resource_limit`` or
+    ``missing_binary``) and how many errors and warnings its output reports.
+    The last event is ``result``.
+    """
+
+    kind: Literal["step_started", "step_finished", "result"]
+    label: str = ""
+    usage: Optional[StepUsage] = None
+    status: Optional[str] = None
+    errors: int = 0
+    warnings: int = 0
+    result: Optional[CompileResult] = None
 
 
 def compile_project(
     work_dir: Path,
     main_file: str,
     options: CompileOptions,
+    cancel: Optional[CancelToken] = None,
 ) -> CompileResult:
     """
     Compile a LaTeX project that has already been laid out in work_dir.
@@ -54,6 +144,8 @@ def compile_project(
         main_file: Relative path to the main .tex file within work_dir
                    (e.g. "main.tex" or "src/main.tex").
         options: Compilation options (engine, passes, timeout).
+        cancel: Token that stops the compile when cancelled; the running step
+                is killed and CompileCancelledError raised.
 
     Returns:
         CompileResult with success status, PDF path, timing, log, errors, warnings.
@@ -61,6 +153,278 @@ def compile_project(
     This function does NOT create or clean up work_dir -- that is the caller's
     responsibility (via workdir.create_workdir / workdir.cleanup_workdir).
     """
+    return _drive(_compile_steps(work_dir, main_file, options), work_dir, cancel)
+
+
+async def compile_project_async(
+    work_dir: Path,
+    main_file: str,
+    options: CompileOptions,
+) -> CompileResult:
+    """
+    Asyncio variant of `compile_project()`.
+
+    Runs each pdflatex / bibtex / biber step with
+    ``asyncio.create_subprocess_exec`` so no thread is pinned per compile.
+    Timeout, missing-binary and output-capture semantics are identical to the
+    synchronous version.  Cancelling the awaiting task kills the running step.
+    """
+    return await _drive_async(_compile_steps(work_dir, main_file, options), work_dir)
+
+
+def compile_project_events(
+    work_dir: Path,
+    main_file: str,
+    options: CompileOptions,
+) -> AsyncIterator[CompileEvent]:
+    """
+    `compile_project_async()`, yielding a `CompileEvent` as each step starts
+    and finishes, then one carrying the CompileResult.
+
+    Cancelling the consuming task, or closing the iterator, kills the
+    running step.
+    """
+    return _drive_events_async(_compile_steps(work_dir, main_file, options), work_dir)
+
+
+def prepare_format(
+    work_dir: Path,
+    main_file: str,
+    options: CompileOptions,
+    cancel: Optional[CancelToken] = None,
+) -> Optional[str]:
+    """
+    Put the precompiled format of the main file's preamble in the format
+    cache, dumping it in work_dir unless it is cached already.
+
+    Compiling many projects that share a preamble at once would otherwise
+    have each of them miss the cache and dump the same format.  Returns the
+    format name, or None if ``FORMAT_CACHE_ENABLED`` is off or the preamble
+    cannot be dumped.
+    """
+    if not settings.FORMAT_CACHE_ENABLED:
+        return None
+    steps = _prepare_format(work_dir, main_file, options, [])
+    try:
+        step = next(steps)
+        while True:
+            step = steps.send(_run_step(step, work_dir, cancel))
+    except StopIteration as done:
+        return done.value
+
+
+def prelint_project(work_dir: Path, main_file: str) -> Optional[CompileResult]:
+    """
+    Pure-Python pre-lint of the main file (see prelint.py).
+
+    Returns a failed CompileResult if the source certainly cannot compile,
+    or None if pdflatex has to decide.
+    """
+    try:
+        source = (work_dir / main_file).read_text(encoding="utf-8", errors="replace")
+    except OSError:
+        return None
+    return prelint_source(source, main_file)
+
+
+def prelint_source(source: str, filename: str = "main.tex") -> Optional[CompileResult]:
+    """`prelint_project()` for source text that is not on disk."""
+    start_time = time.time()
+    errors = prelint(source, filename)
+    if not errors:
+        return None
+    return _failure_result(
+        start_time=start_time,
+        log_sections=["--- Prelint ---\n" + "\n".join(errors) + "\n"],
+        errors=errors,
+        warnings=[],
+        error_message=errors[0],
+    )
+
+
+def validate_project(
+    work_dir: Path,
+    main_file: str,
+    options: CompileOptions,
+    cancel: Optional[CancelToken] = None,
+) -> CompileResult:
+    """
+    Check whether a project compiles, as cheaply as pdflatex allows.
+
+    Runs a single ``-draftmode`` pass with no bibliography backend, so no PDF
+    is written and ``options.passes`` / ``options.adaptive`` are ignored.
+    Undefined citations and references are reported as warnings, exactly as
+    on the first pass of a full compile.
+    """
+    return _drive(_validation_steps(work_dir, main_file, options), work_dir, cancel)
+
+
+async def validate_project_async(
+    work_dir: Path,
+    main_file: str,
+    options: CompileOptions,
+) -> CompileResult:
+    """Asyncio variant of `validate_project()`."""
+    return await _drive_async(
+        _validation_steps(work_dir, main_file, options), work_dir
+    )
+
+
+def failure_type(result: CompileResult) -> str:
+    """``error_type`` of a compile without a PDF, as in the v2 error responses."""
+    if result.resource_limit is not None:
+        return "resource_limit"
+    if "timed out" in (result.error_message or ""):
+        return "timeout"
+    return "latex_compile_error"
+
+
+def compile_outcome(result: CompileResult) -> str:
+    """Outcome label of a finished compile, for `log_compile_event`."""
+    if result.success:
+        return "success"
+    error_type = failure_type(result)
+    return "compile_error" if error_type == "latex_compile_error" else error_type
+
+
+def _drive(
+    steps: Generator[_StepRequest, _StepExecution, CompileResult],
+    work_dir: Path,
+    cancel: Optional[CancelToken] = None,
+) -> CompileResult:
+    usages: list[StepUsage] = []
+    try:
+        step = next(steps)
+        while True:
+            started = time.monotonic()
+            execution = _run_step(step, work_dir, cancel)
+            usages.append(_step_usage(execution, started))
+            step = steps.send(execution)
+    except StopIteration as done:
+        result = done.value
+    result.steps = usages
+    return result
+
+
+async def _drive_async(
+    steps: Generator[_StepRequest, _StepExecution, CompileResult],
+    work_dir: Path,
+) -> CompileResult:
+    async for event in _drive_events_async(steps, work_dir):
+        if event.result is not None:
+            return event.result
+    raise AssertionError("the pipeline ended without a result")
+
+
+async def _drive_events_async(
+    steps: Generator[_StepRequest, _StepExecution, CompileResult],
+    work_dir: Path,
+) -> AsyncIterator[CompileEvent]:
+    # Between steps the generator does blocking filesystem work (format
+    # cache, aux-file hashing, log parsing), so it is advanced on a worker
+    # thread; only the subprocesses themselves are awaited on the loop.
+    usages: list[StepUsage] = []
+    step, result = await asyncio.to_thread(_advance, steps, None)
+    while step is not None:
+        yield CompileEvent("step_started", label=step.label)
+        started = time.monotonic()
+        execution = await _run_step_async(step, work_dir)
+        usage = _step_usage(execution, started)
+        usages.append(usage)
+        step, result, (errors, warnings) = await asyncio.to_thread(
+            _finish_step, steps, step, execution
+        )
+        yield CompileEvent(
+            "step_finished",
+            label=execution.label,
+            usage=usage,
+            status=_step_status(execution),
+            errors=len(errors),
+            warnings=len(warnings),
+        )
+    assert result is not None
+    result.steps = usages
+    yield CompileEvent("result", result=result)
+
+
+def _step_usage(execution: _StepExecution, started: float) -> StepUsage:
+    usage = execution.usage
+    return StepUsage(
+        label=execution.label,
+        wall_ms=int((time.monotonic() - started) * 1000),
+        user_cpu_ms=usage.user_cpu_ms if usage else None,
+        system_cpu_ms=usage.system_cpu_ms if usage else None,
+        max_rss_kb=usage.max_rss_kb if usage else None,
+        blocks_in=usage.blocks_in if usage else None,
+        blocks_out=usage.blocks_out if usage else None,
+    )
+
+
+def _advance(
+    steps: Generator[_StepRequest, _StepExecution, CompileResult],
+    execution: Optional[_StepExecution],
+) -> tuple[Optional[_StepRequest], Optional[CompileResult]]:
+    """Resume *steps*: (next step, None), or (None, result) once it returns."""
+    # StopIteration cannot cross a Future, hence the tuple
+    try:
+        return steps.send(execution), None  # type: ignore[arg-type]
+    except StopIteration as done:
+        return None, done.value
+
+
+def _finish_step(
+    steps: Generator[_StepRequest, _StepExecution, CompileResult],
+    step: _StepRequest,
+    execution: _StepExecution,
+) -> tuple[
+    Optional[_StepRequest],
+    Optional[CompileResult],
+    tuple[list[str], list[str]],
+]:
+    """`_advance()`, plus the errors and warnings of the finished step."""
+    messages: tuple[list[str], list[str]] = ([], [])
+    if step.parse_messages is not None:
+        messages = step.parse_messages(execution.output)
+    return (*_advance(steps, execution), messages)
+
+
+def _step_status(execution: _StepExecution) -> str:
+    if execution.missing_binary_message:
+        return "missing_binary"
+    if execution.timed_out:
+        return "timeout"
+    if execution.limit_exceeded:
+        return "resource_limit"
+    return "ok" if execution.returncode == 0 else "failed"
+
+
+def _validation_steps(
+    work_dir: Path,
+    main_file: str,
+    options: CompileOptions,
+) -> Generator[_StepRequest, _StepExecution, CompileResult]:
+    single_draft_pass = options.model_copy(
+        update={"passes": 1, "adaptive": False, "draft": True}
+    )
+    return _compile_steps(
+        work_dir, main_file, single_draft_pass, run_bibliography=False
+    )
+
+
+def _compile_steps(
+    work_dir: Path,
+    main_file: str,
+    options: CompileOptions,
+    run_bibliography: bool = True,
+) -> Generator[_StepRequest, _StepExecution, CompileResult]:
+    """
+    The compile pipeline, independent of how subprocesses are run.
+
+    Yields a `_StepRequest` for every subprocess it needs, expects the
+    matching `_StepExecution` to be sent back, and returns the final
+    CompileResult.  `compile_project()` and `compile_project_async()` drive
+    it with blocking and asyncio step runners respectively.
+    """
     start_time = time.time()
 
     main_file_path = work_dir / main_file
@@ -75,18 +439,38 @@ def compile_project(
         )
 
     main_stem = Path(main_file).stem
-    compile_cwd = work_dir
+    passes_run = 0
     log_sections: list[str] = []
     backend_warnings: list[str] = []
     final_tex_warnings: list[str] = []
 
+    fmt: Optional[str] = None
+    if settings.FORMAT_CACHE_ENABLED:
+        fmt = yield from _prepare_format(work_dir, main_file, options, log_sections)
+
+    # Auxiliary-file state each pass started from, for adaptive mode
+    read_state = _aux_state(work_dir) if options.adaptive else {}
+
+    # Only the final pass needs to write a PDF; earlier ones run in
+    # -draftmode.  Adaptive mode has to guess which pass is final.
+    if options.draft:
+        draft = True
+    elif options.adaptive:
+        draft = settings.MAX_PASSES > 1 and _expects_rerun(
+            work_dir, main_file, read_state
+        )
+    else:
+        draft = options.passes > 1
+
     # First pdflatex pass determines whether bibliography tooling is needed.
-    first_pass = _run_pdflatex_step(
+    first_pass = yield _pdflatex_step(
         main_file=main_file,
-        compile_cwd=compile_cwd,
         timeout_seconds=options.timeout_seconds,
         pass_number=1,
+        fmt=fmt,
+        draft=draft,
     )
+    passes_run = 1
     log_sections.append(_format_log_section(first_pass))
 
     if first_pass.missing_binary_message:
@@ -94,6 +478,7 @@ def compile_project(
             start_time=start_time,
             log_sections=log_sections,
             message=first_pass.missing_binary_message,
+            passes_run=passes_run,
         )
 
     first_errors, first_warnings = _parse_latex_log_messages(first_pass.output)
@@ -105,6 +490,18 @@ def compile_project(
             label=first_pass.label,
             errors=first_errors,
             warnings=first_warnings,
+            passes_run=passes_run,
+        )
+
+    if first_pass.limit_exceeded:
+        return _resource_limit_result(
+            start_time=start_time,
+            log_sections=log_sections,
+            limit=first_pass.limit_exceeded,
+            label=first_pass.label,
+            errors=first_errors,
+            warnings=first_warnings,
+            passes_run=passes_run,
         )
 
     if first_pass.returncode != 0:
@@ -114,19 +511,26 @@ def compile_project(
             errors=first_errors,
             warnings=first_warnings,
             error_message=first_errors[0] if first_errors else "Compilation failed",
+            passes_run=passes_run,
         )
 
-    bibliography_backend = _detect_bibliography_backend(work_dir, main_stem)
-    total_tex_passes = (
-        options.passes if bibliography_backend is None else max(options.passes, 3)
+    bibliography_backend = (
+        _detect_bibliography_backend(work_dir, main_stem) if run_bibliography else None
     )
+    if options.adaptive:
+        # Passes stop as soon as the auxiliary files converge.
+        total_tex_passes = settings.MAX_PASSES
+    elif bibliography_backend is None:
+        total_tex_passes = options.passes
+    else:
+        total_tex_passes = max(options.passes, 3)
 
     if bibliography_backend is None:
         final_tex_warnings = first_warnings
     else:
-        backend_step = _run_backend_step(
+        backend_step = yield from _run_backend_step(
+            work_dir=work_dir,
             backend=bibliography_backend,
-            compile_cwd=compile_cwd,
             main_stem=main_stem,
             timeout_seconds=options.timeout_seconds,
         )
@@ -143,6 +547,7 @@ def compile_project(
                 log_sections=log_sections,
                 message=backend_step.missing_binary_message,
                 warnings=backend_warnings,
+                passes_run=passes_run,
             )
 
         if backend_step.timed_out:
@@ -153,6 +558,18 @@ def compile_project(
                 label=backend_step.label,
                 errors=backend_errors,
                 warnings=backend_warnings,
+                passes_run=passes_run,
+            )
+
+        if backend_step.limit_exceeded:
+            return _resource_limit_result(
+                start_time=start_time,
+                log_sections=log_sections,
+                limit=backend_step.limit_exceeded,
+                label=backend_step.label,
+                errors=backend_errors,
+                warnings=backend_warnings,
+                passes_run=passes_run,
             )
 
         if backend_step.returncode != 0:
@@ -167,14 +584,36 @@ def compile_project(
                 errors=backend_errors,
                 warnings=backend_warnings,
                 error_message=backend_errors[0] if backend_errors else fallback_message,
+                passes_run=passes_run,
             )
 
-    for pass_number in range(2, total_tex_passes + 1):
-        tex_step = _run_pdflatex_step(
+    last_tex_output = first_pass.output
+    while passes_run < total_tex_passes:
+        is_last_allowed = passes_run + 1 == total_tex_passes
+        if options.adaptive:
+            current_state = _aux_state(work_dir)
+            rerun = _needs_rerun(work_dir, read_state, current_state, last_tex_output)
+            if not rerun and (options.draft or not draft):
+                break
+            # A fresh .bbl only reaches the .aux (\bibcite) on this pass, so
+            # one more pass will follow.  If a draft pass converged, this is
+            # the PDF-producing pass.
+            draft = options.draft or (
+                rerun
+                and not is_last_allowed
+                and _bibliography_changed(read_state, current_state)
+            )
+            read_state = current_state
+        else:
+            draft = options.draft or not is_last_allowed
+
+        passes_run += 1
+        tex_step = yield _pdflatex_step(
             main_file=main_file,
-            compile_cwd=compile_cwd,
             timeout_seconds=options.timeout_seconds,
-            pass_number=pass_number,
+            pass_number=passes_run,
+            fmt=fmt,
+            draft=draft,
         )
         log_sections.append(_format_log_section(tex_step))
 
@@ -184,6 +623,7 @@ def compile_project(
                 log_sections=log_sections,
                 message=tex_step.missing_binary_message,
                 warnings=backend_warnings,
+                passes_run=passes_run,
             )
 
         tex_errors, tex_warnings = _parse_latex_log_messages(tex_step.output)
@@ -195,6 +635,18 @@ def compile_project(
                 label=tex_step.label,
                 errors=tex_errors,
                 warnings=backend_warnings + tex_warnings,
+                passes_run=passes_run,
+            )
+
+        if tex_step.limit_exceeded:
+            return _resource_limit_result(
+                start_time=start_time,
+                log_sections=log_sections,
+                limit=tex_step.limit_exceeded,
+                label=tex_step.label,
+                errors=tex_errors,
+                warnings=backend_warnings + tex_warnings,
+                passes_run=passes_run,
             )
 
         if tex_step.returncode != 0:
@@ -204,13 +656,27 @@ def compile_project(
                 errors=tex_errors,
                 warnings=backend_warnings + tex_warnings,
                 error_message=tex_errors[0] if tex_errors else "Compilation failed",
+                passes_run=passes_run,
             )
 
         final_tex_warnings = tex_warnings
+        last_tex_output = tex_step.output
 
     expected_pdf = _find_expected_pdf(work_dir, main_file)
     warnings = backend_warnings + final_tex_warnings
 
+    if options.draft:
+        # Nothing was written; success means every pass ran cleanly.
+        return CompileResult(
+            success=True,
+            compile_time_ms=int((time.time() - start_time) * 1000),
+            log=_join_log_sections(log_sections),
+            log_truncated=_is_truncated(log_sections),
+            warnings=warnings,
+            errors=[],
+            passes_run=passes_run,
+        )
+
     if not expected_pdf.exists():
         return _failure_result(
             start_time=start_time,
@@ -218,6 +684,7 @@ def compile_project(
             errors=[],
             warnings=warnings,
             error_message="Compilation failed",
+            passes_run=passes_run,
         )
 
     return CompileResult(
@@ -229,87 +696,337 @@ def compile_project(
         log_truncated=_is_truncated(log_sections),
         warnings=warnings,
         errors=[],
+        passes_run=passes_run,
     )
 
 
-def _run_pdflatex_step(
+def _prepare_format(
+    work_dir: Path,
+    main_file: str,
+    options: CompileOptions,
+    log_sections: list[str],
+) -> Generator[_StepRequest, _StepExecution, Optional[str]]:
+    """
+    Make a precompiled format of the main file's preamble available in
+    work_dir, dumping it first on a cache miss.
+
+    Returns the format name to pass to pdflatex, or None to compile normally.
+    """
+    key = format_key(work_dir, main_file)
+    if key is None or format_cache.known_bad(key):
+        return None
+    if format_cache.install(key, work_dir):
+        return key
+
+    dump = yield _format_dump_step(main_file, key, options.timeout_seconds)
+    fmt_path = work_dir / f"{key}.fmt"
+    if dump.returncode != 0 or not fmt_path.exists():
+        # Not fatal: mylatexformat cannot dump every preamble.
+        format_cache.mark_bad(key)
+        reason = "timed out" if dump.timed_out else "failed"
+        log_sections.append(
+            f"--- Format ---\nPreamble format dump {reason}; "
+            f"compiling without it\n"
+        )
+        return None
+
+    format_cache.store(key, fmt_path)
+    log_sections.append(f"--- Format ---\nDumped preamble format {key}\n")
+    return key
+
+
+def _format_dump_step(
     main_file: str,
-    compile_cwd: Path,
+    key: str,
     timeout_seconds: int,
-    pass_number: int,
-) -> _StepExecution:
-    return _run_step(
-        label=f"Pass {pass_number}",
+) -> _StepRequest:
+    return _StepRequest(
+        label="Format",
         cmd=[
             settings.TEX_BIN_PATH,
+            "-ini",
+            f"-jobname={key}",
             "-interaction=nonstopmode",
             "-halt-on-error",
-            "-file-line-error",
             "-no-shell-escape",
+            "&pdflatex",
+            "mylatexformat.ltx",
             main_file,
         ],
-        cwd=compile_cwd,
         timeout_seconds=timeout_seconds,
         missing_binary_message="pdflatex binary not found",
     )
 
 
+def _pdflatex_step(
+    main_file: str,
+    timeout_seconds: int,
+    pass_number: int,
+    fmt: Optional[str] = None,
+    draft: bool = False,
+) -> _StepRequest:
+    cmd = [
+        settings.TEX_BIN_PATH,
+        "-interaction=nonstopmode",
+        "-halt-on-error",
+        "-file-line-error",
+        "-no-shell-escape",
+    ]
+    if fmt is not None:
+        cmd.append(f"-fmt={fmt}")
+    if draft:
+        cmd.append("-draftmode")
+    cmd.append(main_file)
+    return _StepRequest(
+        label=f"Pass {pass_number}",
+        cmd=cmd,
+        timeout_seconds=timeout_seconds,
+        missing_binary_message="pdflatex binary not found",
+        parse_messages=_parse_latex_log_messages,
+    )
+
+
 def _run_backend_step(
+    work_dir: Path,
     backend: BackendName,
-    compile_cwd: Path,
     main_stem: str,
     timeout_seconds: int,
-) -> _StepExecution:
+) -> Generator[_StepRequest, _StepExecution, _StepExecution]:
+    """
+    Run bibtex/biber, or restore its cached .bbl if the citations and
+    bibliography inputs are unchanged.
+
+    A cache hit is reported as a step labelled ``... [cached]`` whose output
+    is the output of the run that produced the .bbl.
+    """
+    request = _backend_step(
+        backend=backend, main_stem=main_stem, timeout_seconds=timeout_seconds
+    )
+    key = (
+        bibliography_key(work_dir, main_stem, backend)
+        if settings.BIB_CACHE_ENABLED
+        else None
+    )
+    bbl_path = work_dir / f"{main_stem}.bbl"
+
+    if key is not None:
+        cached_output = bib_cache.restore(key, bbl_path)
+        if cached_output is not None:
+            return _StepExecution(
+                label=f"{request.label} [cached]",
+                output=cached_output,
+                returncode=0,
+            )
+
+    step = yield request
+    if key is not None and step.returncode == 0 and bbl_path.exists():
+        bib_cache.store(key, bbl_path, step.output)
+    return step
+
+
+def _backend_step(
+    backend: BackendName,
+    main_stem: str,
+    timeout_seconds: int,
+) -> _StepRequest:
     if backend == "biber":
-        return _run_step(
+        return _StepRequest(
             label="Bibliography (biber)",
             cmd=[settings.BIBER_BIN_PATH, main_stem],
-            cwd=compile_cwd,
             timeout_seconds=timeout_seconds,
             missing_binary_message="biber binary not found",
+            parse_messages=_parse_biber_messages,
         )
 
-    return _run_step(
+    return _StepRequest(
         label="Bibliography (bibtex)",
         cmd=[settings.BIBTEX_BIN_PATH, main_stem],
-        cwd=compile_cwd,
         timeout_seconds=timeout_seconds,
         missing_binary_message="bibtex binary not found",
+        parse_messages=_parse_bibtex_messages,
     )
 
 
 def _run_step(
-    label: str,
-    cmd: list[str],
-    cwd: Path,
-    timeout_seconds: int,
-    missing_binary_message: str,
+    step: _StepRequest, cwd: Path, cancel: Optional[CancelToken] = None
 ) -> _StepExecution:
     try:
-        result = subprocess.run(
-            cmd,
+        result = run_process(
+            step.cmd,
             cwd=str(cwd),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            timeout=timeout_seconds,
-            text=True,
+            timeout=step.timeout_seconds,
+            cancel=cancel,
         )
         return _StepExecution(
-            label=label,
+            label=step.label,
             output=result.stdout or "",
             returncode=result.returncode,
+            usage=result.usage,
         )
     except FileNotFoundError:
         return _StepExecution(
-            label=label,
+            label=step.label,
             output="",
-            missing_binary_message=missing_binary_message,
+            missing_binary_message=step.missing_binary_message,
         )
     except subprocess.TimeoutExpired as exc:
         output = exc.stdout or ""
         if isinstance(output, bytes):
             output = output.decode("utf-8", errors="replace")
-        return _StepExecution(label=label, output=output, timed_out=True)
+        return _StepExecution(label=step.label, output=output, timed_out=True)
+    except ResourceLimitExceeded as exc:
+        return _StepExecution(
+            label=step.label,
+            output=exc.output,
+            limit_exceeded=exc.limit,
+            usage=exc.usage,
+        )
+
+
+async def _run_step_async(step: _StepRequest, cwd: Path) -> _StepExecution:
+    sandbox = Sandbox()
+    try:
+        return await _run_sandboxed_step_async(step, cwd, sandbox)
+    finally:
+        sandbox.close()
+
+
+async def _run_sandboxed_step_async(
+    step: _StepRequest, cwd: Path, sandbox: Sandbox
+) -> _StepExecution:
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *step.cmd,
+            cwd=str(cwd),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            start_new_session=True,
+            preexec_fn=sandbox.preexec_fn,
+        )
+    except FileNotFoundError:
+        return _StepExecution(
+            label=step.label,
+            output="",
+            missing_binary_message=step.missing_binary_message,
+        )
+
+    # Read incrementally so partial output survives a timeout, matching
+    # subprocess.TimeoutExpired.stdout in the blocking runner.
+    output = bytearray()
+
+    async def _drain() -> None:
+        assert proc.stdout is not None
+        while chunk := await proc.stdout.read(64 * 1024):
+            output.extend(chunk)
+        await proc.wait()
+
+    try:
+        await asyncio.wait_for(_drain(), timeout=step.timeout_seconds)
+    except TimeoutError:
+        await _kill_async(proc)
+        return _StepExecution(
+            label=step.label,
+            output=output.decode("utf-8", errors="replace"),
+            timed_out=True,
+        )
+    except asyncio.CancelledError:
+        await _kill_async(proc)
+        raise
+
+    text = output.decode("utf-8", errors="replace")
+    return _StepExecution(
+        label=step.label,
+        output=text,
+        returncode=proc.returncode,
+        limit_exceeded=sandbox.breached_limit(proc.returncode, text),
+    )
+
+
+async def _kill_async(proc: asyncio.subprocess.Process) -> None:
+    # The step runs in its own session: kill helpers it spawned as well
+    kill_process_group(proc.pid)
+    await proc.wait()
+
+
+def _aux_state(work_dir: Path) -> dict[str, str]:
+    """Digest of every auxiliary file a pass may read back, by relative path."""
+    state = {}
+    for path in work_dir.rglob("*"):
+        if path.suffix in _AUX_SUFFIXES and path.is_file():
+            digest = hashlib.sha256(path.read_bytes()).hexdigest()
+            state[path.relative_to(work_dir).as_posix()] = digest
+    return state
+
+
+def _needs_rerun(
+    work_dir: Path,
+    read_state: dict[str, str],
+    current_state: dict[str, str],
+    tex_output: str,
+) -> bool:
+    """
+    Whether another pass could change the output.
+
+    *read_state* is what the last pass started from, *current_state* what the
+    next pass would start from.  New files count as unchanged when nothing in
+    them affects typesetting (e.g. an .aux holding only ``\relax``).
+    """
+    # TeX wraps log lines at 79 columns, which can split a rerun message.
+    unwrapped = tex_output.replace("\n", "")
+    if _RERUN_RE.search(tex_output) or _RERUN_RE.search(unwrapped):
+        return True
+    for rel_path in read_state.keys() | current_state.keys():
+        if read_state.get(rel_path) == current_state.get(rel_path):
+            continue
+        if rel_path not in read_state and _is_inert(work_dir / rel_path):
+            continue
+        return True
+    return False
+
+
+def _expects_rerun(
+    work_dir: Path,
+    main_file: str,
+    read_state: dict[str, str],
+) -> bool:
+    """
+    Guess, before the first pass, whether it will need a second one.
+
+    True when the sources use cross-references, citations or lists and there
+    is no .aux from an earlier compile to resolve them from.
+    """
+    if f"{Path(main_file).with_suffix('.aux').as_posix()}" in read_state:
+        return False
+    for path in work_dir.rglob("*.tex"):
+        try:
+            text = path.read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            continue
+        if _CROSS_REFERENCE_RE.search(text):
+            return True
+    return False
+
+
+def _bibliography_changed(
+    read_state: dict[str, str],
+    current_state: dict[str, str],
+) -> bool:
+    return any(
+        read_state.get(rel_path) != current_state.get(rel_path)
+        for rel_path in read_state.keys() | current_state.keys()
+        if rel_path.endswith(".bbl")
+    )
+
+
+def _is_inert(path: Path) -> bool:
+    try:
+        text = path.read_text(encoding="utf-8", errors="replace")
+    except OSError:
+        return False
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if path.suffix != ".aux":
+        return not lines
+    return all(_INERT_AUX_LINE_RE.match(line) for line in lines)
 
 
 def _detect_bibliography_backend(
@@ -358,6 +1075,7 @@ def _missing_binary_result(
     log_sections: list[str],
     message: str,
     warnings: Optional[list[str]] = None,
+    passes_run: int = 0,
 ) -> CompileResult:
     return _failure_result(
         start_time=start_time,
@@ -365,6 +1083,7 @@ def _missing_binary_result(
         errors=[message],
         warnings=warnings or [],
         error_message=message,
+        passes_run=passes_run,
     )
 
 
@@ -375,6 +1094,7 @@ def _timeout_result(
     label: str,
     errors: list[str],
     warnings: list[str],
+    passes_run: int = 0,
 ) -> CompileResult:
     log_sections = log_sections + [
         f"\n--- Timeout after {timeout_seconds}s during {label} ---"
@@ -389,6 +1109,34 @@ def _timeout_result(
         log_truncated=truncated,
         warnings=warnings,
         errors=errors,
+        passes_run=passes_run,
+    )
+
+
+def _resource_limit_result(
+    start_time: float,
+    log_sections: list[str],
+    limit: str,
+    label: str,
+    errors: list[str],
+    warnings: list[str],
+    passes_run: int = 0,
+) -> CompileResult:
+    description = limit.replace("_", " ")
+    log_sections = log_sections + [
+        f"\n--- Exceeded the {description} limit during {label} ---"
+    ]
+    log_output, truncated = _truncate_log("".join(log_sections))
+    return CompileResult(
+        success=False,
+        compile_time_ms=int((time.time() - start_time) * 1000),
+        log=log_output,
+        error_message=f"Compilation exceeded the {description} limit",
+        log_truncated=truncated,
+        warnings=warnings,
+        errors=errors,
+        passes_run=passes_run,
+        resource_limit=limit,
     )
 
 
@@ -398,6 +1146,7 @@ def _failure_result(
     errors: list[str],
     warnings: list[str],
     error_message: str,
+    passes_run: int = 0,
 ) -> CompileResult:
     log_output = "".join(log_sections)
     log_output, truncated = _truncate_log(log_output)
@@ -409,6 +1158,7 @@ def _failure_result(
         log_truncated=truncated,
         warnings=warnings,
         errors=errors,
+        passes_run=passes_run,
     )
 
 
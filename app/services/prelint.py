@@ -0,0 +1,164 @@
+"""
+Pure-Python pre-lint for LaTeX sources.
+
+Rejects input that cannot compile -- a stray ``}``, an argument that is
+never closed, a missing ``\\begin{document}``, mismatched
+``\\begin``/``\\end`` -- in microseconds, without spawning pdflatex.
+
+The checks are deliberately conservative.  Anything that changes how TeX
+reads characters (verbatim material, ``\\catcode``, ``\\url``, ...) switches
+the lexical checks off rather than risk rejecting a valid document.  An empty
+result therefore means "nothing obviously wrong", not "compiles".
+"""
+
+import re
+from typing import Optional
+
+# Constructs after which braces and \begin/\end no longer mean what they
+# appear to mean
+_OPAQUE_RE = re.compile(
+    r"\\(?:verb|catcode|url|path|href|lstinline|mintinline|iffalse|iftrue"
+    r"|scantokens|input|include|import|subimport|subfile)(?![A-Za-z@])"
+    r"|\\begin\s*\{(?:[A-Za-z]*[Vv]erbatim\*?|lstlisting|minted|comment"
+    r"|filecontents\*?)\}"
+    r"|`\\?[{}]"  # character codes such as \ifnum0=`{\fi
+)
+
+# A definition on one line that mentions \begin or \end: environments may be
+# opened and closed through macros, so \begin/\end pairing is not checked.
+_ENV_MACRO_RE = re.compile(
+    r"\\(?:[gex]?def|let|(?:re)?newcommand|providecommand|DeclareRobustCommand"
+    r"|(?:New|Renew|Provide|Declare)DocumentCommand)(?![A-Za-z@])[^\n]*"
+    r"\\(?:begin|end)(?![A-Za-z@])"
+)
+
+# Macros known to take a mandatory argument.  A "{" after any other control
+# word may just open a group (``\bfseries{...``), which TeX only warns about
+# when it is left open, so it is not reported.
+_ARGUMENT_MACROS = frozenset(
+    """
+    documentclass usepackage RequirePackage title author date thanks
+    part chapter section subsection subsubsection paragraph subparagraph
+    caption footnote footnotetext marginpar label ref eqref pageref cite
+    citep citet citeauthor citeyear nocite bibliography bibliographystyle
+    addbibresource includegraphics textbf textit texttt textrm textsf textsc
+    textup textsl textmd textnormal emph underline mbox makebox fbox framebox
+    parbox raisebox textcolor colorbox fcolorbox hspace vspace frac dfrac
+    tfrac binom sqrt mathbf mathrm mathit mathsf mathtt mathcal mathbb
+    mathfrak boldsymbol operatorname overline underbrace overbrace text
+    newcommand renewcommand providecommand newenvironment renewenvironment
+    setlength addtolength setcounter addtocounter newcounter
+    """.split()
+)
+
+_CONTROL_SEQUENCE_RE = re.compile(r"\\(?:[A-Za-z@]+|.)", re.DOTALL)
+_ENV_NAME_RE = re.compile(r"\s*\{([^{}\\#]*)\}")
+
+
+def prelint(source: str, filename: str = "main.tex") -> list[str]:
+    """
+    Return errors that make *source* certain to fail, formatted like
+    pdflatex's ``-file-line-error`` output.  At most one error is reported,
+    since anything after the first structural problem is noise.
+    """
+    uncommented = _strip_comments(source)
+    if _OPAQUE_RE.search(uncommented):
+        return []
+
+    if not re.search(r"\\begin\s*\{document\}", uncommented):
+        return [f"{filename}:1: Missing \\begin{{document}}"]
+
+    check_envs = not _ENV_MACRO_RE.search(uncommented)
+    error = _scan(source, filename, check_envs)
+    return [error] if error else []
+
+
+def _scan(source: str, filename: str, check_envs: bool) -> Optional[str]:
+    # (line, is_argument) of each unmatched "{".  A bare group left open only
+    # earns a warning from TeX; an unclosed macro argument is fatal.
+    open_braces: list[tuple[int, bool]] = []
+    # Next "{" opens a macro argument: the last token was a known
+    # argument-taking macro, \begin{env}, or the end of one of its arguments
+    after_argument_taker = False
+    # after_argument_taker as it was at the last "[" (optional arguments)
+    before_bracket = False
+    envs: list[tuple[str, int]] = []  # (name, line) of each open environment
+    line = 1
+    i = 0
+    n = len(source)
+
+    while i < n:
+        c = source[i]
+        if c == "\n":
+            line += 1
+        elif c in " \t\r":
+            pass
+        elif c == "%":
+            newline = source.find("\n", i)
+            i = n if newline == -1 else newline
+            continue
+        elif c == "\\":
+            match = _CONTROL_SEQUENCE_RE.match(source, i)
+            assert match is not None
+            name = match.group()[1:]
+            i = match.end()
+            line += match.group().count("\n")
+            after_argument_taker = name in _ARGUMENT_MACROS
+            if name in ("begin", "end"):
+                env = _ENV_NAME_RE.match(source, i)
+                if env is None:
+                    continue
+                env_name = env.group(1).strip()
+                line += env.group().count("\n")
+                i = env.end()
+                after_argument_taker = name == "begin" and env_name != "document"
+                if name == "begin":
+                    envs.append((env_name, line))
+                    continue
+                if check_envs:
+                    if not envs:
+                        return (
+                            f"{filename}:{line}: \\end{{{env_name}}} without "
+                            f"matching \\begin"
+                        )
+                    open_name, open_line = envs[-1]
+                    if open_name != env_name:
+                        return (
+                            f"{filename}:{line}: \\end{{{env_name}}} does not match "
+                            f"\\begin{{{open_name}}} on line {open_line}"
+                        )
+                if envs and envs[-1][0] == env_name:
+                    envs.pop()
+                if env_name == "document":
+                    break  # TeX stops reading here
+            continue
+        elif c == "{":
+            open_braces.append((line, after_argument_taker))
+            after_argument_taker = False
+        elif c == "}":
+            if not open_braces:
+                return f"{filename}:{line}: Unbalanced '}}' (no matching '{{')"
+            _, after_argument_taker = open_braces.pop()
+        elif c == "[":
+            before_bracket = after_argument_taker
+            after_argument_taker = False
+        elif c == "]":
+            after_argument_taker = before_bracket
+            before_bracket = False
+        else:
+            after_argument_taker = False
+        i += 1
+
+    for open_line, is_argument in reversed(open_braces):
+        if is_argument:
+            return f"{filename}:{open_line}: Argument opened with '{{' is never closed"
+    if check_envs and envs:
+        name, open_line = envs[-1]
+        return f"{filename}:{open_line}: \\begin{{{name}}} is never ended"
+    return None
+
+
+def _strip_comments(source: str) -> str:
+    return "\n".join(
+        re.sub(r"(?<!\\)%.*", "", line) for line in source.splitlines()
+    )
@@ -0,0 +1,424 @@
+"""
+Launching compile subprocesses.
+
+`run_process` is what the pipeline and texcount use instead of
+``subprocess.run``.  Each child starts in its own session, so a timeout kills
+the whole process tree -- helpers spawned by pdflatex or biber included --
+rather than only the direct child.
+
+A running compile can also be cancelled from the outside, e.g. because the
+client disconnected.  Compiles may run in a thread or in a process pool
+worker, so the signal is a `CancelToken`: a marker file the worker polls for
+while a step runs.
+
+Children also run inside a `Sandbox`: rlimits on address space, CPU time,
+file size and open files, and optionally a cgroup v2 of their own with
+``memory.max``/``cpu.max`` when ``COMPILE_CGROUP_DIR`` names a delegated
+cgroup.  A child that hits one of these limits raises ResourceLimitExceeded,
+so a runaway document is reported differently from a slow one.
+"""
+
+import logging
+import os
+import re
+import resource
+import selectors
+import signal
+import subprocess
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# How often a running step checks its cancel token
+_CANCEL_POLL_SECONDS = 0.1
+
+# How long to wait for output after killing a process group
+_DRAIN_SECONDS = 5
+
+_READ_CHUNK_SIZE = 64 * 1024
+
+
+# cgroup.kill makes stragglers exit; their cgroup can only go once they have
+_CGROUP_RMDIR_ATTEMPTS = 50
+
+# What the tools print when an allocation or open() fails under an rlimit
+_OUT_OF_MEMORY_RE = re.compile(
+    r"memory exhausted|out of memory|cannot allocate memory|bad_alloc", re.IGNORECASE
+)
+_TOO_MANY_FILES_RE = re.compile(r"too many open files", re.IGNORECASE)
+
+
+class CompileCancelledError(Exception):
+    """Raised inside a compile whose `CancelToken` was cancelled."""
+
+
+@dataclass(frozen=True)
+class ProcessUsage:
+    """What one child used, from ``os.wait4``."""
+
+    user_cpu_ms: int
+    system_cpu_ms: int
+    max_rss_kb: int
+    blocks_in: int  # 512-byte blocks read from disk (page cache hits are free)
+    blocks_out: int
+
+
+class ProcessResult(subprocess.CompletedProcess):
+    """``CompletedProcess`` with the child's resource usage."""
+
+    def __init__(
+        self, args: list[str], returncode: int, stdout: str, usage: ProcessUsage
+    ):
+        super().__init__(args, returncode, stdout)
+        self.usage = usage
+
+
+class ResourceLimitExceeded(Exception):
+    """
+    A child was stopped by one of its resource limits.
+
+    ``limit`` is "memory", "cpu_time", "file_size" or "open_files";
+    ``output`` is what the child printed before it died.
+    """
+
+    def __init__(
+        self,
+        cmd: list[str],
+        limit: str,
+        output: str = "",
+        usage: Optional[ProcessUsage] = None,
+    ):
+        self.cmd = cmd
+        self.limit = limit
+        self.output = output
+        self.usage = usage
+        super().__init__(
+            f"{Path(cmd[0]).name} exceeded the {limit.replace('_', ' ')} limit"
+        )
+
+
+@dataclass(frozen=True)
+class ResourceLimits:
+    """Per-process limits for compile children; 0 means unlimited."""
+
+    memory_bytes: int = 0
+    cpu_seconds: int = 0
+    file_size_bytes: int = 0
+    open_files: int = 0
+    cgroup_dir: Optional[str] = None
+    cgroup_cpu_quota: float = 0.0
+
+    @classmethod
+    def from_settings(cls) -> "ResourceLimits":
+        return cls(
+            memory_bytes=settings.COMPILE_MEMORY_LIMIT_BYTES,
+            cpu_seconds=settings.COMPILE_CPU_LIMIT_SECONDS,
+            file_size_bytes=settings.COMPILE_FILE_SIZE_LIMIT_BYTES,
+            open_files=settings.COMPILE_OPEN_FILES_LIMIT,
+            cgroup_dir=settings.COMPILE_CGROUP_DIR,
+            cgroup_cpu_quota=settings.COMPILE_CGROUP_CPU_QUOTA,
+        )
+
+
+class Sandbox:
+    """
+    Resource limits for one child process.
+
+    Pass `preexec_fn` to Popen (or ``create_subprocess_exec``), call
+    `breached_limit` once the child has exited and `close` when done.  With a
+    cgroup the memory limit is enforced there -- on resident memory, with the
+    OOM killer -- instead of through ``RLIMIT_AS``.
+    """
+
+    def __init__(self, limits: Optional[ResourceLimits] = None):
+        self.limits = limits or ResourceLimits.from_settings()
+        self._cgroup = _create_cgroup(self.limits)
+        self._procs_fd: Optional[int] = None
+        if self._cgroup is not None:
+            try:
+                self._procs_fd = os.open(self._cgroup / "cgroup.procs", os.O_WRONLY)
+            except OSError as exc:
+                logger.warning("Cannot use cgroup %s: %s", self._cgroup, exc)
+                _remove_cgroup(self._cgroup)
+                self._cgroup = None
+        self._rlimits = self._rlimit_table()
+
+    @property
+    def preexec_fn(self) -> Optional[Callable[[], None]]:
+        """Child-side setup, or None when there is nothing to apply."""
+        if not self._rlimits and self._procs_fd is None:
+            return None
+        return self._apply
+
+    def _rlimit_table(self) -> list[tuple[int, tuple[int, int]]]:
+        limits = self.limits
+        table = []
+        if limits.memory_bytes and self._cgroup is None:
+            table.append((resource.RLIMIT_AS, (limits.memory_bytes,) * 2))
+        if limits.cpu_seconds:
+            # SIGXCPU at the soft limit, SIGKILL a second later
+            table.append(
+                (resource.RLIMIT_CPU, (limits.cpu_seconds, limits.cpu_seconds + 1))
+            )
+        if limits.file_size_bytes:
+            table.append((resource.RLIMIT_FSIZE, (limits.file_size_bytes,) * 2))
+        if limits.open_files:
+            table.append((resource.RLIMIT_NOFILE, (limits.open_files,) * 2))
+        return table
+
+    def _apply(self) -> None:
+        # Runs in the child between fork and exec: no locks, no allocation
+        # beyond what setrlimit/write need.
+        for resource_id, value in self._rlimits:
+            resource.setrlimit(resource_id, value)
+        if self._procs_fd is not None:
+            os.write(self._procs_fd, b"0")  # "0" moves the writing process
+
+    def breached_limit(
+        self,
+        returncode: Optional[int],
+        output: str,
+        usage: Optional[ProcessUsage] = None,
+    ) -> Optional[str]:
+        """
+        The limit that stopped a child exiting with *returncode*, if any.
+
+        A SIGKILL only counts as the CPU limit when *usage* shows the child
+        used up its CPU time; the runner's own kills on timeout or cancel
+        are not limit breaches.
+        """
+        if returncode is None or returncode == 0:
+            return None
+        limits = self.limits
+        if returncode == -signal.SIGXCPU:
+            return "cpu_time"
+        if returncode == -signal.SIGXFSZ:
+            return "file_size"
+        if returncode == -signal.SIGKILL:
+            if self._oom_killed():
+                return "memory"
+            if limits.cpu_seconds and usage is not None:
+                cpu_ms = usage.user_cpu_ms + usage.system_cpu_ms
+                if cpu_ms >= limits.cpu_seconds * 1000:
+                    return "cpu_time"
+            return None
+        if limits.memory_bytes and _OUT_OF_MEMORY_RE.search(output):
+            return "memory"
+        if self._oom_killed():
+            return "memory"
+        if limits.open_files and _TOO_MANY_FILES_RE.search(output):
+            return "open_files"
+        return None
+
+    def _oom_killed(self) -> bool:
+        if self._cgroup is None:
+            return False
+        try:
+            events = (self._cgroup / "memory.events").read_text()
+        except OSError:
+            return False
+        match = re.search(r"^oom_kill (\d+)$", events, re.MULTILINE)
+        return match is not None and int(match.group(1)) > 0
+
+    def close(self) -> None:
+        """Kill anything left in the cgroup and remove it."""
+        if self._procs_fd is not None:
+            os.close(self._procs_fd)
+            self._procs_fd = None
+        if self._cgroup is not None:
+            _remove_cgroup(self._cgroup)
+            self._cgroup = None
+
+
+class CancelToken:
+    """
+    Cancellation flag that can be passed to a thread or process worker.
+
+    Backed by a marker file, so it pickles as a path and works across
+    processes.  The file only exists once `cancel` has been called; the
+    creator calls `close` when the compile is over.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or (
+            Path(tempfile.gettempdir()) / f"latex_cancel_{uuid.uuid4().hex}"
+        )
+
+    def cancel(self) -> None:
+        self.path.touch()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.path.exists()
+
+    def close(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+def run_process(
+    cmd: list[str],
+    *,
+    cwd: str,
+    timeout: float,
+    cancel: Optional[CancelToken] = None,
+) -> ProcessResult:
+    """
+    Run *cmd* to completion, capturing stdout and stderr together as text.
+
+    Like ``subprocess.run``, raises FileNotFoundError for a missing binary
+    and ``subprocess.TimeoutExpired`` (carrying the partial output) on
+    timeout.  Raises CompileCancelledError if *cancel* is cancelled.  In
+    both cases the child's entire process group is killed first.
+
+    The child runs in a `Sandbox`; ResourceLimitExceeded is raised if one of
+    its limits stopped it.  The child is reaped with ``os.wait4``, so the
+    result carries its `ProcessUsage`.
+    """
+    sandbox = Sandbox()
+    try:
+        proc = subprocess.Popen(
+            cmd,
+            cwd=cwd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+            preexec_fn=sandbox.preexec_fn,
+        )
+        with proc.stdout:  # type: ignore[union-attr]
+            output = _read_output(proc, cmd, timeout, cancel)
+        usage = _reap(proc)
+        limit = sandbox.breached_limit(proc.returncode, output, usage)
+        if limit is not None:
+            raise ResourceLimitExceeded(cmd, limit, output, usage)
+        return ProcessResult(cmd, proc.returncode, output, usage)
+    finally:
+        sandbox.close()
+
+
+def _read_output(
+    proc: subprocess.Popen,
+    cmd: list[str],
+    timeout: float,
+    cancel: Optional[CancelToken],
+) -> str:
+    """Read the child's output until EOF, enforcing *timeout* and *cancel*."""
+    assert proc.stdout is not None
+    fd = proc.stdout.fileno()
+    chunks: list[bytes] = []
+    deadline = time.monotonic() + timeout
+    next_cancel_check = time.monotonic() + _CANCEL_POLL_SECONDS
+    try:
+        with selectors.DefaultSelector() as selector:
+            selector.register(fd, selectors.EVENT_READ)
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    raise subprocess.TimeoutExpired(cmd, timeout)
+                if cancel is not None and now >= next_cancel_check:
+                    if cancel.cancelled:
+                        raise CompileCancelledError(f"{cmd[0]} cancelled")
+                    next_cancel_check = now + _CANCEL_POLL_SECONDS
+                wait = deadline - now
+                if cancel is not None:
+                    wait = min(wait, _CANCEL_POLL_SECONDS)
+                if selector.select(wait):
+                    chunk = os.read(fd, _READ_CHUNK_SIZE)
+                    if not chunk:
+                        return _decode(chunks)
+                    chunks.append(chunk)
+    except subprocess.TimeoutExpired:
+        _kill_group(proc, fd, chunks)
+        raise subprocess.TimeoutExpired(cmd, timeout, output=_decode(chunks)) from None
+    except BaseException:
+        _kill_group(proc, fd, chunks)
+        raise
+
+
+def _reap(proc: subprocess.Popen) -> ProcessUsage:
+    """Wait for *proc* with ``os.wait4`` and return what it used."""
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return ProcessUsage(
+        user_cpu_ms=int(rusage.ru_utime * 1000),
+        system_cpu_ms=int(rusage.ru_stime * 1000),
+        max_rss_kb=rusage.ru_maxrss,
+        blocks_in=rusage.ru_inblock,
+        blocks_out=rusage.ru_oublock,
+    )
+
+
+def _decode(chunks: list[bytes]) -> str:
+    return b"".join(chunks).decode("utf-8", errors="replace")
+
+
+def kill_process_group(pid: int) -> None:
+    """SIGKILL every process in the session led by *pid*."""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _kill_group(proc: subprocess.Popen, fd: int, chunks: list[bytes]) -> None:
+    """Kill *proc*'s process group and reap it, collecting remaining output."""
+    kill_process_group(proc.pid)
+    deadline = time.monotonic() + _DRAIN_SECONDS
+    with selectors.DefaultSelector() as selector:
+        selector.register(fd, selectors.EVENT_READ)
+        # A descendant that left the group may hold the pipe open: give up
+        # on the rest of the output after _DRAIN_SECONDS
+        while (remaining := deadline - time.monotonic()) > 0:
+            if not selector.select(remaining):
+                break
+            chunk = os.read(fd, _READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    proc.kill()
+    proc.wait()
+
+
+def _create_cgroup(limits: ResourceLimits) -> Optional[Path]:
+    """A fresh child cgroup of ``cgroup_dir`` with the limits applied."""
+    if not limits.cgroup_dir:
+        return None
+    path = Path(limits.cgroup_dir) / f"step_{uuid.uuid4().hex}"
+    try:
+        path.mkdir()
+        if limits.memory_bytes:
+            (path / "memory.max").write_text(str(limits.memory_bytes))
+            (path / "memory.swap.max").write_text("0")
+        if limits.cgroup_cpu_quota:
+            period = 100_000
+            quota = max(1000, int(limits.cgroup_cpu_quota * period))
+            (path / "cpu.max").write_text(f"{quota} {period}")
+    except OSError as exc:
+        # No cgroup v2, no delegation or a controller not enabled in the
+        # parent's cgroup.subtree_control: the rlimits still apply.
+        logger.warning("Cannot set up compile cgroup in %s: %s", limits.cgroup_dir, exc)
+        _remove_cgroup(path)
+        return None
+    return path
+
+
+def _remove_cgroup(path: Path) -> None:
+    try:
+        (path / "cgroup.kill").write_text("1")
+    except OSError:
+        pass
+    for _ in range(_CGROUP_RMDIR_ATTEMPTS):
+        try:
+            path.rmdir()
+            return
+        except FileNotFoundError:
+            return
+        except OSError:
+            time.sleep(0.01)
+    logger.warning("Could not remove compile cgroup %s", path)
@@ -0,0 +1,302 @@
+"""
+Content-addressed compile result cache.
+
+Editors with autosave resubmit byte-identical projects constantly.  A compile
+is fully determined by the project contents, the compile options that affect
+output, and the TeX toolchain, so successful results are cached under a hash
+of exactly those and served without creating a work dir or running any
+subprocess.
+
+Two tiers:
+- memory: LRU bounded by ``RESULT_CACHE_MAX_BYTES`` (entries larger than
+  ``RESULT_CACHE_MAX_ENTRY_BYTES`` skip it)
+- disk (optional): ``RESULT_CACHE_DIR``, bounded by
+  ``RESULT_CACHE_DISK_MAX_BYTES`` and evicted least-recently-used by mtime.
+  Shared by all uvicorn workers on the host.
+
+PDFs larger than ``RESULT_CACHE_MAX_ENTRY_BYTES`` are never read into memory:
+their entries reference the file instead, which is copied into (or served
+straight from) the disk tier.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import settings
+from app.core.metrics import observe_cache
+from app.models.compile import (
+    CompileOptions,
+    CompileResult,
+    StepUsage,
+    TextCountResponse,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedCompile:
+    """Everything needed to rebuild a successful compile response."""
+
+    pdf: bytes
+    compile_time_ms: int
+    log: str
+    log_truncated: bool = False
+    passes_run: int = 0
+    warnings: list[str] = field(default_factory=list)
+    errors: list[str] = field(default_factory=list)
+    textcount: Optional[TextCountResponse] = None
+    steps: list[StepUsage] = field(default_factory=list)
+    # Set instead of ``pdf`` for PDFs over RESULT_CACHE_MAX_ENTRY_BYTES
+    pdf_file: Optional[Path] = None
+
+    @classmethod
+    def from_result(
+        cls,
+        result: CompileResult,
+        textcount: Optional[TextCountResponse] = None,
+        read_pdf: bool = True,
+    ) -> "CachedCompile":
+        """
+        Capture a successful CompileResult.
+
+        Small PDFs are read into memory; larger ones (or any, with
+        ``read_pdf=False``) are referenced in place, so the entry is only
+        valid while the compile's work dir exists.
+        """
+        assert result.pdf_path is not None
+        large = (
+            not read_pdf
+            or result.pdf_path.stat().st_size > settings.RESULT_CACHE_MAX_ENTRY_BYTES
+        )
+        return cls(
+            pdf=b"" if large else result.pdf_path.read_bytes(),
+            pdf_file=result.pdf_path if large else None,
+            compile_time_ms=result.compile_time_ms,
+            log=result.log,
+            log_truncated=result.log_truncated,
+            passes_run=result.passes_run,
+            warnings=list(result.warnings),
+            errors=list(result.errors),
+            textcount=textcount,
+            steps=list(result.steps),
+        )
+
+    @property
+    def pdf_size(self) -> int:
+        if self.pdf_file is not None:
+            return self.pdf_file.stat().st_size
+        return len(self.pdf)
+
+    @property
+    def size(self) -> int:
+        return self.pdf_size + len(self.log)
+
+    def read_pdf(self) -> bytes:
+        """The PDF bytes, reading them from ``pdf_file`` if necessary."""
+        if self.pdf_file is not None:
+            return self.pdf_file.read_bytes()
+        return self.pdf
+
+    def metadata(self) -> dict:
+        return {
+            "compile_time_ms": self.compile_time_ms,
+            "log": self.log,
+            "log_truncated": self.log_truncated,
+            "passes_run": self.passes_run,
+            "warnings": self.warnings,
+            "errors": self.errors,
+            "textcount": self.textcount.model_dump() if self.textcount else None,
+            "steps": [step.model_dump() for step in self.steps],
+        }
+
+
+def compile_cache_key(project_digest: str, options: CompileOptions) -> str:
+    """
+    Cache key for compiling a project with the given options.
+
+    ``project_digest`` is `ProjectSnapshot.digest()`.  The timeout is left out
+    on purpose: it does not change the output of a successful compile.
+    """
+    material = {
+        "project": project_digest,
+        "engine": options.engine,
+        "passes": options.passes,
+        "adaptive": options.adaptive,
+        "draft": options.draft,
+        "main_file": options.main_file,
+        "toolchain": toolchain_version(),
+    }
+    encoded = json.dumps(material, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+@functools.lru_cache(maxsize=1)
+def toolchain_version() -> str:
+    """First ``--version`` line of each TeX tool, probed once per process."""
+    versions = []
+    for binary in (
+        settings.TEX_BIN_PATH,
+        settings.BIBTEX_BIN_PATH,
+        settings.BIBER_BIN_PATH,
+    ):
+        try:
+            run = subprocess.run(
+                [binary, "--version"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                timeout=10,
+                check=False,
+            )
+            first_line = (run.stdout or "").strip().splitlines()[:1]
+            versions.append(first_line[0] if first_line else f"{binary}: unknown")
+        except (OSError, subprocess.SubprocessError):
+            versions.append(f"{binary}: unavailable")
+    return " | ".join(versions)
+
+
+class ResultCache:
+    """Two-tier LRU cache of successful compile results."""
+
+    def __init__(self) -> None:
+        self._entries: "OrderedDict[str, CachedCompile]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedCompile]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            entry = self._disk_get(key)
+            if entry is not None:
+                self._memory_put(key, entry)
+        observe_cache("result", hit=entry is not None)
+        return entry
+
+    def put(self, key: str, entry: CachedCompile) -> None:
+        self._memory_put(key, entry)
+        self._disk_put(key, entry)
+
+    def clear(self) -> None:
+        """Drop the memory tier (the disk tier is left alone)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # -- memory tier ---------------------------------------------------------
+
+    def _memory_put(self, key: str, entry: CachedCompile) -> None:
+        if (
+            entry.pdf_file is not None
+            or entry.size > settings.RESULT_CACHE_MAX_ENTRY_BYTES
+        ):
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > settings.RESULT_CACHE_MAX_BYTES and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+
+    # -- disk tier -----------------------------------------------------------
+
+    def _disk_dir(self) -> Optional[Path]:
+        if not settings.RESULT_CACHE_DIR:
+            return None
+        return Path(settings.RESULT_CACHE_DIR)
+
+    def _disk_get(self, key: str) -> Optional[CachedCompile]:
+        cache_dir = self._disk_dir()
+        if cache_dir is None:
+            return None
+        pdf_path = cache_dir / f"{key}.pdf"
+        meta_path = cache_dir / f"{key}.json"
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            # Large PDFs are served from the cache file.  It was just touched,
+            # so LRU eviction by another worker is very unlikely to hit it.
+            large = pdf_path.stat().st_size > settings.RESULT_CACHE_MAX_ENTRY_BYTES
+            pdf = b"" if large else pdf_path.read_bytes()
+            os.utime(pdf_path)
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            return None
+
+        textcount = meta.get("textcount")
+        return CachedCompile(
+            pdf=pdf,
+            pdf_file=pdf_path if large else None,
+            compile_time_ms=meta["compile_time_ms"],
+            log=meta["log"],
+            log_truncated=meta["log_truncated"],
+            passes_run=meta.get("passes_run", 0),
+            warnings=meta["warnings"],
+            errors=meta["errors"],
+            textcount=TextCountResponse(**textcount) if textcount else None,
+            steps=[StepUsage(**step) for step in meta.get("steps", [])],
+        )
+
+    def _disk_put(self, key: str, entry: CachedCompile) -> None:
+        cache_dir = self._disk_dir()
+        if cache_dir is None:
+            return
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            # Write to temp names and rename so readers in other workers never
+            # see a half-written entry.  The PDF lands first: an entry counts
+            # as present once its .json exists.
+            suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+            pdf_tmp = cache_dir / f"{key}.pdf{suffix}"
+            meta_tmp = cache_dir / f"{key}.json{suffix}"
+            if entry.pdf_file is not None:
+                shutil.copyfile(entry.pdf_file, pdf_tmp)
+            else:
+                pdf_tmp.write_bytes(entry.pdf)
+            meta_tmp.write_text(json.dumps(entry.metadata()), encoding="utf-8")
+            os.replace(pdf_tmp, cache_dir / f"{key}.pdf")
+            os.replace(meta_tmp, cache_dir / f"{key}.json")
+            self._disk_evict(cache_dir)
+        except OSError as exc:
+            logger.warning("Failed to write result cache entry %s: %s", key, exc)
+
+    def _disk_evict(self, cache_dir: Path) -> None:
+        entries = []
+        total = 0
+        for path in cache_dir.iterdir():
+            if path.suffix not in (".pdf", ".json"):
+                continue
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= settings.RESULT_CACHE_DISK_MAX_BYTES:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+
+
+result_cache = ResultCache()
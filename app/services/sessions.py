@@ -0,0 +1,323 @@
+"""
+Persistent compile sessions with warm work directories.
+
+Every stateless compile starts from an empty work dir, so cross-references,
+the table of contents and the bibliography have to be rebuilt from scratch.
+A session keeps its work dir between compiles: the .aux, .bbl and .toc files
+of the previous run are there for the next one, and with adaptive passes a
+small edit usually needs a single pdflatex pass.  Clients upload the project
+once and then send only the files that changed.
+
+Sessions live under ``SESSION_DIR`` (shared by all workers on the host)::
+
+    <SESSION_DIR>/<session_id>/
+        files.json   source files, {path: {"sha256": ..., "size": ...}}
+        .lock        flock()ed while a request uses the session
+        work/        the work dir
+
+Requests on one session are serialized by the lock.  Sessions unused for
+``SESSION_TTL_SECONDS`` are removed, and the least recently used ones are
+removed while all sessions together exceed ``SESSION_MAX_BYTES``.  Sessions
+in use are never removed.  A janitor thread sweeps every
+``SESSION_JANITOR_INTERVAL_SECONDS``, and as soon as a session has grown.
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
+from typing import Optional
+
+from app.core.config import settings
+from app.services.adapters import ProjectSnapshot
+from app.services.validators import validate_file_path, validate_limits
+from app.services.workdir import safe_write_file, tree_size
+
+logger = logging.getLogger(__name__)
+
+_SESSION_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+
+class SessionNotFoundError(Exception):
+    """Raised for an unknown, expired or evicted session."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        super().__init__(f"Session {session_id!r} does not exist or has expired")
+
+
+@dataclass
+class Session:
+    """
+    Source files of a session, as recorded in its ``files.json``.
+
+    Build outputs in the work dir (.aux, .pdf, ...) are not tracked.
+    """
+
+    session_id: str
+    root: Path
+    files: dict[str, str] = field(default_factory=dict)  # path -> sha256
+    sizes: dict[str, int] = field(default_factory=dict)  # path -> bytes
+
+    @property
+    def work_dir(self) -> Path:
+        return self.root / "work"
+
+    @property
+    def file_count(self) -> int:
+        return len(self.files)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self.sizes.values())
+
+    def has_file(self, relative_path: str) -> bool:
+        return str(PurePosixPath(relative_path)) in self.files
+
+    def file_digests(self) -> dict[str, str]:
+        return dict(self.files)
+
+    def write_files(self, snapshot: ProjectSnapshot) -> None:
+        """
+        Add or replace the files of a validated *snapshot*.
+
+        Raises PayloadTooLargeError if the session would exceed the
+        per-project file count or size limit.
+        """
+        sizes = {**self.sizes, **{p: len(c) for p, c in snapshot.files.items()}}
+        validate_limits(file_count=len(sizes), total_bytes=sum(sizes.values()), passes=1)
+
+        for rel_path, content in snapshot.files.items():
+            safe_write_file(self.work_dir, rel_path, content)
+            self.files[rel_path] = hashlib.sha256(content).hexdigest()
+            self.sizes[rel_path] = len(content)
+        self._save()
+
+    def delete_file(self, relative_path: str) -> None:
+        """Remove a source file.  Raises KeyError if it is not in the session."""
+        rel_path = validate_file_path(relative_path)
+        if rel_path not in self.files:
+            raise KeyError(rel_path)
+        (self.work_dir / rel_path).unlink(missing_ok=True)
+        del self.files[rel_path]
+        del self.sizes[rel_path]
+        self._save()
+
+    def _save(self) -> None:
+        meta = {
+            path: {"sha256": self.files[path], "size": self.sizes[path]}
+            for path in self.files
+        }
+        tmp = self.root / "files.json.tmp"
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, self.root / "files.json")
+
+
+class SessionHandle:
+    """Exclusive use of a session; `release` it when the request is done."""
+
+    def __init__(self, session: Session, fd: int, local_lock: asyncio.Lock):
+        self.session = session
+        self._fd: Optional[int] = fd
+        self._local_lock = local_lock
+
+    def release(self) -> None:
+        """Unlock the session.  Safe to call more than once."""
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        try:
+            os.utime(self.session.root)  # last use, for TTL/LRU eviction
+        except FileNotFoundError:
+            pass  # deleted while held
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+        self._local_lock.release()
+
+
+class SessionStore:
+    """Create, lock, delete and evict sessions under ``SESSION_DIR``."""
+
+    def __init__(self) -> None:
+        # Serializes requests within this process without pinning a thread
+        # per waiter; the flock() serializes across worker processes.
+        self._local_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = (
+            weakref.WeakValueDictionary()
+        )
+        self._lock = threading.Lock()
+        self._janitor: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+
+    def sessions_dir(self) -> Path:
+        if settings.SESSION_DIR:
+            return Path(settings.SESSION_DIR)
+        return Path(tempfile.gettempdir()) / "latex_sessions"
+
+    def create(self) -> Session:
+        """Create an empty session.  Blocking; evicts old sessions first."""
+        self._start_janitor()
+        self.sweep()
+        session_id = uuid.uuid4().hex
+        root = self.sessions_dir() / session_id
+        (root / "work").mkdir(parents=True)
+        (root / ".lock").touch()
+        session = Session(session_id=session_id, root=root)
+        session._save()
+        return session
+
+    async def open(self, session_id: str) -> SessionHandle:
+        """
+        Wait for exclusive use of a session.
+
+        Raises SessionNotFoundError if it does not exist (or was evicted or
+        deleted while waiting).
+        """
+        root = self._root(session_id)
+        self._start_janitor()
+        local_lock = self._local_locks.get(session_id)
+        if local_lock is None:
+            local_lock = asyncio.Lock()
+            self._local_locks[session_id] = local_lock
+
+        await local_lock.acquire()
+        try:
+            fd = os.open(root / ".lock", os.O_RDWR)
+        except FileNotFoundError:
+            local_lock.release()
+            raise SessionNotFoundError(session_id) from None
+
+        try:
+            await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+            session = await asyncio.to_thread(self._load, session_id, root)
+        except BaseException:
+            os.close(fd)
+            local_lock.release()
+            raise
+        return SessionHandle(session, fd, local_lock)
+
+    def delete(self, handle: SessionHandle) -> None:
+        """Remove a session the caller holds, then release it."""
+        # files.json goes first, so requests waiting for the lock see the
+        # session as gone
+        (handle.session.root / "files.json").unlink(missing_ok=True)
+        shutil.rmtree(handle.session.root, ignore_errors=True)
+        handle.release()
+        self._local_locks.pop(handle.session.session_id, None)
+
+    def schedule_sweep(self) -> None:
+        """
+        Have the janitor sweep soon, e.g. after a session has grown.  Does
+        not block.
+        """
+        self._start_janitor()
+        self._wake.set()
+
+    def sweep(self) -> None:
+        """Remove expired sessions, then the least recently used over budget."""
+        sessions_dir = self.sessions_dir()
+        sessions_dir.mkdir(parents=True, exist_ok=True)
+        now = time.time()
+
+        idle = []  # (last_used, size, root) of sessions not in use
+        total = 0
+        for root in sessions_dir.iterdir():
+            if not _SESSION_ID_RE.fullmatch(root.name):
+                continue
+            try:
+                last_used = root.stat().st_mtime
+                size = tree_size(root)
+            except OSError:
+                continue
+            total += size
+            if now - last_used > settings.SESSION_TTL_SECONDS:
+                if self._remove_if_idle(root):
+                    total -= size
+                continue
+            idle.append((last_used, size, root))
+
+        idle.sort()
+        for _, size, root in idle:
+            if total <= settings.SESSION_MAX_BYTES:
+                break
+            if self._remove_if_idle(root):
+                total -= size
+
+    def disk_usage(self) -> int:
+        """Bytes used by all sessions on this host."""
+        return tree_size(self.sessions_dir())
+
+    def _remove_if_idle(self, root: Path) -> bool:
+        if not _remove_if_idle(root):
+            return False
+        self._local_locks.pop(root.name, None)
+        return True
+
+    # -- janitor ---------------------------------------------------------------
+
+    def _start_janitor(self) -> None:
+        with self._lock:
+            if self._janitor is not None:
+                return
+            self._janitor = threading.Thread(
+                target=self._janitor_loop, name="session-janitor", daemon=True
+            )
+        self._janitor.start()
+
+    def _janitor_loop(self) -> None:
+        while True:
+            self._wake.wait(settings.SESSION_JANITOR_INTERVAL_SECONDS)
+            self._wake.clear()
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Session janitor failed")
+
+    def _root(self, session_id: str) -> Path:
+        if not _SESSION_ID_RE.fullmatch(session_id):
+            raise SessionNotFoundError(session_id)
+        return self.sessions_dir() / session_id
+
+    def _load(self, session_id: str, root: Path) -> Session:
+        try:
+            meta = json.loads((root / "files.json").read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            raise SessionNotFoundError(session_id) from None
+        return Session(
+            session_id=session_id,
+            root=root,
+            files={path: entry["sha256"] for path, entry in meta.items()},
+            sizes={path: entry["size"] for path, entry in meta.items()},
+        )
+
+
+def _remove_if_idle(root: Path) -> bool:
+    """Delete a session directory unless a request holds its lock."""
+    try:
+        fd = os.open(root / ".lock", os.O_RDWR | os.O_CREAT)
+    except OSError:
+        return False
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        (root / "files.json").unlink(missing_ok=True)
+        shutil.rmtree(root, ignore_errors=True)
+        logger.info("Evicted session %s", root.name)
+        return True
+    finally:
+        os.close(fd)
+
+
+session_store = SessionStore()
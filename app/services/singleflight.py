@@ -0,0 +1,119 @@
+"""
+Single-flight deduplication of identical in-flight compiles.
+
+When several requests for the same key arrive while a compile for that key
+is still running, they all join the one running call instead of starting
+their own, and all receive the same result.
+
+Results often own resources (a work dir holding the PDF), so callers get a
+`Lease` rather than a bare value.  The optional ``finalize`` callback runs
+once, after the last lease on a successful result is released.  If every
+caller goes away (e.g. client disconnects) before the call finishes, the call
+is cancelled.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Generic, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class _Flight(Generic[T]):
+    task: "asyncio.Task[T]"
+    finalize: Optional[Callable[[T], None]]
+    holders: int = 0
+
+
+class Lease(Generic[T]):
+    """A caller's share of a single-flight result."""
+
+    def __init__(
+        self,
+        group: "SingleFlight[T]",
+        flight: _Flight[T],
+        result: T,
+        shared: bool,
+    ):
+        self._group = group
+        self._flight = flight
+        self._released = False
+        self.result = result
+        self.shared = shared  # True if this caller joined someone else's call
+
+    def release(self) -> None:
+        """Give up this share.  Safe to call more than once."""
+        if self._released:
+            return
+        self._released = True
+        self._group._drop(self._flight)
+
+
+class SingleFlight(Generic[T]):
+    """Deduplicate concurrent calls by key within one event loop."""
+
+    def __init__(self) -> None:
+        self._flights: dict[str, _Flight[T]] = {}
+
+    def in_flight(self) -> int:
+        """Number of distinct calls currently running."""
+        return len(self._flights)
+
+    async def join(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[T]],
+        finalize: Optional[Callable[[T], None]] = None,
+    ) -> Lease[T]:
+        """
+        Await the call for *key*, starting it with *factory* if none is running.
+
+        *finalize* is only used by the caller that starts the call.  Exceptions
+        raised by the call propagate to every joined caller.
+        """
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight(task=asyncio.ensure_future(factory()), finalize=finalize)
+            self._flights[key] = flight
+            flight.task.add_done_callback(
+                lambda _task, key=key, flight=flight: self._forget(key, flight)
+            )
+
+        flight.holders += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        except BaseException:
+            self._drop(flight)
+            raise
+        return Lease(self, flight, result, shared)
+
+    def _forget(self, key: str, flight: _Flight[T]) -> None:
+        # Later callers start a fresh call; current holders keep their leases.
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _drop(self, flight: _Flight[T]) -> None:
+        flight.holders -= 1
+        if flight.holders > 0:
+            return
+        if flight.task.done():
+            self._finalize(flight)
+        else:
+            # Nobody is waiting any more: stop the work, then clean up if it
+            # managed to finish anyway.
+            flight.task.cancel()
+            flight.task.add_done_callback(lambda _task: self._finalize(flight))
+
+    def _finalize(self, flight: _Flight[T]) -> None:
+        task = flight.task
+        if flight.finalize is None or task.cancelled() or task.exception():
+            return
+        try:
+            flight.finalize(task.result())
+        except Exception:
+            logger.exception("Single-flight finalizer failed")
@@ -18,6 +18,7 @@ from app.models.compile import (
     TextCountResponse,
     TextCountTotals,
 )
+from app.services.process import ResourceLimitExceeded, run_process
 
 logger = logging.getLogger(__name__)
 
@@ -65,6 +66,8 @@ def collect_textcount(work_dir: Path, main_file: str) -> TextCountResponse:
                 f"after {settings.TEXTCOUNT_TIMEOUT_SECONDS}s"
             ),
         )
+    except ResourceLimitExceeded as exc:
+        return TextCountResponse(status="error", message=f"texcount summary: {exc}")
     except Exception as exc:  # pragma: no cover - defensive catch
         logger.exception("Unexpected texcount summary failure")
         return TextCountResponse(status="error", message=f"texcount failed: {exc}")
@@ -95,6 +98,12 @@ def collect_textcount(work_dir: Path, main_file: str) -> TextCountResponse:
             ),
             totals=totals,
         )
+    except ResourceLimitExceeded as exc:
+        return TextCountResponse(
+            status="partial",
+            message=f"texcount per-file breakdown: {exc}",
+            totals=totals,
+        )
     except Exception as exc:  # pragma: no cover - defensive catch
         logger.exception("Unexpected texcount file breakdown failure")
         return TextCountResponse(
@@ -124,14 +133,8 @@ def collect_textcount(work_dir: Path, main_file: str) -> TextCountResponse:
 
 
 def _run_texcount(cmd: list[str], work_dir: Path) -> subprocess.CompletedProcess[str]:
-    return subprocess.run(
-        cmd,
-        cwd=str(work_dir),
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-        timeout=settings.TEXTCOUNT_TIMEOUT_SECONDS,
-        check=False,
+    return run_process(
+        cmd, cwd=str(work_dir), timeout=settings.TEXTCOUNT_TIMEOUT_SECONDS
     )
 
 
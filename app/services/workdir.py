@@ -5,13 +5,20 @@ Provides safe creation, file writing, and guaranteed cleanup of temporary
 compilation work directories.
 """
 
+import fcntl
 import logging
+import os
 import shutil
 import tempfile
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+WORKDIR_PREFIX = "latex_job_"
+
+# Linux FICLONE ioctl: copy-on-write clone on btrfs/xfs/overlayfs
+_FICLONE = 0x40049409
+
 
 def create_workdir() -> Path:
     """
@@ -19,10 +26,34 @@ def create_workdir() -> Path:
 
     Returns the Path to the created directory.
     """
-    work_dir = Path(tempfile.mkdtemp(prefix="latex_job_"))
+    work_dir = Path(tempfile.mkdtemp(prefix=WORKDIR_PREFIX))
     return work_dir
 
 
+def tree_size(root: Path) -> int:
+    """Total size of the files under *root*, skipping any that vanish."""
+    total = 0
+    for dirpath, _dirnames, filenames in os.walk(root):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def workdir_disk_usage() -> int:
+    """Bytes used by all compile work dirs on this host."""
+    total = 0
+    with os.scandir(tempfile.gettempdir()) as entries:
+        for entry in entries:
+            if entry.name.startswith(WORKDIR_PREFIX) and entry.is_dir(
+                follow_symlinks=False
+            ):
+                total += tree_size(Path(entry.path))
+    return total
+
+
 def cleanup_workdir(work_dir: Path) -> None:
     """
     Recursively delete a work directory.
@@ -37,15 +68,15 @@ def cleanup_workdir(work_dir: Path) -> None:
         logger.warning("Failed to clean up work directory %s: %s", work_dir, exc)
 
 
-def safe_write_file(work_dir: Path, relative_path: str, content: bytes) -> Path:
+def safe_workdir_path(work_dir: Path, relative_path: str) -> Path:
     """
-    Write a file into the work directory at the given relative path.
+    Resolve a relative path inside the work directory, ready to be created.
 
     - Creates parent directories as needed.
     - Validates that the resolved destination stays within work_dir
       (prevents symlink escapes).
 
-    Returns the absolute path to the written file.
+    Returns the absolute destination path.
     Raises ValueError if the resolved path escapes work_dir.
     """
     dest = (work_dir / relative_path).resolve()
@@ -63,7 +94,38 @@ def safe_write_file(work_dir: Path, relative_path: str, content: bytes) -> Path:
     # Create parent directories
     dest.parent.mkdir(parents=True, exist_ok=True)
 
-    # Write file contents (overwrites if file already exists from duplicate path)
+    return dest
+
+
+def safe_write_file(work_dir: Path, relative_path: str, content: bytes) -> Path:
+    """
+    Write a file into the work directory at the given relative path.
+
+    The destination is checked by `safe_workdir_path`.
+
+    Returns the absolute path to the written file.
+    Raises ValueError if the resolved path escapes work_dir.
+    """
+    dest = safe_workdir_path(work_dir, relative_path)
+
+    # Write file contents (replaces a file already there from a duplicate
+    # path).  Unlink first: the old file may be hardlinked from the blob store.
+    dest.unlink(missing_ok=True)
     dest.write_bytes(content)
 
     return dest
+
+
+def clone_file(src: Path, dest: Path) -> None:
+    """
+    Copy *src* to *dest* as a copy-on-write clone where the filesystem
+    supports it, else as a plain copy.  *dest* is writable either way.
+    """
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+            return
+        except OSError:
+            pass
+        shutil.copyfileobj(fsrc, fdst)
+    os.chmod(dest, 0o644)
@@ -12,7 +12,9 @@ from pathlib import Path
 import pytest
 from fastapi.testclient import TestClient
 
+from app.core.config import settings
 from app.main import app
+from app.services.result_cache import result_cache
 
 FIXTURES_DIR = Path(__file__).parent / "fixtures" / "projects"
 
@@ -40,6 +42,50 @@ def _has_kpsewhich_file(filename: str) -> bool:
 HAS_BIBLATEX_STY = _has_kpsewhich_file("biblatex.sty")
 
 
+@pytest.fixture(autouse=True)
+def _isolate_result_cache():
+    """Keep cached compiles from leaking between tests."""
+    result_cache.clear()
+    yield
+    result_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def _isolate_bib_cache(tmp_path, monkeypatch):
+    """Give every test an empty bibliography cache."""
+    monkeypatch.setattr(settings, "BIB_CACHE_DIR", str(tmp_path / "bib_cache"))
+
+
+# Body of the default fake pdflatex: fails on sources containing "fail",
+# otherwise writes main.pdf
+FAKE_PDFLATEX = (
+    "grep -q fail main.tex && { echo '! Undefined control sequence.'; exit 1; }\n"
+    "printf '%%PDF-1.4' > main.pdf\n"
+)
+
+
+@pytest.fixture
+def fake_pdflatex(tmp_path, monkeypatch):
+    """
+    Install a fake pdflatex shell script as ``TEX_BIN_PATH``.
+
+    Returns a function taking the script body (run after the ``--version``
+    probe has been answered, in the work dir) that installs the script and
+    returns its path.  The result cache is disabled, so every request runs
+    the script.
+    """
+
+    def install(body: str = FAKE_PDFLATEX) -> Path:
+        script = tmp_path / "pdflatex"
+        script.write_text('#!/bin/sh\n[ "$1" = --version ] && exit 0\n' + body)
+        script.chmod(0o755)
+        monkeypatch.setattr(settings, "TEX_BIN_PATH", str(script))
+        monkeypatch.setattr(settings, "RESULT_CACHE_ENABLED", False)
+        return script
+
+    return install
+
+
 @pytest.fixture
 def client():
     """FastAPI test client."""
@@ -0,0 +1,161 @@
+"""
+Tests for app.services.admission and its wiring into the compile routes.
+"""
+
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.services.admission import AdmissionController, OverloadedError
+
+client = TestClient(app)
+
+SIMPLE_TEX = rb"\documentclass{article}\begin{document}Hi\end{document}"
+
+
+# =====================================================================
+# AdmissionController
+# =====================================================================
+
+
+class TestAdmissionController:
+    def test_admits_up_to_max_concurrency_without_waiting(self):
+        async def main():
+            gate = AdmissionController(2, 4, 1.0)
+            first = await gate.acquire()
+            second = await gate.acquire()
+            return gate, first, second
+
+        gate, first, second = asyncio.run(main())
+        assert gate.active == 2
+        assert first.queue_wait_ms == 0
+        assert second.queue_depth == 0
+
+    def test_rejects_when_queue_is_full(self):
+        async def main():
+            gate = AdmissionController(1, 0, 1.0)
+            await gate.acquire()
+            await gate.acquire()
+
+        with pytest.raises(OverloadedError) as exc_info:
+            asyncio.run(main())
+        assert exc_info.value.retry_after >= 1
+
+    def test_queue_timeout_rejects_and_leaves_queue(self):
+        async def main():
+            gate = AdmissionController(1, 4, 0.05)
+            await gate.acquire()
+            with pytest.raises(OverloadedError):
+                await gate.acquire()
+            return gate
+
+        gate = asyncio.run(main())
+        assert gate.queue_depth == 0
+        assert gate.active == 1
+
+    def test_release_hands_slot_to_oldest_waiter(self):
+        async def main():
+            gate = AdmissionController(1, 4, 5.0)
+            order: list[str] = []
+
+            async def worker(name: str, hold: float):
+                async with gate.slot() as ticket:
+                    order.append(name)
+                    await asyncio.sleep(hold)
+                    return ticket
+
+            first = asyncio.create_task(worker("a", 0.05))
+            await asyncio.sleep(0)
+            second = asyncio.create_task(worker("b", 0))
+            third = asyncio.create_task(worker("c", 0))
+            tickets = await asyncio.gather(first, second, third)
+            return gate, order, tickets
+
+        gate, order, tickets = asyncio.run(main())
+        assert order == ["a", "b", "c"]
+        assert tickets[1].queue_depth == 0
+        assert tickets[2].queue_depth == 1
+        assert tickets[2].queue_wait_ms > 0
+        assert gate.active == 0
+
+    def test_cancelled_waiter_does_not_leak_slot(self):
+        async def main():
+            gate = AdmissionController(1, 4, 5.0)
+            await gate.acquire()
+            waiter = asyncio.create_task(gate.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            gate.release()
+            return gate
+
+        gate = asyncio.run(main())
+        assert gate.active == 0
+        assert gate.queue_depth == 0
+
+    def test_retry_after_tracks_observed_latency(self):
+        async def main():
+            gate = AdmissionController(1, 0, 1.0)
+            async with gate.slot():
+                await asyncio.sleep(1.1)
+            return gate.retry_after()
+
+        assert asyncio.run(main()) == 2
+
+
+# =====================================================================
+# Route wiring
+# =====================================================================
+
+
+class TestOverloadResponses:
+    def test_v2_returns_503_with_retry_after(self, monkeypatch):
+        monkeypatch.setattr(settings, "MAX_CONCURRENT_COMPILES", 0)
+        monkeypatch.setattr(settings, "COMPILE_QUEUE_SIZE", 0)
+
+        with patch("app.api.routes_v2.compile_project") as mock_compile:
+            r = client.post(
+                "/v2/compile/sync",
+                data={"main_file": "main.tex"},
+                files=[("files", ("main.tex", SIMPLE_TEX))],
+            )
+
+        assert r.status_code == 503
+        assert int(r.headers["retry-after"]) >= 1
+        body = r.json()
+        assert body["status"] == "error"
+        assert body["error_type"] == "overloaded"
+        mock_compile.assert_not_called()
+
+    def test_v2_logs_overloaded_compile_event(self, monkeypatch):
+        monkeypatch.setattr(settings, "MAX_CONCURRENT_COMPILES", 0)
+        monkeypatch.setattr(settings, "COMPILE_QUEUE_SIZE", 0)
+
+        with patch("app.api.routes_v2.log_compile_event") as mock_log:
+            r = client.post(
+                "/v2/compile/validate",
+                json={"code": SIMPLE_TEX.decode(), "prelint": False},
+            )
+
+        assert r.status_code == 503
+        mock_log.assert_called_once()
+        event = mock_log.call_args.kwargs
+        assert event["outcome"] == "overloaded"
+        assert event["endpoint"] == "/v2/compile/validate"
+        assert event["queue_depth"] == 0
+
+    def test_v1_returns_503_with_retry_after(self, monkeypatch):
+        monkeypatch.setattr(settings, "MAX_CONCURRENT_COMPILES", 0)
+        monkeypatch.setattr(settings, "COMPILE_QUEUE_SIZE", 0)
+
+        with patch("app.api.routes_compile.compile_latex_sync") as mock_compile:
+            r = client.post("/compile/sync", data={"code": SIMPLE_TEX.decode()})
+
+        assert r.status_code == 503
+        assert "retry-after" in r.headers
+        mock_compile.assert_not_called()
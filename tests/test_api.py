@@ -19,53 +19,44 @@ def test_health():
 
 
 @patch("app.api.routes_compile.compile_latex_sync")
-def test_compile_sync_file(mock_compile):
-    # Mock successful compilation
+def test_compile_sync_file(mock_compile, tmp_path):
+    # Mock successful compilation; the PDF is streamed from result.pdf_path
+    pdf_path = tmp_path / "main.pdf"
+    pdf_path.write_bytes(b"PDF CONTENT")
     mock_result = MagicMock()
     mock_result.success = True
-    # Use a mock for pdf_path so we can mock exists()
-    mock_pdf_path = MagicMock()
-    mock_pdf_path.exists.return_value = True
-    mock_result.pdf_path = mock_pdf_path
-
+    mock_result.pdf_path = pdf_path
+    mock_result.work_dir = None
     mock_result.compile_time_ms = 100
     mock_compile.return_value = mock_result
 
-    # Mock file open
-    # We need to mock open() because the route tries to open result.pdf_path
-    with patch("builtins.open", create=True) as mock_open:
-        mock_open.return_value.__enter__.return_value.read.return_value = b"PDF CONTENT"
-
-        response = client.post(
-            "/compile/sync", files={"file": ("test.tex", b"content", "text/plain")}
-        )
+    response = client.post(
+        "/compile/sync", files={"file": ("test.tex", b"content", "text/plain")}
+    )
 
-        assert response.status_code == 200
-        assert response.content == b"PDF CONTENT"
+    assert response.status_code == 200
+    assert response.content == b"PDF CONTENT"
+    assert response.headers["content-type"] == "application/pdf"
 
 
 @patch("app.api.routes_compile.compile_latex_sync")
-def test_compile_sync_code(mock_compile):
-    # Mock successful compilation
+def test_compile_sync_code(mock_compile, tmp_path):
+    # Mock successful compilation; the PDF is streamed from result.pdf_path
+    pdf_path = tmp_path / "main.pdf"
+    pdf_path.write_bytes(b"PDF CONTENT")
     mock_result = MagicMock()
     mock_result.success = True
-    # Use a mock for pdf_path so we can mock exists()
-    mock_pdf_path = MagicMock()
-    mock_pdf_path.exists.return_value = True
-    mock_result.pdf_path = mock_pdf_path
-
+    mock_result.pdf_path = pdf_path
+    mock_result.work_dir = None
     mock_result.compile_time_ms = 100
     mock_compile.return_value = mock_result
 
-    with patch("builtins.open", create=True) as mock_open:
-        mock_open.return_value.__enter__.return_value.read.return_value = b"PDF CONTENT"
-
-        response = client.post(
-            "/compile/sync", data={"code": r"\documentclass{article}..."}
-        )
+    response = client.post(
+        "/compile/sync", data={"code": r"\documentclass{article}..."}
+    )
 
-        assert response.status_code == 200
-        assert response.content == b"PDF CONTENT"
+    assert response.status_code == 200
+    assert response.content == b"PDF CONTENT"
 
 
 def test_compile_sync_missing_input():
@@ -0,0 +1,183 @@
+"""
+Tests for batch compiles (/v2/compile/batch).
+"""
+
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.responses import PDF_CHUNK_SIZE, ZipStream
+from app.api.routes_v2 import _BatchItemResult, _iter_batch
+from app.core.config import settings
+from app.main import app
+from app.services.blob_store import blob_store
+
+client = TestClient(app)
+
+MAIN = "\\documentclass{article}\n\\begin{document}x\\end{document}\n"
+
+
+@pytest.fixture(autouse=True)
+def _toolchain(tmp_path, monkeypatch, fake_pdflatex):
+    """Fake pdflatex whose PDF starts with the first bytes of the main file."""
+    fake_pdflatex(
+        "grep -q fail \"$(eval echo \\${$#})\" && { echo '! Undefined control sequence.'; exit 1; }\n"
+        'printf "%%PDF-1.4 $(cat "$(eval echo \\${$#})" | head -c 8)" > "$(basename "$(eval echo \\${$#})" .tex).pdf"\n'
+    )
+    monkeypatch.setattr(settings, "BLOB_STORE_DIR", str(tmp_path / "blobs"))
+
+
+def _lines(r) -> dict[str, dict]:
+    assert r.status_code == 200
+    return {line["id"]: line for line in map(json.loads, r.text.splitlines())}
+
+
+def test_ndjson_mixes_successes_and_failures():
+    r = client.post(
+        "/v2/compile/batch",
+        json={
+            "passes": 1,
+            "items": [
+                {"id": "a", "code": MAIN},
+                {"id": "broken", "code": "fail"},
+                {"id": "evil", "code": "\\write18{rm -rf /}"},
+                {"id": "empty", "code": "  "},
+                {"id": "both", "code": MAIN, "files": {}},
+            ],
+        },
+    )
+
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = _lines(r)
+    assert set(lines) == {"a", "broken", "evil", "empty", "both"}
+    assert lines["a"]["status"] == "ok"
+    assert lines["a"]["passes_run"] == 1
+    assert base64.b64decode(lines["a"]["pdf_base64"]).startswith(b"%PDF-1.4")
+    assert lines["broken"]["error_type"] == "latex_compile_error"
+    assert "Undefined control sequence" in lines["broken"]["log"]
+    assert lines["evil"]["error_type"] == "invalid_input"
+    assert "Dangerous macro" in lines["evil"]["message"]
+    assert lines["empty"]["error_type"] == "invalid_input"
+    assert lines["both"]["error_type"] == "invalid_input"
+
+
+def test_manifest_items():
+    main = MAIN.encode()
+    digest = blob_store.put(main)
+    missing = hashlib.sha256(b"not stored").hexdigest()
+
+    r = client.post(
+        "/v2/compile/batch",
+        json={
+            "passes": 1,
+            "items": [
+                {"id": "stored", "files": {"doc.tex": digest}, "main_file": "doc.tex"},
+                {"id": "missing", "files": {"main.tex": missing}},
+            ],
+        },
+    )
+
+    lines = _lines(r)
+    assert lines["stored"]["status"] == "ok"
+    assert lines["missing"]["error_type"] == "missing_blobs"
+    assert lines["missing"]["errors"] == [missing]
+
+
+def test_zip():
+    r = client.post(
+        "/v2/compile/batch",
+        json={
+            "return": "zip",
+            "passes": 1,
+            "items": [{"id": "one", "code": MAIN}, {"id": "two", "code": "fail"}],
+        },
+    )
+
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(r.content)) as zf:
+        assert sorted(zf.namelist()) == ["one.json", "one.pdf", "two.json"]
+        assert zf.read("one.pdf").startswith(b"%PDF-1.4")
+        assert json.loads(zf.read("one.json"))["status"] == "ok"
+        assert json.loads(zf.read("two.json"))["status"] == "error"
+
+
+@pytest.mark.parametrize(
+    "body, status",
+    [
+        ({"items": []}, 422),
+        ({"items": [{"id": "../x", "code": MAIN}]}, 422),
+        ({"items": [{"id": "a", "code": MAIN}, {"id": "a", "code": MAIN}]}, 422),
+        ({"items": [{"id": "a", "code": MAIN}], "return": "pdf"}, 422),
+        ({"items": [{"id": "a", "code": MAIN}], "concurrency": 0}, 422),
+        ({"items": [{"id": "a", "code": MAIN}], "engine": "xelatex"}, 422),
+        ({"items": [{"id": f"d{i}", "code": MAIN} for i in range(3)]}, 413),
+    ],
+)
+def test_rejected_batches(body, status, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_MAX_ITEMS", 2)
+    r = client.post("/v2/compile/batch", json=body)
+    assert r.status_code == status
+
+
+def test_iter_batch_limits_concurrency_and_cleans_up():
+    active = 0
+    peak = 0
+    cleaned: list[int] = []
+
+    async def compile_item(n: int) -> _BatchItemResult:
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01 * (n % 3))
+        active -= 1
+        return _BatchItemResult({"id": n}, cleanup=lambda: cleaned.append(n))
+
+    async def run(stop_after=None):
+        seen = []
+        async for result in _iter_batch(list(range(10)), compile_item, concurrency=3):
+            seen.append(result.metadata["id"])
+            if len(seen) == stop_after:
+                break
+        return seen
+
+    assert sorted(asyncio.run(run())) == list(range(10))
+    assert peak <= 3
+    assert sorted(cleaned) == list(range(10))
+
+    # Abandoning the batch releases whatever already finished
+    cleaned.clear()
+
+    async def abandon():
+        seen = await run(stop_after=2)
+        await asyncio.sleep(0.05)
+        return seen
+
+    asyncio.run(abandon())
+    assert len(cleaned) >= 2
+
+
+def test_zip_stream_sends_pdfs_in_chunks(tmp_path):
+    pdf = tmp_path / "big.pdf"
+    pdf.write_bytes(bytes(range(256)) * (3 * PDF_CHUNK_SIZE // 256 + 1))
+
+    async def build() -> list[bytes]:
+        archive = ZipStream()
+        chunks = [chunk async for chunk in archive.add_pdf("big.pdf", pdf)]
+        chunks.append(await asyncio.to_thread(archive.add, "big.json", b"{}"))
+        chunks.append(await asyncio.to_thread(archive.close))
+        return chunks
+
+    chunks = asyncio.run(build())
+
+    assert len(chunks) >= 4
+    assert max(map(len, chunks)) < 2 * PDF_CHUNK_SIZE
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zf:
+        assert zf.read("big.pdf") == pdf.read_bytes()
+        assert zf.read("big.json") == b"{}"
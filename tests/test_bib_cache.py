@@ -0,0 +1,143 @@
+"""
+Tests for app.services.bib_cache and its use by the compile pipeline.
+"""
+
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from app.core.config import settings
+from app.models.compile import CompileOptions
+from app.services import bib_cache as bib_cache_module
+from app.services.bib_cache import bibliography_key
+from app.services.pipeline import compile_project
+
+AUX = "\\relax\n\\citation{knuth}\n\\bibstyle{plain}\n\\bibdata{refs}\n"
+BIB = "@book{knuth, title={TAOCP}}\n"
+
+
+@pytest.fixture
+def work_dir():
+    d = Path(tempfile.mkdtemp(prefix="latex_job_"))
+    yield d
+    shutil.rmtree(d, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def _fixed_toolchain(monkeypatch):
+    monkeypatch.setattr(bib_cache_module, "toolchain_version", lambda: "test")
+
+
+def _fake_tools(directory: Path, calls_log: Path) -> None:
+    """pdflatex writes a citing .aux and a PDF; bibtex writes a .bbl."""
+    pdflatex = directory / "pdflatex"
+    pdflatex.write_text(
+        "#!/bin/sh\n"
+        f"printf '{AUX.encode('unicode_escape').decode()}' > main.aux\n"
+        "printf '%%PDF-1.4 fake' > main.pdf\n",
+        encoding="utf-8",
+    )
+    bibtex = directory / "bibtex"
+    bibtex.write_text(
+        "#!/bin/sh\n"
+        f'echo bibtex >> {calls_log}\n'
+        "echo 'Warning--empty author in knuth'\n"
+        "printf 'thebibliography' > main.bbl\n",
+        encoding="utf-8",
+    )
+    for path in (pdflatex, bibtex):
+        path.chmod(0o755)
+
+
+# =====================================================================
+# Keys
+# =====================================================================
+
+
+class TestBibliographyKey:
+    def test_bibtex_key_ignores_unrelated_aux_lines(self, work_dir):
+        (work_dir / "refs.bib").write_text(BIB)
+        (work_dir / "main.aux").write_text(AUX)
+        first = bibliography_key(work_dir, "main", "bibtex")
+        (work_dir / "main.aux").write_text(AUX + "\\newlabel{x}{{1}{1}}\n")
+        assert first is not None
+        assert bibliography_key(work_dir, "main", "bibtex") == first
+
+    @pytest.mark.parametrize(
+        "change",
+        [
+            lambda d: (d / "refs.bib").write_text(BIB + "@misc{other}\n"),
+            lambda d: (d / "main.aux").write_text(AUX + "\\citation{other}\n"),
+            lambda d: (d / "chapter.aux").write_text("\\citation{other}\n"),
+            lambda d: (d / "plain.bst").write_text("ENTRY {} {} {}"),
+        ],
+    )
+    def test_bibtex_key_tracks_inputs(self, work_dir, change):
+        (work_dir / "refs.bib").write_text(BIB)
+        (work_dir / "main.aux").write_text(AUX + "\\@input{chapter.aux}\n")
+        first = bibliography_key(work_dir, "main", "bibtex")
+        change(work_dir)
+        assert bibliography_key(work_dir, "main", "bibtex") != first
+
+    def test_biber_key_tracks_data_sources(self, work_dir):
+        (work_dir / "refs.bib").write_text(BIB)
+        (work_dir / "main.bcf").write_text(
+            '<bcf:datasource type="file" datatype="bibtex" glob="false">'
+            "refs.bib</bcf:datasource>"
+        )
+        first = bibliography_key(work_dir, "main", "biber")
+        (work_dir / "refs.bib").write_text(BIB + "@misc{other}\n")
+        assert first is not None
+        assert bibliography_key(work_dir, "main", "biber") != first
+
+    def test_remote_biber_sources_are_not_cached(self, work_dir):
+        (work_dir / "main.bcf").write_text(
+            '<bcf:datasource type="file" datatype="bibtex" glob="false">'
+            "https://example.org/refs.bib</bcf:datasource>"
+        )
+        assert bibliography_key(work_dir, "main", "biber") is None
+
+
+# =====================================================================
+# Pipeline integration
+# =====================================================================
+
+
+class TestPipelineBibCache:
+    def _compile(self, tmp_path):
+        work_dir = Path(tempfile.mkdtemp(prefix="latex_job_", dir=tmp_path))
+        (work_dir / "main.tex").write_text("\\documentclass{article}")
+        (work_dir / "refs.bib").write_text(BIB)
+        return work_dir, compile_project(
+            work_dir, "main.tex", CompileOptions(passes=2, main_file="main.tex")
+        )
+
+    def test_second_compile_restores_the_bbl(self, tmp_path, monkeypatch):
+        calls_log = tmp_path / "calls.log"
+        _fake_tools(tmp_path, calls_log)
+        monkeypatch.setattr(settings, "TEX_BIN_PATH", str(tmp_path / "pdflatex"))
+        monkeypatch.setattr(settings, "BIBTEX_BIN_PATH", str(tmp_path / "bibtex"))
+
+        _, first = self._compile(tmp_path)
+        work_dir, second = self._compile(tmp_path)
+
+        assert first.success and second.success
+        assert calls_log.read_text().splitlines() == ["bibtex"]
+        assert "--- Bibliography (bibtex) [cached] ---" in second.log
+        assert (work_dir / "main.bbl").read_text() == "thebibliography"
+        assert second.warnings == first.warnings
+        assert any("empty author" in w for w in second.warnings)
+
+    def test_disabled(self, tmp_path, monkeypatch):
+        calls_log = tmp_path / "calls.log"
+        _fake_tools(tmp_path, calls_log)
+        monkeypatch.setattr(settings, "TEX_BIN_PATH", str(tmp_path / "pdflatex"))
+        monkeypatch.setattr(settings, "BIBTEX_BIN_PATH", str(tmp_path / "bibtex"))
+        monkeypatch.setattr(settings, "BIB_CACHE_ENABLED", False)
+
+        self._compile(tmp_path)
+        self._compile(tmp_path)
+
+        assert calls_log.read_text().splitlines() == ["bibtex", "bibtex"]
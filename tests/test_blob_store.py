@@ -0,0 +1,167 @@
+"""
+Tests for the content-addressed blob store and manifest compiles.
+"""
+
+import hashlib
+import os
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.models.compile import CompileResult
+from app.services.adapters import (
+    MissingBlobsError,
+    ProjectSnapshot,
+    read_manifest,
+    write_manifest,
+)
+from app.services.blob_store import blob_store
+from app.services.validators import ValidationError
+
+client = TestClient(app)
+
+MAIN = b"\\documentclass{article}\n\\begin{document}\nHi\n\\end{document}\n"
+FIGURE = b"\x89PNG fake image"
+
+
+def _sha(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+@pytest.fixture(autouse=True)
+def _isolated_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "BLOB_STORE_DIR", str(tmp_path / "blobs"))
+
+
+# =====================================================================
+# BlobStore
+# =====================================================================
+
+
+class TestBlobStore:
+    def test_put_and_missing(self):
+        digest = blob_store.put(MAIN)
+        assert digest == _sha(MAIN)
+        assert blob_store.read(digest) == MAIN
+        assert blob_store.missing([digest, _sha(FIGURE)]) == [_sha(FIGURE)]
+
+    def test_stored_blobs_are_read_only(self):
+        path = blob_store.path(blob_store.put(MAIN))
+        assert not os.stat(path).st_mode & 0o222
+
+    def test_evicts_least_recently_used(self, monkeypatch):
+        monkeypatch.setattr(settings, "BLOB_STORE_MAX_BYTES", 2 * len(MAIN))
+        first = blob_store.put(b"a" * len(MAIN))
+        os.utime(blob_store.path(first), (1, 1))
+        blob_store.put(b"b" * len(MAIN))
+        blob_store.put(b"c" * len(MAIN))
+        assert blob_store.missing([first]) == [first]
+
+    @pytest.mark.parametrize("link", [True, False])
+    def test_materialize(self, link, tmp_path):
+        digest = blob_store.put(FIGURE)
+        dest = tmp_path / "fig.png"
+        blob_store.materialize(digest, dest, link=link)
+        assert dest.read_bytes() == FIGURE
+        assert os.path.samefile(dest, blob_store.path(digest)) is link
+
+
+# =====================================================================
+# read_manifest() / write_manifest()
+# =====================================================================
+
+
+class TestManifest:
+    def test_digest_matches_snapshot(self):
+        files = {"main.tex": MAIN, "fig.png": FIGURE}
+        for content in files.values():
+            blob_store.put(content)
+        manifest = read_manifest({p: _sha(c) for p, c in files.items()}, passes=2)
+
+        assert manifest.total_bytes == len(MAIN) + len(FIGURE)
+        assert manifest.digest() == ProjectSnapshot(files=files).digest()
+
+    def test_missing_blobs(self):
+        blob_store.put(MAIN)
+        with pytest.raises(MissingBlobsError) as exc_info:
+            read_manifest({"main.tex": _sha(MAIN), "fig.png": _sha(FIGURE)}, passes=2)
+        assert exc_info.value.missing == [_sha(FIGURE)]
+
+    def test_scans_stored_sources(self):
+        evil = b"\\immediate\\write18{rm -rf /}"
+        blob_store.put(evil)
+        with pytest.raises(ValidationError):
+            read_manifest({"main.tex": _sha(evil)}, passes=2)
+
+    def test_links_only_read_only_inputs(self, tmp_path):
+        files = {"main.tex": MAIN, "figs/a.png": FIGURE, "main.pdf": b"%PDF stale"}
+        for content in files.values():
+            blob_store.put(content)
+        manifest = read_manifest({p: _sha(c) for p, c in files.items()}, passes=2)
+
+        write_manifest(manifest, tmp_path, "main.tex")
+
+        for rel_path, content in files.items():
+            assert (tmp_path / rel_path).read_bytes() == content
+        assert os.path.samefile(tmp_path / "figs/a.png", blob_store.path(_sha(FIGURE)))
+        assert not os.path.samefile(tmp_path / "main.tex", blob_store.path(_sha(MAIN)))
+        assert not os.path.samefile(
+            tmp_path / "main.pdf", blob_store.path(_sha(b"%PDF stale"))
+        )
+
+
+# =====================================================================
+# Endpoints
+# =====================================================================
+
+
+def _fake_pdf_compile(work_dir, main_file, options, cancel=None):
+    assert (work_dir / "fig.png").read_bytes() == FIGURE
+    pdf = work_dir / "main.pdf"
+    pdf.write_bytes(b"%PDF-1.4 manifest")
+    return CompileResult(success=True, pdf_path=pdf, compile_time_ms=3, log="", passes_run=1)
+
+
+class TestManifestEndpoints:
+    def test_negotiate_upload_compile(self):
+        manifest = {"main.tex": _sha(MAIN), "fig.png": _sha(FIGURE)}
+
+        r = client.post("/v2/blobs/missing", json={"files": manifest})
+        assert r.status_code == 200
+        assert r.json()["missing"] == sorted(manifest.values())
+
+        r = client.post("/v2/compile/manifest", json={"main_file": "main.tex", "files": manifest})
+        assert r.status_code == 409
+        assert r.json()["error_type"] == "missing_blobs"
+        assert r.json()["errors"] == sorted(manifest.values())
+
+        r = client.post(
+            "/v2/blobs",
+            files=[("files", (_sha(MAIN), MAIN)), ("files", ("fig.png", FIGURE))],
+        )
+        assert r.status_code == 200
+        assert [b["sha256"] for b in r.json()["stored"]] == [_sha(MAIN), _sha(FIGURE)]
+        assert client.post("/v2/blobs/missing", json={"files": manifest}).json() == {
+            "missing": []
+        }
+
+        with patch(
+            "app.api.routes_v2.compile_project", side_effect=_fake_pdf_compile
+        ) as mock_compile:
+            r = client.post(
+                "/v2/compile/manifest", json={"main_file": "main.tex", "files": manifest}
+            )
+        assert r.status_code == 200
+        assert r.content == b"%PDF-1.4 manifest"
+        assert mock_compile.call_count == 1
+
+    def test_upload_rejects_digest_mismatch(self):
+        r = client.post("/v2/blobs", files=[("files", (_sha(FIGURE), MAIN))])
+        assert r.status_code == 422
+
+    def test_bad_digest(self):
+        r = client.post("/v2/blobs/missing", json={"files": {"main.tex": "abc"}})
+        assert r.status_code == 422
@@ -14,7 +14,7 @@ from app.models.compile import CompileOptions
 
 @pytest.fixture
 def mock_subprocess():
-    with patch("app.services.pipeline.subprocess.run") as mock:
+    with patch("app.services.pipeline.run_process") as mock:
         yield mock
 
 
@@ -39,7 +39,7 @@ def _write_tex_source(
 
 
 def test_compile_success(mock_workdir, mock_subprocess):
-    process_mock = MagicMock()
+    process_mock = MagicMock(usage=None)
     process_mock.returncode = 0
     process_mock.stdout = "Output log"
     mock_subprocess.return_value = process_mock
@@ -63,7 +63,7 @@ def test_compile_success(mock_workdir, mock_subprocess):
 
 
 def test_compile_failure(mock_workdir, mock_subprocess):
-    process_mock = MagicMock()
+    process_mock = MagicMock(usage=None)
     process_mock.returncode = 1
     process_mock.stdout = "Error log"
     mock_subprocess.return_value = process_mock
@@ -81,7 +81,7 @@ def test_compile_failure(mock_workdir, mock_subprocess):
 
 
 def test_error_parsing(mock_workdir, mock_subprocess):
-    process_mock = MagicMock()
+    process_mock = MagicMock(usage=None)
     process_mock.returncode = 1
     process_mock.stdout = "This is pdfTeX...\n! Undefined control sequence.\nl.10 \\foo"
     mock_subprocess.return_value = process_mock
@@ -97,7 +97,7 @@ def test_error_parsing(mock_workdir, mock_subprocess):
 
 
 def test_warning_parsing(mock_workdir, mock_subprocess):
-    process_mock = MagicMock()
+    process_mock = MagicMock(usage=None)
     process_mock.returncode = 0
     process_mock.stdout = "LaTeX Warning: Label(s) may have changed.\n"
     mock_subprocess.return_value = process_mock
@@ -158,7 +158,7 @@ def test_compile_zip_success(mock_workdir, mock_subprocess, tmp_path):
         )
         zf.writestr("image.png", b"\x89PNG fake image data")
 
-    process_mock = MagicMock()
+    process_mock = MagicMock(usage=None)
     process_mock.returncode = 0
     process_mock.stdout = "Output log"
     mock_subprocess.return_value = process_mock
@@ -0,0 +1,74 @@
+"""
+Unit tests for app.services.executor.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services.executor import (
+    get_compile_executor,
+    run_in_compile_executor,
+    shutdown_compile_executor,
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_executor():
+    shutdown_compile_executor()
+    yield
+    shutdown_compile_executor()
+
+
+def test_runs_off_the_event_loop_thread():
+    async def main():
+        loop_thread = threading.get_ident()
+        worker_thread = await run_in_compile_executor(threading.get_ident)
+        return loop_thread, worker_thread
+
+    loop_thread, worker_thread = asyncio.run(main())
+    assert loop_thread != worker_thread
+
+
+def test_passes_args_and_kwargs():
+    def combine(a, b, *, sep):
+        return f"{a}{sep}{b}"
+
+    result = asyncio.run(run_in_compile_executor(combine, "x", "y", sep="-"))
+    assert result == "x-y"
+
+
+def test_compiles_overlap_up_to_worker_count(monkeypatch):
+    monkeypatch.setattr(settings, "COMPILE_WORKERS", 4)
+
+    async def main():
+        t0 = time.monotonic()
+        await asyncio.gather(
+            *(run_in_compile_executor(time.sleep, 0.2) for _ in range(4))
+        )
+        return time.monotonic() - t0
+
+    elapsed = asyncio.run(main())
+    assert elapsed < 0.6
+
+
+def test_event_loop_stays_responsive_during_compile():
+    async def main():
+        compile_task = asyncio.create_task(run_in_compile_executor(time.sleep, 0.3))
+        t0 = time.monotonic()
+        await asyncio.sleep(0.01)
+        ticked_after = time.monotonic() - t0
+        await compile_task
+        return ticked_after
+
+    assert asyncio.run(main()) < 0.2
+
+
+def test_shutdown_recreates_executor_on_next_use():
+    first = get_compile_executor()
+    shutdown_compile_executor()
+    second = get_compile_executor()
+    assert first is not second
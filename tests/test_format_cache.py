@@ -0,0 +1,185 @@
+"""
+Tests for app.services.format_cache and its use by the compile pipeline.
+"""
+
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from app.core.config import settings
+from app.models.compile import CompileOptions
+from app.services import format_cache as format_cache_module
+from app.services.format_cache import extract_preamble, format_cache, format_key
+from app.services.pipeline import compile_project
+
+PREAMBLE_DOC = (
+    "\\documentclass{article}\n"
+    "\\usepackage{amsmath}\n"
+    "\\begin{document}\n"
+    "Hello\n"
+    "\\end{document}\n"
+)
+
+
+@pytest.fixture
+def work_dir():
+    d = Path(tempfile.mkdtemp(prefix="latex_job_"))
+    yield d
+    shutil.rmtree(d, ignore_errors=True)
+
+
+@pytest.fixture
+def format_settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "FORMAT_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "FORMAT_CACHE_DIR", str(tmp_path / "fmt"))
+    monkeypatch.setattr(format_cache_module, "toolchain_version", lambda: "test")
+    format_cache.clear()
+    yield tmp_path
+    format_cache.clear()
+
+
+def _fake_pdflatex(directory: Path, calls_log: Path, dump_ok: bool = True) -> str:
+    """pdflatex stand-in: dumps <jobname>.fmt under -ini, else writes a PDF."""
+    dump = 'printf fmt > "${a#-jobname=}.fmt"; exit 0' if dump_ok else "exit 1"
+    path = directory / "pdflatex"
+    path.write_text(
+        "#!/bin/sh\n"
+        f'echo "$@" >> {calls_log}\n'
+        'for a in "$@"; do\n'
+        f'  case "$a" in -jobname=*) {dump};; esac\n'
+        "done\n"
+        "printf '%%PDF-1.4 fake' > main.pdf\n",
+        encoding="utf-8",
+    )
+    path.chmod(0o755)
+    return str(path)
+
+
+# =====================================================================
+# Preamble detection and keys
+# =====================================================================
+
+
+class TestFormatKey:
+    def test_extract_preamble_ignores_commented_begin_document(self):
+        source = "\\documentclass{article}\n% \\begin{document}\n\\begin{document}x"
+        assert extract_preamble(source) == "\\documentclass{article}\n"
+
+    def test_no_begin_document_has_no_preamble(self):
+        assert extract_preamble("\\documentclass{article}\n") is None
+
+    def test_key_ignores_document_body(self, work_dir, format_settings):
+        (work_dir / "main.tex").write_text(PREAMBLE_DOC)
+        first = format_key(work_dir, "main.tex")
+        (work_dir / "main.tex").write_text(PREAMBLE_DOC.replace("Hello", "Bye"))
+        assert first is not None
+        assert format_key(work_dir, "main.tex") == first
+
+    @pytest.mark.parametrize(
+        "name",
+        ["local.sty", "styles/custom.bbx", "ngerman.ldf", "tikzlibrarymine.code.tex"],
+    )
+    def test_key_covers_local_style_files(self, work_dir, format_settings, name):
+        (work_dir / "main.tex").write_text(PREAMBLE_DOC)
+        (work_dir / name).parent.mkdir(parents=True, exist_ok=True)
+        (work_dir / name).write_text("\\def\\a{1}")
+        first = format_key(work_dir, "main.tex")
+        (work_dir / name).write_text("\\def\\a{2}")
+        assert format_key(work_dir, "main.tex") != first
+
+    @pytest.mark.parametrize(
+        "line",
+        ["\\input{macros}", "\\include{chapter}", "\\makeindex", "\\jobname"],
+    )
+    def test_undumpable_preambles_have_no_key(self, work_dir, format_settings, line):
+        (work_dir / "main.tex").write_text(
+            PREAMBLE_DOC.replace("\\begin{document}", line + "\n\\begin{document}")
+        )
+        assert format_key(work_dir, "main.tex") is None
+
+    def test_commented_input_is_ignored(self, work_dir, format_settings):
+        (work_dir / "main.tex").write_text(
+            PREAMBLE_DOC.replace("\\begin{document}", "% \\input{x}\n\\begin{document}")
+        )
+        assert format_key(work_dir, "main.tex") is not None
+
+
+# =====================================================================
+# Pipeline integration
+# =====================================================================
+
+
+class TestPipelineFormats:
+    def _compile(self, work_dir: Path, passes: int = 2):
+        (work_dir / "main.tex").write_text(PREAMBLE_DOC)
+        return compile_project(
+            work_dir, "main.tex", CompileOptions(passes=passes, main_file="main.tex")
+        )
+
+    def test_dumps_format_once_then_reuses_it(
+        self, work_dir, format_settings, monkeypatch
+    ):
+        calls_log = format_settings / "calls"
+        monkeypatch.setattr(
+            settings, "TEX_BIN_PATH", _fake_pdflatex(format_settings, calls_log)
+        )
+
+        first = self._compile(work_dir)
+        key = format_key(work_dir, "main.tex")
+        calls = calls_log.read_text().splitlines()
+
+        assert first.success is True
+        assert "--- Format ---" in first.log
+        assert len(calls) == 3
+        assert "-ini" in calls[0] and "mylatexformat.ltx" in calls[0]
+        assert all(f"-fmt={key}" in call for call in calls[1:])
+        assert (format_settings / "fmt" / f"{key}.fmt").exists()
+
+        second_dir = Path(tempfile.mkdtemp(prefix="latex_job_"))
+        try:
+            calls_log.unlink()
+            second = self._compile(second_dir)
+            calls = calls_log.read_text().splitlines()
+
+            assert second.success is True
+            assert len(calls) == 2
+            assert not any("-ini" in call for call in calls)
+            assert (second_dir / f"{key}.fmt").exists()
+        finally:
+            shutil.rmtree(second_dir, ignore_errors=True)
+
+    def test_dump_failure_falls_back_and_is_remembered(
+        self, work_dir, format_settings, monkeypatch
+    ):
+        calls_log = format_settings / "calls"
+        monkeypatch.setattr(
+            settings,
+            "TEX_BIN_PATH",
+            _fake_pdflatex(format_settings, calls_log, dump_ok=False),
+        )
+
+        first = self._compile(work_dir, passes=1)
+        calls = calls_log.read_text().splitlines()
+
+        assert first.success is True
+        assert "Preamble format dump failed" in first.log
+        assert len(calls) == 2
+        assert "-fmt=" not in calls[1]
+
+        calls_log.unlink()
+        second = self._compile(work_dir, passes=1)
+        assert second.success is True
+        assert len(calls_log.read_text().splitlines()) == 1
+
+    def test_disabled_by_default(self, work_dir, tmp_path, monkeypatch):
+        calls_log = tmp_path / "calls"
+        monkeypatch.setattr(
+            settings, "TEX_BIN_PATH", _fake_pdflatex(tmp_path, calls_log)
+        )
+
+        result = self._compile(work_dir, passes=1)
+
+        assert result.success is True
+        assert "-ini" not in calls_log.read_text()
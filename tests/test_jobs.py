@@ -0,0 +1,217 @@
+"""
+Tests for the asynchronous job API (/v2/jobs) and app.services.jobs.
+"""
+
+import io
+import json
+import os
+import time
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.services.jobs import JobStore, job_store
+from tests.conftest import FAKE_PDFLATEX
+
+MAIN_TEX = b"\\documentclass{article}\n\\begin{document}x\\end{document}\n"
+
+# Writes a recognisable log line
+JOB_PDFLATEX = "echo 'This is pdfTeX'\n" + FAKE_PDFLATEX
+
+
+@pytest.fixture
+def jobs_dir(tmp_path, monkeypatch):
+    path = tmp_path / "jobs"
+    monkeypatch.setattr(settings, "JOB_DIR", str(path))
+    return path
+
+
+@pytest.fixture
+def client():
+    # Jobs compile through the event loop that accepted them: keep it running
+    with TestClient(app) as client:
+        yield client
+
+
+def _wait(client: TestClient, job_id: str) -> dict:
+    for _ in range(200):
+        body = client.get(f"/v2/jobs/{job_id}").json()
+        if body["status"] in ("succeeded", "failed"):
+            return body
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+# =====================================================================
+# Routes
+# =====================================================================
+
+
+class TestJobRoutes:
+    def test_multipart_job(self, client, jobs_dir, fake_pdflatex):
+        fake_pdflatex(JOB_PDFLATEX)
+        r = client.post(
+            "/v2/jobs",
+            files=[("files", ("main.tex", MAIN_TEX))],
+            data={"main_file": "main.tex", "passes": "1"},
+        )
+
+        assert r.status_code == 202
+        job_id = r.json()["job_id"]
+        assert r.headers["Location"] == f"/v2/jobs/{job_id}"
+        assert r.json()["status"] in ("queued", "running", "succeeded")
+
+        body = _wait(client, job_id)
+        assert body["status"] == "succeeded"
+        assert body["passes_run"] == 1
+        assert body["pdf_url"] == f"/v2/jobs/{job_id}/pdf"
+        assert body["expires_at"] >= body["finished_at"]
+
+        pdf = client.get(body["pdf_url"])
+        assert pdf.status_code == 200
+        assert pdf.content == b"%PDF-1.4"
+        assert pdf.headers["X-Passes-Run"] == "1"
+        assert "This is pdfTeX" in client.get(body["log_url"]).text
+
+        # The work dir is removed once the job has finished
+        assert not (jobs_dir / job_id / "work").exists()
+
+    def test_zip_job(self, client, jobs_dir, fake_pdflatex):
+        fake_pdflatex(JOB_PDFLATEX)
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w") as zf:
+            zf.writestr("src/main.tex", MAIN_TEX)
+
+        r = client.post(
+            "/v2/jobs",
+            files={"file": ("project.zip", buf.getvalue(), "application/zip")},
+            data={"main_file": "src/main.tex", "passes": "1"},
+        )
+
+        assert r.status_code == 202
+        assert _wait(client, r.json()["job_id"])["status"] == "succeeded"
+
+    def test_failed_job(self, client, jobs_dir, fake_pdflatex):
+        fake_pdflatex(JOB_PDFLATEX)
+        r = client.post(
+            "/v2/jobs",
+            files=[("files", ("main.tex", b"fail"))],
+            data={"main_file": "main.tex", "passes": "1"},
+        )
+
+        body = _wait(client, r.json()["job_id"])
+        assert body["status"] == "failed"
+        assert body["error_type"] == "latex_compile_error"
+        assert body["pdf_url"] is None
+        assert client.get(f"/v2/jobs/{body['job_id']}/pdf").status_code == 404
+        log = client.get(body["log_url"])
+        assert "Undefined control sequence" in log.text
+
+    @pytest.mark.parametrize(
+        "files, data",
+        [
+            ([("files", ("main.tex", MAIN_TEX))], {"main_file": "other.tex"}),
+            ([("files", ("main.tex", MAIN_TEX))], {"main_file": "../main.tex"}),
+            ([("files", ("../evil.tex", b"x"))], {"main_file": "main.tex"}),
+            (
+                [("files", ("main.tex", MAIN_TEX))],
+                {"main_file": "main.tex", "engine": "xelatex"},
+            ),
+        ],
+    )
+    def test_invalid_upload_leaves_no_job(self, jobs_dir, files, data):
+        r = TestClient(app).post("/v2/jobs", files=files, data=data)
+
+        assert r.status_code == 422
+        assert r.json()["error_type"] == "invalid_input"
+        assert not jobs_dir.exists() or not any(jobs_dir.iterdir())
+
+    def test_unfinished_job_artifacts_conflict(self, client, jobs_dir):
+        job = job_store.create("main.tex")
+
+        assert client.get(f"/v2/jobs/{job.job_id}").json()["status"] == "queued"
+        for artifact in ("pdf", "log"):
+            r = client.get(f"/v2/jobs/{job.job_id}/{artifact}")
+            assert r.status_code == 409
+            assert r.json()["error_type"] == "job_not_finished"
+
+    def test_jobs_count_against_compile_admission(
+        self, client, jobs_dir, fake_pdflatex, tmp_path, monkeypatch
+    ):
+        monkeypatch.setattr(settings, "MAX_CONCURRENT_COMPILES", 1)
+        monkeypatch.setattr(settings, "JOB_WORKERS", 2)
+        lock, overlaps = tmp_path / "running", tmp_path / "overlaps"
+        fake_pdflatex(
+            f"mkdir {lock} || echo overlap >> {overlaps}\n"
+            "sleep 0.3\n"
+            f"rmdir {lock}\n" + FAKE_PDFLATEX
+        )
+
+        job_ids = [
+            client.post(
+                "/v2/jobs",
+                files=[("files", ("main.tex", MAIN_TEX))],
+                data={"main_file": "main.tex", "passes": "1"},
+            ).json()["job_id"]
+            for _ in range(2)
+        ]
+
+        assert [_wait(client, job_id)["status"] for job_id in job_ids] == [
+            "succeeded",
+            "succeeded",
+        ]
+        assert not overlaps.exists()
+
+    @pytest.mark.parametrize("job_id", ["0" * 32, "not-a-job"])
+    def test_unknown_job(self, jobs_dir, job_id):
+        r = TestClient(app).get(f"/v2/jobs/{job_id}")
+        assert r.status_code == 404
+        assert r.json()["error_type"] == "not_found"
+
+
+# =====================================================================
+# JobStore
+# =====================================================================
+
+
+class TestSweep:
+    def test_expired_jobs_are_removed(
+        self, client, jobs_dir, fake_pdflatex, monkeypatch
+    ):
+        fake_pdflatex(JOB_PDFLATEX)
+        monkeypatch.setattr(settings, "JOB_TTL_SECONDS", 0)
+        r = client.post(
+            "/v2/jobs",
+            files=[("files", ("main.tex", MAIN_TEX))],
+            data={"main_file": "main.tex", "passes": "1"},
+        )
+        job_id = r.json()["job_id"]
+        _wait(client, job_id)
+
+        job_store.sweep()
+
+        assert not (jobs_dir / job_id).exists()
+        assert client.get(f"/v2/jobs/{job_id}").status_code == 404
+
+    def test_jobs_of_exited_processes_fail(self, jobs_dir):
+        # A job queued by an earlier process with this pid, then a job of
+        # this store that is still queued
+        orphan = JobStore().create("main.tex")
+        queued = job_store.create("main.tex")
+
+        job_store.sweep()
+
+        _, state = job_store.get(orphan.job_id)
+        assert state.status == "failed"
+        assert state.error_type == "internal"
+        assert not orphan.work_dir.exists()
+        _, state = job_store.get(queued.job_id)
+        assert state.status == "queued"
+
+    def test_job_json_records_owner(self, jobs_dir):
+        job = job_store.create("main.tex")
+        data = json.loads((job.root / "job.json").read_text())
+        assert data["owner"].split("_")[0] == str(os.getpid())
@@ -0,0 +1,165 @@
+"""
+Tests for mail-merge compiles (/v2/compile/merge).
+"""
+
+import base64
+import io
+import json
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.services import format_cache as format_cache_module
+from app.services.adapters import escape_latex
+from app.services.format_cache import format_cache
+
+client = TestClient(app)
+
+TEMPLATE = (
+    b"\\documentclass{article}\n"
+    b"\\begin{document}\n"
+    b"Dear \\name, you owe \\amount.\n"
+    b"\\end{document}\n"
+)
+
+
+@pytest.fixture(autouse=True)
+def calls(tmp_path, fake_pdflatex):
+    """Fake pdflatex whose PDF holds the top-level .tex files it compiled."""
+    calls = tmp_path / "calls"
+    fake_pdflatex(
+        f'echo "$@" >> {calls}\n'
+        'for a in "$@"; do\n'
+        '  case "$a" in -jobname=*) printf fmt > "${a#-jobname=}.fmt"; exit 0;; esac\n'
+        "done\n"
+        'main="$(eval echo \\${$#})"\n'
+        "grep -q fail *.tex && { echo '! Undefined control sequence.'; exit 1; }\n"
+        '{ printf "%%PDF-1.4\\n"; cat *.tex; } > "$(basename "$main" .tex).pdf"\n'
+    )
+    return calls
+
+
+def _merge(variables, files=None, **data):
+    return client.post(
+        "/v2/compile/merge",
+        files=files or [("files", ("main.tex", TEMPLATE))],
+        data={
+            "main_file": "main.tex",
+            "passes": "1",
+            "variables": json.dumps(variables),
+            **data,
+        },
+    )
+
+
+def _lines(r) -> dict[str, dict]:
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    return {line["id"]: line for line in map(json.loads, r.text.splitlines())}
+
+
+def _pdf(line: dict) -> str:
+    return base64.b64decode(line["pdf_base64"]).decode()
+
+
+def test_variables_are_defined_after_begin_document():
+    r = _merge(
+        [{"name": "Ada", "amount": 12}, {"name": "50% & $x_1", "amount": "1"}]
+    )
+
+    lines = _lines(r)
+    assert set(lines) == {"0", "1"}
+    assert lines["0"]["status"] == "ok"
+    pdf = _pdf(lines["0"])
+    assert "\\begin{document}\\def\\name{Ada}\\def\\amount{12}\nDear" in pdf
+    assert "\\def\\name{50\\% \\& \\$x\\_1}" in _pdf(lines["1"])
+
+
+def test_data_file_and_zip():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("main.tex", TEMPLATE.replace(b"Dear", b"\\input{vars}Dear"))
+        zf.writestr("logo.png", b"png")
+    r = _merge(
+        [{"name": "Ada"}, {"name": "Bob"}],
+        files={"file": ("template.zip", buf.getvalue(), "application/zip")},
+        data_file="vars.tex",
+        **{"return": "zip"},
+    )
+
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(r.content)) as zf:
+        assert sorted(zf.namelist()) == ["0.json", "0.pdf", "1.json", "1.pdf"]
+        pdf = zf.read("1.pdf").decode()
+        assert "\\def\\name{Bob}\n" in pdf
+        assert "\\begin{document}\n" in pdf  # the main file is unchanged
+
+
+def test_failed_variants_do_not_fail_the_merge():
+    r = _merge([{"name": "fail"}, {"openout": "x"}, {"name": "Ada"}])
+
+    lines = _lines(r)
+    assert lines["0"]["error_type"] == "latex_compile_error"
+    assert lines["1"]["error_type"] == "invalid_input"
+    assert "Dangerous macro" in lines["1"]["message"]
+    assert lines["2"]["status"] == "ok"
+
+
+def test_variants_share_one_preamble_format(calls, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "FORMAT_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "FORMAT_CACHE_DIR", str(tmp_path / "fmt"))
+    monkeypatch.setattr(format_cache_module, "toolchain_version", lambda: "test")
+    format_cache.clear()
+
+    r = _merge([{"name": str(i)} for i in range(4)], concurrency="4")
+
+    assert all(line["status"] == "ok" for line in _lines(r).values())
+    invocations = calls.read_text().splitlines()
+    assert sum("-ini" in line for line in invocations) == 1
+    assert sum("-fmt=" in line for line in invocations) == 4
+
+
+@pytest.mark.parametrize(
+    "variables, data, status",
+    [
+        ("not json", {}, 422),
+        ({"name": "x"}, {}, 422),
+        ([], {}, 422),
+        ([{"na me": "x"}], {}, 422),
+        ([{"x1": "x"}], {}, 422),
+        ([{"name": ["x"]}], {}, 422),
+        ([{}, {}, {}], {}, 413),
+        ([{}], {"main_file": "other.tex"}, 422),
+        ([{}], {"data_file": "main.tex"}, 422),
+        ([{}], {"data_file": "vars.sty"}, 422),
+        ([{}], {"return": "pdf"}, 422),
+        ([{}], {"concurrency": "0"}, 422),
+    ],
+)
+def test_rejected_merges(variables, data, status, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_MAX_ITEMS", 2)
+    if not isinstance(variables, str):
+        variables = json.dumps(variables)
+    r = client.post(
+        "/v2/compile/merge",
+        files=[("files", ("main.tex", TEMPLATE))],
+        data={"main_file": "main.tex", "variables": variables, **data},
+    )
+    assert r.status_code == status
+
+
+def test_template_without_begin_document_needs_a_data_file():
+    r = _merge([{}], files=[("files", ("main.tex", b"\\documentclass{article}\n"))])
+    assert r.status_code == 422
+    assert "data_file" in r.json()["message"]
+
+
+def test_escape_latex():
+    assert escape_latex("a\\b{c}~^") == (
+        "a\\textbackslash{}b\\{c\\}\\textasciitilde{}\\textasciicircum{}"
+    )
+    assert escape_latex("two\nlines") == "two lines"
@@ -0,0 +1,173 @@
+"""
+Tests for app.core.metrics and the /metrics endpoint.
+"""
+
+import os
+import re
+import subprocess
+import sys
+import textwrap
+import time
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge, Histogram, Registry
+from app.main import app
+
+MAIN_TEX = b"\\documentclass{article}\n\\begin{document}x\\end{document}\n"
+
+# A worker process that counts two compiles, reports 3 compiles in flight,
+# writes its metrics file and waits for stdin to close
+WORKER = textwrap.dedent(
+    """
+    import sys
+    from app.core import metrics
+
+    metrics.COMPILE_REQUESTS.inc(2, endpoint="/v2/compile/sync", outcome="success")
+    metrics.COMPILES_IN_FLIGHT.set_function(lambda: 3)
+    metrics.REGISTRY.flush()
+    print("ready", flush=True)
+    sys.stdin.read()
+    """
+)
+
+
+def _sample(text: str, name: str, labels: str = "") -> float:
+    """Value of one sample in exposition text (0 if absent)."""
+    line = name + (f"{{{labels}}}" if labels else "")
+    for candidate in text.splitlines():
+        if candidate.startswith(line + " "):
+            return float(candidate.rsplit(" ", 1)[1])
+    return 0.0
+
+
+# =====================================================================
+# Registry
+# =====================================================================
+
+
+class TestRegistry:
+    def test_render(self):
+        registry = Registry()
+        requests = Counter("t_requests_total", "Requests.", ("outcome",), registry)
+        latency = Histogram(
+            "t_latency_seconds", "Latency.", buckets=(0.1, 1), registry=registry
+        )
+        depth = Gauge("t_depth", "Depth.", registry=registry)
+        depth.set_function(lambda: 4)
+
+        requests.inc(outcome="success")
+        requests.inc(outcome='we"ird')
+        latency.observe(0.05)
+        latency.observe(0.5)
+        latency.observe(5)
+
+        text = registry.render()
+        assert "# TYPE t_requests_total counter" in text
+        assert 't_requests_total{outcome="success"} 1' in text
+        assert 't_requests_total{outcome="we\\"ird"} 1' in text
+        assert 't_latency_seconds_bucket{le="0.1"} 1' in text
+        assert 't_latency_seconds_bucket{le="1"} 2' in text
+        assert 't_latency_seconds_bucket{le="+Inf"} 3' in text
+        assert "t_latency_seconds_sum 5.55" in text
+        assert "t_latency_seconds_count 3" in text
+        assert "t_depth 4" in text
+
+    def test_labels_are_checked(self):
+        registry = Registry()
+        requests = Counter("t_requests_total", "Requests.", ("outcome",), registry)
+        with pytest.raises(ValueError):
+            requests.inc(endpoint="/x")
+
+    def test_aggregates_worker_processes(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(settings, "METRICS_DIR", str(tmp_path))
+        registry = Registry()
+        Counter(
+            "latex_compile_requests_total",
+            "Compile requests.",
+            ("endpoint", "outcome"),
+            registry,
+        )
+        Gauge("latex_compiles_in_flight", "In flight.", registry=registry)
+        sample = (
+            "latex_compile_requests_total",
+            'endpoint="/v2/compile/sync",outcome="success"',
+        )
+
+        worker = subprocess.Popen(
+            [sys.executable, "-c", WORKER],
+            cwd=Path(__file__).resolve().parents[1],
+            env={**os.environ, "METRICS_DIR": str(tmp_path)},
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        try:
+            assert worker.stdout.readline() == "ready\n"
+            text = registry.render()
+            assert _sample(text, *sample) == 2
+            assert _sample(text, "latex_compiles_in_flight") == 3
+        finally:
+            worker.communicate("")
+
+        # Counters of exited workers are kept; their gauges are not
+        text = registry.render()
+        assert _sample(text, *sample) == 2
+        assert _sample(text, "latex_compiles_in_flight") == 0
+
+
+# =====================================================================
+# /metrics
+# =====================================================================
+
+
+def test_metrics_endpoint_counts_compiles(fake_pdflatex):
+    fake_pdflatex()
+    client = TestClient(app)
+    success = 'endpoint="/v2/compile/sync",outcome="success"'
+    invalid = 'endpoint="/v2/compile/sync",outcome="invalid_input"'
+
+    before = client.get("/metrics").text
+    client.post(
+        "/v2/compile/sync",
+        files=[("files", ("main.tex", MAIN_TEX))],
+        data={"main_file": "main.tex", "passes": "1"},
+    )
+    client.post(
+        "/v2/compile/sync",
+        files=[("files", ("main.tex", MAIN_TEX))],
+        data={"main_file": "missing.tex"},
+    )
+    r = client.get("/metrics")
+
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    after = r.text
+    name = "latex_compile_requests_total"
+    assert _sample(after, name, success) == _sample(before, name, success) + 1
+    assert _sample(after, name, invalid) == _sample(before, name, invalid) + 1
+
+    pass1 = "latex_compile_phase_duration_seconds_count"
+    assert _sample(after, pass1, 'phase="pass1"') >= 1
+    route = 'route="/v2/compile/sync",status="200"'
+    assert _sample(after, "latex_http_requests_total", route) >= 1
+    assert re.search(r"^latex_workdir_disk_bytes \d+", after, re.MULTILINE)
+
+
+def test_flush_writes_only_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_DIR", str(tmp_path))
+    registry = Registry()
+    requests = Counter("t_requests_total", "Requests.", registry=registry)
+    requests.inc()
+
+    registry.flush()
+    (path,) = tmp_path.glob("*.json")
+    mtime = path.stat().st_mtime_ns
+    time.sleep(0.01)
+    registry.flush()
+
+    assert path.stat().st_mtime_ns == mtime
+    assert path.name.startswith(f"{os.getpid()}_")
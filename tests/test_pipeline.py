@@ -6,10 +6,14 @@ Covers:
 - Bibliography backend orchestration
 - Log parsing and truncation
 - Timeout and missing-binary handling
+- Adaptive pass count and -draftmode selection
+- The asyncio step runner behind compile_project_async()
+- Progress events of compile_project_events()
 """
 
 from pathlib import Path
 from unittest.mock import MagicMock, patch
+import asyncio
 import subprocess
 
 import pytest
@@ -20,6 +24,8 @@ from app.services.pipeline import (
     _parse_log_messages,
     _truncate_log,
     compile_project,
+    compile_project_async,
+    compile_project_events,
 )
 from app.services.workdir import cleanup_workdir, create_workdir, safe_write_file
 from tests.conftest import (
@@ -101,10 +107,10 @@ class TestCompileProjectMocked:
         return work_dir
 
     def _tex_success(self, stdout: str = "This is pdfTeX...\n") -> MagicMock:
-        return MagicMock(returncode=0, stdout=stdout)
+        return MagicMock(returncode=0, stdout=stdout, usage=None)
 
     def _backend_success(self, stdout: str = "") -> MagicMock:
-        return MagicMock(returncode=0, stdout=stdout)
+        return MagicMock(returncode=0, stdout=stdout, usage=None)
 
     def test_missing_main_file(self):
         work_dir = create_workdir()
@@ -116,7 +122,7 @@ class TestCompileProjectMocked:
         finally:
             cleanup_workdir(work_dir)
 
-    @patch("app.services.pipeline.subprocess.run")
+    @patch("app.services.pipeline.run_process")
     def test_successful_compile(self, mock_run):
         work_dir = self._make_workdir_with_tex(b"\\documentclass{article}")
         try:
@@ -133,7 +139,7 @@ class TestCompileProjectMocked:
         finally:
             cleanup_workdir(work_dir)
 
-    @patch("app.services.pipeline.subprocess.run")
+    @patch("app.services.pipeline.run_process")
     def test_pdf_name_from_nested_main(self, mock_run):
         work_dir = create_workdir()
         try:
@@ -150,13 +156,14 @@ class TestCompileProjectMocked:
         finally:
             cleanup_workdir(work_dir)
 
-    @patch("app.services.pipeline.subprocess.run")
+    @patch("app.services.pipeline.run_process")
     def test_compile_failure(self, mock_run):
         work_dir = self._make_workdir_with_tex(b"bad latex")
         try:
             mock_run.return_value = MagicMock(
                 returncode=1,
                 stdout="! Undefined control sequence.\nl.3 \\badcommand\n",
+                usage=None,
             )
 
             options = CompileOptions(passes=2, main_file="main.tex")
@@ -166,7 +173,7 @@ class TestCompileProjectMocked:
         finally:
             cleanup_workdir(work_dir)
 
-    @patch("app.services.pipeline.subprocess.run")
+    @patch("app.services.pipeline.run_process")
     def test_timeout(self, mock_run):
         work_dir = self._make_workdir_with_tex(b"\\documentclass{article}")
         try:
@@ -182,7 +189,7 @@ class TestCompileProjectMocked:
         finally:
             cleanup_workdir(work_dir)
 
-    @patch("app.services.pipeline.subprocess.run")
+    @patch("app.services.pipeline.run_process")
     def test_pdflatex_not_found(self, mock_run):
         work_dir = self._make_workdir_with_tex(b"\\documentclass{article}")
         try:
@@ -195,7 +202,7 @@ class TestCompileProjectMocked:
         finally:
             cleanup_workdir(work_dir)
 
-    @patch("app.services.pipeline.subprocess.run")
+    @patch("app.services.pipeline.run_process")
     def test_biblatex_uses_biber_and_promotes_passes(self, mock_run):
         work_dir = self._make_workdir_with_tex(b"\\documentclass{article}")
         calls: list[list[str]] = []
@@ -233,7 +240,7 @@ class TestCompileProjectMocked:
         finally:
             cleanup_workdir(work_dir)
 
-    @patch("app.services.pipeline.subprocess.run")
+    @patch("app.services.pipeline.run_process")
     def test_bibtex_uses_aux_and_promotes_passes(self, mock_run):
         work_dir = self._make_workdir_with_tex(b"\\documentclass{article}")
         calls: list[list[str]] = []
@@ -271,7 +278,7 @@ class TestCompileProjectMocked:
         finally:
             cleanup_workdir(work_dir)
 
-    @patch("app.services.pipeline.subprocess.run")
+    @patch("app.services.pipeline.run_process")
     def test_biber_wins_when_bcf_and_aux_exist(self, mock_run):
         work_dir = self._make_workdir_with_tex(b"\\documentclass{article}")
         calls: list[list[str]] = []
@@ -301,7 +308,7 @@ class TestCompileProjectMocked:
         finally:
             cleanup_workdir(work_dir)
 
-    @patch("app.services.pipeline.subprocess.run")
+    @patch("app.services.pipeline.run_process")
     def test_bibliography_nested_main_uses_main_stem(self, mock_run):
         work_dir = create_workdir()
         calls: list[list[str]] = []
@@ -331,7 +338,7 @@ class TestCompileProjectMocked:
         finally:
             cleanup_workdir(work_dir)
 
-    @patch("app.services.pipeline.subprocess.run")
+    @patch("app.services.pipeline.run_process")
     def test_plain_document_keeps_requested_pass_count(self, mock_run):
         work_dir = self._make_workdir_with_tex(b"\\documentclass{article}")
         calls: list[list[str]] = []
@@ -355,6 +362,7 @@ class TestCompileProjectMocked:
                     "-halt-on-error",
                     "-file-line-error",
                     "-no-shell-escape",
+                    "-draftmode",
                     "main.tex",
                 ],
                 [
@@ -369,7 +377,7 @@ class TestCompileProjectMocked:
         finally:
             cleanup_workdir(work_dir)
 
-    @patch("app.services.pipeline.subprocess.run")
+    @patch("app.services.pipeline.run_process")
     def test_bibliography_passes_five_runs_five_tex_passes(self, mock_run):
         work_dir = self._make_workdir_with_tex(b"\\documentclass{article}")
         calls: list[list[str]] = []
@@ -398,7 +406,7 @@ class TestCompileProjectMocked:
         finally:
             cleanup_workdir(work_dir)
 
-    @patch("app.services.pipeline.subprocess.run")
+    @patch("app.services.pipeline.run_process")
     def test_missing_biber_fails_even_if_initial_pdf_exists(self, mock_run):
         work_dir = self._make_workdir_with_tex(b"\\documentclass{article}")
 
@@ -421,7 +429,7 @@ class TestCompileProjectMocked:
         finally:
             cleanup_workdir(work_dir)
 
-    @patch("app.services.pipeline.subprocess.run")
+    @patch("app.services.pipeline.run_process")
     def test_missing_bibtex_fails_even_if_initial_pdf_exists(self, mock_run):
         work_dir = self._make_workdir_with_tex(b"\\documentclass{article}")
 
@@ -447,7 +455,7 @@ class TestCompileProjectMocked:
         finally:
             cleanup_workdir(work_dir)
 
-    @patch("app.services.pipeline.subprocess.run")
+    @patch("app.services.pipeline.run_process")
     def test_backend_failure_falls_back_to_backend_error(self, mock_run):
         work_dir = self._make_workdir_with_tex(b"\\documentclass{article}")
 
@@ -456,7 +464,9 @@ class TestCompileProjectMocked:
                 (work_dir / "main.bcf").write_text("bcf", encoding="utf-8")
                 (work_dir / "main.pdf").write_bytes(b"%PDF-1.4 fake")
                 return self._tex_success()
-            return MagicMock(returncode=1, stdout="INFO - still failing\n")
+            return MagicMock(
+                returncode=1, stdout="INFO - still failing\n", usage=None
+            )
 
         mock_run.side_effect = side_effect
 
@@ -470,7 +480,7 @@ class TestCompileProjectMocked:
         finally:
             cleanup_workdir(work_dir)
 
-    @patch("app.services.pipeline.subprocess.run")
+    @patch("app.services.pipeline.run_process")
     def test_backend_timeout_returns_timeout(self, mock_run):
         work_dir = self._make_workdir_with_tex(b"\\documentclass{article}")
 
@@ -496,13 +506,14 @@ class TestCompileProjectMocked:
         finally:
             cleanup_workdir(work_dir)
 
-    @patch("app.services.pipeline.subprocess.run")
+    @patch("app.services.pipeline.run_process")
     def test_first_pass_failure_does_not_run_backend(self, mock_run):
         work_dir = self._make_workdir_with_tex(b"\\documentclass{article}")
         try:
             mock_run.return_value = MagicMock(
                 returncode=1,
                 stdout="! LaTeX Error: File `biblatex.sty' not found.\n",
+                usage=None,
             )
 
             options = CompileOptions(passes=3, main_file="main.tex")
@@ -513,7 +524,7 @@ class TestCompileProjectMocked:
         finally:
             cleanup_workdir(work_dir)
 
-    @patch("app.services.pipeline.subprocess.run")
+    @patch("app.services.pipeline.run_process")
     def test_successful_compile_keeps_only_final_tex_warnings(self, mock_run):
         work_dir = self._make_workdir_with_tex(b"\\documentclass{article}")
         calls: list[list[str]] = []
@@ -550,6 +561,464 @@ class TestCompileProjectMocked:
             cleanup_workdir(work_dir)
 
 
+# =====================================================================
+# compile_project — adaptive pass count
+# =====================================================================
+
+
+def _run_fake_tex(
+    mock_run,
+    on_tex_pass,
+    passes: int = 2,
+    source: bytes = b"\\documentclass{article}",
+    adaptive: bool = True,
+    draft: bool = False,
+):
+    """Compile with a fake pdflatex; on_tex_pass(n, work_dir) -> stdout."""
+    work_dir = create_workdir()
+    safe_write_file(work_dir, "main.tex", source)
+    calls: list[list[str]] = []
+
+    def side_effect(cmd, **kwargs):
+        calls.append(cmd)
+        if cmd[0] == settings.TEX_BIN_PATH:
+            pass_number = sum(1 for c in calls if c[0] == settings.TEX_BIN_PATH)
+            stdout = on_tex_pass(pass_number, work_dir) or ""
+            (work_dir / "main.pdf").write_bytes(b"%PDF-1.4 fake")
+            return MagicMock(returncode=0, stdout=stdout, usage=None)
+        (work_dir / "main.bbl").write_text("\\begin{thebibliography}{1}")
+        return MagicMock(returncode=0, stdout="", usage=None)
+
+    mock_run.side_effect = side_effect
+    try:
+        options = CompileOptions(
+            passes=passes, main_file="main.tex", adaptive=adaptive, draft=draft
+        )
+        result = compile_project(work_dir, "main.tex", options)
+    finally:
+        cleanup_workdir(work_dir)
+    return result, calls
+
+
+class TestAdaptivePasses:
+    """options.adaptive stops once the auxiliary files have converged."""
+
+    @patch("app.services.pipeline.run_process")
+    def test_simple_document_needs_one_pass(self, mock_run):
+        def on_tex_pass(n, work_dir):
+            (work_dir / "main.aux").write_text(
+                "\\relax \n\\gdef \\@abspage@last{1}\n"
+            )
+            (work_dir / "main.out").write_text("")
+
+        result, calls = _run_fake_tex(mock_run, on_tex_pass)
+
+        assert result.success is True
+        assert result.passes_run == 1
+        assert len(calls) == 1
+
+    @patch("app.services.pipeline.run_process")
+    def test_labels_need_a_second_pass_only(self, mock_run):
+        def on_tex_pass(n, work_dir):
+            (work_dir / "main.aux").write_text("\\relax \n\\newlabel{a}{{1}{1}}\n")
+
+        result, _ = _run_fake_tex(mock_run, on_tex_pass, passes=5)
+
+        assert result.passes_run == 2
+
+    @patch("app.services.pipeline.run_process")
+    def test_rerun_message_forces_another_pass(self, mock_run):
+        def on_tex_pass(n, work_dir):
+            (work_dir / "main.aux").write_text("\\relax \n")
+            if n < 3:
+                return (
+                    "LaTeX Warning: Label(s) may have changed. Rerun to get cross-"
+                    "\nreferences right.\n"
+                )
+
+        result, _ = _run_fake_tex(mock_run, on_tex_pass)
+
+        assert result.passes_run == 3
+
+    @patch("app.services.pipeline.run_process")
+    def test_bibliography_runs_until_stable(self, mock_run):
+        def on_tex_pass(n, work_dir):
+            if n == 1:
+                (work_dir / "main.bcf").write_text("bcf")
+                (work_dir / "main.aux").write_text("\\relax \n")
+            else:
+                (work_dir / "main.aux").write_text("\\relax \n\\abx@aux@cite{0}{k}\n")
+
+        result, calls = _run_fake_tex(mock_run, on_tex_pass, passes=1)
+
+        assert result.passes_run == 3
+        assert [cmd[0] for cmd in calls] == [
+            settings.TEX_BIN_PATH,
+            settings.BIBER_BIN_PATH,
+            settings.TEX_BIN_PATH,
+            settings.TEX_BIN_PATH,
+        ]
+
+    @patch("app.services.pipeline.run_process")
+    def test_never_exceeds_max_passes(self, mock_run, monkeypatch):
+        monkeypatch.setattr(settings, "MAX_PASSES", 4)
+
+        def on_tex_pass(n, work_dir):
+            (work_dir / "main.aux").write_text(f"\\newlabel{{a}}{{{{{n}}}{{1}}}}\n")
+
+        result, _ = _run_fake_tex(mock_run, on_tex_pass)
+
+        assert result.success is True
+        assert result.passes_run == 4
+
+    @patch("app.services.pipeline.run_process")
+    def test_fixed_mode_reports_passes_run(self, mock_run):
+        mock_run.return_value = MagicMock(returncode=0, stdout="", usage=None)
+        work_dir = create_workdir()
+        safe_write_file(work_dir, "main.tex", b"\\documentclass{article}")
+        (work_dir / "main.pdf").write_bytes(b"%PDF-1.4 fake")
+        try:
+            options = CompileOptions(passes=3, main_file="main.tex")
+            result = compile_project(work_dir, "main.tex", options)
+        finally:
+            cleanup_workdir(work_dir)
+
+        assert result.passes_run == 3
+        assert mock_run.call_count == 3
+
+
+# =====================================================================
+# compile_project — -draftmode
+# =====================================================================
+
+
+def _draft_flags(calls: list[list[str]]) -> list[bool]:
+    return [
+        "-draftmode" in cmd for cmd in calls if cmd[0] == settings.TEX_BIN_PATH
+    ]
+
+
+class TestDraftMode:
+    """Only the pass whose PDF is kept runs without -draftmode."""
+
+    @patch("app.services.pipeline.run_process")
+    def test_fixed_passes_draft_all_but_last(self, mock_run):
+        result, calls = _run_fake_tex(mock_run, lambda n, d: None, passes=3, adaptive=False)
+
+        assert result.success is True
+        assert _draft_flags(calls) == [True, True, False]
+
+    @patch("app.services.pipeline.run_process")
+    def test_single_pass_is_not_draft(self, mock_run):
+        _, calls = _run_fake_tex(mock_run, lambda n, d: None, passes=1, adaptive=False)
+
+        assert _draft_flags(calls) == [False]
+
+    @patch("app.services.pipeline.run_process")
+    def test_bibliography_detected_after_full_first_pass(self, mock_run):
+        def on_tex_pass(n, work_dir):
+            if n == 1:
+                (work_dir / "main.bcf").write_text("bcf")
+
+        _, calls = _run_fake_tex(mock_run, on_tex_pass, passes=1, adaptive=False)
+
+        assert _draft_flags(calls) == [False, True, False]
+
+    @patch("app.services.pipeline.run_process")
+    def test_draft_option_never_writes_pdf(self, mock_run):
+        result, calls = _run_fake_tex(
+            mock_run, lambda n, d: None, passes=2, adaptive=False, draft=True
+        )
+
+        assert result.success is True
+        assert result.pdf_path is None
+        assert _draft_flags(calls) == [True, True]
+
+    @patch("app.services.pipeline.run_process")
+    def test_adaptive_drafts_first_pass_of_cross_referenced_document(self, mock_run):
+        def on_tex_pass(n, work_dir):
+            (work_dir / "main.aux").write_text("\\relax \n\\newlabel{a}{{1}{1}}\n")
+
+        result, calls = _run_fake_tex(
+            mock_run, on_tex_pass, source=b"\\documentclass{article} \\ref{a}"
+        )
+
+        assert result.passes_run == 2
+        assert _draft_flags(calls) == [True, False]
+
+    @patch("app.services.pipeline.run_process")
+    def test_adaptive_adds_pdf_pass_when_draft_pass_converged(self, mock_run):
+        def on_tex_pass(n, work_dir):
+            (work_dir / "main.aux").write_text("\\relax \n")
+
+        result, calls = _run_fake_tex(
+            mock_run, on_tex_pass, source=b"\\documentclass{article} \\ref{a}"
+        )
+
+        assert result.passes_run == 2
+        assert _draft_flags(calls) == [True, False]
+
+    @patch("app.services.pipeline.run_process")
+    def test_adaptive_drafts_pass_that_reads_new_bibliography(self, mock_run):
+        def on_tex_pass(n, work_dir):
+            if n == 1:
+                (work_dir / "main.bcf").write_text("bcf")
+                (work_dir / "main.aux").write_text("\\relax \n")
+            else:
+                (work_dir / "main.aux").write_text("\\relax \n\\abx@aux@cite{0}{k}\n")
+
+        result, calls = _run_fake_tex(
+            mock_run, on_tex_pass, source=b"\\documentclass{article} \\cite{k}"
+        )
+
+        assert result.passes_run == 3
+        assert _draft_flags(calls) == [True, True, False]
+
+
+# =====================================================================
+# compile_project_async — fake binaries
+# =====================================================================
+
+
+def _fake_binary(directory: Path, name: str, script: str) -> str:
+    """Write an executable shell script standing in for a TeX tool."""
+    path = directory / name
+    path.write_text("#!/bin/sh\n" + script, encoding="utf-8")
+    path.chmod(0o755)
+    return str(path)
+
+
+class TestCompileProjectAsync:
+    """compile_project_async() runs real child processes via asyncio."""
+
+    def test_successful_compile(self, tmp_path, monkeypatch):
+        work_dir = self._workdir()
+        calls_log = tmp_path / "calls"
+        monkeypatch.setattr(
+            settings,
+            "TEX_BIN_PATH",
+            _fake_binary(
+                tmp_path,
+                "pdflatex",
+                f'echo "$@" >> {calls_log}\n'
+                'echo "LaTeX Warning: Something happened."\n'
+                "printf '%%PDF-1.4 fake' > main.pdf\n",
+            ),
+        )
+        try:
+            options = CompileOptions(passes=2, main_file="main.tex")
+            result = asyncio.run(compile_project_async(work_dir, "main.tex", options))
+
+            assert result.success is True
+            assert result.pdf_path == work_dir / "main.pdf"
+            assert result.warnings == ["LaTeX Warning: Something happened."]
+            assert len(calls_log.read_text().splitlines()) == 2
+            assert "--- Pass 2 ---" in result.log
+        finally:
+            cleanup_workdir(work_dir)
+
+    def test_filesystem_work_runs_off_the_event_loop(self, tmp_path, monkeypatch):
+        import threading
+
+        from app.services import pipeline
+
+        work_dir = self._workdir()
+        monkeypatch.setattr(
+            settings,
+            "TEX_BIN_PATH",
+            _fake_binary(tmp_path, "pdflatex", "printf '%%PDF-1.4 fake' > main.pdf\n"),
+        )
+        threads = []
+        real_aux_state = pipeline._aux_state
+
+        def recording_aux_state(*args, **kwargs):
+            threads.append(threading.current_thread())
+            return real_aux_state(*args, **kwargs)
+
+        monkeypatch.setattr(pipeline, "_aux_state", recording_aux_state)
+        try:
+            options = CompileOptions(passes=3, main_file="main.tex", adaptive=True)
+            result = asyncio.run(compile_project_async(work_dir, "main.tex", options))
+
+            assert result.success is True
+            assert threads
+            assert threading.main_thread() not in threads
+        finally:
+            cleanup_workdir(work_dir)
+
+    def test_matches_sync_result_on_failure(self, tmp_path, monkeypatch):
+        work_dir = self._workdir()
+        monkeypatch.setattr(
+            settings,
+            "TEX_BIN_PATH",
+            _fake_binary(
+                tmp_path,
+                "pdflatex",
+                'echo "! Undefined control sequence."\nexit 1\n',
+            ),
+        )
+        try:
+            options = CompileOptions(passes=2, main_file="main.tex")
+            async_result = asyncio.run(
+                compile_project_async(work_dir, "main.tex", options)
+            )
+            sync_result = compile_project(work_dir, "main.tex", options)
+
+            assert async_result.success is False
+            assert async_result.errors == sync_result.errors
+            assert async_result.error_message == sync_result.error_message
+            assert async_result.log == sync_result.log
+        finally:
+            cleanup_workdir(work_dir)
+
+    def test_missing_binary(self, tmp_path, monkeypatch):
+        work_dir = self._workdir()
+        monkeypatch.setattr(settings, "TEX_BIN_PATH", str(tmp_path / "missing"))
+        try:
+            options = CompileOptions(passes=1, main_file="main.tex")
+            result = asyncio.run(compile_project_async(work_dir, "main.tex", options))
+
+            assert result.success is False
+            assert result.error_message == "pdflatex binary not found"
+        finally:
+            cleanup_workdir(work_dir)
+
+    def test_timeout_keeps_partial_output(self, tmp_path, monkeypatch):
+        work_dir = self._workdir()
+        monkeypatch.setattr(
+            settings,
+            "TEX_BIN_PATH",
+            _fake_binary(
+                tmp_path,
+                "pdflatex",
+                'echo "LaTeX Warning: partial"\nexec sleep 30\n',
+            ),
+        )
+        try:
+            options = CompileOptions(passes=1, main_file="main.tex", timeout_seconds=1)
+            result = asyncio.run(compile_project_async(work_dir, "main.tex", options))
+
+            assert result.success is False
+            assert result.error_message == "Compilation timed out"
+            assert result.warnings == ["LaTeX Warning: partial"]
+        finally:
+            cleanup_workdir(work_dir)
+
+    def test_cancellation_kills_running_step(self, tmp_path, monkeypatch):
+        work_dir = self._workdir()
+        pid_file = tmp_path / "pid"
+        monkeypatch.setattr(
+            settings,
+            "TEX_BIN_PATH",
+            _fake_binary(tmp_path, "pdflatex", f"echo $$ > {pid_file}\nexec sleep 30\n"),
+        )
+
+        async def main():
+            options = CompileOptions(passes=1, main_file="main.tex", timeout_seconds=30)
+            task = asyncio.create_task(
+                compile_project_async(work_dir, "main.tex", options)
+            )
+            while not pid_file.exists():
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        try:
+            asyncio.run(main())
+            pid = int(pid_file.read_text())
+            assert not Path(f"/proc/{pid}").exists()
+        finally:
+            cleanup_workdir(work_dir)
+
+    def test_events(self, tmp_path, monkeypatch):
+        work_dir = self._workdir()
+        monkeypatch.setattr(settings, "BIB_CACHE_ENABLED", False)
+        monkeypatch.setattr(
+            settings,
+            "TEX_BIN_PATH",
+            _fake_binary(
+                tmp_path,
+                "pdflatex",
+                'echo "LaTeX Warning: Citation undefined."\n'
+                "printf '%s\\n' '\\bibdata{refs}' > main.aux\n"
+                "printf '%%PDF-1.4 fake' > main.pdf\n",
+            ),
+        )
+        monkeypatch.setattr(
+            settings,
+            "BIBTEX_BIN_PATH",
+            _fake_binary(tmp_path, "bibtex", "touch main.bbl\n"),
+        )
+
+        async def collect():
+            options = CompileOptions(passes=1, main_file="main.tex")
+            return [
+                event
+                async for event in compile_project_events(
+                    work_dir, "main.tex", options
+                )
+            ]
+
+        try:
+            events = asyncio.run(collect())
+
+            started = [e.label for e in events if e.kind == "step_started"]
+            assert started == ["Pass 1", "Bibliography (bibtex)", "Pass 2", "Pass 3"]
+            finished = [e for e in events if e.kind == "step_finished"]
+            assert [e.label for e in finished] == started
+            assert finished[0].status == "ok"
+            assert finished[0].warnings == 1
+            assert finished[0].usage.label == "Pass 1"
+            assert events[0].kind == "step_started"
+            assert events[1].kind == "step_finished"
+            assert events[-1].kind == "result"
+            assert events[-1].result.success is True
+            assert len(events[-1].result.steps) == 4
+        finally:
+            cleanup_workdir(work_dir)
+
+    def test_failed_step_event_counts_errors(self, tmp_path, monkeypatch):
+        work_dir = self._workdir()
+        monkeypatch.setattr(
+            settings,
+            "TEX_BIN_PATH",
+            _fake_binary(
+                tmp_path,
+                "pdflatex",
+                'echo "! Undefined control sequence."\nexit 1\n',
+            ),
+        )
+
+        async def collect():
+            options = CompileOptions(passes=2, main_file="main.tex")
+            return [
+                event
+                async for event in compile_project_events(
+                    work_dir, "main.tex", options
+                )
+            ]
+
+        try:
+            events = asyncio.run(collect())
+
+            assert [e.kind for e in events] == [
+                "step_started",
+                "step_finished",
+                "result",
+            ]
+            assert events[1].status == "failed"
+            assert events[1].errors == 1
+            assert events[2].result.success is False
+        finally:
+            cleanup_workdir(work_dir)
+
+    def _workdir(self) -> Path:
+        work_dir = create_workdir()
+        safe_write_file(work_dir, "main.tex", b"\\documentclass{article}")
+        return work_dir
+
+
 # =====================================================================
 # compile_project — real pdflatex
 # =====================================================================
@@ -0,0 +1,165 @@
+"""
+Tests for the pure-Python pre-lint (app.services.prelint) and the
+validation mode of the pipeline.
+"""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.models.compile import CompileOptions
+from app.services.pipeline import validate_project
+from app.services.prelint import prelint
+from app.services.workdir import cleanup_workdir, create_workdir, safe_write_file
+
+client = TestClient(app)
+
+GOOD = "\\documentclass{article}\n\\begin{document}\nHello\n\\end{document}\n"
+
+
+# =====================================================================
+# prelint()
+# =====================================================================
+
+
+class TestPrelint:
+    @pytest.mark.parametrize(
+        "source",
+        [
+            GOOD,
+            # escaped braces, \\ followed by a group, braces in comments
+            "\\documentclass{article}\\begin{document}\\{ \\\\{x} % }}\n\\end{document}",
+            # a bare group left open is only a TeX warning
+            "\\documentclass{article}\\begin{document}{\\bf x\n\\end{document}",
+            "\\documentclass{article}\\begin{document}\\bfseries{ x\n\\end{document}",
+            # anything after \end{document} is ignored by TeX
+            GOOD + "}}} \\end{itemize}",
+            # verbatim material switches the lexical checks off
+            "\\documentclass{article}\\begin{document}\\verb|}|\\end{document}",
+            # environments closed through macros
+            "\\documentclass{article}\n\\def\\eeq{\\end{equation}}\n"
+            "\\begin{document}\\begin{equation}x\\eeq\\end{document}",
+        ],
+    )
+    def test_accepts(self, source):
+        assert prelint(source) == []
+
+    def test_missing_begin_document(self):
+        assert prelint("\\documentclass{article}\nHello") == [
+            "main.tex:1: Missing \\begin{document}"
+        ]
+
+    def test_commented_begin_document_does_not_count(self):
+        errors = prelint("\\documentclass{article}\n% \\begin{document}\n")
+        assert errors and "Missing \\begin{document}" in errors[0]
+
+    def test_stray_closing_brace(self):
+        errors = prelint("\\documentclass{article}\n\\begin{document}\nx}\n\\end{document}")
+        assert errors == ["main.tex:3: Unbalanced '}' (no matching '{')"]
+
+    def test_unclosed_argument(self):
+        errors = prelint(
+            "\\documentclass{article}\n\\begin{document}\n\\textbf{x\n\\end{document}"
+        )
+        assert errors == ["main.tex:3: Argument opened with '{' is never closed"]
+
+    def test_unclosed_argument_after_optional_argument(self):
+        errors = prelint(
+            "\\documentclass{article}\n\\begin{document}\n"
+            "\\section[short]{Long\n\\end{document}"
+        )
+        assert errors == ["main.tex:3: Argument opened with '{' is never closed"]
+
+    def test_mismatched_environment(self):
+        errors = prelint(
+            "\\documentclass{article}\n\\begin{document}\n\\begin{itemize}\n"
+            "\\end{enumerate}\n\\end{document}"
+        )
+        assert errors == [
+            "main.tex:4: \\end{enumerate} does not match \\begin{itemize} on line 3"
+        ]
+
+    def test_unended_environment(self):
+        errors = prelint("\\documentclass{article}\n\\begin{document}\nx\n")
+        assert errors == ["main.tex:2: \\begin{document} is never ended"]
+
+
+# =====================================================================
+# validate_project()
+# =====================================================================
+
+
+class TestValidateProject:
+    @patch("app.services.pipeline.run_process")
+    def test_single_draft_pass_without_bibliography(self, mock_run):
+        work_dir = create_workdir()
+        safe_write_file(work_dir, "main.tex", GOOD.encode())
+
+        def side_effect(cmd, **kwargs):
+            (work_dir / "main.bcf").write_text("bcf")
+            return MagicMock(returncode=0, stdout="", usage=None)
+
+        mock_run.side_effect = side_effect
+        try:
+            options = CompileOptions(passes=3, main_file="main.tex", adaptive=True)
+            result = validate_project(work_dir, "main.tex", options)
+        finally:
+            cleanup_workdir(work_dir)
+
+        assert result.success is True
+        assert result.pdf_path is None
+        assert result.passes_run == 1
+        assert mock_run.call_count == 1
+        assert "-draftmode" in mock_run.call_args.args[0]
+
+
+# =====================================================================
+# Validate endpoints
+# =====================================================================
+
+
+class TestValidateStages:
+    BROKEN = "\\documentclass{article}\n\\begin{document}\nx}\n\\end{document}"
+
+    @pytest.mark.parametrize("path", ["/v2/compile/validate", "/compile/validate"])
+    def test_prelint_rejects_without_pdflatex(self, path):
+        with patch("app.services.pipeline.run_process") as mock_run, patch(
+            "app.api.routes_v2.create_workdir"
+        ) as mock_workdir:
+            r = client.post(path, json={"code": self.BROKEN})
+
+        assert r.status_code == 200
+        body = r.json()
+        assert body["compilable"] is False
+        assert body["stage"] == "prelint"
+        assert body["errors"] == ["main.tex:3: Unbalanced '}' (no matching '{')"]
+        mock_run.assert_not_called()
+        mock_workdir.assert_not_called()
+
+    def test_prelint_can_be_disabled(self):
+        with patch("app.services.pipeline.run_process") as mock_run:
+            mock_run.return_value = MagicMock(
+                returncode=1, stdout="./main.tex:3: Too many }'s.\n", usage=None
+            )
+            r = client.post(
+                "/v2/compile/validate", json={"code": self.BROKEN, "prelint": False}
+            )
+
+        body = r.json()
+        assert body["compilable"] is False
+        assert body["stage"] == "pdflatex"
+        assert mock_run.call_count == 1
+        assert mock_run.call_args.args[0][0] == settings.TEX_BIN_PATH
+
+    def test_clean_input_is_decided_by_pdflatex(self):
+        with patch("app.services.pipeline.run_process") as mock_run:
+            mock_run.return_value = MagicMock(returncode=0, stdout="", usage=None)
+            r = client.post("/v2/compile/validate", json={"code": GOOD, "passes": 3})
+
+        body = r.json()
+        assert body["compilable"] is True
+        assert body["stage"] == "pdflatex"
+        assert mock_run.call_count == 1
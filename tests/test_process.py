@@ -0,0 +1,331 @@
+"""
+Tests for app.services.process, cancellable executor calls and
+app.api.disconnect.
+"""
+
+import asyncio
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.disconnect import ClientDisconnectedError, cancel_on_disconnect
+from app.core.config import settings
+from app.main import app
+from app.models.compile import CompileOptions
+from app.services.executor import (
+    run_cancellable_in_compile_executor,
+    shutdown_compile_executor,
+)
+from app.services.pipeline import compile_project
+from app.services.process import (
+    CancelToken,
+    CompileCancelledError,
+    ResourceLimitExceeded,
+    run_process,
+)
+
+# Starts a grandchild that outlives its parent unless the group is killed
+SPAWN_GRANDCHILD = "sleep 30 & echo $! > grandchild.pid; echo started; wait"
+
+
+def _alive(pid: int) -> bool:
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except FileNotFoundError:
+        return False
+    return stat.rsplit(")", 1)[1].split()[0] != "Z"
+
+
+def _grandchild_exits(tmp_path: Path) -> bool:
+    """Whether the grandchild is gone (SIGKILL delivery is asynchronous)."""
+    pid = int((tmp_path / "grandchild.pid").read_text())
+    deadline = time.monotonic() + 2
+    while _alive(pid):
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture(autouse=True)
+def fresh_executor():
+    shutdown_compile_executor()
+    yield
+    shutdown_compile_executor()
+
+
+# =====================================================================
+# run_process
+# =====================================================================
+
+
+class TestRunProcess:
+    def test_captures_output_and_returncode(self, tmp_path):
+        result = run_process(
+            ["sh", "-c", "echo out; echo err >&2; exit 3"], cwd=str(tmp_path), timeout=5
+        )
+        assert result.returncode == 3
+        assert result.stdout == "out\nerr\n"
+
+    def test_missing_binary(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            run_process(["/nonexistent/pdflatex"], cwd=str(tmp_path), timeout=5)
+
+    def test_timeout_kills_the_process_tree(self, tmp_path):
+        with pytest.raises(subprocess.TimeoutExpired) as excinfo:
+            run_process(["sh", "-c", SPAWN_GRANDCHILD], cwd=str(tmp_path), timeout=0.5)
+
+        assert excinfo.value.output == "started\n"
+        assert _grandchild_exits(tmp_path)
+
+    def test_cancel_kills_the_process_tree(self, tmp_path):
+        token = CancelToken(tmp_path / "cancel")
+        threading.Timer(0.3, token.cancel).start()
+
+        t0 = time.monotonic()
+        with pytest.raises(CompileCancelledError):
+            run_process(
+                ["sh", "-c", SPAWN_GRANDCHILD],
+                cwd=str(tmp_path),
+                timeout=30,
+                cancel=token,
+            )
+
+        assert time.monotonic() - t0 < 5
+        assert _grandchild_exits(tmp_path)
+
+
+# =====================================================================
+# Resource limits
+# =====================================================================
+
+
+# Body of a fake pdflatex that writes a 1 MB file (exec: dd is the child)
+WRITE_BIG_FILE = "exec dd if=/dev/zero of=big bs=1024 count=1024\n"
+
+
+class TestResourceLimits:
+    def test_file_size(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(settings, "COMPILE_FILE_SIZE_LIMIT_BYTES", 64 * 1024)
+        with pytest.raises(ResourceLimitExceeded) as excinfo:
+            run_process(
+                ["dd", "if=/dev/zero", "of=big", "bs=1024", "count=1024"],
+                cwd=str(tmp_path),
+                timeout=10,
+            )
+        assert excinfo.value.limit == "file_size"
+        assert (tmp_path / "big").stat().st_size <= 64 * 1024
+
+    def test_cpu_time(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(settings, "COMPILE_CPU_LIMIT_SECONDS", 1)
+        with pytest.raises(ResourceLimitExceeded) as excinfo:
+            run_process(
+                [sys.executable, "-c", "while True: pass"],
+                cwd=str(tmp_path),
+                timeout=10,
+            )
+        assert excinfo.value.limit == "cpu_time"
+
+    def test_cpu_time_hard_limit(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(settings, "COMPILE_CPU_LIMIT_SECONDS", 1)
+        ignore_sigxcpu = (
+            "import signal\n"
+            "signal.signal(signal.SIGXCPU, signal.SIG_IGN)\n"
+            "while True: pass"
+        )
+        with pytest.raises(ResourceLimitExceeded) as excinfo:
+            run_process(
+                [sys.executable, "-c", ignore_sigxcpu], cwd=str(tmp_path), timeout=10
+            )
+        assert excinfo.value.limit == "cpu_time"
+
+    def test_other_sigkill_is_not_a_cpu_breach(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(settings, "COMPILE_CPU_LIMIT_SECONDS", 1)
+        result = run_process(["sh", "-c", "kill -9 $$"], cwd=str(tmp_path), timeout=10)
+        assert result.returncode == -9
+
+    @pytest.mark.skipif(shutil.which("perl") is None, reason="perl not installed")
+    def test_memory(self, tmp_path, monkeypatch):
+        # biber and texcount are Perl
+        monkeypatch.setattr(settings, "COMPILE_MEMORY_LIMIT_BYTES", 256 * 1024 * 1024)
+        with pytest.raises(ResourceLimitExceeded) as excinfo:
+            run_process(
+                ["perl", "-e", '$x = "a" x (512 * 1024 * 1024)'],
+                cwd=str(tmp_path),
+                timeout=10,
+            )
+        assert excinfo.value.limit == "memory"
+        assert "Out of memory" in excinfo.value.output
+
+    def test_limits_can_be_disabled(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(settings, "COMPILE_FILE_SIZE_LIMIT_BYTES", 0)
+        result = run_process(
+            ["dd", "if=/dev/zero", "of=big", "bs=1024", "count=1024"],
+            cwd=str(tmp_path),
+            timeout=10,
+        )
+        assert result.returncode == 0
+
+    def test_pipeline_reports_the_limit(self, tmp_path, monkeypatch, fake_pdflatex):
+        fake_pdflatex(WRITE_BIG_FILE)
+        monkeypatch.setattr(settings, "COMPILE_FILE_SIZE_LIMIT_BYTES", 64 * 1024)
+        work_dir = tmp_path / "work"
+        work_dir.mkdir()
+        (work_dir / "main.tex").write_text("\\documentclass{article}")
+
+        result = compile_project(
+            work_dir, "main.tex", CompileOptions(passes=1, main_file="main.tex")
+        )
+
+        assert not result.success
+        assert result.resource_limit == "file_size"
+        assert result.error_message == "Compilation exceeded the file size limit"
+        assert "--- Exceeded the file size limit during Pass 1 ---" in result.log
+
+    def test_v2_error_type(self, monkeypatch, fake_pdflatex):
+        fake_pdflatex(WRITE_BIG_FILE)
+        monkeypatch.setattr(settings, "COMPILE_FILE_SIZE_LIMIT_BYTES", 64 * 1024)
+
+        r = TestClient(app).post(
+            "/v2/compile/sync",
+            files=[("files", ("main.tex", b"\\documentclass{article}\n"))],
+            data={"main_file": "main.tex"},
+        )
+
+        assert r.status_code == 400
+        assert r.json()["error_type"] == "resource_limit"
+
+
+# =====================================================================
+# Resource accounting
+# =====================================================================
+
+
+class TestUsage:
+    def test_run_process_reports_rusage(self, tmp_path):
+        burn = (
+            "import time\n"
+            "t = time.process_time()\n"
+            "while time.process_time() - t < 0.2: pass"
+        )
+        result = run_process(
+            [sys.executable, "-c", burn], cwd=str(tmp_path), timeout=10
+        )
+        assert result.usage.user_cpu_ms + result.usage.system_cpu_ms >= 150
+        assert result.usage.max_rss_kb > 0
+
+    def test_compile_result_lists_steps(self, tmp_path, fake_pdflatex):
+        fake_pdflatex()
+        work_dir = tmp_path / "work"
+        work_dir.mkdir()
+        (work_dir / "main.tex").write_text("\\documentclass{article}")
+
+        result = compile_project(
+            work_dir, "main.tex", CompileOptions(passes=2, main_file="main.tex")
+        )
+
+        assert result.success
+        assert [step.label for step in result.steps] == ["Pass 1", "Pass 2"]
+        for step in result.steps:
+            assert step.max_rss_kb and step.user_cpu_ms is not None
+
+    def test_json_response_and_compile_event(self, fake_pdflatex, caplog):
+        fake_pdflatex()
+
+        with caplog.at_level("INFO", logger="compile"):
+            r = TestClient(app).post(
+                "/v2/compile/sync",
+                files=[("files", ("main.tex", b"\\documentclass{article}\n"))],
+                data={"main_file": "main.tex", "passes": "1", "return": "json"},
+            )
+
+        assert r.status_code == 200
+        steps = r.json()["steps"]
+        assert [step["label"] for step in steps] == ["Pass 1"]
+        assert set(steps[0]) == {
+            "label",
+            "wall_ms",
+            "user_cpu_ms",
+            "system_cpu_ms",
+            "max_rss_kb",
+            "blocks_in",
+            "blocks_out",
+        }
+        event = next(rec for rec in caplog.records if rec.name == "compile")
+        assert event.extra_fields["steps"] == steps
+        assert event.extra_fields["max_rss_kb"] == steps[0]["max_rss_kb"]
+
+
+# =====================================================================
+# Cancellation from the event loop
+# =====================================================================
+
+
+def _wait_for_cancel(started: threading.Event, stopped: threading.Event, *, cancel):
+    started.set()
+    while not cancel.cancelled:
+        time.sleep(0.01)
+    stopped.set()
+    raise CompileCancelledError()
+
+
+def test_cancelling_the_caller_waits_for_the_worker():
+    started, stopped = threading.Event(), threading.Event()
+
+    async def main():
+        task = asyncio.ensure_future(
+            run_cancellable_in_compile_executor(_wait_for_cancel, started, stopped)
+        )
+        await asyncio.to_thread(started.wait, 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return stopped.is_set()
+
+    assert asyncio.run(main())
+
+
+class _FakeRequest:
+    def __init__(self, disconnect_after: int):
+        self.polls = 0
+        self.disconnect_after = disconnect_after
+
+    async def is_disconnected(self) -> bool:
+        self.polls += 1
+        return self.polls >= self.disconnect_after
+
+
+def test_disconnect_cancels_the_work():
+    cancelled = False
+
+    async def work():
+        nonlocal cancelled
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+
+    async def main():
+        await cancel_on_disconnect(_FakeRequest(2), work(), poll_interval=0.01)
+
+    with pytest.raises(ClientDisconnectedError):
+        asyncio.run(main())
+    assert cancelled
+
+
+def test_connected_client_gets_the_result():
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    request = _FakeRequest(disconnect_after=10**6)
+    result = asyncio.run(cancel_on_disconnect(request, work(), poll_interval=0.01))
+    assert result == "done"
+    assert request.polls > 0
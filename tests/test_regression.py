@@ -39,12 +39,12 @@ client = TestClient(app)
 class TestPDFNameDerivation:
     """v1 hardcoded 'main.pdf' — v2 derives from main_file stem."""
 
-    @patch("app.services.pipeline.subprocess.run")
+    @patch("app.services.pipeline.run_process")
     def test_pdf_named_after_document_tex(self, mock_run):
         work_dir = create_workdir()
         try:
             safe_write_file(work_dir, "document.tex", b"\\documentclass{article}")
-            mock_run.return_value = MagicMock(returncode=0, stdout="OK")
+            mock_run.return_value = MagicMock(returncode=0, stdout="OK", usage=None)
             (work_dir / "document.pdf").write_bytes(b"%PDF-1.4")
 
             options = CompileOptions(passes=1, main_file="document.tex")
@@ -54,13 +54,13 @@ class TestPDFNameDerivation:
         finally:
             cleanup_workdir(work_dir)
 
-    @patch("app.services.pipeline.subprocess.run")
+    @patch("app.services.pipeline.run_process")
     def test_pdf_named_from_nested_path(self, mock_run):
         work_dir = create_workdir()
         try:
             (work_dir / "src").mkdir()
             safe_write_file(work_dir, "src/thesis.tex", b"\\documentclass{article}")
-            mock_run.return_value = MagicMock(returncode=0, stdout="OK")
+            mock_run.return_value = MagicMock(returncode=0, stdout="OK", usage=None)
             # pdflatex outputs PDF in cwd (work_dir), not alongside source
             (work_dir / "thesis.pdf").write_bytes(b"%PDF-1.4")
 
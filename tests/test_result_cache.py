@@ -0,0 +1,246 @@
+"""
+Tests for app.services.result_cache and the X-Cache behaviour of v2 compiles.
+"""
+
+from pathlib import Path
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.models.compile import CompileOptions, CompileResult, TextCountResponse
+from app.services.adapters import ProjectSnapshot
+from app.services.result_cache import (
+    CachedCompile,
+    ResultCache,
+    compile_cache_key,
+)
+from tests.conftest import make_zip_from_dict
+
+client = TestClient(app)
+
+SIMPLE_TEX = rb"\documentclass{article}\begin{document}Hi\end{document}"
+
+
+def _entry(pdf: bytes = b"%PDF-1.4 cached", log: str = "log") -> CachedCompile:
+    return CachedCompile(pdf=pdf, compile_time_ms=5, log=log)
+
+
+# =====================================================================
+# Cache keys
+# =====================================================================
+
+
+class TestCompileCacheKey:
+    def test_independent_of_upload_order(self):
+        a = ProjectSnapshot(files={"main.tex": b"x", "refs.bib": b"y"})
+        b = ProjectSnapshot(files={"refs.bib": b"y", "main.tex": b"x"})
+        options = CompileOptions(main_file="main.tex")
+        assert compile_cache_key(a.digest(), options) == compile_cache_key(
+            b.digest(), options
+        )
+
+    def test_changes_with_content_path_and_options(self):
+        options = CompileOptions(main_file="main.tex")
+        base = compile_cache_key(
+            ProjectSnapshot(files={"main.tex": b"x"}).digest(), options
+        )
+        assert base != compile_cache_key(
+            ProjectSnapshot(files={"main.tex": b"y"}).digest(), options
+        )
+        assert base != compile_cache_key(
+            ProjectSnapshot(files={"other.tex": b"x"}).digest(), options
+        )
+        assert base != compile_cache_key(
+            ProjectSnapshot(files={"main.tex": b"x"}).digest(),
+            CompileOptions(main_file="main.tex", passes=3),
+        )
+
+    def test_ignores_timeout(self):
+        digest = ProjectSnapshot(files={"main.tex": b"x"}).digest()
+        assert compile_cache_key(
+            digest, CompileOptions(main_file="main.tex", timeout_seconds=5)
+        ) == compile_cache_key(
+            digest, CompileOptions(main_file="main.tex", timeout_seconds=50)
+        )
+
+
+# =====================================================================
+# ResultCache
+# =====================================================================
+
+
+class TestResultCache:
+    def test_memory_lru_evicts_oldest_over_budget(self, monkeypatch):
+        monkeypatch.setattr(settings, "RESULT_CACHE_MAX_BYTES", 250)
+        cache = ResultCache()
+        cache.put("a", _entry(b"a" * 100))
+        cache.put("b", _entry(b"b" * 100))
+        assert cache.get("a") is not None  # "a" is now most recently used
+        cache.put("c", _entry(b"c" * 100))
+
+        assert cache.get("a") is not None
+        assert cache.get("b") is None
+        assert cache.get("c") is not None
+
+    def test_oversized_entry_skips_memory(self, monkeypatch):
+        monkeypatch.setattr(settings, "RESULT_CACHE_MAX_ENTRY_BYTES", 10)
+        cache = ResultCache()
+        cache.put("big", _entry(b"x" * 100))
+        assert cache.get("big") is None
+
+    def test_disk_tier_round_trip(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(settings, "RESULT_CACHE_DIR", str(tmp_path))
+        textcount = TextCountResponse(status="unavailable", message="nope")
+        writer = ResultCache()
+        writer.put(
+            "k",
+            CachedCompile(
+                pdf=b"%PDF-1.4 disk",
+                compile_time_ms=7,
+                log="disk log",
+                warnings=["w"],
+                textcount=textcount,
+            ),
+        )
+
+        # A fresh cache (another worker) finds it on disk
+        entry = ResultCache().get("k")
+        assert entry is not None
+        assert entry.pdf == b"%PDF-1.4 disk"
+        assert entry.warnings == ["w"]
+        assert entry.textcount == textcount
+
+    def test_disk_tier_evicts_over_budget(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(settings, "RESULT_CACHE_DIR", str(tmp_path))
+        monkeypatch.setattr(settings, "RESULT_CACHE_DISK_MAX_BYTES", 600)
+        cache = ResultCache()
+        for key in ("a", "b", "c"):
+            cache.put(key, _entry(b"x" * 200))
+
+        total = sum(p.stat().st_size for p in tmp_path.iterdir())
+        assert total <= 600
+        assert (tmp_path / "c.json").exists()
+
+    def test_large_pdfs_stay_on_disk(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(settings, "RESULT_CACHE_DIR", str(tmp_path / "cache"))
+        monkeypatch.setattr(settings, "RESULT_CACHE_MAX_ENTRY_BYTES", 10)
+        pdf = tmp_path / "main.pdf"
+        pdf.write_bytes(b"%PDF-1.4 " + b"x" * 100)
+        result = CompileResult(success=True, pdf_path=pdf, compile_time_ms=1, log="")
+
+        entry = CachedCompile.from_result(result)
+        assert entry.pdf == b"" and entry.pdf_file == pdf
+        cache = ResultCache()
+        cache.put("k", entry)
+        pdf.unlink()  # the work dir goes away after the response
+
+        hit = cache.get("k")
+        assert hit is not None
+        assert hit.pdf == b""
+        assert hit.pdf_file == tmp_path / "cache" / "k.pdf"
+        assert hit.read_pdf() == b"%PDF-1.4 " + b"x" * 100
+
+
+# =====================================================================
+# v2 routes
+# =====================================================================
+
+
+def _fake_compile(
+    work_dir: Path, main_file: str, options, cancel=None
+) -> CompileResult:
+    pdf = work_dir / (Path(main_file).stem + ".pdf")
+    pdf.write_bytes(b"%PDF-1.4 " + (work_dir / main_file).read_bytes()[:10])
+    return CompileResult(
+        success=True, pdf_path=pdf, compile_time_ms=3, log="--- Pass 1 ---\n"
+    )
+
+
+class TestCompileRoutesCache:
+    @patch("app.api.routes_v2.compile_project", side_effect=_fake_compile)
+    def test_identical_resubmit_is_served_from_cache(self, mock_compile):
+        def post():
+            return client.post(
+                "/v2/compile/sync",
+                data={"main_file": "main.tex"},
+                files=[("files", ("main.tex", SIMPLE_TEX))],
+            )
+
+        first = post()
+        second = post()
+
+        assert first.status_code == second.status_code == 200
+        assert first.headers["x-cache"] == "MISS"
+        assert second.headers["x-cache"] == "HIT"
+        assert second.content == first.content
+        assert mock_compile.call_count == 1
+
+    @patch("app.api.routes_v2.compile_project", side_effect=_fake_compile)
+    def test_zip_and_multipart_share_entries(self, mock_compile):
+        client.post(
+            "/v2/compile/sync",
+            data={"main_file": "main.tex"},
+            files=[("files", ("main.tex", SIMPLE_TEX))],
+        )
+        r = client.post(
+            "/v2/compile/zip",
+            data={"main_file": "main.tex"},
+            files=[
+                (
+                    "file",
+                    ("p.zip", make_zip_from_dict({"main.tex": SIMPLE_TEX}), "application/zip"),
+                )
+            ],
+        )
+        assert r.headers["x-cache"] == "HIT"
+        assert mock_compile.call_count == 1
+
+    @patch("app.api.routes_v2.compile_project", side_effect=_fake_compile)
+    def test_changed_content_misses(self, mock_compile):
+        for body in (SIMPLE_TEX, SIMPLE_TEX + b"%"):
+            r = client.post(
+                "/v2/compile/sync",
+                data={"main_file": "main.tex"},
+                files=[("files", ("main.tex", body))],
+            )
+            assert r.headers["x-cache"] == "MISS"
+        assert mock_compile.call_count == 2
+
+    @patch("app.api.routes_v2.compile_project")
+    def test_failures_are_not_cached(self, mock_compile):
+        mock_compile.return_value = CompileResult(
+            success=False,
+            compile_time_ms=1,
+            log="",
+            error_message="Compilation failed",
+        )
+        for _ in range(2):
+            r = client.post(
+                "/v2/compile/sync",
+                data={"main_file": "main.tex"},
+                files=[("files", ("main.tex", SIMPLE_TEX))],
+            )
+            assert r.status_code == 400
+        assert mock_compile.call_count == 2
+
+    @patch("app.api.routes_v2.compile_project", side_effect=_fake_compile)
+    def test_disabled_cache_sends_no_header(self, mock_compile, monkeypatch):
+        monkeypatch.setattr(settings, "RESULT_CACHE_ENABLED", False)
+        r = client.post(
+            "/v2/compile/sync",
+            data={"main_file": "main.tex"},
+            files=[("files", ("main.tex", SIMPLE_TEX))],
+        )
+        assert r.status_code == 200
+        assert "x-cache" not in r.headers
+
+
+class TestToolchainProbe:
+    def test_probed_at_startup(self):
+        from app.services.result_cache import toolchain_version
+
+        toolchain_version.cache_clear()
+        with TestClient(app):
+            assert toolchain_version.cache_info().currsize == 1
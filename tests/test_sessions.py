@@ -0,0 +1,202 @@
+"""
+Tests for persistent compile sessions (app.services.sessions and the
+/v2/sessions endpoints).
+"""
+
+import asyncio
+import os
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.services.sessions import session_store
+
+client = TestClient(app)
+
+MAIN = (
+    b"\\documentclass{article}\n\\begin{document}\n"
+    b"\\section{A}\\label{a} See \\ref{a}.\n\\end{document}\n"
+)
+
+
+@pytest.fixture(autouse=True)
+def _isolated_sessions(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SESSION_DIR", str(tmp_path / "sessions"))
+
+
+def _fake_pdflatex(cmd, cwd=None, **kwargs):
+    """Write a converged .aux every pass, and a PDF unless in draft mode."""
+    if cwd is None:  # toolchain --version probe
+        return MagicMock(returncode=0, stdout="pdfTeX 3.14", usage=None)
+    work_dir = Path(cwd)
+    (work_dir / "main.aux").write_text("\\relax\n\\newlabel{a}{{1}{1}}\n")
+    if "-draftmode" not in cmd:
+        (work_dir / "main.pdf").write_bytes(b"%PDF-1.4 session")
+    return MagicMock(returncode=0, stdout="", usage=None)
+
+
+def _create(files=(("main.tex", MAIN),)):
+    r = client.post("/v2/sessions", files=[("files", f) for f in files])
+    assert r.status_code == 201
+    return r.json()["session_id"]
+
+
+def _compile(session_id, **data):
+    return client.post(
+        f"/v2/sessions/{session_id}/compile", data={"main_file": "main.tex", **data}
+    )
+
+
+# =====================================================================
+# Session lifecycle
+# =====================================================================
+
+
+class TestSessionEndpoints:
+    def test_files_can_be_added_replaced_and_removed(self):
+        session_id = _create()
+
+        r = client.patch(
+            f"/v2/sessions/{session_id}/files",
+            files=[("files", ("chapters/one.tex", b"One")), ("files", ("main.tex", b"x"))],
+        )
+        assert r.status_code == 200
+        body = r.json()
+        assert sorted(body["files"]) == ["chapters/one.tex", "main.tex"]
+        assert body["total_bytes"] == 4
+
+        r = client.delete(f"/v2/sessions/{session_id}/files/chapters/one.tex")
+        assert r.status_code == 200
+        assert list(r.json()["files"]) == ["main.tex"]
+        r = client.delete(f"/v2/sessions/{session_id}/files/chapters/one.tex")
+        assert r.status_code == 404
+
+        assert client.delete(f"/v2/sessions/{session_id}").status_code == 204
+        r = client.get(f"/v2/sessions/{session_id}")
+        assert r.status_code == 404
+        assert r.json()["error_type"] == "not_found"
+
+    def test_uploads_are_validated(self):
+        session_id = _create()
+        r = client.patch(
+            f"/v2/sessions/{session_id}/files",
+            files=[("files", ("evil.tex", b"\\immediate\\write18{ls}"))],
+        )
+        assert r.status_code == 422
+        assert list(client.get(f"/v2/sessions/{session_id}").json()["files"]) == [
+            "main.tex"
+        ]
+
+    def test_unknown_session(self):
+        assert _compile("0" * 32).status_code == 404
+        assert client.get("/v2/sessions/../etc").status_code == 404
+
+    def test_compile_requires_main_file_in_session(self):
+        session_id = _create(files=(("other.tex", MAIN),))
+        assert _compile(session_id).status_code == 422
+
+
+# =====================================================================
+# Warm work dirs
+# =====================================================================
+
+
+class TestWarmCompiles:
+    @patch("app.services.pipeline.run_process", side_effect=_fake_pdflatex)
+    def test_edit_after_warm_compile_needs_one_pass(self, mock_run):
+        session_id = _create()
+
+        r = _compile(session_id)
+        assert r.status_code == 200
+        assert r.content == b"%PDF-1.4 session"
+        assert r.headers["x-passes-run"] == "2"
+
+        client.patch(
+            f"/v2/sessions/{session_id}/files",
+            files=[("files", ("main.tex", MAIN.replace(b"See", b"Cf.")))],
+        )
+        mock_run.reset_mock()
+        r = _compile(session_id)
+        assert r.status_code == 200
+        assert r.headers["x-passes-run"] == "1"
+        assert mock_run.call_count == 1
+        assert "-draftmode" not in mock_run.call_args.args[0]
+
+    @patch("app.services.pipeline.run_process", side_effect=_fake_pdflatex)
+    def test_session_compiles_bypass_the_result_cache(self, mock_run, monkeypatch):
+        monkeypatch.setattr(settings, "RESULT_CACHE_ENABLED", True)
+        data = {"main_file": "main.tex", "passes": "1"}
+        files = [("files", ("main.tex", MAIN))]
+        assert client.post("/v2/compile/sync", files=files, data=data).status_code == 200
+        session_id = _create()
+
+        mock_run.reset_mock()
+        r = _compile(session_id, passes="1")
+        assert r.status_code == 200
+        assert "x-cache" not in r.headers
+        assert mock_run.called
+        assert (session_store.sessions_dir() / session_id / "work" / "main.aux").exists()
+
+        r = client.post("/v2/compile/sync", files=files, data=data)
+        assert r.headers["x-cache"] == "HIT"
+
+
+# =====================================================================
+# Eviction
+# =====================================================================
+
+
+class TestSweep:
+    def test_expired_sessions_are_removed(self):
+        old, fresh = _create(), _create()
+        os.utime(session_store.sessions_dir() / old, (1, 1))
+
+        session_store.sweep()
+
+        assert client.get(f"/v2/sessions/{old}").status_code == 404
+        assert client.get(f"/v2/sessions/{fresh}").status_code == 200
+
+    def test_lru_over_budget_skips_sessions_in_use(self, monkeypatch):
+        first, second, third = _create(), _create(), _create()
+        for age, session_id in enumerate((first, second, third)):
+            stamp = 1_000_000_000 + age
+            os.utime(session_store.sessions_dir() / session_id, (stamp, stamp))
+        monkeypatch.setattr(settings, "SESSION_TTL_SECONDS", 10**10)
+        monkeypatch.setattr(settings, "SESSION_MAX_BYTES", 0)
+
+        async def sweep_while_holding(session_id):
+            handle = await session_store.open(session_id)
+            try:
+                session_store.sweep()
+            finally:
+                handle.release()
+
+        asyncio.run(sweep_while_holding(first))
+
+        remaining = [
+            s
+            for s in (first, second, third)
+            if client.get(f"/v2/sessions/{s}").status_code == 200
+        ]
+        assert remaining == [first]
+
+    def test_growing_a_session_evicts_idle_ones(self, monkeypatch):
+        old, grown = _create(), _create()
+        os.utime(session_store.sessions_dir() / old, (1_000_000_000,) * 2)
+        monkeypatch.setattr(settings, "SESSION_TTL_SECONDS", 10**10)
+        monkeypatch.setattr(settings, "SESSION_MAX_BYTES", 0)
+
+        r = client.patch(
+            f"/v2/sessions/{grown}/files", files=[("files", ("big.tex", b"x" * 4096))]
+        )
+        assert r.status_code == 200
+
+        deadline = time.monotonic() + 5
+        while (session_store.sessions_dir() / old).exists():
+            assert time.monotonic() < deadline, "the janitor did not evict"
+            time.sleep(0.01)
@@ -0,0 +1,256 @@
+"""
+Tests for app.services.singleflight and its wiring into the compile routes.
+"""
+
+import asyncio
+import threading
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models.compile import CompileResult
+from app.services.singleflight import SingleFlight
+from tests.conftest import make_zip_from_dict
+
+SIMPLE_TEX = rb"\documentclass{article}\begin{document}Hi\end{document}"
+
+
+# =====================================================================
+# SingleFlight
+# =====================================================================
+
+
+class TestSingleFlight:
+    def test_concurrent_callers_share_one_call(self):
+        calls = []
+        finalized = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "result"
+
+        async def main():
+            group: SingleFlight[str] = SingleFlight()
+            leases = await asyncio.gather(
+                *(group.join("k", work, finalize=finalized.append) for _ in range(3))
+            )
+            assert group.in_flight() == 0
+            for lease in leases[:-1]:
+                lease.release()
+            assert finalized == []
+            leases[-1].release()
+            leases[-1].release()  # idempotent
+            return leases
+
+        leases = asyncio.run(main())
+        assert len(calls) == 1
+        assert [lease.result for lease in leases] == ["result"] * 3
+        assert [lease.shared for lease in leases] == [False, True, True]
+        assert finalized == ["result"]
+
+    def test_finished_call_is_not_reused(self):
+        calls = []
+
+        async def work():
+            calls.append(1)
+            return len(calls)
+
+        async def main():
+            group: SingleFlight[int] = SingleFlight()
+            first = await group.join("k", work)
+            second = await group.join("k", work)
+            return first.result, second.result
+
+        assert asyncio.run(main()) == (1, 2)
+
+    def test_exception_reaches_every_caller(self):
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        async def main():
+            group: SingleFlight[str] = SingleFlight()
+            return await asyncio.gather(
+                group.join("k", work), group.join("k", work), return_exceptions=True
+            )
+
+        results = asyncio.run(main())
+        assert all(isinstance(r, ValueError) for r in results)
+
+    def test_call_is_cancelled_when_every_caller_leaves(self):
+        started = []
+        cancelled = []
+
+        async def work():
+            started.append(1)
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        async def main():
+            group: SingleFlight[None] = SingleFlight()
+            callers = [asyncio.ensure_future(group.join("k", work)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            callers[0].cancel()
+            await asyncio.sleep(0.01)
+            assert cancelled == []  # the other caller still waits
+            callers[1].cancel()
+            await asyncio.gather(*callers, return_exceptions=True)
+            await asyncio.sleep(0.01)
+
+        asyncio.run(main())
+        assert started == [1]
+        assert cancelled == [1]
+
+
+# =====================================================================
+# Route wiring
+# =====================================================================
+
+
+def _slow_compile(
+    work_dir: Path, main_file: str, options, cancel=None
+) -> CompileResult:
+    time.sleep(0.3)
+    pdf = work_dir / "main.pdf"
+    pdf.write_bytes(b"%PDF-1.4 shared")
+    return CompileResult(success=True, pdf_path=pdf, log="ok", compile_time_ms=300)
+
+
+def _post_concurrently(c: TestClient, count: int, **kwargs) -> list:
+    responses: list = [None] * count
+
+    def send(i: int) -> None:
+        responses[i] = c.post("/v2/compile/sync", **kwargs)
+
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return responses
+
+
+class TestSharedCompiles:
+    @pytest.fixture(autouse=True)
+    def _no_result_cache(self, monkeypatch):
+        from app.core.config import settings
+
+        monkeypatch.setattr(settings, "RESULT_CACHE_ENABLED", False)
+
+    def test_identical_v2_requests_compile_once(self):
+        with patch(
+            "app.api.routes_v2.compile_project", side_effect=_slow_compile
+        ) as mock_compile, TestClient(app) as c:
+            responses = _post_concurrently(
+                c,
+                3,
+                data={"main_file": "main.tex"},
+                files=[("files", ("main.tex", SIMPLE_TEX))],
+            )
+
+        assert mock_compile.call_count == 1
+        assert [r.status_code for r in responses] == [200] * 3
+        assert all(r.content == b"%PDF-1.4 shared" for r in responses)
+
+    def test_different_projects_compile_separately(self):
+        with patch(
+            "app.api.routes_v2.compile_project", side_effect=_slow_compile
+        ) as mock_compile, TestClient(app) as c:
+            threads = [
+                threading.Thread(
+                    target=c.post,
+                    args=("/v2/compile/sync",),
+                    kwargs={
+                        "data": {"main_file": "main.tex"},
+                        "files": [("files", ("main.tex", SIMPLE_TEX + b"%" * i))],
+                    },
+                )
+                for i in range(2)
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        assert mock_compile.call_count == 2
+
+    def test_identical_v2_validations_run_pdflatex_once(self):
+        def slow_tex(cmd, cwd, **kwargs):
+            time.sleep(0.3)
+            return MagicMock(returncode=0, stdout="", usage=None)
+
+        with patch(
+            "app.services.pipeline.run_process", side_effect=slow_tex
+        ) as mock_run, TestClient(app) as c:
+            responses: list = [None] * 3
+
+            def send(i: int) -> None:
+                responses[i] = c.post(
+                    "/v2/compile/validate", json={"code": SIMPLE_TEX.decode()}
+                )
+
+            threads = [threading.Thread(target=send, args=(i,)) for i in range(3)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        assert mock_run.call_count == 1
+        assert all(r.json()["compilable"] is True for r in responses)
+
+
+# =====================================================================
+# v1 routes, through the real compile_latex_sync
+# =====================================================================
+
+
+def _fake_tex(cmd, cwd, **kwargs):
+    time.sleep(0.1)
+    (Path(cwd) / "main.pdf").write_bytes(b"%PDF-1.4 v1")
+    return MagicMock(returncode=0, stdout="", usage=None)
+
+
+class TestV1SharedCompiles:
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            {"data": {"code": SIMPLE_TEX.decode()}},
+            {"files": {"file": ("main.tex", SIMPLE_TEX, "text/plain")}},
+            {
+                "files": {
+                    "file": (
+                        "p.zip",
+                        make_zip_from_dict({"main.tex": SIMPLE_TEX}),
+                        "application/zip",
+                    )
+                }
+            },
+        ],
+    )
+    def test_compile_sync(self, kwargs):
+        with patch("app.services.pipeline.run_process", side_effect=_fake_tex):
+            with TestClient(app) as c:
+                r = c.post(
+                    "/compile/sync",
+                    data={"passes": "1", **kwargs.get("data", {})},
+                    files=kwargs.get("files"),
+                )
+
+        assert r.status_code == 200, r.text
+        assert r.content == b"%PDF-1.4 v1"
+
+    def test_validate(self):
+        with patch("app.services.pipeline.run_process", side_effect=_fake_tex):
+            with TestClient(app) as c:
+                r = c.post("/compile/validate", json={"code": SIMPLE_TEX.decode()})
+
+        assert r.status_code == 200
+        assert r.json()["compilable"] is True
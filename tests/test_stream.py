@@ -0,0 +1,121 @@
+"""
+Tests for the Server-Sent Events compile stream (/v2/compile/stream).
+"""
+
+import base64
+import io
+import json
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from tests.conftest import FAKE_PDFLATEX
+
+MAIN_TEX = b"\\documentclass{article}\n\\begin{document}x\\end{document}\n"
+
+# Reports one warning per pass
+STREAM_PDFLATEX = "echo 'LaTeX Warning: Reference undefined.'\n" + FAKE_PDFLATEX
+
+
+def _events(text: str) -> list[tuple[str, dict]]:
+    """``(event, data)`` pairs of an event stream."""
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def _stream(files, data) -> list[tuple[str, dict]]:
+    r = TestClient(app).post("/v2/compile/stream", files=files, data=data)
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/event-stream")
+    return _events(r.text)
+
+
+def test_success(fake_pdflatex):
+    fake_pdflatex(STREAM_PDFLATEX)
+    events = _stream(
+        [("files", ("main.tex", MAIN_TEX))], {"main_file": "main.tex", "passes": "2"}
+    )
+
+    names = [name for name, _ in events]
+    assert names == [
+        "accepted",
+        "extracted",
+        "queued",
+        "step_started",
+        "step_finished",
+        "step_started",
+        "step_finished",
+        "texcount",
+        "result",
+    ]
+    data = dict(events)
+    assert data["extracted"] == {"file_count": 1, "total_bytes": len(MAIN_TEX)}
+    step = events[4][1]
+    assert step["label"] == "Pass 1"
+    assert step["status"] == "ok"
+    assert step["warnings"] == 1
+    assert step["errors"] == 0
+    assert "wall_ms" in step
+
+    result = data["result"]
+    assert result["status"] == "ok"
+    assert result["passes_run"] == 2
+    assert base64.b64decode(result["pdf_base64"]) == b"%PDF-1.4"
+
+
+def test_zip_upload(fake_pdflatex):
+    fake_pdflatex(STREAM_PDFLATEX)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("main.tex", MAIN_TEX)
+
+    events = _stream(
+        {"file": ("project.zip", buf.getvalue(), "application/zip")},
+        {"main_file": "main.tex", "passes": "1"},
+    )
+
+    assert events[-1][0] == "result"
+    assert events[-1][1]["status"] == "ok"
+
+
+def test_compile_error_stops_at_failed_step(fake_pdflatex):
+    fake_pdflatex(STREAM_PDFLATEX)
+    events = _stream(
+        [("files", ("main.tex", b"fail"))], {"main_file": "main.tex", "passes": "2"}
+    )
+
+    names = [name for name, _ in events]
+    assert names[-3:] == ["step_started", "step_finished", "result"]
+    assert events[-2][1]["status"] == "failed"
+    assert events[-2][1]["errors"] == 1
+    assert events[-1][1]["error_type"] == "latex_compile_error"
+
+
+def test_invalid_project_is_reported_in_the_stream():
+    events = _stream(
+        [("files", ("main.tex", MAIN_TEX))], {"main_file": "other.tex"}
+    )
+
+    assert [name for name, _ in events] == ["accepted", "result"]
+    assert events[1][1]["status"] == "error"
+    assert events[1][1]["error_type"] == "invalid_input"
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"main_file": "main.tex", "engine": "xelatex"},
+        {"main_file": "main.tex"},  # neither files nor file
+    ],
+)
+def test_invalid_form_is_rejected_before_streaming(data):
+    r = TestClient(app).post(
+        "/v2/compile/stream", data=data, files={"other": ("x", b"x")}
+    )
+    assert r.status_code == 422
+    assert r.json()["error_type"] == "invalid_input"
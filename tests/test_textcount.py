@@ -12,7 +12,7 @@ def _completed(stdout: str, returncode: int = 0) -> CompletedProcess[str]:
     return CompletedProcess(args=["texcount"], returncode=returncode, stdout=stdout)
 
 
-@patch("app.services.textcount.subprocess.run")
+@patch("app.services.textcount.run_process")
 def test_collect_textcount_ok_with_file_breakdown(mock_run, tmp_path):
     summary = (
         '{"words_text":5,"words_headers":2,"words_captions":0,"headings":1,'
@@ -39,7 +39,7 @@ def test_collect_textcount_ok_with_file_breakdown(mock_run, tmp_path):
     assert result.files[1].role == "included"
 
 
-@patch("app.services.textcount.subprocess.run")
+@patch("app.services.textcount.run_process")
 def test_collect_textcount_unavailable(mock_run, tmp_path):
     mock_run.side_effect = FileNotFoundError("texcount not found")
 
@@ -51,7 +51,7 @@ def test_collect_textcount_unavailable(mock_run, tmp_path):
     assert result.files == []
 
 
-@patch("app.services.textcount.subprocess.run")
+@patch("app.services.textcount.run_process")
 def test_collect_textcount_summary_timeout_is_error(mock_run, tmp_path):
     mock_run.side_effect = TimeoutExpired(cmd="texcount", timeout=5)
 
@@ -62,7 +62,7 @@ def test_collect_textcount_summary_timeout_is_error(mock_run, tmp_path):
     assert result.files == []
 
 
-@patch("app.services.textcount.subprocess.run")
+@patch("app.services.textcount.run_process")
 def test_collect_textcount_partial_when_brief_parse_fails(mock_run, tmp_path):
     summary = (
         '{"words_text":6,"words_headers":0,"words_captions":0,"headings":0,'
@@ -80,7 +80,7 @@ def test_collect_textcount_partial_when_brief_parse_fails(mock_run, tmp_path):
     assert result.files == []
 
 
-@patch("app.services.textcount.subprocess.run")
+@patch("app.services.textcount.run_process")
 def test_collect_textcount_partial_when_brief_times_out(mock_run, tmp_path):
     summary = (
         '{"words_text":2,"words_headers":0,"words_captions":0,"headings":0,'
@@ -0,0 +1,139 @@
+"""
+Tests for app.core.timing and the Server-Timing header.
+"""
+
+import io
+import zipfile
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.timing import PhaseTimer, step_phase_name, timed
+from app.main import app
+from app.models.compile import StepUsage
+from app.services.adapters import build_workdir_from_zip
+
+MAIN_TEX = b"\\documentclass{article}\n\\begin{document}x\\end{document}\n"
+
+
+def _server_timing(header: str) -> dict[str, str]:
+    """``{name: metric}`` of a Server-Timing header value."""
+    return {
+        metric.split(";")[0]: metric
+        for metric in (part.strip() for part in header.split(","))
+    }
+
+
+# =====================================================================
+# PhaseTimer
+# =====================================================================
+
+
+class TestPhaseTimer:
+    def test_repeated_phases_accumulate(self):
+        phases: dict[str, float] = {}
+        with timed(phases, "scan"):
+            pass
+        first = phases["scan"]
+        with timed(phases, "scan"):
+            pass
+        assert phases["scan"] >= first
+
+    def test_header_value(self):
+        timer = PhaseTimer()
+        timer.add("upload", 1.25)
+        timer.add_steps([StepUsage(label="Pass 1", wall_ms=800)])
+        metrics = _server_timing(timer.header_value())
+        assert list(metrics) == ["upload", "pass1", "total"]
+        assert metrics["upload"] == "upload;dur=1.2"
+        assert metrics["pass1"] == 'pass1;dur=800.0;desc="Pass 1"'
+
+    @pytest.mark.parametrize(
+        "label, name",
+        [
+            ("Pass 2", "pass2"),
+            ("Format", "format"),
+            ("Bibliography (biber)", "bib"),
+            ("Bibliography (bibtex) [cached]", "bib"),
+        ],
+    )
+    def test_step_phase_name(self, label, name):
+        assert step_phase_name(label) == name
+
+
+# =====================================================================
+# Routes
+# =====================================================================
+
+
+class TestServerTimingHeader:
+    def test_v2_sync(self, fake_pdflatex, caplog):
+        fake_pdflatex()
+        with caplog.at_level("INFO", logger="compile"):
+            r = TestClient(app).post(
+                "/v2/compile/sync",
+                files=[("files", ("main.tex", MAIN_TEX))],
+                data={"main_file": "main.tex", "passes": "1"},
+            )
+
+        assert r.status_code == 200
+        metrics = _server_timing(r.headers["Server-Timing"])
+        for name in ("upload", "validate", "scan", "digest", "write", "queue"):
+            assert name in metrics
+        assert metrics["pass1"].endswith(';desc="Pass 1"')
+        assert "total" in metrics
+
+        # Sending the PDF and cleanup end after the headers: log only
+        event = next(rec for rec in caplog.records if rec.name == "compile")
+        phases = event.extra_fields["phases"]
+        assert {"upload", "write", "pass1", "pdf", "cleanup"} <= set(phases)
+
+    def test_v2_zip(self, fake_pdflatex):
+        fake_pdflatex()
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w") as zf:
+            zf.writestr("main.tex", MAIN_TEX)
+
+        r = TestClient(app).post(
+            "/v2/compile/zip",
+            files={"file": ("project.zip", buf.getvalue(), "application/zip")},
+            data={"main_file": "main.tex", "passes": "1", "return": "json"},
+        )
+
+        assert r.status_code == 200
+        metrics = _server_timing(r.headers["Server-Timing"])
+        for name in ("spool", "extract", "validate", "scan", "pass1", "texcount"):
+            assert name in metrics
+
+    def test_v1_sync(self, fake_pdflatex):
+        fake_pdflatex()
+        r = TestClient(app).post(
+            "/compile/sync", data={"code": MAIN_TEX.decode(), "passes": "1"}
+        )
+
+        assert r.status_code == 200
+        metrics = _server_timing(r.headers["Server-Timing"])
+        for name in ("upload", "spool", "scan", "write", "pass1"):
+            assert name in metrics
+
+    def test_error_responses_get_a_total(self):
+        r = TestClient(app).post(
+            "/v2/compile/sync",
+            files=[("files", ("../evil.tex", b"x"))],
+            data={"main_file": "main.tex"},
+        )
+        assert r.status_code == 422
+        assert "total" in _server_timing(r.headers["Server-Timing"])
+
+
+def test_build_workdir_reports_phases(tmp_path: Path):
+    zip_path = tmp_path / "p.zip"
+    with zipfile.ZipFile(zip_path, "w") as zf:
+        zf.writestr("main.tex", MAIN_TEX)
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+
+    metadata = build_workdir_from_zip(zip_path, work_dir, passes=1)
+
+    assert set(metadata["phases"]) == {"extract", "validate", "scan", "write"}
@@ -5,14 +5,21 @@ Uses FastAPI TestClient. Tests that require real pdflatex are marked with
 @requires_pdflatex and will be skipped gracefully in CI without TeX.
 """
 
+import asyncio
+import base64
 import io
+import json
+import zipfile
 from unittest.mock import patch
 
 import pytest
 from fastapi.testclient import TestClient
 
+from app.api.responses import PdfFileResponse
+from app.core.config import settings
 from app.main import app
 from app.models.compile import CompileResult
+from app.services.validators import scan_dangerous_macros
 from tests.conftest import (
     load_fixture_files,
     make_zip_from_fixture,
@@ -400,6 +407,276 @@ class TestV2CompileFailuresMocked:
         assert body["message"] == "Biber failed"
         assert body["status"] == "error"
 
+    def test_oversized_zip_is_rejected_and_logged(self, monkeypatch, caplog):
+        monkeypatch.setattr(settings, "MAX_UPLOAD_SIZE", 16)
+        with caplog.at_level("INFO", logger="compile"):
+            r = client.post(
+                "/v2/compile/zip",
+                data={"main_file": "main.tex"},
+                files=[("file", ("project.zip", make_zip_from_fixture("simple")))],
+            )
+
+        assert r.status_code == 413
+        assert r.json()["error_type"] == "payload_too_large"
+        event = next(rec for rec in caplog.records if rec.name == "compile")
+        assert event.extra_fields["outcome"] == "invalid_input"
+
+
+# =====================================================================
+# Streamed PDF responses
+# =====================================================================
+
+
+class TestStreamedPdfResponses:
+    """PDFs are streamed from the work dir, which outlives the handler."""
+
+    @patch("app.api.routes_v2.compile_project")
+    def test_work_dir_is_kept_until_the_body_is_sent(self, mock_compile):
+        seen = {}
+
+        def fake_compile(work_dir, main_file, options, cancel=None):
+            seen["work_dir"] = work_dir
+            pdf = work_dir / "main.pdf"
+            pdf.write_bytes(b"%PDF-1.4 " + b"x" * 100_000)
+            return CompileResult(
+                success=True, pdf_path=pdf, compile_time_ms=4, log="", passes_run=1
+            )
+
+        mock_compile.side_effect = fake_compile
+        r = client.post(
+            "/v2/compile/sync",
+            data={"main_file": "main.tex"},
+            files=[("files", ("main.tex", load_fixture_files("simple")["main.tex"]))],
+        )
+
+        assert r.status_code == 200
+        assert r.content == b"%PDF-1.4 " + b"x" * 100_000
+        assert r.headers["content-disposition"] == 'attachment; filename="output.pdf"'
+        assert r.headers["x-passes-run"] == "1"
+        assert not seen["work_dir"].exists()
+
+    def test_on_close_runs_when_sending_fails(self, tmp_path):
+        pdf = tmp_path / "output.pdf"
+        pdf.write_bytes(b"%PDF-1.4")
+        closed = []
+        response = PdfFileResponse(pdf, on_close=lambda: closed.append(True))
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            raise OSError("client went away")
+
+        scope = {"type": "http", "method": "GET", "headers": [], "asgi": {"spec_version": "2.4"}}
+        with pytest.raises(OSError):
+            asyncio.run(response(scope, receive, send))
+        assert closed == [True]
+
+
+# =====================================================================
+# return=multipart
+# =====================================================================
+
+
+def _multipart_parts(response) -> list:
+    """Split a multipart/mixed response into (headers, body) pairs."""
+    import email
+    import email.policy
+
+    raw = (
+        f"Content-Type: {response.headers['content-type']}\r\n\r\n".encode()
+        + response.content
+    )
+    message = email.message_from_bytes(raw, policy=email.policy.HTTP)
+    return [(part, part.get_payload(decode=True)) for part in message.iter_parts()]
+
+
+def _fake_pdf_compile(work_dir, main_file, options, cancel=None):
+    pdf = work_dir / "main.pdf"
+    pdf.write_bytes(b"%PDF-1.4 \r\n--not-a-boundary\r\n" + bytes(range(256)))
+    return CompileResult(
+        success=True,
+        pdf_path=pdf,
+        compile_time_ms=4,
+        log="--- Pass 1 ---\n",
+        warnings=["LaTeX Warning: x"],
+        passes_run=1,
+    )
+
+
+class TestMultipartResponses:
+    def _post(self):
+        return client.post(
+            "/v2/compile/sync",
+            data={"main_file": "main.tex", "return": "multipart"},
+            files=[("files", ("main.tex", load_fixture_files("simple")["main.tex"]))],
+        )
+
+    @pytest.mark.parametrize("cache_enabled", [True, False])
+    @patch("app.api.routes_v2.compile_project", side_effect=_fake_pdf_compile)
+    def test_json_part_then_raw_pdf_part(self, mock_compile, cache_enabled, monkeypatch):
+        from app.core.config import settings
+
+        monkeypatch.setattr(settings, "RESULT_CACHE_ENABLED", cache_enabled)
+        responses = [self._post(), self._post()]
+
+        for r in responses:
+            assert r.status_code == 200
+            assert r.headers["content-type"].startswith("multipart/mixed; boundary=")
+            assert r.headers["x-passes-run"] == "1"
+            (meta_part, meta), (pdf_part, pdf) = _multipart_parts(r)
+            assert meta_part.get_content_type() == "application/json"
+            body = json.loads(meta)
+            assert body["status"] == "ok"
+            assert body["warnings"] == ["LaTeX Warning: x"]
+            assert "pdf_base64" not in body
+            assert "textcount" in body
+            assert pdf_part.get_content_type() == "application/pdf"
+            assert pdf == b"%PDF-1.4 \r\n--not-a-boundary\r\n" + bytes(range(256))
+        assert mock_compile.call_count == (1 if cache_enabled else 2)
+
+    @patch("app.api.routes_v2.compile_project")
+    def test_failure_is_a_json_error(self, mock_compile):
+        mock_compile.return_value = CompileResult(
+            success=False, compile_time_ms=1, log="", error_message="Compilation failed"
+        )
+        r = self._post()
+        assert r.status_code == 400
+        assert r.json()["error_type"] == "latex_compile_error"
+
+
+# =====================================================================
+# Streamed return=json
+# =====================================================================
+
+
+class TestStreamedJson:
+    @pytest.mark.parametrize("size", [0, 1, 2, 3, 48 * 1024 + 1, 200_001])
+    def test_base64_round_trips_across_chunks(self, size, tmp_path):
+        from app.api.responses import Base64JsonResponse
+
+        pdf = tmp_path / "main.pdf"
+        data = bytes(i % 251 for i in range(size))
+        pdf.write_bytes(data)
+
+        async def collect():
+            response = Base64JsonResponse({"status": "ok", "log": "x"}, pdf)
+            return b"".join([chunk async for chunk in response.body_iterator])
+
+        body = json.loads(asyncio.run(collect()))
+        assert body["status"] == "ok"
+        assert base64.b64decode(body["pdf_base64"]) == data
+
+    @patch("app.api.routes_v2.compile_project", side_effect=_fake_pdf_compile)
+    def test_route_streams_json(self, mock_compile):
+        r = client.post(
+            "/v2/compile/sync",
+            data={"main_file": "main.tex", "return": "json"},
+            files=[("files", ("main.tex", load_fixture_files("simple")["main.tex"]))],
+        )
+        assert r.status_code == 200
+        assert r.headers["content-type"] == "application/json"
+        assert "content-length" not in r.headers
+        body = r.json()
+        assert base64.b64decode(body["pdf_base64"]).startswith(b"%PDF-1.4")
+        assert body["passes_run"] == 1
+
+
+# =====================================================================
+# Several main files per upload
+# =====================================================================
+
+
+TARGETS = {
+    "paper.tex": b"\\documentclass{article}\\begin{document}paper\\end{document}",
+    "talk/slides.tex": b"\\documentclass{beamer}\\begin{document}fail\\end{document}",
+    "fig.png": b"png",
+}
+
+
+def _fake_target_compile(work_dir, main_file, options, cancel=None):
+    """Writes <stem>.pdf, recording how many links fig.png has."""
+    if b"fail" in (work_dir / main_file).read_bytes():
+        return CompileResult(
+            success=False,
+            compile_time_ms=1,
+            log="! Undefined",
+            error_message="Compilation failed",
+        )
+    pdf = work_dir / f"{main_file.rsplit('/', 1)[-1][:-4]}.pdf"
+    links = (work_dir / "fig.png").stat().st_nlink
+    pdf.write_bytes(b"%PDF-1.4 " + main_file.encode() + f" {links}".encode())
+    return CompileResult(
+        success=True, pdf_path=pdf, compile_time_ms=2, log="", passes_run=1
+    )
+
+
+class TestMultipleMainFiles:
+    def _post(self, main_files, **data):
+        return client.post(
+            "/v2/compile/sync",
+            data={"main_file": main_files, **data},
+            files=[("files", (path, content)) for path, content in TARGETS.items()],
+        )
+
+    @patch("app.api.routes_v2.compile_project", side_effect=_fake_target_compile)
+    def test_targets_compile_from_one_layout(self, mock_compile):
+        with patch(
+            "app.services.adapters.scan_dangerous_macros", wraps=scan_dangerous_macros
+        ) as scan:
+            r = self._post(["paper.tex", "talk/slides.tex"], **{"return": "ndjson"})
+
+        assert r.status_code == 200
+        lines = {line["id"]: line for line in map(json.loads, r.text.splitlines())}
+        assert lines["paper"]["status"] == "ok"
+        pdf = base64.b64decode(lines["paper"]["pdf_base64"])
+        assert pdf.startswith(b"%PDF-1.4 paper.tex")
+        assert int(pdf.split()[-1]) > 1  # fig.png is hardlinked, not copied
+        assert lines["talk/slides"]["error_type"] == "latex_compile_error"
+
+        # Validated and scanned once per file, compiled in separate work dirs
+        assert scan.call_count == len(TARGETS)
+        work_dirs = {call.args[0] for call in mock_compile.call_args_list}
+        assert len(work_dirs) == 2
+
+    @patch("app.api.routes_v2.compile_project", side_effect=_fake_target_compile)
+    def test_zip_upload_returns_a_zip(self, mock_compile):
+        files = {**TARGETS, "talk/slides.tex": TARGETS["paper.tex"]}
+        r = client.post(
+            "/v2/compile/zip",
+            data={"main_file": ["paper.tex", "talk/slides.tex"]},
+            files={"file": ("p.zip", make_zip_from_dict(files), "application/zip")},
+        )
+
+        assert r.status_code == 200
+        assert r.headers["content-type"] == "application/zip"
+        with zipfile.ZipFile(io.BytesIO(r.content)) as zf:
+            assert sorted(zf.namelist()) == [
+                "paper.json",
+                "paper.pdf",
+                "talk/slides.json",
+                "talk/slides.pdf",
+            ]
+            assert zf.read("talk/slides.pdf").startswith(b"%PDF-1.4 talk/slides.tex")
+
+    @pytest.mark.parametrize(
+        "main_files, data",
+        [
+            (["paper.tex", "talk/slides.tex"], {"return": "json"}),
+            (["paper.tex", "paper.tex"], {}),
+            (["paper.tex", "missing.tex"], {}),
+            (["paper.tex", "talk/slides.tex", "fig.tex"], {}),
+        ],
+    )
+    def test_rejected(self, main_files, data, monkeypatch, caplog):
+        monkeypatch.setattr(settings, "MAX_MAIN_FILES", 2)
+        with caplog.at_level("INFO", logger="compile"):
+            r = self._post(main_files, **data)
+        assert r.status_code == 422
+        assert r.json()["error_type"] == "invalid_input"
+        event = next(rec for rec in caplog.records if rec.name == "compile")
+        assert event.extra_fields["outcome"] == "invalid_input"
+
 
 # =====================================================================
 # Response headers